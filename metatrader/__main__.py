@@ -0,0 +1,5 @@
+import sys
+
+from metatrader.cli import main
+
+sys.exit(main())
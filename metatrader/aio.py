@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import uuid
+
+
+def as_completed_bounded(coros, limit):
+    """
+    Notes:
+      run coroutines with at most limit of them in flight.
+      coroutine is not started until a slot of semaphore is free.
+    Args:
+      coros(iterable): coroutine objects
+      limit(int): max number of coroutines running at once
+    Returns:
+      iterator of awaitables in order of completion, same as asyncio.as_completed.
+      e.g.:
+        for next_result in as_completed_bounded(coros, 4):
+            result = await next_result
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def bounded(coro):
+        async with semaphore:
+            return await coro
+
+    return asyncio.as_completed([bounded(coro) for coro in coros])
+
+
+def run_backtests_async(backtests, aliases, optimize=False):
+    """
+    Notes:
+      run backtests on terminals of aliases, one job per terminal at once.
+      each job takes an idle alias, so concurrency is bounded by number of aliases.
+    Args:
+      backtests(iterable): metatrader.backtest.BackTest objects
+      aliases(list): aliases of terminals registered by metatrader.mt5.initizalize
+      optimize(bool): call BackTest.optimize_async instead of BackTest.run_async
+    Returns:
+      iterator of awaitables in order of completion.
+      each resolves to backtest, or to OptimizationReport if optimize is True.
+    """
+    idle_aliases = asyncio.Queue()
+    for alias in aliases:
+        idle_aliases.put_nowait(alias)
+
+    async def run_job(backtest):
+        alias = await idle_aliases.get()
+        try:
+            if optimize:
+                return await backtest.optimize_async(alias=alias)
+            await backtest.run_async(alias=alias)
+            return backtest
+        finally:
+            idle_aliases.put_nowait(alias)
+
+    jobs = []
+    for backtest in backtests:
+        if backtest.job_id is None:
+            backtest.job_id = uuid.uuid4().hex[:12]
+        jobs.append(run_job(backtest))
+
+    return as_completed_bounded(jobs, len(aliases))
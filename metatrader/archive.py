@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+"""
+compressed, deduplicated archive of result directories.
+every file of a run is stored once per content as a compressed blob named by its sha256,
+so identical charts and reports of many runs take the space of one. sqlite index maps
+(sweep, run, path) to blob, so one file is read back in constant time without extracting anything.
+
+  <root>/index.sqlite
+  <root>/blobs/<first 2 chars of digest>/<digest>.gz or .zst
+
+gzip is always available, zstd is used when zstandard package is installed.
+"""
+import gzip
+import hashlib
+import io
+import logging
+import os
+import shutil
+import sqlite3
+import time
+
+from metatrader.exception import InvalidReportFormat
+
+# path of backtest report in a run directory, see report.get_report_abs_path
+REPORT_PATH = 'report/report.htm'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sweeps (
+    sweep TEXT PRIMARY KEY,
+    archived_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    codec TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    stored_size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    sweep TEXT NOT NULL,
+    run TEXT NOT NULL,
+    path TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (sweep, run, path)
+);
+CREATE INDEX IF NOT EXISTS files_digest ON files (digest);
+'''
+
+# codec => file extension of blob
+CODEC_EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def default_codec():
+    return 'zstd' if _zstd() is not None else 'gzip'
+
+
+def _compress(data, codec):
+    if codec == 'gzip':
+        return gzip.compress(data, compresslevel=6)
+    if codec == 'zstd':
+        zstd = _zstd()
+        if zstd is None:
+            raise RuntimeError('zstd codec needs zstandard package')
+        return zstd.ZstdCompressor(level=10).compress(data)
+    raise ValueError('unknown codec %s. use one of %s' % (codec, ', '.join(sorted(CODEC_EXTENSIONS))))
+
+
+def _open_blob(path, codec):
+    if codec == 'gzip':
+        return gzip.open(path, 'rb')
+    zstd = _zstd()
+    if zstd is None:
+        raise RuntimeError('%s is compressed with zstd, which needs zstandard package' % path)
+    return zstd.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+
+
+def parse_size(text):
+    """
+    Returns:
+      num of bytes of text like 500M, 20G or 1024
+    """
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+    text = text.strip().upper().rstrip('B')
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+class Archive(object):
+    """
+    Notes:
+      content addressed archive of result directories grouped by sweep.
+    Args:
+      root(string): archive directory, created if it does not exist
+      codec(string): 'gzip' or 'zstd' for new blobs. default is zstd if available
+    """
+
+    def __init__(self, root, codec=None):
+        self.root = root
+        self.codec = codec or default_codec()
+        if self.codec not in CODEC_EXTENSIONS:
+            raise ValueError('unknown codec %s. use one of %s' % (self.codec, ', '.join(sorted(CODEC_EXTENSIONS))))
+        os.makedirs(os.path.join(root, 'blobs'), exist_ok=True)
+
+        self.connection = sqlite3.connect(os.path.join(root, 'index.sqlite'))
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def _blob_path(self, digest, codec):
+        return os.path.join(self.root, 'blobs', digest[:2], digest + CODEC_EXTENSIONS[codec])
+
+    def _put_blob(self, data, written=None):
+        """
+        Notes:
+          called in transaction of add_run, which holds write lock of index while blob files are written
+        Args:
+          written(list): path of blob file is appended if it was written
+        Returns:
+          digest of data. blob is written only if archive does not have the same content
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        if self.connection.execute('SELECT 1 FROM blobs WHERE digest = ?', (digest,)).fetchone():
+            return digest
+
+        compressed = _compress(data, self.codec)
+        self.connection.execute('INSERT INTO blobs (digest, codec, size, stored_size) VALUES (?, ?, ?, ?)',
+                                (digest, self.codec, len(data), len(compressed)))
+        path = self._blob_path(digest, self.codec)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp_path, 'wb') as fp:
+            fp.write(compressed)
+        os.replace(tmp_path, path)
+        if written is not None:
+            written.append(path)
+        return digest
+
+    def add_run(self, sweep, test_dir, run=None, remove=False):
+        """
+        Notes:
+          archive every file of run directory. if it fails, blob files written for it are deleted
+          with its rows, so no file is left without index.
+        Args:
+          sweep(string): name of sweep which run belongs to
+          test_dir(string): run directory
+          run(string): name of run. default is name of test_dir
+          remove(bool): delete test_dir after it is archived. run without files is not deleted
+        Returns:
+          num of archived files
+        """
+        run = run or os.path.basename(os.path.normpath(test_dir))
+        rows = []
+        written = []
+        with self.connection:
+            # takes write lock before any blob file is written, see _delete_orphan_blobs
+            self.connection.execute('INSERT OR IGNORE INTO sweeps (sweep, archived_at) VALUES (?, ?)',
+                                    (sweep, time.time()))
+            try:
+                for dir_path, dir_names, file_names in os.walk(test_dir):
+                    dir_names.sort()
+                    for file_name in sorted(file_names):
+                        file_path = os.path.join(dir_path, file_name)
+                        with open(file_path, 'rb') as fp:
+                            digest = self._put_blob(fp.read(), written)
+                        path = os.path.relpath(file_path, test_dir).replace(os.sep, '/')
+                        rows.append((sweep, run, path, digest))
+                self.connection.executemany(
+                    'INSERT OR REPLACE INTO files (sweep, run, path, digest) VALUES (?, ?, ?, ?)', rows)
+            except BaseException:
+                for path in written:
+                    _remove_file(path)
+                raise
+        if remove:
+            if rows:
+                shutil.rmtree(test_dir)
+            else:
+                logging.warning('%s has no files to archive, it is not removed', test_dir)
+        return len(rows)
+
+    def add_sweep(self, sweep, result_dir, remove=False):
+        """
+        Notes:
+          archive every run directory directly under result_dir
+        Returns:
+          num of archived runs
+        """
+        n_runs = 0
+        for name in sorted(os.listdir(result_dir)):
+            test_dir = os.path.join(result_dir, name)
+            if os.path.isdir(test_dir):
+                self.add_run(sweep, test_dir, remove=remove)
+                n_runs += 1
+        return n_runs
+
+    def sweeps(self):
+        return [row[0] for row in self.connection.execute('SELECT sweep FROM sweeps ORDER BY archived_at, sweep')]
+
+    def runs(self, sweep):
+        sql = 'SELECT DISTINCT run FROM files WHERE sweep = ? ORDER BY run'
+        return [row[0] for row in self.connection.execute(sql, (sweep,))]
+
+    def files(self, sweep, run):
+        sql = 'SELECT path FROM files WHERE sweep = ? AND run = ? ORDER BY path'
+        return [row[0] for row in self.connection.execute(sql, (sweep, run))]
+
+    def open(self, sweep, run, path=REPORT_PATH):
+        """
+        Returns:
+          binary stream of archived file, decompressed while it is read
+        Raises:
+          FileNotFoundError: file is not archived
+        """
+        row = self.connection.execute(
+            'SELECT blobs.digest, blobs.codec FROM files JOIN blobs ON files.digest = blobs.digest '
+            'WHERE files.sweep = ? AND files.run = ? AND files.path = ?', (sweep, run, path)).fetchone()
+        if row is None:
+            raise FileNotFoundError('%s is not in archive %s' % (self.uri(sweep, run, path), self.root))
+        return _open_blob(self._blob_path(*row), row[1])
+
+    def read(self, sweep, run, path=REPORT_PATH):
+        with self.open(sweep, run, path) as fp:
+            return fp.read()
+
+    def extract(self, sweep, run, test_dir):
+        """
+        Notes:
+          restore run directory
+        """
+        for path in self.files(sweep, run):
+            dst_path = os.path.join(test_dir, *path.split('/'))
+            os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+            with self.open(sweep, run, path) as src, open(dst_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+
+    @staticmethod
+    def uri(sweep, run, path=REPORT_PATH):
+        return 'archive:%s/%s/%s' % (sweep, run, path)
+
+    def read_backtest_summary(self, sweep, run):
+        """
+        Notes:
+          summary of archived backtest report, see metatrader.report.read_backtest_summary
+        """
+        from metatrader.report import parse_backtest_summary
+
+        try:
+            return parse_backtest_summary(self.read(sweep, run))
+        except InvalidReportFormat as e:
+            e.report_file = self.uri(sweep, run)
+            raise
+
+    def iter_optimization_results(self, backtest, sweep, run, path):
+        """
+        Notes:
+          stream archived optimization report (html or xml), see metatrader.report.iter_optimization_results
+        """
+        from metatrader.report import (XML_REPORT_SUFFIX, encoding_of_head, iter_html_optimization_results,
+                                       iter_xml_optimization_stream)
+
+        uri = self.uri(sweep, run, path)
+        if path.endswith(XML_REPORT_SUFFIX):
+            with self.open(sweep, run, path) as fp:
+                yield from iter_xml_optimization_stream(backtest, fp, uri)
+            return
+
+        with self.open(sweep, run, path) as fp:
+            encoding = encoding_of_head(fp.read(2))
+        with self.open(sweep, run, path) as fp:
+            yield from iter_html_optimization_results(backtest, io.TextIOWrapper(fp, encoding=encoding), uri)
+
+    def read_deals(self, sweep, run):
+        """
+        Notes:
+          deals table of archived mt5 backtest report, see metatrader.deals.read_deals
+        """
+        from metatrader.deals import parse_deals
+        from metatrader.report import encoding_of_head
+
+        data = self.read(sweep, run)
+        try:
+            return parse_deals(data.decode(encoding_of_head(data)))
+        except InvalidReportFormat as e:
+            e.report_file = self.uri(sweep, run)
+            raise
+
+    def disk_usage(self):
+        """
+        Returns:
+          (stored bytes, original bytes of every archived file). original bytes count duplicates
+        """
+        stored = self.connection.execute('SELECT COALESCE(SUM(stored_size), 0) FROM blobs').fetchone()[0]
+        original = self.connection.execute(
+            'SELECT COALESCE(SUM(blobs.size), 0) FROM files JOIN blobs ON files.digest = blobs.digest').fetchone()[0]
+        return stored, original
+
+    def delete_sweep(self, sweep):
+        """
+        Notes:
+          delete sweep and blobs which no other sweep refers to
+        Returns:
+          num of deleted blobs
+        """
+        with self.connection:
+            self.connection.execute('DELETE FROM files WHERE sweep = ?', (sweep,))
+            self.connection.execute('DELETE FROM sweeps WHERE sweep = ?', (sweep,))
+        return self._delete_orphan_blobs()
+
+    def _delete_orphan_blobs(self):
+        """
+        Notes:
+          delete blobs which no file refers to, and blob files which are not indexed, e.g. left by a crash.
+          write lock of index is held, so blob files of runs which other processes are adding are kept
+        Returns:
+          num of deleted blobs
+        """
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            orphans = self.connection.execute(
+                'SELECT digest, codec FROM blobs WHERE digest NOT IN (SELECT digest FROM files)').fetchall()
+            self.connection.executemany('DELETE FROM blobs WHERE digest = ?', [(digest,) for digest, _ in orphans])
+            for digest, codec in orphans:
+                _remove_file(self._blob_path(digest, codec))
+
+            indexed = set(self._blob_path(digest, codec)
+                          for digest, codec in self.connection.execute('SELECT digest, codec FROM blobs'))
+            for dir_path, _, file_names in os.walk(os.path.join(self.root, 'blobs')):
+                for file_name in file_names:
+                    path = os.path.join(dir_path, file_name)
+                    if path not in indexed:
+                        logging.info('%s is not indexed, deleted', path)
+                        _remove_file(path)
+        return len(orphans)
+
+    def enforce_quota(self, max_bytes, keep=1):
+        """
+        Notes:
+          retention policy. delete oldest sweeps until stored bytes are within max_bytes.
+        Args:
+          max_bytes(int): disk quota of blobs
+          keep(int): num of newest sweeps which are never deleted
+        Returns:
+          list of deleted sweeps
+        """
+        deleted = []
+        sweeps = self.sweeps()
+        for sweep in sweeps[:max(len(sweeps) - keep, 0)]:
+            if self.disk_usage()[0] <= max_bytes:
+                break
+            self.delete_sweep(sweep)
+            deleted.append(sweep)
+            logging.info('deleted sweep %s from archive %s to meet quota', sweep, self.root)
+        return deleted
@@ -8,9 +8,16 @@ import os
 import shutil
 from itertools import chain
 
+from metatrader import instrument
 from metatrader.mt5 import DEFAULT_MT5_NAME
 from metatrader.mt5 import get_mt5
 
+# values of Optimization key in config
+OPTIMIZATION_DISABLED = 0
+OPTIMIZATION_COMPLETE = 1
+OPTIMIZATION_GENETIC = 2
+OPTIMIZATION_ALL_SYMBOLS = 3
+
 
 class BackTest:
     """
@@ -26,12 +33,25 @@ class BackTest:
         2: Open prices only
       spread(int): spread
       optimization(bool): optimization flag. optimization is enabled if True
+      optimization_mode(int): algorithm used by optimize
+        1: Slow complete algorithm
+        2: Fast genetic based algorithm
+        3: All symbols selected in Market Watch
       replace_report(bool): replace report flag. replace report is enabled if True
+      job_id(string): id which makes parameter and report file names unique in terminal data folder.
+        if None, shared names param.set and report are used.
+      duration(float): seconds of last run or optimization on a terminal of BacktestPool. None if not run by pool
+      timeout(float): terminal is killed when run takes longer, see metatrader.mt5.MT5.run. None means no limit
+      idle_timeout(float): terminal is killed when its logs are not written for this long. None means no limit
+      symbol_data_file(string): history file of symbol which the run tests on, see metatrader.catalog.
+        cached reports of BacktestPool are invalidated when it changes. None if not tracked
 
     """
 
     def __init__(self, test_dir, ea_name, param, symbol, period, deposit, from_date, to_date, model=1, spread=5,
-                 forward_mode=0, execution_mode=1, replace_report=True, leverage='1:100', shutdown_terminal=True):
+                 forward_mode=0, execution_mode=1, replace_report=True, leverage='1:100', shutdown_terminal=True,
+                 job_id=None, optimization_mode=OPTIMIZATION_COMPLETE, timeout=None, idle_timeout=None,
+                 symbol_data_file=None):
         self.test_dir = test_dir
         self.ea_name = ea_name
         self.param = param
@@ -47,14 +67,43 @@ class BackTest:
         self.replace_report = replace_report
         self.leverage = leverage
         self.shutdown_terminal = shutdown_terminal
+        self.job_id = job_id
+        self.optimization_mode = optimization_mode
+        self.optimization = False
+        self.duration = None
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.symbol_data_file = symbol_data_file
+
+    @property
+    def param_file_name(self):
+        """
+        Notes:
+          name of parameter file in MQL5\\Profiles\\Tester of terminal data folder
+        """
+        if self.job_id is None:
+            return 'param.set'
+        return 'param_%s.set' % self.job_id
+
+    @property
+    def report_dir_name(self):
+        """
+        Notes:
+          name of directory in terminal data folder which terminal writes report into
+        """
+        if self.job_id is None:
+            return 'report'
+        return 'report_%s' % self.job_id
 
     def _prepare(self, alias=DEFAULT_MT5_NAME):
         """
         Notes:
           create backtest config file and parameter file
         """
-        self._create_conf(alias=alias)
-        self._create_param(alias=alias)
+        with instrument.span(instrument.SPAN_CREATE_CONF, alias=alias):
+            self._create_conf(alias=alias)
+        with instrument.span(instrument.SPAN_CREATE_PARAM, alias=alias):
+            self._create_param(alias=alias)
 
     def _create_conf(self, alias=DEFAULT_MT5_NAME):
         """
@@ -80,22 +129,23 @@ class BackTest:
 
         mt5 = get_mt5(alias)
         conf_file = os.path.join(self.test_dir, 'config.ini')
-        report_dir = os.path.join(mt5.appdata_path, 'report')
+        report_dir = os.path.join(mt5.appdata_path, self.report_dir_name)
         os.makedirs(report_dir, exist_ok=True)
 
         with open(conf_file, 'w+') as fp:
             fp.write('[Tester]\n')
             fp.write('Expert=%s\n' % self.ea_name)
-            fp.write('ExpertParameters=%s\n' % 'param.set')
+            fp.write('ExpertParameters=%s\n' % self.param_file_name)
             fp.write('Symbol=%s\n' % self.symbol)
             fp.write('Model=%s\n' % self.model)
             fp.write('Deposit=%s\n' % self.deposit)
+            fp.write('Optimization=%s\n' % (self.optimization_mode if self.optimization else OPTIMIZATION_DISABLED))
             fp.write('ForwardMode=%s\n' % self.forward_mode)
             fp.write('ExecutionMode=%s\n' % self.execution_mode)
             fp.write('Period=%s\n' % self.period)
             fp.write('FromDate=%s\n' % self.from_date.strftime('%Y.%m.%d'))
             fp.write('ToDate=%s\n' % self.to_date.strftime('%Y.%m.%d'))
-            fp.write('Report=%s\n' % 'report/report')
+            fp.write('Report=%s/report\n' % self.report_dir_name)
             fp.write('Leverage=%s\n' % self.leverage)
             fp.write('ReplaceReport=%s\n' % int(self.replace_report))
             fp.write('ShutdownTerminal=%s\n' % int(self.shutdown_terminal))
@@ -116,7 +166,7 @@ class BackTest:
                 value = values.pop('value')
                 fp.write('%s=%s\n' % (k, value))
                 if self.optimization:
-                    if values.has_key('max') and values.has_key('interval'):
+                    if 'max' in values and 'interval' in values:
                         fp.write('%s,F=1\n' % k)
                         fp.write('%s,1=%s\n' % (k, value))
                         interval = values.pop('interval')
@@ -141,19 +191,24 @@ class BackTest:
                         fp.write('%s,3=0\n' % k)
 
         mt5 = get_mt5(alias)
-        real_param_path = os.path.join(mt5.appdata_path, 'MQL5\\Profiles\\Tester', 'param.set')
-        shutil.copy(param_file, real_param_path)
+        real_param_path = os.path.join(mt5.appdata_path, 'MQL5', 'Profiles', 'Tester', self.param_file_name)
+        with instrument.span(instrument.SPAN_COPY_PARAM, alias=alias):
+            shutil.copy(param_file, real_param_path)
 
     def _get_conf_abs_path(self, alias=DEFAULT_MT5_NAME):
         conf_file = os.path.join(self.test_dir, 'config.ini')
         return conf_file
 
     def move_and_fix_report(self, alias=DEFAULT_MT5_NAME):
+        with instrument.span(instrument.SPAN_MOVE_REPORT, alias=alias):
+            self._move_and_fix_report(alias=alias)
+
+    def _move_and_fix_report(self, alias=DEFAULT_MT5_NAME):
         mt5 = get_mt5(alias)
-        src_report_dir = os.path.join(mt5.appdata_path, 'report')
+        src_report_dir = os.path.join(mt5.appdata_path, self.report_dir_name)
         dst_report_dir = os.path.join(self.test_dir, 'report')
         shutil.rmtree(dst_report_dir, ignore_errors=True)
-        shutil.move(src_report_dir, self.test_dir)
+        shutil.move(src_report_dir, dst_report_dir)
         content_dir = os.path.join(dst_report_dir, 'report')
         os.makedirs(content_dir)
 
@@ -171,12 +226,14 @@ class BackTest:
 
         self.optimization = False
 
-        self._prepare(alias=alias)
-        bt_conf = self._get_conf_abs_path(alias=alias)
+        with instrument.span(instrument.SPAN_RUN, alias=alias, job_id=self.job_id):
+            self._prepare(alias=alias)
+            bt_conf = self._get_conf_abs_path(alias=alias)
 
-        mt5 = get_mt5(alias=alias)
-        mt5.run(conf=bt_conf)
-        self.move_and_fix_report()
+            mt5 = get_mt5(alias=alias)
+            with instrument.span(instrument.SPAN_TERMINAL, alias=alias):
+                mt5.run(conf=bt_conf, timeout=self.timeout, idle_timeout=self.idle_timeout)
+            self.move_and_fix_report(alias=alias)
 
     def optimize(self, alias=DEFAULT_MT5_NAME):
         """
@@ -184,11 +241,51 @@ class BackTest:
         from metatrader.report import OptimizationReport
 
         self.optimization = True
-        self._prepare(alias=alias)
-        bt_conf = self._get_conf_abs_path(alias=alias)
+        with instrument.span(instrument.SPAN_OPTIMIZE, alias=alias, job_id=self.job_id):
+            self._prepare(alias=alias)
+            bt_conf = self._get_conf_abs_path(alias=alias)
+
+            mt5 = get_mt5(alias=alias)
+            with instrument.span(instrument.SPAN_TERMINAL, alias=alias):
+                mt5.run(conf=bt_conf, timeout=self.timeout, idle_timeout=self.idle_timeout)
+            self.move_and_fix_report(alias=alias)
+
+            ret = OptimizationReport(self)
+        return ret
+
+    async def run_async(self, alias=DEFAULT_MT5_NAME):
+        """
+        Notes:
+          run backtest without blocking event loop while terminal works.
+        """
+
+        self.optimization = False
+
+        with instrument.span(instrument.SPAN_RUN, alias=alias, job_id=self.job_id):
+            self._prepare(alias=alias)
+            bt_conf = self._get_conf_abs_path(alias=alias)
+
+            mt5 = get_mt5(alias=alias)
+            with instrument.span(instrument.SPAN_TERMINAL, alias=alias):
+                await mt5.run_async(conf=bt_conf, timeout=self.timeout, idle_timeout=self.idle_timeout)
+            self.move_and_fix_report(alias=alias)
+
+    async def optimize_async(self, alias=DEFAULT_MT5_NAME):
+        """
+        Notes:
+          run optimization without blocking event loop while terminal works.
+        """
+        from metatrader.report import OptimizationReport
+
+        self.optimization = True
+        with instrument.span(instrument.SPAN_OPTIMIZE, alias=alias, job_id=self.job_id):
+            self._prepare(alias=alias)
+            bt_conf = self._get_conf_abs_path(alias=alias)
 
-        mt5 = get_mt5(alias=alias)
-        mt5.run(conf=bt_conf)
+            mt5 = get_mt5(alias=alias)
+            with instrument.span(instrument.SPAN_TERMINAL, alias=alias):
+                await mt5.run_async(conf=bt_conf, timeout=self.timeout, idle_timeout=self.idle_timeout)
+            self.move_and_fix_report(alias=alias)
 
-        ret = OptimizationReport(self)
+            ret = OptimizationReport(self)
         return ret
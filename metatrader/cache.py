@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+"""
+content addressed cache of backtest reports.
+key is a hash of all BackTest inputs, EA binary and symbol data file,
+so a repeated backtest restores its report instead of launching terminal.
+"""
+import datetime
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+
+from metatrader.mt5 import DEFAULT_MT5_NAME
+from metatrader.mt5 import get_mt5
+
+# BackTest attributes which change result of backtest
+KEY_ATTRIBUTES = ('ea_name', 'param', 'symbol', 'period', 'deposit', 'from_date', 'to_date', 'model', 'spread',
+                  'forward_mode', 'execution_mode', 'leverage')
+
+_fingerprints = {}
+_fingerprints_lock = threading.Lock()
+
+
+def fingerprint_file(path, content=True):
+    """
+    Notes:
+      fingerprint of file. content hash is memoized by size and mtime, so file is read once while unchanged.
+    Args:
+      path(string): file path
+      content(bool): hash content if True. otherwise only name, size and mtime are used, for large data files
+    Returns:
+      hex string, or None if file does not exist
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    stamp = (path, st.st_size, st.st_mtime_ns, content)
+    with _fingerprints_lock:
+        if stamp in _fingerprints:
+            return _fingerprints[stamp]
+
+    if content:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as fp:
+            for chunk in iter(lambda: fp.read(1024 * 1024), b''):
+                sha.update(chunk)
+        fingerprint = sha.hexdigest()
+    else:
+        fingerprint = '%s:%d:%d' % (os.path.basename(path), st.st_size, st.st_mtime_ns)
+
+    with _fingerprints_lock:
+        _fingerprints[stamp] = fingerprint
+    return fingerprint
+
+
+def _dir_size(path):
+    size = 0
+    for root, _, files in os.walk(path):
+        size += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return size
+
+
+def get_ea_file_path(ea_name, alias=DEFAULT_MT5_NAME):
+    """
+    Returns:
+      abs path of compiled ea. e.g.: <appdata>\\MQL5\\Experts\\Advisors\\ExpertMACD.ex5
+    """
+    mt5 = get_mt5(alias)
+    parts = ea_name.replace('\\', '/').split('/')
+    return os.path.join(mt5.appdata_path, 'MQL5', 'Experts', *parts) + '.ex5'
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def make_cache_key(backtest, ea_fingerprint=None, data_fingerprint=None):
+    """
+    Returns:
+      sha256 hex of canonical json of backtest inputs and fingerprints
+    """
+    inputs = {name: getattr(backtest, name) for name in KEY_ATTRIBUTES}
+    inputs['ea_fingerprint'] = ea_fingerprint
+    inputs['data_fingerprint'] = data_fingerprint
+    canonical = json.dumps(inputs, sort_keys=True, separators=(',', ':'), default=_json_default)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class BacktestCache(object):
+    """
+    Notes:
+      cache of backtest reports in cache_dir/<key[:2]>/<key>.
+      concurrent callers of the same key share one terminal run (single flight within a process).
+      last access time of entry is its directory mtime, which eviction uses.
+      access time and size of entries are kept in memory, cache_dir is walked again every rescan_interval
+      to see entries of other processes, so eviction after each miss does not stat every file.
+    Args:
+      cache_dir(string): cache directory
+      max_entries(int): max num of entries. None means unlimited
+      max_bytes(int): max total size of entries. None means unlimited
+      max_age(float): seconds since last access after which entry is removed. None means forever
+      rescan_interval(float): seconds after which in memory index of entries is built again
+    """
+
+    def __init__(self, cache_dir, max_entries=None, max_bytes=None, max_age=None, rescan_interval=300.0):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.rescan_interval = rescan_interval
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        # entry dir => [accessed_at, size]. None until first eviction
+        self._index = None
+        self._scanned_at = None
+        self._index_lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, backtest, alias=DEFAULT_MT5_NAME, symbol_data_file=None):
+        """
+        Args:
+          backtest(metatrader.backtest.BackTest): backtest
+          alias(string): alias of terminal whose data folder has compiled ea
+          symbol_data_file(string): history file of symbol. None if not tracked
+        """
+        ea_fingerprint = fingerprint_file(get_ea_file_path(backtest.ea_name, alias))
+        data_fingerprint = None
+        if symbol_data_file is not None:
+            data_fingerprint = fingerprint_file(symbol_data_file, content=False)
+        return make_cache_key(backtest, ea_fingerprint, data_fingerprint)
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def _restore(self, key, backtest):
+        entry_dir = self._entry_dir(key)
+        if not os.path.isdir(entry_dir):
+            return False
+
+        dst_report_dir = os.path.join(backtest.test_dir, 'report')
+        shutil.rmtree(dst_report_dir, ignore_errors=True)
+        try:
+            shutil.copytree(os.path.join(entry_dir, 'report'), dst_report_dir)
+        except (OSError, shutil.Error):
+            # entry was evicted meanwhile
+            return False
+        os.utime(entry_dir)
+        with self._index_lock:
+            if self._index is not None and entry_dir in self._index:
+                self._index[entry_dir][0] = time.time()
+        return True
+
+    def _store(self, key, backtest):
+        entry_dir = self._entry_dir(key)
+        tmp_dir = '%s.%s.tmp' % (entry_dir, uuid.uuid4().hex[:8])
+        shutil.copytree(os.path.join(backtest.test_dir, 'report'), os.path.join(tmp_dir, 'report'))
+        try:
+            os.replace(tmp_dir, entry_dir)
+        except OSError:
+            # same key was stored by other process
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+        with self._index_lock:
+            if self._index is not None:
+                self._index[entry_dir] = [time.time(), _dir_size(entry_dir)]
+
+    def get(self, backtest, alias=DEFAULT_MT5_NAME, symbol_data_file=None):
+        """
+        Notes:
+          restore cached report into backtest.test_dir
+        Returns:
+          True if report was restored
+        """
+        return self._restore(self.key(backtest, alias, symbol_data_file), backtest)
+
+    def run(self, backtest, alias=DEFAULT_MT5_NAME, symbol_data_file=None, runner=None):
+        """
+        Notes:
+          restore report from cache, or run backtest and cache its report.
+          if the same key is running in other thread, wait for it instead of launching terminal.
+          if entry is evicted before it is restored, backtest is run.
+        Args:
+          runner(callable): runs backtest when cache misses. default is backtest.run(alias=alias)
+        Returns:
+          backtest
+        """
+        key = self.key(backtest, alias, symbol_data_file)
+
+        while True:
+            with self._lock:
+                future = self._in_flight.get(key)
+                is_cached = future is None and os.path.isdir(self._entry_dir(key))
+                is_leader = future is None and not is_cached
+                if is_leader:
+                    future = self._in_flight[key] = Future()
+                    self.misses += 1
+            if is_leader:
+                break
+
+            if future is not None:
+                future.result()
+            if self._restore(key, backtest):
+                with self._lock:
+                    self.hits += 1
+                return backtest
+            # evicted between check and restore. next round runs it, or waits for thread which does
+            logging.info('cached report of %s was evicted before restore', backtest.test_dir)
+
+        try:
+            if runner is None:
+                backtest.run(alias=alias)
+            else:
+                runner()
+            self._store(key, backtest)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(key)
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+        self.evict()
+        return backtest
+
+    def _entries(self):
+        """
+        Returns:
+          list of (accessed_at, size, entry dir) of entries on disk
+        """
+        entries = []
+        for prefix in os.listdir(self.cache_dir):
+            prefix_dir = os.path.join(self.cache_dir, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for name in os.listdir(prefix_dir):
+                if name.endswith('.tmp'):
+                    continue
+                entry_dir = os.path.join(prefix_dir, name)
+                try:
+                    entries.append((os.path.getmtime(entry_dir), _dir_size(entry_dir), entry_dir))
+                except OSError:
+                    # evicted by other process meanwhile
+                    continue
+        return entries
+
+    def _indexed_entries(self):
+        """
+        Returns:
+          list of (accessed_at, size, entry dir) from in memory index. index is built again if it is old
+        """
+        with self._index_lock:
+            now = time.time()
+            if self._index is None or now - self._scanned_at > self.rescan_interval:
+                self._index = {entry_dir: [accessed_at, size] for accessed_at, size, entry_dir in self._entries()}
+                self._scanned_at = now
+            return [(accessed_at, size, entry_dir) for entry_dir, (accessed_at, size) in self._index.items()]
+
+    def evict(self):
+        """
+        Notes:
+          remove expired entries, then least recently used ones until limits are met.
+        Returns:
+          num of removed entries
+        """
+        if self.max_entries is None and self.max_bytes is None and self.max_age is None:
+            return 0
+
+        entries = sorted(self._indexed_entries())
+        removed = []
+        now = time.time()
+        total_bytes = sum(size for _, size, _ in entries)
+
+        for accessed_at, size, entry_dir in entries:
+            n_left = len(entries) - len(removed)
+            if self.max_age is not None and now - accessed_at > self.max_age:
+                pass
+            elif self.max_entries is not None and n_left > self.max_entries:
+                pass
+            elif self.max_bytes is not None and total_bytes > self.max_bytes:
+                pass
+            else:
+                continue
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            removed.append(entry_dir)
+            total_bytes -= size
+
+        with self._index_lock:
+            for entry_dir in removed:
+                self._index.pop(entry_dir, None)
+        if removed:
+            logging.info('%d entries evicted from %s', len(removed), self.cache_dir)
+        return len(removed)
@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+"""
+catalog of symbol history files.
+history of a symbol is a csv file named SYMBOL_x_DDMMYYYY_DDMMYYYY.csv in data directory.
+file names are parsed once and re-listed only when mtime of data directory changes, and
+bars of a csv are converted once into one .npy file per column, which is memory mapped on load:
+
+  <cache_dir>/<csv name without extension>/time.npy, open.npy, ..., source
+"""
+import csv
+import datetime
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from metatrader.exception import MissingSymbolData
+
+DATA_FILE_SUFFIX = '.csv'
+DATE_FORMAT = '%d%m%Y'
+# columns of converted bars, in order of mt5 csv export. volume and spread are optional in csv
+BAR_COLUMNS = ('time', 'open', 'high', 'low', 'close', 'tick_volume', 'volume', 'spread')
+# file in converted directory which records size and mtime of csv it was converted from
+_SOURCE_FILE = 'source'
+# seconds after which mtime of data directory is trusted to be final
+_MTIME_MARGIN = 2.0
+
+
+class SymbolData(object):
+    """
+    Notes:
+      history file of a symbol. from_date and to_date are dates in file name, both inclusive
+    """
+    __slots__ = ('symbol', 'kind', 'from_date', 'to_date', 'path')
+
+    def __init__(self, symbol, kind, from_date, to_date, path):
+        self.symbol = symbol
+        self.kind = kind
+        self.from_date = from_date
+        self.to_date = to_date
+        self.path = path
+
+    def covers(self, from_date, to_date):
+        return self.from_date <= _as_date(from_date) and _as_date(to_date) <= self.to_date
+
+    def __iter__(self):
+        # unpacks like (symbol, from_date, to_date) of former list_symbols
+        return iter((self.symbol, self.from_date, self.to_date))
+
+    def __repr__(self):
+        return 'SymbolData(%s, %s..%s)' % (self.symbol, self.from_date.date(), self.to_date.date())
+
+
+def _as_date(value):
+    # date or datetime => datetime at midnight, like dates in file name
+    return datetime.datetime(value.year, value.month, value.day)
+
+
+def parse_file_name(file_name, data_dir=''):
+    """
+    Returns:
+      SymbolData of history file name, None if name does not match SYMBOL_x_DDMMYYYY_DDMMYYYY.csv
+    """
+    if not file_name.endswith(DATA_FILE_SUFFIX):
+        return None
+    parts = file_name[:-len(DATA_FILE_SUFFIX)].split('_')
+    if len(parts) != 4:
+        return None
+    symbol, kind, from_text, to_text = parts
+    try:
+        from_date, to_date = (datetime.datetime.strptime(text, DATE_FORMAT) for text in (from_text, to_text))
+    except ValueError:
+        return None
+    return SymbolData(symbol, kind, from_date, to_date, os.path.join(data_dir, file_name))
+
+
+def _sniff_delimiter(line):
+    for delimiter in ('\t', ';', ','):
+        if delimiter in line:
+            return delimiter
+    return ','
+
+
+def _to_iso(date_text, time_text):
+    return '%sT%s' % (date_text.replace('.', '-'), time_text or '00:00')
+
+
+def read_csv_bars(path):
+    """
+    Notes:
+      parse bars of csv exported by mt5 (tab separated, <DATE> <TIME> columns, utf-16 or not)
+      or imported as custom symbol (comma separated, date and time in one or two columns).
+    Returns:
+      dict of column => numpy array, columns are BAR_COLUMNS
+    """
+    import numpy as np
+
+    from metatrader.report import encoding_of_head
+
+    with open(path, 'rb') as fp:
+        encoding = encoding_of_head(fp.read(2))
+
+    times = []
+    values = []
+    with open(path, encoding=encoding, newline='') as fp:
+        first_line = fp.readline()
+        fp.seek(0)
+        for row in csv.reader(fp, delimiter=_sniff_delimiter(first_line)):
+            if not row or not row[0].strip() or not row[0].strip()[0].isdigit():
+                # header or empty line
+                continue
+            row = [cell.strip() for cell in row]
+            if ' ' in row[0]:
+                date_text, time_text = row[0].split(' ', 1)
+                numbers = row[1:]
+            else:
+                date_text, time_text = row[0], row[1]
+                numbers = row[2:]
+            if len(numbers) < 5:
+                raise ValueError('%s has too few columns: %s' % (path, row))
+            times.append(_to_iso(date_text, time_text))
+            values.append((numbers + ['0', '0'])[:7])
+
+    numbers = np.array(values, dtype='f8').reshape(-1, 7)
+    return {
+        'time': np.array(times, dtype='datetime64[s]'),
+        'open': numbers[:, 0].copy(),
+        'high': numbers[:, 1].copy(),
+        'low': numbers[:, 2].copy(),
+        'close': numbers[:, 3].copy(),
+        'tick_volume': numbers[:, 4].astype('i8'),
+        'volume': numbers[:, 5].astype('i8'),
+        'spread': numbers[:, 6].astype('i4'),
+    }
+
+
+class SymbolCatalog(object):
+    """
+    Notes:
+      index of history files in data_dir, and memory mapped bars converted from them.
+      index is built on first use and rebuilt when mtime of data_dir changes. safe to share between threads.
+    Args:
+      data_dir(string): directory of SYMBOL_x_DDMMYYYY_DDMMYYYY.csv files
+      cache_dir(string): directory of converted bars. default is <data_dir>/npy
+    """
+
+    def __init__(self, data_dir, cache_dir=None):
+        self.data_dir = data_dir
+        self.cache_dir = cache_dir or os.path.join(data_dir, 'npy')
+        self._lock = threading.Lock()
+        self._dir_mtime = None
+        # symbol => list of SymbolData sorted by from_date
+        self._index = {}
+
+    def _symbols(self):
+        dir_mtime = os.stat(self.data_dir).st_mtime_ns
+        with self._lock:
+            if dir_mtime != self._dir_mtime:
+                index = {}
+                for file_name in sorted(os.listdir(self.data_dir)):
+                    data = parse_file_name(file_name, self.data_dir)
+                    if data is not None:
+                        index.setdefault(data.symbol, []).append(data)
+                for files in index.values():
+                    files.sort(key=lambda d: (d.from_date, d.to_date))
+                self._index = index
+                # file added right after listing may keep the same mtime, so recent mtime is not trusted
+                self._dir_mtime = dir_mtime if time.time() - dir_mtime / 1e9 > _MTIME_MARGIN else None
+            return self._index
+
+    def list_symbols(self):
+        """
+        Returns:
+          list of SymbolData sorted by symbol, each unpacks into (symbol, from_date, to_date)
+        """
+        index = self._symbols()
+        return [data for symbol in sorted(index) for data in index[symbol]]
+
+    def get(self, symbol, from_date=None, to_date=None):
+        """
+        Returns:
+          SymbolData of symbol which covers from_date..to_date (any file of symbol if range is not given),
+          None if there is no such file
+        """
+        for data in self._symbols().get(symbol, ()):
+            if from_date is None or data.covers(from_date, to_date or from_date):
+                return data
+        return None
+
+    def get_symbol_dates(self, symbol):
+        """
+        Returns:
+          (from_date, to_date) of first history file of symbol, None if symbol has no file
+        """
+        data = self.get(symbol)
+        return None if data is None else (data.from_date, data.to_date)
+
+    def validate_range(self, symbol, from_date, to_date):
+        """
+        Notes:
+          check history before terminal is launched, a run without history fails only after terminal start.
+        Returns:
+          SymbolData which covers the range
+        Raises:
+          MissingSymbolData: no history file of symbol covers from_date..to_date
+        """
+        data = self.get(symbol, from_date, to_date)
+        if data is None:
+            available = [(d.from_date, d.to_date) for d in self._symbols().get(symbol, ())]
+            error = MissingSymbolData(symbol, from_date, to_date, available)
+            logging.error(str(error))
+            raise error
+        return data
+
+    def _bars_dir(self, data):
+        return os.path.join(self.cache_dir, os.path.basename(data.path)[:-len(DATA_FILE_SUFFIX)])
+
+    @staticmethod
+    def _source_stamp(data):
+        st = os.stat(data.path)
+        return '%d %d' % (st.st_size, st.st_mtime_ns)
+
+    def _is_converted(self, data):
+        try:
+            with open(os.path.join(self._bars_dir(data), _SOURCE_FILE)) as fp:
+                return fp.read() == self._source_stamp(data)
+        except OSError:
+            return False
+
+    def convert(self, data):
+        """
+        Notes:
+          convert csv of data into .npy per column, unless it is converted since csv was last modified
+        Returns:
+          directory of converted columns
+        """
+        import numpy as np
+
+        bars_dir = self._bars_dir(data)
+        if self._is_converted(data):
+            return bars_dir
+
+        stamp = self._source_stamp(data)
+        bars = read_csv_bars(data.path)
+        tmp_dir = '%s.%s.tmp' % (bars_dir, uuid.uuid4().hex[:8])
+        os.makedirs(tmp_dir)
+        for column in BAR_COLUMNS:
+            np.save(os.path.join(tmp_dir, column + '.npy'), bars[column])
+        # written last, so directory without it is never read
+        with open(os.path.join(tmp_dir, _SOURCE_FILE), 'w') as fp:
+            fp.write(stamp)
+
+        shutil.rmtree(bars_dir, ignore_errors=True)
+        try:
+            os.replace(tmp_dir, bars_dir)
+        except OSError:
+            # converted by other process meanwhile
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        logging.info('converted %d bars of %s into %s', len(bars['time']), data.path, bars_dir)
+        return bars_dir
+
+    def load_bars(self, symbol, from_date=None, to_date=None, columns=BAR_COLUMNS):
+        """
+        Notes:
+          bars of symbol as read only memory mapped arrays. csv is converted on first load.
+        Args:
+          symbol(string): symbol
+          from_date(datetime): first bar time, inclusive. None means first bar of file
+          to_date(datetime): last bar date, inclusive. None means last bar of file
+          columns(tuple): columns to load, subset of BAR_COLUMNS
+        Returns:
+          dict of column => numpy array
+        Raises:
+          MissingSymbolData: no history file of symbol covers from_date..to_date
+        """
+        import numpy as np
+
+        if from_date is None and to_date is None:
+            data = self.get(symbol)
+            if data is None:
+                raise MissingSymbolData(symbol, None, None, [])
+        else:
+            data = self.validate_range(symbol, from_date or to_date, to_date or from_date)
+
+        bars_dir = self.convert(data)
+        time_column = np.load(os.path.join(bars_dir, 'time.npy'), mmap_mode='r')
+        start, stop = 0, len(time_column)
+        if from_date is not None:
+            start = int(np.searchsorted(time_column, np.datetime64(from_date, 's'), side='left'))
+        if to_date is not None:
+            end = np.datetime64(_as_date(to_date) + datetime.timedelta(days=1), 's')
+            stop = int(np.searchsorted(time_column, end, side='left'))
+
+        bars = {}
+        for column in columns:
+            array = time_column if column == 'time' else np.load(os.path.join(bars_dir, column + '.npy'),
+                                                                 mmap_mode='r')
+            bars[column] = array[start:stop]
+        return bars
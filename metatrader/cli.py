@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+"""
+metatrader command line.
+
+  metatrader run     run one backtest
+  metatrader sweep   run param space as native optimizations
+  metatrader walkforward  optimize rolling in-sample windows and test them out-of-sample
+  metatrader parse   print backtest or optimization report
+  metatrader status  print results store summary and leaderboard
+  metatrader ingest  parse result directories into csv, sqlite or parquet
+  metatrader watch   keep top runs of a results directory which is being written
+  metatrader archive pack result directories into compressed, deduplicated archive
+
+only argparse is imported at start. each command imports what it needs,
+so parse and status don't pay for terminal, numpy or bs4 imports.
+"""
+import argparse
+import os
+import sys
+
+# env of terminal install folders separated by os.pathsep, used when --terminal is not given
+TERMINAL_ENV = 'METATRADER_TERMINAL'
+DATE_FORMATS = ('%Y.%m.%d', '%Y-%m-%d')
+
+BACKTEST_FIELDS = ('ea_name', 'param', 'symbol', 'period', 'deposit', 'from_date', 'to_date', 'model', 'spread')
+
+
+def parse_date(text):
+    import datetime
+
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, date_format)
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError('invalid date %s, use YYYY.MM.DD' % text)
+
+
+def parse_value(text):
+    """
+    Returns:
+      int or float if text is a number, otherwise text
+    """
+    for convert in (int, float):
+        try:
+            return convert(text)
+        except ValueError:
+            pass
+    return text
+
+
+def parse_param(text):
+    name, sep, value = text.partition('=')
+    if not sep or not name:
+        raise argparse.ArgumentTypeError('invalid param %s, use name=value' % text)
+    return name, parse_value(value)
+
+
+def _init_terminals(args):
+    from metatrader.mt5 import initizalize
+
+    terminals = args.terminal or [p for p in os.environ.get(TERMINAL_ENV, '').split(os.pathsep) if p]
+    if not terminals:
+        raise SystemExit('terminal install folder is required. use --terminal or %s' % TERMINAL_ENV)
+
+    if getattr(args, 'sandboxes', None):
+        from metatrader.sandbox import SandboxManager
+
+        # portable clones of the first install, one per parallel terminal
+        sandbox_dir = args.sandbox_dir or os.path.join(args.test_dir, 'sandboxes')
+        return SandboxManager(terminals[0], sandbox_dir).provision(args.sandboxes)
+
+    aliases = []
+    for i, prog_path in enumerate(terminals):
+        alias = 'terminal_%d' % i
+        initizalize(prog_path, alias=alias)
+        aliases.append(alias)
+    return aliases
+
+
+def _check_history(args):
+    if not args.data_dir:
+        return
+    from metatrader.catalog import SymbolCatalog
+    from metatrader.exception import MissingSymbolData
+
+    try:
+        SymbolCatalog(args.data_dir).validate_range(args.symbol, args.from_date, args.to_date)
+    except MissingSymbolData as e:
+        raise SystemExit(str(e))
+
+
+def _print_summary(summary):
+    width = max(len(name) for name in summary) if summary else 0
+    for name in sorted(summary):
+        print('%-*s  %s' % (width, name, summary[name]))
+
+
+def _print_passes(reports, top):
+    reports = sorted(reports, key=lambda r: -r.profit if r.profit is not None else float('inf'))
+    if top:
+        reports = reports[:top]
+    print('%12s %8s %8s %10s %10s  %s' % ('profit', 'trades', 'pf', 'dd', 'dd%', 'param'))
+    for r in reports:
+        param = ' '.join('%s=%s' % (name.strip(), value) for name, value in r.param_key)
+        print('%12s %8s %8s %10s %10s  %s' % (r.profit, r.total_trades, r.profit_factor, r.max_drawdown,
+                                               r.max_drawdown_rate, param))
+
+
+def cmd_run(args):
+    from metatrader.backtest import BackTest
+    from metatrader.report import get_report_abs_path, read_backtest_summary
+
+    _check_history(args)
+    alias = _init_terminals(args)[0]
+    os.makedirs(args.test_dir, exist_ok=True)
+
+    param = dict(args.param)
+    backtest = BackTest(args.test_dir, args.ea, {name: {'value': value} for name, value in param.items()},
+                        args.symbol, args.period, args.deposit, args.from_date, args.to_date,
+                        model=args.model, spread=args.spread, timeout=args.timeout, idle_timeout=args.idle_timeout)
+    backtest.run(alias=alias)
+    summary = read_backtest_summary(get_report_abs_path(args.test_dir))
+
+    if args.db:
+        from metatrader.store import ResultStore
+
+        with ResultStore(args.db) as store:
+            store.add(args.ea, param, args.symbol, args.period, from_date=args.from_date, to_date=args.to_date,
+                      model=args.model, spread=args.spread, deposit=args.deposit, test_dir=args.test_dir,
+                      metrics=summary)
+    _print_summary(summary)
+    return 0
+
+
+def cmd_sweep(args):
+    import json
+
+    from metatrader.sweep import run_sweep
+
+    _check_history(args)
+    alias = _init_terminals(args)[0]
+    with open(args.space) as fp:
+        param_space = json.load(fp)
+
+    reports = run_sweep(args.test_dir, args.ea, param_space, args.symbol, args.period, args.deposit,
+                        args.from_date, args.to_date, genetic=args.genetic, alias=alias, model=args.model,
+                        spread=args.spread, timeout=args.timeout, idle_timeout=args.idle_timeout)
+    for outer, report in reports:
+        print('# %s' % ' '.join('%s=%s' % item for item in sorted(outer.items())))
+        _print_passes(report.results, args.top)
+    return 0
+
+
+def cmd_walkforward(args):
+    import json
+
+    from metatrader.pool import BacktestPool
+    from metatrader.walkforward import walk_forward
+
+    _check_history(args)
+    aliases = _init_terminals(args)
+    with open(args.space) as fp:
+        param_space = json.load(fp)
+
+    with BacktestPool(aliases) as pool:
+        report = walk_forward(pool, args.test_dir, args.ea, param_space, args.symbol, args.period, args.deposit,
+                              args.from_date, args.to_date, args.windows, in_sample_ratio=args.in_sample_ratio,
+                              anchored=args.anchored, metric=args.metric, genetic=args.genetic, model=args.model,
+                              spread=args.spread, timeout=args.timeout, idle_timeout=args.idle_timeout)
+    if args.report:
+        report.write(args.report)
+
+    for w in report.windows:
+        window = w.window
+        result = w.error or '%s  %s' % (w.out_of_sample.get('profit'),
+                                        ' '.join('%s=%s' % item for item in sorted(w.param.items())))
+        print('%d  %s..%s  %s' % (window.index, window.out_from.date(), window.out_to.date(), result))
+    print('profit: %s trades: %d efficiency: %s' % (report.profit, report.total_trades, report.efficiency))
+    return 0
+
+
+def _is_optimization_report(report_file):
+    if report_file.endswith('.xml'):
+        # only optimization is exported as xml spreadsheet
+        return True
+    # title comes in the first lines of report, report of mt5 is utf-16
+    with open(report_file, 'rb') as fp:
+        head = fp.read(4096)
+    return b'Optimization Report' in head or 'Optimization Report'.encode('utf-16-le') in head
+
+
+def cmd_parse(args):
+    if not _is_optimization_report(args.report):
+        from metatrader.report import read_backtest_summary
+
+        summary = read_backtest_summary(args.report)
+        if args.json:
+            import json
+            print(json.dumps(summary, sort_keys=True))
+        else:
+            _print_summary(summary)
+        return 0
+
+    from metatrader.report import iter_optimization_results
+
+    # report file alone does not tell backtest input
+    backtest = argparse.Namespace(**dict.fromkeys(BACKTEST_FIELDS))
+    reports = iter_optimization_results(backtest, args.report)
+    if args.json:
+        import json
+        for r in reports:
+            print(json.dumps({'param': {name.strip(): value for name, value in r.param_key},
+                              'profit': r.profit, 'total_trades': r.total_trades,
+                              'profit_factor': r.profit_factor, 'expected_payoff': r.expected_payoff,
+                              'max_drawdown': r.max_drawdown, 'max_drawdown_rate': r.max_drawdown_rate},
+                             sort_keys=True))
+    else:
+        _print_passes(reports, args.top)
+    return 0
+
+
+def cmd_status(args):
+    from metatrader.store import ResultStore
+
+    if not os.path.exists(args.db):
+        print('%s does not exist' % args.db, file=sys.stderr)
+        return 1
+
+    with ResultStore(args.db) as store:
+        print('runs: %d' % store.count())
+        rows = store.leaderboard(args.metric, strategy=args.strategy, symbol=args.symbol, timeframe=args.period,
+                                 limit=args.limit)
+    for row in rows:
+        print('%12s  %s %s %s %s' % (row[args.metric], row['strategy'], row['symbol'], row['timeframe'],
+                                     ' '.join('%s=%s' % item for item in sorted(row['params'].items()))))
+    return 0
+
+
+def cmd_ingest(args):
+    from metatrader.ingest import ingest
+
+    def progress(n_done, n_total):
+        print('\r%d / %d' % (n_done, n_total), end='', file=sys.stderr, flush=True)
+
+    n_parsed, n_failed = ingest(args.root, args.output, workers=args.workers, chunk_size=args.chunk_size,
+                                progress=None if args.quiet else progress)
+    if not args.quiet:
+        print(file=sys.stderr)
+    print('parsed: %d failed: %d' % (n_parsed, n_failed))
+    return 0
+
+
+def cmd_watch(args):
+    from metatrader.leaderboard import Leaderboard, ResultWatcher
+
+    leaderboard = Leaderboard(k=args.k, metric=args.metric, descending=not args.ascending)
+    watcher = ResultWatcher(args.result_dir, leaderboard)
+    try:
+        watcher.watch(interval=args.interval, snapshot_path=args.snapshot, snapshot_interval=args.snapshot_interval,
+                      max_polls=args.max_polls)
+    except KeyboardInterrupt:
+        if args.snapshot:
+            leaderboard.write_snapshot(args.snapshot)
+
+    for strategy, symbol, timeframe in leaderboard.groups():
+        print('# %s %s %s' % (strategy, symbol, timeframe))
+        for record in leaderboard.top(strategy, symbol, timeframe):
+            print('%12s  %s' % (record[args.metric], record['params']))
+    return 0
+
+
+def cmd_archive(args):
+    from metatrader.archive import Archive, parse_size
+
+    with Archive(args.archive, codec=args.codec) as archive:
+        if args.result_dir:
+            sweep = args.sweep or os.path.basename(os.path.normpath(args.result_dir))
+            n_runs = archive.add_sweep(sweep, args.result_dir, remove=args.remove)
+            print('archived %d runs into sweep %s' % (n_runs, sweep))
+        if args.quota:
+            for sweep in archive.enforce_quota(parse_size(args.quota), keep=args.keep):
+                print('deleted sweep %s' % sweep)
+        stored, original = archive.disk_usage()
+        print('stored: %d bytes, original: %d bytes, sweeps: %d' % (stored, original, len(archive.sweeps())))
+    return 0
+
+
+def _add_backtest_arguments(parser):
+    parser.add_argument('--terminal', action='append', help='terminal install folder. default is $%s' % TERMINAL_ENV)
+    parser.add_argument('--ea', required=True, help='ea name. e.g.: Advisors\\ExpertMACD')
+    parser.add_argument('--symbol', required=True)
+    parser.add_argument('--period', required=True, help='timeframe. e.g.: H1')
+    parser.add_argument('--from', dest='from_date', type=parse_date, required=True)
+    parser.add_argument('--to', dest='to_date', type=parse_date, required=True)
+    parser.add_argument('--deposit', type=int, default=10000)
+    parser.add_argument('--model', type=int, default=1)
+    parser.add_argument('--spread', type=int, default=5)
+    parser.add_argument('--test-dir', default='.', help='directory which report is moved into')
+    parser.add_argument('--timeout', type=float, help='seconds after which terminal is killed')
+    parser.add_argument('--idle-timeout', type=float, help='seconds without terminal log activity before kill')
+    parser.add_argument('--sandboxes', type=int, help='run on n portable clones of the first terminal')
+    parser.add_argument('--sandbox-dir', help='directory of clones. default is <test dir>/sandboxes')
+    parser.add_argument('--data-dir', help='symbol history csv directory. range is checked before terminal start')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='metatrader', description='backtest and optimize MetaTrader experts')
+    parser.add_argument('--events', help='json lines file which timing of each phase is appended to')
+    parser.add_argument('--metrics', help='prometheus textfile which phase durations are written into')
+    parser.add_argument('--profile', help='directory which cProfile stats of python phases are written into')
+    commands = parser.add_subparsers(dest='command')
+
+    run = commands.add_parser('run', help='run one backtest')
+    _add_backtest_arguments(run)
+    run.add_argument('--param', action='append', type=parse_param, default=[], help='ea input. e.g.: InpLots=0.1')
+    run.add_argument('--db', help='results store to record the run into')
+    run.set_defaults(func=cmd_run)
+
+    sweep = commands.add_parser('sweep', help='run param space as native optimizations')
+    _add_backtest_arguments(sweep)
+    sweep.add_argument('--space', required=True, help='json file of param space, see metatrader.sweep')
+    sweep.add_argument('--genetic', action='store_true', help='use genetic algorithm')
+    sweep.add_argument('--top', type=int, default=10, help='num of passes printed per optimization')
+    sweep.set_defaults(func=cmd_sweep)
+
+    walkforward = commands.add_parser('walkforward',
+                                      help='optimize rolling in-sample windows and test them out-of-sample')
+    _add_backtest_arguments(walkforward)
+    walkforward.add_argument('--space', required=True, help='json file of param space, see metatrader.sweep')
+    walkforward.add_argument('--windows', type=int, default=4, help='num of windows')
+    walkforward.add_argument('--in-sample-ratio', type=float, default=0.75, help='in-sample part of each window')
+    walkforward.add_argument('--anchored', action='store_true', help='every in-sample segment starts at --from')
+    walkforward.add_argument('--metric', default='profit', help='metric which selects the best in-sample pass')
+    walkforward.add_argument('--genetic', action='store_true', help='use genetic algorithm')
+    walkforward.add_argument('--report', help='json file which stitched report is written into')
+    walkforward.set_defaults(func=cmd_walkforward)
+
+    parse = commands.add_parser('parse', help='print backtest or optimization report')
+    parse.add_argument('report', help='report.htm')
+    parse.add_argument('--json', action='store_true', help='print json lines')
+    parse.add_argument('--top', type=int, default=0, help='num of passes printed. 0 means all')
+    parse.set_defaults(func=cmd_parse)
+
+    status = commands.add_parser('status', help='print results store summary and leaderboard')
+    status.add_argument('--db', required=True, help='results store')
+    status.add_argument('--metric', default='profit')
+    status.add_argument('--limit', type=int, default=10)
+    status.add_argument('--strategy')
+    status.add_argument('--symbol')
+    status.add_argument('--period')
+    status.set_defaults(func=cmd_status)
+
+    ingest = commands.add_parser('ingest', help='parse result directories into csv, sqlite or parquet')
+    ingest.add_argument('root', help='directory to search result directories in')
+    ingest.add_argument('--output', required=True, help='.csv, .sqlite or .parquet file')
+    ingest.add_argument('--workers', type=int, help='num of processes. default is num of cpus, 0 means no pool')
+    ingest.add_argument('--chunk-size', type=int, default=64, help='num of directories per task')
+    ingest.add_argument('--quiet', action='store_true', help='no progress')
+    ingest.set_defaults(func=cmd_ingest)
+
+    archive = commands.add_parser('archive', help='pack result directories into compressed, deduplicated archive')
+    archive.add_argument('result_dir', nargs='?', help='directory of run directories to archive')
+    archive.add_argument('--archive', required=True, help='archive directory')
+    archive.add_argument('--sweep', help='name of sweep. default is name of result_dir')
+    archive.add_argument('--codec', choices=('gzip', 'zstd'), help='default is zstd if zstandard is installed')
+    archive.add_argument('--remove', action='store_true', help='delete run directories after they are archived')
+    archive.add_argument('--quota', help='delete oldest sweeps until archive fits. e.g.: 20G')
+    archive.add_argument('--keep', type=int, default=1, help='num of newest sweeps which quota never deletes')
+    archive.set_defaults(func=cmd_archive)
+
+    watch = commands.add_parser('watch', help='keep top runs of a results directory which is being written')
+    watch.add_argument('result_dir')
+    watch.add_argument('--snapshot', help='json file which top runs are written into')
+    watch.add_argument('--metric', default='profit')
+    watch.add_argument('--ascending', action='store_true', help='smaller metric is better')
+    watch.add_argument('--k', type=int, default=10, help='num of runs kept per strategy, symbol and timeframe')
+    watch.add_argument('--interval', type=float, default=10.0, help='seconds between polls')
+    watch.add_argument('--snapshot-interval', type=float, default=60.0, help='min seconds between snapshots')
+    watch.add_argument('--max-polls', type=int, help='stop after this num of polls')
+    watch.set_defaults(func=cmd_watch)
+    return parser
+
+
+def _start_instrument(args):
+    """
+    Returns:
+      list of functions to call when command ends
+    """
+    if not (args.events or args.metrics or args.profile):
+        return []
+    from metatrader import instrument
+
+    finalizers = []
+    if args.events:
+        finalizers.append(instrument.add_hook(instrument.JsonLinesSink(args.events)).close)
+    if args.metrics:
+        finalizers.append(instrument.add_hook(instrument.PrometheusTextfileExporter(args.metrics)).close)
+    if args.profile:
+        profiler = instrument.Profiler()
+        instrument.set_profiler(profiler)
+        finalizers.append(lambda: profiler.dump(args.profile))
+    return finalizers
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 2
+
+    finalizers = _start_instrument(args)
+    try:
+        return args.func(args)
+    finally:
+        for finalize in finalizers:
+            finalize()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+deals table of mt5 backtest report as typed numpy columns.
+"""
+import logging
+import re
+
+import numpy as np
+
+from metatrader.exception import InvalidReportFormat
+from metatrader.report import sniff_report_encoding
+
+# same order as ENUM_DEAL_TYPE of mql5, code is index
+DEAL_TYPES = ('buy', 'sell', 'balance', 'credit', 'charge', 'correction', 'bonus', 'commission',
+              'commission daily', 'commission monthly', 'commission agent daily', 'commission agent monthly',
+              'interest', 'buy canceled', 'sell canceled')
+# same order as ENUM_DEAL_ENTRY of mql5, code is index
+DEAL_DIRECTIONS = ('in', 'out', 'in/out', 'out by')
+# code of type or direction which is empty or unknown
+MISSING_CODE = -1
+
+DEAL_DTYPE = np.dtype([
+    ('time', 'datetime64[s]'),
+    ('deal', 'i8'),
+    ('type', 'i1'),
+    ('direction', 'i1'),
+    ('volume', 'f8'),
+    ('price', 'f8'),
+    ('commission', 'f8'),
+    ('swap', 'f8'),
+    ('profit', 'f8'),
+    ('balance', 'f8'),
+])
+
+# header text in report => column
+_HEADER_COLUMNS = {
+    'Time': 'time',
+    'Deal': 'deal',
+    'Type': 'type',
+    'Direction': 'direction',
+    'Volume': 'volume',
+    'Price': 'price',
+    'Commission': 'commission',
+    'Swap': 'swap',
+    'Profit': 'profit',
+    'Balance': 'balance',
+}
+_TYPE_CODES = {name: code for code, name in enumerate(DEAL_TYPES)}
+_DIRECTION_CODES = {name: code for code, name in enumerate(DEAL_DIRECTIONS)}
+
+_DEALS_TITLE_RE = re.compile(r'<b>Deals</b>')
+_ROW_RE = re.compile(r'<tr[^>]*>(.*?)</tr>', re.S)
+_CELL_RE = re.compile(r'<td[^>]*>(.*?)</td>', re.S)
+_TAG_RE = re.compile(r'<[^>]+>')
+_DATE_RE = re.compile(r'\d{4}\.\d{2}\.\d{2}')
+
+
+def _cells(row):
+    return [_TAG_RE.sub('', cell).strip() for cell in _CELL_RE.findall(row)]
+
+
+def _to_float(text):
+    # thousands are separated by space. e.g.: 10 000.00
+    text = text.replace(' ', '').replace('\xa0', '')
+    return float(text) if text else np.nan
+
+
+def parse_deals(text):
+    """
+    Notes:
+      extract deals table from html of mt5 backtest report.
+      type and direction are codes into DEAL_TYPES and DEAL_DIRECTIONS. empty numbers are nan.
+    Args:
+      text(string): decoded html of report
+    Returns:
+      numpy.ndarray: structured array with DEAL_DTYPE, one row per deal
+    Raises:
+      InvalidReportFormat: deals table is not found
+    """
+    title = _DEALS_TITLE_RE.search(text)
+    if title is None:
+        raise InvalidReportFormat('report', 'Deals')
+
+    columns = None
+    values = {name: [] for name in DEAL_DTYPE.names}
+    for row in _ROW_RE.finditer(text, title.end()):
+        cells = _cells(row.group(1))
+        if columns is None:
+            columns = [(i, _HEADER_COLUMNS[cell]) for i, cell in enumerate(cells) if cell in _HEADER_COLUMNS]
+            if len(columns) != len(_HEADER_COLUMNS):
+                raise InvalidReportFormat('report', 'header of deals table')
+            continue
+        if not cells or not _DATE_RE.match(cells[0]):
+            # row of totals follows last deal
+            break
+
+        for i, name in columns:
+            cell = cells[i]
+            if name == 'time':
+                values[name].append(cell.replace('.', '-').replace(' ', 'T'))
+            elif name == 'deal':
+                values[name].append(int(cell))
+            elif name == 'type':
+                values[name].append(_TYPE_CODES.get(cell, MISSING_CODE))
+            elif name == 'direction':
+                values[name].append(_DIRECTION_CODES.get(cell, MISSING_CODE))
+            else:
+                values[name].append(_to_float(cell))
+
+    deals = np.empty(len(values['time']), dtype=DEAL_DTYPE)
+    for name in DEAL_DTYPE.names:
+        deals[name] = np.array(values[name], dtype=DEAL_DTYPE[name])
+    return deals
+
+
+def read_deals(report_file):
+    """
+    Notes:
+      read deals table of mt5 backtest report. e.g.: <test_dir>\\report\\report.htm
+    Returns:
+      numpy.ndarray: structured array with DEAL_DTYPE
+    Raises:
+      InvalidReportFormat: deals table is not found
+    """
+    with open(report_file, 'r', encoding=sniff_report_encoding(report_file)) as fp:
+        text = fp.read()
+
+    try:
+        return parse_deals(text)
+    except InvalidReportFormat as e:
+        e.report_file = report_file
+        logging.error(str(e))
+        raise
@@ -1,11 +1,10 @@
 import os
 import shutil
-from datetime import datetime
-
-from sklearn.model_selection import ParameterGrid
 
 from metatrader.backtest import BackTest
+from metatrader.catalog import SymbolCatalog
 from metatrader.mt5 import initizalize
+from metatrader.sampling import ParameterGrid
 
 CONF_FILE_PATH = 'D:\\metatrader\config.ini'
 PARAM_FILE_PATH = 'D:\\metatrader\param.set'
@@ -21,17 +20,9 @@ def prepare_dir(prefix, name):
 
 
 def list_symbols():
-    def parse_darte(date_str):
-        return datetime.strptime(date_str, '%d%m%Y')
-
-    for file in os.listdir(DATA_DIR):
-        if file.endswith('.csv'):
-            file = file.split('.')[0]
-            symbol, _, start_date, end_date = file.split('_')
-            start_date, end_date = map(parse_darte, (start_date, end_date))
-
-            if 'CND' in symbol:
-                yield symbol, start_date, end_date
+    for symbol, start_date, end_date in SymbolCatalog(DATA_DIR).list_symbols():
+        if 'CND' in symbol:
+            yield symbol, start_date, end_date
 
 
 def main():
@@ -19,3 +19,50 @@ class InvalidReportFormat(Exception):
 
     def __str__(self):
         return '%s seems invalid format. %s not found' % (self.report_file, self.err_msg)
+
+
+class TerminalError(RuntimeError):
+    '''
+    exception when terminal exits with non zero code.
+    RuntimeError for compatibility with callers of former versions.
+    '''
+    # crash of terminal is often transient, so run can be retried
+    retryable = True
+
+    def __init__(self, cmd, returncode, err_msg=None):
+        self.cmd = cmd
+        self.returncode = returncode
+        self.err_msg = err_msg or 'run mt4 with cmd[%s] failed!!' % (cmd,)
+        super(TerminalError, self).__init__(self.err_msg)
+
+    def __str__(self):
+        return self.err_msg
+
+
+class TerminalTimeout(TerminalError):
+    '''
+    exception when terminal is killed by watchdog.
+    reason is 'timeout' if run took too long, 'idle' if terminal stopped writing logs.
+    '''
+
+    def __init__(self, cmd, reason, seconds):
+        self.reason = reason
+        self.seconds = seconds
+        err_msg = 'terminal cmd[%s] killed after %s seconds of %s' % (cmd, seconds, reason)
+        super(TerminalTimeout, self).__init__(cmd, None, err_msg)
+
+
+class MissingSymbolData(ValueError):
+    '''
+    exception when no history file of symbol covers requested dates.
+    ValueError, so run is never retried.
+    '''
+
+    def __init__(self, symbol, from_date, to_date, available):
+        self.symbol = symbol
+        self.from_date = from_date
+        self.to_date = to_date
+        self.available = available
+        ranges = ', '.join('%s..%s' % (d1.date(), d2.date()) for d1, d2 in available) or 'none'
+        dates = ' for %s..%s' % (from_date, to_date) if from_date is not None else ''
+        super(MissingSymbolData, self).__init__('no history of %s%s. available: %s' % (symbol, dates, ranges))
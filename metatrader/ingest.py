@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+bulk ingestion of result directories.
+reports are parsed by a process pool in chunks and compact records are streamed into one output
+(csv, sqlite results store or parquet), so tens of thousands of reports use every core.
+"""
+import csv
+import json
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from metatrader.exception import InvalidReportFormat
+from metatrader.report import get_report_abs_path, read_backtest_summary
+from metatrader.store import METRIC_NAMES, RUN_COLUMNS, ResultStore, dump_params, make_dir_run_key
+
+KEY_FIELDS = ('test_dir', 'strategy', 'params', 'symbol', 'timeframe') + RUN_COLUMNS + ('error',)
+# record is a tuple of these fields. params is canonical json, dates are iso format,
+# error is None if report was parsed
+RECORD_FIELDS = KEY_FIELDS + METRIC_NAMES
+
+
+def find_report_dirs(root):
+    """
+    Notes:
+      find directories under root which have report/report.htm written by BackTest.move_and_fix_report
+    Returns:
+      generator of test_dir, sorted within each directory
+    """
+    for dir_path, dir_names, file_names in os.walk(root):
+        if os.path.exists(get_report_abs_path(dir_path)):
+            yield dir_path
+            # report directory of a run does not contain other runs
+            dir_names[:] = []
+        else:
+            dir_names.sort()
+
+
+def read_record(test_dir):
+    """
+    Notes:
+      parse one result directory. conf.json (see strategy_testing.save_conf) is optional.
+    Returns:
+      tuple of RECORD_FIELDS. metrics are None and error is set if report is missing or invalid,
+      or conf.json is unreadable, so one broken directory does not stop ingestion
+    """
+    conf = {}
+    error = None
+    summary = {}
+    try:
+        conf_path = os.path.join(test_dir, 'conf.json')
+        if os.path.exists(conf_path):
+            with open(conf_path) as f:
+                conf = json.load(f)
+        summary = read_backtest_summary(get_report_abs_path(test_dir))
+    except (InvalidReportFormat, ValueError, IndexError, OSError) as e:
+        error = str(e) or type(e).__name__
+
+    key = (test_dir, conf.get('strategy'), dump_params(conf.get('params', {})), conf.get('symbol'),
+           conf.get('timeframe')) + tuple(conf.get(name) for name in RUN_COLUMNS) + (error,)
+    return key + tuple(summary.get(name) for name in METRIC_NAMES)
+
+
+def read_records(test_dirs):
+    """
+    Notes:
+      parse chunk of result directories in worker process
+    """
+    return [read_record(test_dir) for test_dir in test_dirs]
+
+
+def _chunks(items, chunk_size):
+    for i in range(0, len(items), chunk_size):
+        yield items[i:i + chunk_size]
+
+
+def iter_records(test_dirs, workers=None, chunk_size=64):
+    """
+    Notes:
+      parse result directories in parallel and yield records as chunks complete.
+      at most 2 chunks per worker are in flight, so memory does not grow with num of directories.
+    Args:
+      test_dirs(list): result directories
+      workers(int): num of processes. None means num of cpus, 0 parses in this process
+      chunk_size(int): num of directories sent to a worker at once
+    Returns:
+      generator of record tuples, see RECORD_FIELDS
+    """
+    test_dirs = list(test_dirs)
+    if workers == 0:
+        for chunk in _chunks(test_dirs, chunk_size):
+            for record in read_records(chunk):
+                yield record
+        return
+
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = 2 * workers
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunks = _chunks(test_dirs, chunk_size)
+        in_flight = set()
+        while True:
+            for chunk in chunks:
+                in_flight.add(executor.submit(read_records, chunk))
+                if len(in_flight) >= max_in_flight:
+                    break
+            if not in_flight:
+                break
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                for record in future.result():
+                    yield record
+
+
+class CsvWriter(object):
+    """
+    Notes:
+      write records into csv with header of RECORD_FIELDS
+    """
+
+    def __init__(self, path):
+        self._fp = open(path, 'w', newline='')
+        self._writer = csv.writer(self._fp)
+        self._writer.writerow(RECORD_FIELDS)
+
+    def write(self, record):
+        self._writer.writerow(['' if value is None else value for value in record])
+
+    def close(self):
+        self._fp.close()
+
+
+class StoreWriter(object):
+    """
+    Notes:
+      write records into ResultStore. failed reports are recorded with error and without metrics,
+      so they count as tested. records without conf.json are keyed by their directory, see make_dir_run_key
+    """
+
+    def __init__(self, path):
+        self._store = ResultStore(path)
+
+    def write(self, record):
+        values = dict(zip(RECORD_FIELDS, record))
+        metrics = None if values['error'] else {name: values[name] for name in METRIC_NAMES}
+        run_key = make_dir_run_key(values['test_dir']) if values['strategy'] is None else None
+        self._store.add(values['strategy'] or '', json.loads(values['params']), values['symbol'] or '',
+                        values['timeframe'] or '', test_dir=values['test_dir'], metrics=metrics, error=values['error'],
+                        run_key=run_key, **{name: values[name] for name in RUN_COLUMNS})
+
+    def close(self):
+        self._store.close()
+
+
+class ParquetWriter(object):
+    """
+    Notes:
+      write records into parquet file in row groups of batch_size. needs pyarrow.
+    """
+
+    def __init__(self, path, batch_size=10000):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        # model, spread and deposit are numbers, other key fields are strings
+        key_types = {'model': pa.int64(), 'spread': pa.int64(), 'deposit': pa.float64()}
+        fields = [pa.field(name, key_types.get(name, pa.string())) for name in KEY_FIELDS]
+        fields.extend(pa.field(name, pa.float64()) for name in METRIC_NAMES)
+        self._schema = pa.schema(fields)
+        self._writer = pq.ParquetWriter(path, self._schema)
+        self._batch_size = batch_size
+        self._pending = []
+
+    def write(self, record):
+        self._pending.append(record)
+        if len(self._pending) >= self._batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        columns = [self._pa.array(list(column), type=field.type)
+                   for column, field in zip(zip(*self._pending), self._schema)]
+        self._writer.write_table(self._pa.Table.from_arrays(columns, schema=self._schema))
+        self._pending = []
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+
+
+# extension of output => writer
+WRITERS = {
+    '.csv': CsvWriter,
+    '.sqlite': StoreWriter,
+    '.db': StoreWriter,
+    '.parquet': ParquetWriter,
+}
+
+
+def open_writer(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in WRITERS:
+        raise ValueError('unknown output format %s. use one of %s' % (ext, ', '.join(sorted(WRITERS))))
+    return WRITERS[ext](path)
+
+
+def ingest(root, output, workers=None, chunk_size=64, progress=None):
+    """
+    Notes:
+      parse every result directory under root into output.
+      invalid reports don't stop ingestion, they are logged and written with error.
+    Args:
+      root(string): directory to search result directories in
+      output(string): .csv, .sqlite (ResultStore) or .parquet file
+      workers(int): num of processes, see iter_records
+      chunk_size(int): num of directories per task
+      progress(callable): called with (num of done, num of all) after each chunk
+    Returns:
+      (num of parsed, num of failed)
+    """
+    test_dirs = list(find_report_dirs(root))
+    n_total = len(test_dirs)
+    n_done, n_failed = 0, 0
+    error_index = RECORD_FIELDS.index('error')
+
+    writer = open_writer(output)
+    try:
+        for record in iter_records(test_dirs, workers=workers, chunk_size=chunk_size):
+            writer.write(record)
+            n_done += 1
+            if record[error_index]:
+                n_failed += 1
+                logging.warning('%s: %s', record[0], record[error_index])
+            if progress is not None and (n_done % chunk_size == 0 or n_done == n_total):
+                progress(n_done, n_total)
+    finally:
+        writer.close()
+
+    return n_done - n_failed, n_failed
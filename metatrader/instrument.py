@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+timing spans of backtest phases.
+each phase (config and param files, terminal run, moving report, parsing) is wrapped in a span,
+finished spans are passed to hooks. included hooks:
+  JsonLinesSink               one json event per span
+  PrometheusTextfileExporter  counters and histograms for node_exporter textfile collector
+  Profiler                    opt-in cProfile of python side spans
+without hooks a span costs two perf_counter calls.
+"""
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+# names of spans
+SPAN_RUN = 'backtest.run'
+SPAN_OPTIMIZE = 'backtest.optimize'
+SPAN_CREATE_CONF = 'backtest.create_conf'
+SPAN_CREATE_PARAM = 'backtest.create_param'
+SPAN_COPY_PARAM = 'backtest.copy_param'
+SPAN_TERMINAL = 'terminal.run'
+SPAN_MOVE_REPORT = 'backtest.move_report'
+SPAN_PARSE_BACKTEST = 'report.parse_backtest'
+SPAN_PARSE_OPTIMIZATION = 'report.parse_optimization'
+
+# spans of python work, which are profiled by default
+PYTHON_SPANS = (SPAN_CREATE_CONF, SPAN_CREATE_PARAM, SPAN_COPY_PARAM, SPAN_MOVE_REPORT, SPAN_PARSE_BACKTEST,
+                SPAN_PARSE_OPTIMIZATION)
+
+_hooks = []
+_profiler = None
+
+
+def add_hook(hook):
+    """
+    Notes:
+      register hook which is called with event dict of every finished span:
+        name, start (epoch seconds), duration (seconds), thread, error (type name or None) and labels
+    """
+    _hooks.append(hook)
+    return hook
+
+
+def remove_hook(hook):
+    _hooks.remove(hook)
+
+
+def clear_hooks():
+    del _hooks[:]
+
+
+def set_profiler(profiler):
+    """
+    Notes:
+      profile spans with profiler. None disables profiling
+    """
+    global _profiler
+    _profiler = profiler
+
+
+@contextlib.contextmanager
+def span(name, **labels):
+    """
+    Notes:
+      time the block. e.g.:
+        with span(SPAN_TERMINAL, alias=alias):
+            ...
+    Args:
+      name(string): span name
+      labels: values added to event. e.g.: alias, job_id
+    """
+    if not _hooks and _profiler is None:
+        yield
+        return
+
+    profiler = _profiler
+    profile = None
+    if profiler is not None:
+        try:
+            profile = profiler.start(name)
+        except Exception:
+            logging.exception('profiler failed to start span %s', name)
+    error = None
+    start = time.time()
+    counter = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - counter
+        if profile is not None:
+            try:
+                profiler.stop(name, profile)
+            except Exception:
+                logging.exception('profiler failed to stop span %s', name)
+        if _hooks:
+            event = {'name': name, 'start': start, 'duration': duration,
+                     'thread': threading.current_thread().name, 'error': error}
+            event.update(labels)
+            for hook in list(_hooks):
+                try:
+                    hook(event)
+                except Exception:
+                    logging.exception('instrument hook %r failed', hook)
+
+
+class JsonLinesSink(object):
+    """
+    Notes:
+      append event of each span to file as a json line. safe to share between threads.
+    Args:
+      path(string): file path
+      flush_every(int): num of events buffered before write
+    """
+
+    def __init__(self, path, flush_every=100):
+        self.path = path
+        self.flush_every = flush_every
+        self._lines = []
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        line = json.dumps(event, sort_keys=True, default=str)
+        with self._lock:
+            self._lines.append(line)
+            if len(self._lines) >= self.flush_every:
+                self._write()
+
+    def _write(self):
+        if not self._lines:
+            return
+        with open(self.path, 'a') as fp:
+            fp.write('\n'.join(self._lines) + '\n')
+        self._lines = []
+
+    def flush(self):
+        with self._lock:
+            self._write()
+
+    close = flush
+
+
+# upper bounds in seconds of histogram buckets, from config file writes to long terminal runs
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 1800, 3600, 4 * 3600)
+
+
+class PrometheusTextfileExporter(object):
+    """
+    Notes:
+      aggregate spans into prometheus histogram per span name and write them in text exposition format,
+      for node_exporter textfile collector. dashboards get throughput from rate of _count,
+      p50/p95 from histogram_quantile and overhead share from sums of python spans over sum of runs.
+    Args:
+      path(string): .prom file path
+      prefix(string): metric name prefix
+      buckets(tuple): upper bounds of buckets in seconds
+      write_interval(float): min seconds between writes triggered by events. None writes only by write()
+    """
+
+    def __init__(self, path, prefix='metatrader', buckets=DEFAULT_BUCKETS, write_interval=15.0):
+        self.path = path
+        self.prefix = prefix
+        self.buckets = tuple(sorted(buckets))
+        self.write_interval = write_interval
+        self._lock = threading.Lock()
+        # name => [bucket counts..., count, sum]
+        self._histograms = {}
+        # name => num of failed spans
+        self._errors = {}
+        self._last_write = time.time()
+
+    def __call__(self, event):
+        name, duration = event['name'], event['duration']
+        with self._lock:
+            values = self._histograms.get(name)
+            if values is None:
+                values = self._histograms[name] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if duration <= bound:
+                    values[i] += 1
+            values[-2] += 1
+            values[-1] += duration
+            if event.get('error'):
+                self._errors[name] = self._errors.get(name, 0) + 1
+
+            should_write = self.write_interval is not None and time.time() - self._last_write >= self.write_interval
+        if should_write:
+            self.write()
+
+    def render(self):
+        """
+        Returns:
+          metrics in prometheus text format
+        """
+        metric = '%s_span_duration_seconds' % self.prefix
+        errors = '%s_span_errors_total' % self.prefix
+        lines = ['# HELP %s duration of backtest phases' % metric, '# TYPE %s histogram' % metric]
+        with self._lock:
+            for name in sorted(self._histograms):
+                values = self._histograms[name]
+                for bound, count in zip(self.buckets, values):
+                    lines.append('%s_bucket{span="%s",le="%r"} %d' % (metric, name, float(bound), count))
+                lines.append('%s_bucket{span="%s",le="+Inf"} %d' % (metric, name, values[-2]))
+                lines.append('%s_count{span="%s"} %d' % (metric, name, values[-2]))
+                lines.append('%s_sum{span="%s"} %r' % (metric, name, values[-1]))
+            lines.extend(['# HELP %s spans which raised' % errors, '# TYPE %s counter' % errors])
+            for name in sorted(self._errors):
+                lines.append('%s{span="%s"} %d' % (errors, name, self._errors[name]))
+        return '\n'.join(lines) + '\n'
+
+    def write(self):
+        """
+        Notes:
+          write metrics into path atomically, textfile collector never reads a partial file
+        """
+        text = self.render()
+        tmp_path = '%s.%d.tmp' % (self.path, os.getpid())
+        with open(tmp_path, 'w') as fp:
+            fp.write(text)
+        os.replace(tmp_path, self.path)
+        self._last_write = time.time()
+
+    close = write
+
+
+class Profiler(object):
+    """
+    Notes:
+      cProfile of spans whose name is in names. set by set_profiler.
+      one span of the process is profiled at once, spans which start meanwhile (nested or in other threads)
+      are not profiled, because python 3.12+ allows only one active profiler per process.
+    Args:
+      names(tuple): span names to profile
+    """
+
+    def __init__(self, names=PYTHON_SPANS):
+        self.names = frozenset(names)
+        # held while a span is profiled
+        self._active = threading.Lock()
+        self._lock = threading.Lock()
+        # name => list of cProfile.Profile
+        self._profiles = {}
+
+    def start(self, name):
+        if name not in self.names or not self._active.acquire(blocking=False):
+            return None
+        import cProfile
+
+        try:
+            profile = cProfile.Profile()
+            profile.enable()
+        except BaseException:
+            self._active.release()
+            raise
+        return profile
+
+    def stop(self, name, profile):
+        try:
+            profile.disable()
+        finally:
+            self._active.release()
+        with self._lock:
+            self._profiles.setdefault(name, []).append(profile)
+
+    def stats(self, name):
+        """
+        Returns:
+          pstats.Stats of all profiled spans of name, None if none was profiled
+        """
+        import pstats
+
+        with self._lock:
+            profiles = list(self._profiles.get(name, []))
+        if not profiles:
+            return None
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        return stats
+
+    def dump(self, output_dir):
+        """
+        Notes:
+          write <span name>.prof per span name, readable by pstats or snakeviz
+        Returns:
+          list of written paths
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        paths = []
+        for name in sorted(self._profiles):
+            path = os.path.join(output_dir, '%s.prof' % name)
+            self.stats(name).dump_stats(path)
+            paths.append(path)
+        return paths
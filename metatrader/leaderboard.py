@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+live leaderboard of a results directory which is still being written.
+watcher polls for newly completed runs and parses only those, leaderboard keeps top k per
+strategy, symbol and timeframe in heaps, so each update costs O(new runs * log k).
+"""
+import heapq
+import itertools
+import json
+import logging
+import os
+import time
+
+from metatrader.ingest import RECORD_FIELDS, read_record
+from metatrader.store import METRIC_NAMES
+
+# file written last into a run directory by strategy_testing.record_result
+COMPLETION_FILE = 'conf.json'
+# seconds after which mtime of results directory is trusted to be final
+_MTIME_MARGIN = 2.0
+
+
+class Leaderboard(object):
+    """
+    Notes:
+      running top k records per (strategy, symbol, timeframe).
+    Args:
+      k(int): num of records kept per group
+      metric(string): metric to rank by, one of metatrader.store.METRIC_NAMES
+      descending(bool): larger metric is better if True
+    """
+
+    def __init__(self, k=10, metric='profit', descending=True):
+        if metric not in METRIC_NAMES:
+            raise ValueError('%s is not a metric' % metric)
+        self.k = k
+        self.metric = metric
+        self.descending = descending
+        self.n_runs = 0
+        self.is_dirty = False
+
+        self._heaps = {}
+        # tie breaker, records are never compared
+        self._counter = itertools.count()
+
+    def add(self, record):
+        """
+        Notes:
+          add record of a run. records without the metric (e.g. invalid report) are counted only.
+        Args:
+          record(dict): record of metatrader.ingest, field name => value
+        Returns:
+          True if record entered top k of its group
+        """
+        self.n_runs += 1
+        value = record.get(self.metric)
+        if record.get('error') or value is None:
+            return False
+
+        score = value if self.descending else -value
+        key = (record['strategy'], record['symbol'], record['timeframe'])
+        heap = self._heaps.setdefault(key, [])
+        entry = (score, next(self._counter), record)
+
+        if len(heap) < self.k:
+            heapq.heappush(heap, entry)
+        elif score > heap[0][0]:
+            heapq.heapreplace(heap, entry)
+        else:
+            return False
+        self.is_dirty = True
+        return True
+
+    def groups(self):
+        return sorted(self._heaps, key=lambda key: tuple('' if v is None else v for v in key))
+
+    def top(self, strategy, symbol, timeframe):
+        """
+        Returns:
+          list of records of group, best first
+        """
+        heap = self._heaps.get((strategy, symbol, timeframe), [])
+        return [record for _, _, record in sorted(heap, key=lambda entry: (-entry[0], entry[1]))]
+
+    def snapshot(self):
+        """
+        Returns:
+          json serializable dict of every group's top k
+        """
+        groups = []
+        for strategy, symbol, timeframe in self.groups():
+            top = []
+            for record in self.top(strategy, symbol, timeframe):
+                record = dict(record)
+                record['params'] = json.loads(record['params'])
+                top.append(record)
+            groups.append({'strategy': strategy, 'symbol': symbol, 'timeframe': timeframe, 'top': top})
+        return {'updated_at': time.time(), 'metric': self.metric, 'descending': self.descending, 'k': self.k,
+                'n_runs': self.n_runs, 'groups': groups}
+
+    def write_snapshot(self, path):
+        """
+        Notes:
+          write snapshot as json. readers never see a partly written file.
+        """
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=1)
+        os.replace(tmp_path, path)
+        self.is_dirty = False
+
+
+class ResultWatcher(object):
+    """
+    Notes:
+      find runs completed since last poll in a results directory whose sub directories are runs,
+      as strategy_testing writes them. run is complete when its completion file exists.
+      names of seen directories are the high-water mark: only new names and runs still
+      in progress are checked, and nothing is listed while mtime of directory is unchanged.
+    Args:
+      result_dir(string): results directory
+      leaderboard(Leaderboard): leaderboard to update
+      completion_file(string): file in run directory which is written when run is done
+    """
+
+    def __init__(self, result_dir, leaderboard, completion_file=COMPLETION_FILE):
+        self.result_dir = result_dir
+        self.leaderboard = leaderboard
+        self.completion_file = completion_file
+
+        self._dir_mtime = None
+        self._seen = set()
+        self._pending = set()
+
+    def _list_new_dirs(self):
+        try:
+            dir_mtime = os.stat(self.result_dir).st_mtime_ns
+        except FileNotFoundError:
+            return []
+        if dir_mtime == self._dir_mtime:
+            return []
+        # entry added right after listing may keep the same mtime, so recent mtime is not trusted
+        self._dir_mtime = dir_mtime if time.time() - dir_mtime / 1e9 > _MTIME_MARGIN else None
+
+        new_names = set(os.listdir(self.result_dir)) - self._seen
+        self._seen.update(new_names)
+        return [name for name in new_names if os.path.isdir(os.path.join(self.result_dir, name))]
+
+    def poll(self):
+        """
+        Notes:
+          parse runs completed since last poll and add them to leaderboard
+        Returns:
+          list of new records (dict)
+        """
+        self._pending.update(self._list_new_dirs())
+
+        completed = sorted(name for name in self._pending
+                           if os.path.exists(os.path.join(self.result_dir, name, self.completion_file)))
+        records = []
+        for name in completed:
+            self._pending.discard(name)
+            record = dict(zip(RECORD_FIELDS, read_record(os.path.join(self.result_dir, name))))
+            if record['error']:
+                logging.warning('%s: %s', record['test_dir'], record['error'])
+            self.leaderboard.add(record)
+            records.append(record)
+        return records
+
+    def watch(self, interval=10.0, snapshot_path=None, snapshot_interval=60.0, max_polls=None):
+        """
+        Notes:
+          poll until interrupted and write snapshot when leaderboard changed and snapshot_interval passed.
+        Args:
+          interval(float): seconds between polls
+          snapshot_path(string): json file of snapshot. None means no snapshot
+          snapshot_interval(float): min seconds between snapshots
+          max_polls(int): stop after this num of polls. None means forever
+        """
+        last_snapshot = 0.0
+        for n_polls in itertools.count(1):
+            records = self.poll()
+            if records:
+                logging.info('%d new runs, %d runs in total', len(records), self.leaderboard.n_runs)
+
+            now = time.time()
+            if snapshot_path and self.leaderboard.is_dirty and now - last_snapshot >= snapshot_interval:
+                self.leaderboard.write_snapshot(snapshot_path)
+                last_snapshot = now
+
+            if max_polls is not None and n_polls >= max_polls:
+                break
+            time.sleep(interval)
+
+        if snapshot_path and self.leaderboard.is_dirty:
+            self.leaderboard.write_snapshot(snapshot_path)
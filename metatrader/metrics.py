@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+vectorized metrics of deals table (see metatrader.deals).
+every function works on whole columns, there is no python loop per deal.
+equity here is balance after each deal, open positions are not marked to market.
+"""
+import numpy as np
+
+from metatrader.deals import DEAL_DIRECTIONS, DEAL_TYPES
+
+_BUY = DEAL_TYPES.index('buy')
+_SELL = DEAL_TYPES.index('sell')
+_BALANCE = DEAL_TYPES.index('balance')
+_OUT = DEAL_DIRECTIONS.index('out')
+_OUT_BY = DEAL_DIRECTIONS.index('out by')
+_IN_OUT = DEAL_DIRECTIONS.index('in/out')
+
+# periods per year of period codes of returns_by_period
+PERIODS_PER_YEAR = {'D': 252, 'W': 52, 'M': 12}
+
+
+def equity_curve(deals):
+    """
+    Notes:
+      balance after each deal recomputed from profit, commission and swap.
+      deposit is the profit of balance deal, so equals balance column of report.
+    Returns:
+      numpy.ndarray of float
+    """
+    return np.cumsum(np.nan_to_num(deals['profit']) + np.nan_to_num(deals['commission']) +
+                     np.nan_to_num(deals['swap']))
+
+
+def drawdown(equity):
+    """
+    Returns:
+      (drawdown, drawdown_rate): arrays of distance from running peak, in money and in % of peak
+    """
+    equity = np.asarray(equity, dtype=float)
+    peak = np.maximum.accumulate(equity)
+    dd = peak - equity
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate = np.where(peak > 0, dd / peak * 100, 0.0)
+    return dd, rate
+
+
+def max_drawdown(equity):
+    """
+    Returns:
+      (max drawdown, max drawdown rate). 0 if equity is empty
+    """
+    if len(equity) == 0:
+        return 0.0, 0.0
+    dd, rate = drawdown(equity)
+    return float(dd.max()), float(rate.max())
+
+
+def time_under_water(times, equity):
+    """
+    Notes:
+      time spent below former peak of equity. period under water ends when equity gets back to its peak.
+    Args:
+      times(numpy.ndarray): datetime64 of each equity point
+      equity(numpy.ndarray): equity
+    Returns:
+      (longest, total): numpy.timedelta64 of the longest period under water and of all of them
+    """
+    times = np.asarray(times)
+    zero = np.timedelta64(0, 's')
+    if len(times) < 2:
+        return zero, zero
+
+    dd, _ = drawdown(equity)
+    under = dd > 0
+    # time from each point to next one, counted when equity is under water at the point
+    spans = np.diff(times).astype('timedelta64[s]')
+    under_spans = np.where(under[:-1], spans, zero)
+    total = under_spans.sum()
+
+    # id of period under water. a new period starts at each point which is on the peak
+    period_ids = np.cumsum(~under[:-1])
+    longest = np.bincount(period_ids, weights=under_spans.astype('int64')).max()
+    return np.timedelta64(int(longest), 's'), total
+
+
+def returns_by_period(times, equity, period='D'):
+    """
+    Notes:
+      returns between ends of calendar periods. periods without deals are skipped.
+    Args:
+      period(string): numpy datetime unit. e.g.: 'D', 'W', 'M'
+    Returns:
+      numpy.ndarray of float
+    """
+    equity = np.asarray(equity, dtype=float)
+    if len(equity) == 0:
+        return np.empty(0)
+    keys = np.asarray(times).astype('datetime64[%s]' % period)
+    # last point of each period
+    is_last = np.append(keys[1:] != keys[:-1], True)
+    closes = np.concatenate(([equity[0]], equity[is_last]))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = np.diff(closes) / closes[:-1]
+    return returns[np.isfinite(returns)]
+
+
+def sharpe_ratio(times, equity, period='D', risk_free=0.0):
+    """
+    Notes:
+      annualized sharpe ratio of returns by period. nan if it can't be computed.
+    Args:
+      risk_free(float): risk free return per period
+    """
+    returns = returns_by_period(times, equity, period=period) - risk_free
+    if len(returns) < 2 or returns.std(ddof=1) == 0:
+        return np.nan
+    return float(returns.mean() / returns.std(ddof=1) * np.sqrt(PERIODS_PER_YEAR.get(period, 252)))
+
+
+def sortino_ratio(times, equity, period='D', risk_free=0.0):
+    """
+    Notes:
+      annualized sortino ratio, deviation is of negative returns only. nan if it can't be computed.
+    """
+    returns = returns_by_period(times, equity, period=period) - risk_free
+    downside = np.sqrt(np.mean(np.minimum(returns, 0) ** 2)) if len(returns) else 0
+    if len(returns) < 2 or downside == 0:
+        return np.nan
+    return float(returns.mean() / downside * np.sqrt(PERIODS_PER_YEAR.get(period, 252)))
+
+
+def trade_profits(deals):
+    """
+    Returns:
+      net profit of each deal which closes position (profit, commission and swap)
+    """
+    closes = np.isin(deals['direction'], (_OUT, _IN_OUT, _OUT_BY))
+    net = np.nan_to_num(deals['profit']) + np.nan_to_num(deals['commission']) + np.nan_to_num(deals['swap'])
+    return net[closes]
+
+
+def profit_factor(profits):
+    gross_loss = -profits[profits < 0].sum()
+    if gross_loss == 0:
+        return np.nan
+    return float(profits[profits > 0].sum() / gross_loss)
+
+
+def position_volume(deals):
+    """
+    Returns:
+      net volume after each deal. buy adds, sell subtracts
+    """
+    sign = np.where(deals['type'] == _BUY, 1.0, np.where(deals['type'] == _SELL, -1.0, 0.0))
+    return np.cumsum(sign * np.nan_to_num(deals['volume']))
+
+
+def exposure(deals):
+    """
+    Notes:
+      fraction of time from first to last deal when a position is open.
+      hedged positions of equal volume count as flat.
+    """
+    times = deals['time']
+    if len(times) < 2:
+        return 0.0
+    total = (times[-1] - times[0]).astype('int64')
+    if total == 0:
+        return 0.0
+    spans = np.diff(times).astype('timedelta64[s]').astype('int64')
+    is_open = ~np.isclose(position_volume(deals)[:-1], 0)
+    return float(spans[is_open].sum() / total)
+
+
+def summary(deals, period='D'):
+    """
+    Returns:
+      dict of metrics of deals table
+    """
+    times = deals['time']
+    equity = equity_curve(deals)
+    profits = trade_profits(deals)
+    dd, dd_rate = max_drawdown(equity)
+    longest_under_water, total_under_water = time_under_water(times, equity)
+    deposit = np.nan_to_num(deals['profit'][deals['type'] == _BALANCE]).sum()
+
+    return {
+        'initial_deposit': float(deposit),
+        'profit': float(equity[-1] - deposit) if len(equity) else 0.0,
+        'total_trades': int(len(profits)),
+        'profit_factor': profit_factor(profits),
+        'win_rate': float((profits > 0).mean()) if len(profits) else np.nan,
+        'max_drawdown': dd,
+        'max_drawdown_rate': dd_rate,
+        'sharpe_ratio': sharpe_ratio(times, equity, period=period),
+        'sortino_ratio': sortino_ratio(times, equity, period=period),
+        'longest_under_water': longest_under_water,
+        'time_under_water': total_under_water,
+        'exposure': exposure(deals),
+    }
@@ -2,14 +2,23 @@
 """
 @author: samuraitaiga
 """
+import glob
+import json
 import logging
 import os
+import threading
+import time
+
+from metatrader.exception import TerminalError, TerminalTimeout
 
 _mt5s = {}
 
 DEFAULT_MT5_NAME = 'default'
 # mt4 program file path is written in origin.txt 
 ORIGIN_TXT = 'origin.txt'
+# env of discovery cache file path, empty value keeps cache in memory only
+DISCOVERY_CACHE_ENV = 'METATRADER_DISCOVERY_CACHE'
+DEFAULT_DISCOVERY_CACHE = os.path.join(os.path.expanduser('~'), '.metatrader', 'discovery.json')
 
 
 class MT5(object):
@@ -18,27 +27,218 @@ class MT5(object):
       meta trader5 class which can lunch metatrader5.
       this class will only lunch metatrader5,
       because metatrader5 can lunch either normal mode or backtest mode.
+    Args:
+      prog_path(string): install folder
+      portable(bool): launch terminal with /portable, so install folder is its data folder
     """
     prog_path = None
     appdata_path = None
+    portable = False
+    # seconds between watchdog checks of running terminal
+    poll_interval = 1.0
 
-    def __init__(self, prog_path):
+    def __init__(self, prog_path, portable=False):
         if os.path.exists(prog_path):
             self.prog_path = prog_path
-            if is_uac_enabled():
-                self.appdata_path = get_appdata_path(prog_path)
-            else:
-                self.appdata_path = prog_path
-
+            self.portable = portable
+            self.appdata_path, self.mt_exe = discover(prog_path, portable)
         else:
             err_msg = 'prog_path %s not exists' % prog_path
             logging.error(err_msg)
             raise IOError(err_msg)
 
-        self.mt_exe = self.get_mt5_exe_file_name(self.prog_path)
-
     @staticmethod
     def get_mt5_exe_file_name(prog_path):
+        return get_platform().get_exe_file_name(prog_path)
+
+    def _log_dirs(self):
+        tester_dir = os.path.join(self.appdata_path, 'Tester')
+        return ([os.path.join(self.appdata_path, 'logs'), os.path.join(tester_dir, 'logs')] +
+                glob.glob(os.path.join(tester_dir, '*', 'logs')))
+
+    def last_activity(self):
+        """
+        Returns:
+          latest mtime of terminal and tester agent logs. 0 if there is no log
+        """
+        latest = 0
+        for log_dir in self._log_dirs():
+            try:
+                for entry in os.scandir(log_dir):
+                    latest = max(latest, entry.stat().st_mtime)
+            except FileNotFoundError:
+                pass
+        return latest
+
+    def _expired(self, start, timeout, idle_timeout):
+        """
+        Returns:
+          (reason, seconds) if run should be killed, otherwise None
+        """
+        now = time.time()
+        if timeout is not None and now - start > timeout:
+            return 'timeout', timeout
+        if idle_timeout is not None and now - max(start, self.last_activity()) > idle_timeout:
+            return 'idle', idle_timeout
+        return None
+
+    def run(self, conf=None, timeout=None, idle_timeout=None):
+        """
+        Notes:
+          run terminal.exe. process tree of terminal is killed when it runs longer than timeout
+          or its logs are not written for idle_timeout, e.g. it waits on a dialog.
+        Args:
+          conf(string): abs path of conf file. 
+            details see mt4 help doc Client Terminal/Tools/Configuration at Startup 
+          timeout(float): max seconds of run. None means no limit
+          idle_timeout(float): max seconds without log activity. None means no limit
+        Raises:
+          TerminalTimeout: terminal was killed
+          TerminalError: terminal exited with non zero code
+        """
+        import subprocess
+
+        if conf:
+            platform = get_platform()
+            cmd = platform.terminal_command(os.path.join(self.prog_path, self.mt_exe), conf, portable=self.portable)
+
+            p = subprocess.Popen(cmd, **platform.popen_kwargs())
+            start = time.time()
+            while True:
+                try:
+                    p.wait(timeout=None if timeout is None and idle_timeout is None else self.poll_interval)
+                    break
+                except subprocess.TimeoutExpired:
+                    expired = self._expired(start, timeout, idle_timeout)
+                    if expired is not None:
+                        platform.kill_tree(p)
+                        p.wait()
+                        self._raise_timeout(cmd, *expired)
+            self._check_returncode(cmd, p.returncode)
+
+    async def run_async(self, conf=None, timeout=None, idle_timeout=None):
+        """
+        Notes:
+          run terminal.exe without blocking event loop.
+        Args:
+          conf(string): abs path of conf file. same as run.
+          timeout(float): same as run
+          idle_timeout(float): same as run
+        """
+        import asyncio
+
+        if conf:
+            platform = get_platform()
+            prog = os.path.join(self.prog_path, self.mt_exe)
+            args = ['/config:%s' % conf] + (['/portable'] if self.portable else [])
+            cmd = '"%s" %s' % (prog, ' '.join(args))
+
+            p = await asyncio.create_subprocess_exec(prog, *args, **platform.popen_kwargs())
+            start = time.time()
+            while True:
+                try:
+                    returncode = await asyncio.wait_for(
+                        p.wait(), None if timeout is None and idle_timeout is None else self.poll_interval)
+                    break
+                except asyncio.TimeoutError:
+                    expired = self._expired(start, timeout, idle_timeout)
+                    if expired is not None:
+                        platform.kill_tree(p)
+                        await p.wait()
+                        self._raise_timeout(cmd, *expired)
+            self._check_returncode(cmd, returncode)
+
+    @staticmethod
+    def _raise_timeout(cmd, reason, seconds):
+        err = TerminalTimeout(cmd, reason, seconds)
+        logging.error(str(err))
+        raise err
+
+    @staticmethod
+    def _check_returncode(cmd, returncode):
+        if returncode == 0:
+            logging.info('cmd[%s] successded', cmd)
+        else:
+            err = TerminalError(cmd, returncode)
+            logging.error(str(err))
+            raise err
+
+
+class WindowsPlatform(object):
+    """
+    Notes:
+      terminal installed on windows. data folder is found from registry and %APPDATA%.
+    """
+
+    def __init__(self):
+        self._uac_enabled = None
+
+    def is_uac_enabled(self):
+        """
+        Note:
+          check uac is enabled or not from reg value. registry is read once per platform object.
+        Returns:
+         True if uac is enabled, False if uac is disabled.
+        """
+        if self._uac_enabled is None:
+            self._uac_enabled = self._read_uac_enabled()
+        return self._uac_enabled
+
+    def _read_uac_enabled(self):
+        import winreg
+
+        reg_key = winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE,
+                                 'SOFTWARE\\Microsoft\\Windows\\CurrentVersion\\Policies\\System',
+                                 0, winreg.KEY_READ)
+        value, regtype = winreg.QueryValueEx(reg_key, 'EnableLUA')
+
+        if value == 1:
+            # reg value 1 means UAC is enabled
+            return True
+        else:
+            return False
+
+    def get_appdata_path(self, program_file_dir):
+        """
+        Returns:
+          AppData path corresponding to provided program file path
+          e.g.: C:\\Users\\UserName\\AppData\\Roaming\\MetaQuotes\\Terminal\\7269C010EA668AEAE793BEE37C26ED57
+        """
+        app_data = os.environ.get('APPDATA')
+        mt5_appdata_path = os.path.join(app_data, 'MetaQuotes', 'Terminal')
+
+        app_dir = None
+
+        walk_depth = 1
+        for root, dirs, files in os.walk(mt5_appdata_path):
+            # search ORIGIN_TXT until walk_depth
+            depth = root[len(mt5_appdata_path):].count(os.path.sep)
+
+            if ORIGIN_TXT in files:
+                origin_file = os.path.join(root, ORIGIN_TXT)
+
+                import codecs
+                with codecs.open(origin_file, 'r', 'utf-16') as fp:
+                    line = fp.read()
+                    if line == program_file_dir:
+                        app_dir = root
+                        break
+
+            if depth >= walk_depth:
+                dirs[:] = []
+
+        if app_dir is None:
+            err_msg = '%s does not have appdata dir!.' % program_file_dir
+            logging.error(err_msg)
+            raise IOError(err_msg)
+
+        return app_dir
+
+    def get_exe_file_name(self, prog_path):
+        """
+        Returns:
+          file name of terminal executable in install folder
+        """
         file_names = set(map(str.lower, os.listdir(prog_path)))
         if 'terminal.exe' in file_names:
             return 'terminal.exe'
@@ -46,89 +246,239 @@ class MT5(object):
             return 'terminal64.exe'
         raise FileNotFoundError('terminal.exe not found')
 
-    def run(self, conf=None):
+    def terminal_command(self, exe_path, conf, portable=False):
+        cmd = '"%s" /config:"%s"' % (exe_path, conf)
+        return cmd + ' /portable' if portable else cmd
+
+    def popen_kwargs(self):
+        """
+        Returns:
+          extra arguments of subprocess.Popen so that kill_tree can kill every child of terminal
+        """
+        return {}
+
+    def kill_tree(self, process):
         """
         Notes:
-          run terminal.exe.
-        Args:
-          conf(string): abs path of conf file. 
-            details see mt4 help doc Client Terminal/Tools/Configuration at Startup 
+          kill terminal and its children, e.g. tester agents. process is Popen or asyncio Process
         """
         import subprocess
 
-        if conf:
-            prog = '"%s"' % os.path.join(self.prog_path, self.mt_exe)
-            conf = '/config:"%s"' % conf
-            cmd = '%s %s' % (prog, conf)
+        subprocess.call(['taskkill', '/F', '/T', '/PID', str(process.pid)],
+                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        if process.returncode is None:
+            process.kill()
 
-            p = subprocess.Popen(cmd)
-            p.wait()
-            if p.returncode == 0:
-                logging.info('cmd[%s] successded', cmd)
-            else:
-                err_msg = 'run mt4 with cmd[%s] failed!!' % cmd
-                logging.error(err_msg)
-                raise RuntimeError(err_msg)
 
+class PortablePlatform(WindowsPlatform):
+    """
+    Notes:
+      terminal whose data folder is its install folder, e.g. started in portable mode,
+      run under wine or replaced by a stand-in script off windows.
+    """
 
-def is_uac_enabled():
+    def is_uac_enabled(self):
+        return False
+
+    def get_appdata_path(self, program_file_dir):
+        return program_file_dir
+
+    def terminal_command(self, exe_path, conf, portable=False):
+        if os.name == 'nt':
+            return super(PortablePlatform, self).terminal_command(exe_path, conf, portable)
+        return [exe_path, '/config:%s' % conf] + (['/portable'] if portable else [])
+
+    def popen_kwargs(self):
+        if os.name == 'nt':
+            return super(PortablePlatform, self).popen_kwargs()
+        # own process group, which kill_tree kills at once
+        return {'start_new_session': True}
+
+    def kill_tree(self, process):
+        if os.name == 'nt':
+            return super(PortablePlatform, self).kill_tree(process)
+        import signal
+
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+_platform = None
+
+
+def get_platform():
     """
-    Note:
-      check uac is enabled or not from reg value.
     Returns:
-     True if uac is enabled, False if uac is disabled.
+      platform used to find data folder and launch terminal.
+      WindowsPlatform on windows and PortablePlatform elsewhere unless set by set_platform
     """
-    import winreg
+    global _platform
+    if _platform is None:
+        _platform = WindowsPlatform() if os.name == 'nt' else PortablePlatform()
+    return _platform
 
-    reg_key = winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, 'SOFTWARE\Microsoft\Windows\CurrentVersion\Policies\System',
-                             0, winreg.KEY_READ)
-    value, regtype = winreg.QueryValueEx(reg_key, 'EnableLUA')
 
-    if value == 1:
-        # reg value 1 means UAC is enabled
-        return True
-    else:
-        return False
+def set_platform(platform):
+    """
+    Notes:
+      replace platform. None restores default.
+    """
+    global _platform
+    _platform = platform
 
 
-def get_appdata_path(program_file_dir):
+class DiscoveryCache(object):
+    """
+    Notes:
+      persistent map of install folder => (data folder, exe name), so terminals are found without
+      walking %APPDATA% and listing install folder in every process. entry is valid while mtime of install
+      folder and of origin.txt in data folder are unchanged. safe to share between threads.
+    Args:
+      path(string): json file. None keeps entries in memory only
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def _read(self):
+        if self.path is None:
+            return {}
+        try:
+            with open(self.path) as fp:
+                entries = json.load(fp)
+        except (OSError, ValueError):
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    @staticmethod
+    def _stamp(prog_path, appdata_path):
+        stamp = [os.stat(prog_path).st_mtime_ns]
+        if os.path.abspath(appdata_path) != os.path.abspath(prog_path):
+            stamp.append(os.stat(os.path.join(appdata_path, ORIGIN_TXT)).st_mtime_ns)
+        return stamp
+
+    def get(self, key, prog_path):
+        """
+        Returns:
+          (appdata path, exe name) of valid entry, None if there is none
+        """
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._read()
+            entry = self._entries.get(key)
+        try:
+            is_valid = entry is not None and entry['stamp'] == self._stamp(prog_path, entry['appdata_path'])
+        except (OSError, KeyError, TypeError):
+            is_valid = False
+
+        with self._lock:
+            if is_valid:
+                self.hits += 1
+                return entry['appdata_path'], entry['exe']
+            self.misses += 1
+        return None
+
+    def put(self, key, prog_path, appdata_path, exe_name):
+        entry = {'appdata_path': appdata_path, 'exe': exe_name, 'stamp': self._stamp(prog_path, appdata_path)}
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._read()
+            self._entries[key] = entry
+            if self.path is None:
+                return
+            # entries of other processes written meanwhile are kept
+            entries = self._read()
+            entries[key] = entry
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                tmp_path = '%s.%d.tmp' % (self.path, os.getpid())
+                with open(tmp_path, 'w') as fp:
+                    json.dump(entries, fp, indent=1, sort_keys=True)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                # cache is an optimization, read only home is not an error
+                logging.warning('discovery cache %s not written: %s', self.path, e)
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            if self.path is not None and os.path.exists(self.path):
+                os.remove(self.path)
+
+
+_discovery_cache = None
+
+
+def get_discovery_cache():
     """
     Returns:
-      AppData path corresponding to provided program file path
-      e.g.: C:\\Users\\UserName\\AppData\\Roaming\\MetaQuotes\\Terminal\\7269C010EA668AEAE793BEE37C26ED57
+      DiscoveryCache at $METATRADER_DISCOVERY_CACHE or DEFAULT_DISCOVERY_CACHE, unless set by set_discovery_cache
     """
-    app_data = os.environ.get('APPDATA')
-    mt5_appdata_path = os.path.join(app_data, 'MetaQuotes', 'Terminal')
+    global _discovery_cache
+    if _discovery_cache is None:
+        path = os.environ.get(DISCOVERY_CACHE_ENV, DEFAULT_DISCOVERY_CACHE)
+        _discovery_cache = DiscoveryCache(path or None)
+    return _discovery_cache
 
-    app_dir = None
 
-    walk_depth = 1
-    for root, dirs, files in os.walk(mt5_appdata_path):
-        # search ORIGIN_TXT until walk_depth
-        depth = root[len(mt5_appdata_path):].count(os.path.sep)
+def set_discovery_cache(cache):
+    """
+    Notes:
+      replace discovery cache. None restores default.
+    """
+    global _discovery_cache
+    _discovery_cache = cache
 
-        if ORIGIN_TXT in files:
-            origin_file = os.path.join(root, ORIGIN_TXT)
 
-            import codecs
-            with codecs.open(origin_file, 'r', 'utf-16') as fp:
-                line = fp.read()
-                if line == program_file_dir:
-                    app_dir = root
-                    break
+def discover(prog_path, portable=False):
+    """
+    Notes:
+      find data folder and exe name of install folder by platform, through discovery cache
+    Args:
+      prog_path(string): install folder
+      portable(bool): data folder is install folder
+    Returns:
+      (appdata path, exe name)
+    """
+    platform = get_platform()
+    uac = not portable and platform.is_uac_enabled()
+    key = '%s:%s:%s' % (type(platform).__name__, 'appdata' if uac else 'portable', os.path.abspath(prog_path))
+    cache = get_discovery_cache()
+    found = cache.get(key, prog_path)
+    if found is not None:
+        return found
 
-        if depth >= walk_depth:
-            dirs[:] = []
+    appdata_path = platform.get_appdata_path(prog_path) if uac else prog_path
+    exe_name = platform.get_exe_file_name(prog_path)
+    cache.put(key, prog_path, appdata_path, exe_name)
+    return appdata_path, exe_name
 
-    if app_dir is None:
-        err_msg = '%s does not have appdata dir!.' % program_file_dir
-        logging.error(err_msg)
-        raise IOError(err_msg)
 
-    return app_dir
+def is_uac_enabled():
+    """
+    Note:
+      check uac is enabled or not.
+    Returns:
+     True if uac is enabled, False if uac is disabled.
+    """
+    return get_platform().is_uac_enabled()
 
 
-def initizalize(ntpath, alias=DEFAULT_MT5_NAME):
+def get_appdata_path(program_file_dir):
+    """
+    Returns:
+      AppData path corresponding to provided program file path
+    """
+    return get_platform().get_appdata_path(program_file_dir)
+
+
+def initizalize(ntpath, alias=DEFAULT_MT5_NAME, portable=False):
     """
     Notes:
       initialize mt4
@@ -136,11 +486,12 @@ def initizalize(ntpath, alias=DEFAULT_MT5_NAME):
       ntpath(string): mt4 install folder path.
         e.g.: C:\\Program Files (x86)\\MetaTrader 5 - Alpari Japan
       alias(string): mt4 object alias name. default value is DEFAULT_MT4_NAME
+      portable(bool): run terminal in portable mode, see MT5
     """
     global _mt5s
     if alias not in _mt5s:
         # store mt4 objecct with alias name
-        _mt5s[alias] = MT5(ntpath)
+        _mt5s[alias] = MT5(ntpath, portable=portable)
     else:
         logging.info('%s is already initialized' % alias)
 
@@ -160,3 +511,13 @@ def get_mt5(alias=DEFAULT_MT5_NAME):
         return _mt5s[alias]
     else:
         raise RuntimeError('mt5[%s] is not initialized.' % alias)
+
+
+def release(alias=DEFAULT_MT5_NAME):
+    """
+    Notes:
+      forget mt5 object of alias, so alias can be initialized again. unknown alias is ignored
+    Returns:
+      released mt5 object or None
+    """
+    return _mt5s.pop(alias, None)
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+import logging
+import queue
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from metatrader.mt5 import get_mt5
+
+
+class BacktestPool(object):
+    """
+    Notes:
+      run queued backtests on several terminals at once.
+      each job is handed to whichever terminal becomes idle first.
+      terminal processes do the heavy work, so one thread per terminal is enough to keep them all busy.
+    Args:
+      aliases(list): aliases of terminals registered by metatrader.mt5.initizalize.
+        every alias must point to its own install (data folder), a terminal can not run twice at once.
+      cache(metatrader.cache.BacktestCache): if given, backtests found in cache don't take a terminal
+      retry(metatrader.retry.RetryPolicy): if given, retryable failures are run again.
+        terminal is released while a job waits for its next attempt
+    """
+
+    def __init__(self, aliases, cache=None, retry=None):
+        aliases = list(aliases)
+        if not aliases:
+            raise ValueError('BacktestPool needs at least one terminal alias')
+
+        for alias in aliases:
+            # fail fast if alias is not initialized
+            get_mt5(alias)
+
+        self.aliases = aliases
+        self.cache = cache
+        self.retry = retry
+        self._idle_aliases = queue.Queue()
+        for alias in aliases:
+            self._idle_aliases.put(alias)
+
+        # terminals are bounded by idle aliases. with cache or retry, extra threads wait for
+        # runs of duplicated keys or for backoff without blocking jobs which need a terminal
+        n_workers = len(aliases) * 2 if cache is not None or retry is not None else len(aliases)
+        self._executor = ThreadPoolExecutor(max_workers=n_workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+    def _run_on_idle_terminal(self, backtest, optimize):
+        alias = self._idle_aliases.get()
+        start = time.time()
+        try:
+            logging.info('run %s on terminal %s', backtest.test_dir, alias)
+            if optimize:
+                return backtest.optimize(alias=alias)
+            backtest.run(alias=alias)
+            return backtest
+        finally:
+            # recorded for metatrader.scheduler.CostModel
+            backtest.duration = time.time() - start
+            self._idle_aliases.put(alias)
+
+    def _run_attempts(self, backtest, optimize):
+        if self.retry is None:
+            return self._run_on_idle_terminal(backtest, optimize)
+        return self.retry.call(lambda: self._run_on_idle_terminal(backtest, optimize), name=backtest.test_dir)
+
+    def _run_job(self, backtest, optimize):
+        if self.cache is None or optimize:
+            return self._run_attempts(backtest, optimize)
+        # history of symbol is part of cache key, report of changed history is not reused
+        return self.cache.run(backtest, alias=self.aliases[0],
+                              symbol_data_file=getattr(backtest, 'symbol_data_file', None),
+                              runner=lambda: self._run_attempts(backtest, optimize))
+
+    def submit(self, backtest, optimize=False):
+        """
+        Notes:
+          queue backtest. job id is assigned if backtest does not have one,
+          so parameter and report files of concurrent runs never collide.
+        Args:
+          backtest(metatrader.backtest.BackTest): backtest to run
+          optimize(bool): call BackTest.optimize instead of BackTest.run
+        Returns:
+          future(concurrent.futures.Future): resolves to backtest, or to OptimizationReport if optimize is True
+        """
+        if backtest.job_id is None:
+            backtest.job_id = uuid.uuid4().hex[:12]
+        return self._executor.submit(self._run_job, backtest, optimize)
+
+    def map(self, backtests, optimize=False):
+        """
+        Notes:
+          run all backtests and yield results in order of completion.
+        """
+        futures = [self.submit(backtest, optimize=optimize) for backtest in backtests]
+        for future in as_completed(futures):
+            yield future.result()
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,410 @@
+# -*- coding: utf-8 -*-
+"""
+approximate backtests of moving average and macd experts on csv bars, to prune sweeps.
+signals of an expert are rebuilt with numpy from its inputs and a position is held from close to
+close, so thousands of candidates are scored in seconds and only the best of them are run on terminal.
+indicators are shared between candidates, e.g. candidates which differ only in stop loss or
+trailing inputs reuse both the moving averages and the score.
+
+it is an approximation: stops, trailing, money management and intrabar fills are ignored.
+rank_agreement tells how well its ranking agrees with terminal results of the same candidates.
+"""
+import logging
+import time
+
+import numpy as np
+
+from metatrader.metrics import max_drawdown
+
+# ENUM_MA_METHOD of mql5
+MA_SMA = 0
+MA_EMA = 1
+MA_SMMA = 2
+MA_LWMA = 3
+
+# ENUM_APPLIED_PRICE of mql5
+PRICE_CLOSE = 1
+PRICE_OPEN = 2
+PRICE_HIGH = 3
+PRICE_LOW = 4
+PRICE_MEDIAN = 5
+PRICE_TYPICAL = 6
+PRICE_WEIGHTED = 7
+
+# scores a candidate can be ranked by
+SCORES = ('profit', 'sharpe', 'recovery_factor')
+
+_TIMEFRAME_UNITS = {'M': 60, 'H': 60 * 60, 'D': 24 * 60 * 60}
+
+
+def timeframe_seconds(timeframe):
+    """
+    Returns:
+      seconds of timeframe. e.g.: 'M15' => 900
+    Raises:
+      ValueError: timeframe is not fixed length (W1, MN1) or unknown
+    """
+    unit, count = timeframe[:1], timeframe[1:]
+    if unit not in _TIMEFRAME_UNITS or not count.isdigit():
+        raise ValueError('%s is not a fixed length timeframe' % timeframe)
+    return _TIMEFRAME_UNITS[unit] * int(count)
+
+
+def resample(bars, timeframe):
+    """
+    Notes:
+      aggregate bars into bars of timeframe. bars without trades leave no bar, like terminal
+    Args:
+      bars(dict): column => array, see metatrader.catalog.BAR_COLUMNS
+      timeframe(string): e.g.: 'H1'
+    Returns:
+      dict of column => array
+    """
+    seconds = timeframe_seconds(timeframe)
+    times = np.asarray(bars['time']).astype('datetime64[s]').astype('i8')
+    if len(times) == 0:
+        return {column: np.asarray(values)[:0] for column, values in bars.items()}
+    buckets = times // seconds
+    starts = np.flatnonzero(np.concatenate(([True], buckets[1:] != buckets[:-1])))
+    ends = np.append(starts[1:], len(times)) - 1
+
+    resampled = {'time': (buckets[starts] * seconds).astype('datetime64[s]')}
+    for column, values in bars.items():
+        values = np.asarray(values)
+        if column == 'time':
+            continue
+        elif column == 'high':
+            resampled[column] = np.maximum.reduceat(values, starts)
+        elif column == 'low':
+            resampled[column] = np.minimum.reduceat(values, starts)
+        elif column in ('tick_volume', 'volume'):
+            resampled[column] = np.add.reduceat(values, starts)
+        elif column == 'close':
+            resampled[column] = values[ends]
+        else:
+            # open and spread of first bar
+            resampled[column] = values[starts]
+    return resampled
+
+
+def applied_price(bars, applied):
+    """
+    Returns:
+      price array of ENUM_APPLIED_PRICE code
+    """
+    open_, high, low, close = (np.asarray(bars[c], dtype='f8') for c in ('open', 'high', 'low', 'close'))
+    if applied == PRICE_CLOSE:
+        return close
+    if applied == PRICE_OPEN:
+        return open_
+    if applied == PRICE_HIGH:
+        return high
+    if applied == PRICE_LOW:
+        return low
+    if applied == PRICE_MEDIAN:
+        return (high + low) / 2
+    if applied == PRICE_TYPICAL:
+        return (high + low + close) / 3
+    if applied == PRICE_WEIGHTED:
+        return (high + low + 2 * close) / 4
+    raise ValueError('unknown applied price %s' % applied)
+
+
+def _recursive_average(values, alpha, seed):
+    # y[i] = y[i - 1] + alpha * (x[i] - y[i - 1]) from index of seed. the only loop of this module,
+    # it runs once per distinct indicator
+    result = np.full(len(values), np.nan)
+    start, y = seed
+    out = [y]
+    for x in values[start + 1:].tolist():
+        y += alpha * (x - y)
+        out.append(y)
+    result[start:] = out
+    return result
+
+
+def moving_average(values, period, method=MA_SMA):
+    """
+    Notes:
+      moving average like iMA of mql5. first period - 1 values are nan
+    Args:
+      values(numpy.ndarray): prices
+      period(int): averaging period
+      method(int): ENUM_MA_METHOD code
+    """
+    values = np.asarray(values, dtype='f8')
+    period = int(period)
+    if period < 1:
+        raise ValueError('period must be 1 or more, got %s' % period)
+    if len(values) < period:
+        return np.full(len(values), np.nan)
+
+    if method == MA_SMA:
+        sums = np.cumsum(np.concatenate(([0.0], values)))
+        result = np.full(len(values), np.nan)
+        result[period - 1:] = (sums[period:] - sums[:-period]) / period
+        return result
+    if method == MA_EMA:
+        result = _recursive_average(values, 2.0 / (period + 1), (0, values[0]))
+    elif method == MA_SMMA:
+        result = _recursive_average(values, 1.0 / period, (period - 1, values[:period].mean()))
+    elif method == MA_LWMA:
+        weights = np.arange(period, 0, -1, dtype='f8')
+        result = np.full(len(values), np.nan)
+        result[period - 1:] = np.convolve(values, weights, 'valid') / weights.sum()
+    else:
+        raise ValueError('unknown ma method %s' % method)
+    result[:period - 1] = np.nan
+    return result
+
+
+def shift(values, bars):
+    """
+    Returns:
+      values moved bars to the right, like ma_shift of iMA. vacated values are nan
+    """
+    bars = int(bars)
+    if bars <= 0:
+        return values
+    result = np.full(len(values), np.nan)
+    result[bars:] = values[:-bars]
+    return result
+
+
+def guess_point(close):
+    """
+    Returns:
+      price step of symbol, from num of decimals of close prices
+    """
+    close = np.asarray(close, dtype='f8')[:1000]
+    for digits in range(6):
+        if np.allclose(np.round(close, digits), close, rtol=0, atol=1e-9):
+            return 10.0 ** -digits
+    return 10.0 ** -6
+
+
+def _position(signal):
+    # sign of signal, 0 where indicators are not ready
+    return np.where(np.isnan(signal), 0, np.sign(signal)).astype('i1')
+
+
+def ma_signal(screener, params):
+    """
+    Notes:
+      ExpertMAMA (signal of CSignalMA): long while close is above shifted moving average, short while below.
+      trailing inputs only move stops, they don't change positions.
+    """
+    ma = screener.ma(params.get('Inp_Signal_MA_Period', 12), params.get('Inp_Signal_MA_Method', MA_SMA),
+                     params.get('Inp_Signal_MA_Applied', PRICE_CLOSE))
+    return _position(screener.close - shift(ma, params.get('Inp_Signal_MA_Shift', 0)))
+
+
+def macd_signal(screener, params):
+    """
+    Notes:
+      ExpertMACD (signal of CSignalMACD): long while macd main line is above signal line, short while below.
+    """
+    main, signal = screener.macd(params.get('Inp_Signal_MACD_PeriodFast', 12),
+                                 params.get('Inp_Signal_MACD_PeriodSlow', 24),
+                                 params.get('Inp_Signal_MACD_PeriodSignal', 9))
+    return _position(main - signal)
+
+
+def mamacd_signal(screener, params):
+    """
+    Notes:
+      MAMACD: long while ema MA3 of close is above both lwma MA1 and MA2 of low and macd main is positive,
+      short while it is below both and macd main is negative, flat otherwise.
+    """
+    fast = screener.ma(params.get('MA3', 5), MA_EMA, PRICE_CLOSE)
+    slow_1 = screener.ma(params.get('MA1', 85), MA_LWMA, PRICE_LOW)
+    slow_2 = screener.ma(params.get('MA2', 75), MA_LWMA, PRICE_LOW)
+    main, _ = screener.macd(params.get('fastema', 15), params.get('slowema', 26), 1)
+    with np.errstate(invalid='ignore'):
+        is_long = (fast > slow_1) & (fast > slow_2) & (main > 0)
+        is_short = (fast < slow_1) & (fast < slow_2) & (main < 0)
+    return is_long.astype('i1') - is_short.astype('i1')
+
+
+# strategy => (function of position, inputs which change position)
+SIGNALS = {
+    'ExpertMAMA': (ma_signal, ('Inp_Signal_MA_Period', 'Inp_Signal_MA_Shift', 'Inp_Signal_MA_Method',
+                               'Inp_Signal_MA_Applied')),
+    'ExpertMACD': (macd_signal, ('Inp_Signal_MACD_PeriodFast', 'Inp_Signal_MACD_PeriodSlow',
+                                 'Inp_Signal_MACD_PeriodSignal')),
+    'MAMACD': (mamacd_signal, ('MA1', 'MA2', 'MA3', 'fastema', 'slowema')),
+}
+
+
+def simulate(position, close, cost):
+    """
+    Notes:
+      hold position[i] (1 long, -1 short, 0 flat) from close i to close i + 1.
+      each unit of position change pays cost, which is half of spread.
+    Args:
+      position(numpy.ndarray): position of each bar
+      close(numpy.ndarray): close prices
+      cost(numpy.ndarray or float): cost per unit traded at each bar, in price
+    Returns:
+      dict of profit, total_trades, max_drawdown, sharpe and recovery_factor. money is in price units of 1 lot
+    """
+    position = np.asarray(position, dtype='f8')
+    traded = np.abs(np.diff(np.concatenate(([0.0], position))))
+    pnl = np.concatenate((position[:-1] * np.diff(close), [0.0])) - traded * cost
+    equity = np.cumsum(pnl)
+    profit = float(equity[-1]) if len(equity) else 0.0
+    dd = max_drawdown(np.concatenate(([0.0], equity)))[0]
+    std = pnl.std()
+    return {
+        'profit': profit,
+        'total_trades': int(np.count_nonzero((position != 0) & (traded != 0))),
+        'max_drawdown': dd,
+        'sharpe': float(pnl.mean() / std * np.sqrt(len(pnl))) if std > 0 else 0.0,
+        'recovery_factor': profit / dd if dd > 0 else (np.inf if profit > 0 else 0.0),
+    }
+
+
+class Prescreener(object):
+    """
+    Notes:
+      approximate backtests of SIGNALS strategies on bars. indicators and scores are memoized,
+      so one instance should score all candidates of a symbol and timeframe.
+    Args:
+      bars(dict): column => array, e.g. from metatrader.catalog.SymbolCatalog.load_bars
+      timeframe(string): resample bars into timeframe. None if bars are already of the timeframe
+      point(float): price step, spread column is in points. default is guessed from close prices
+    """
+
+    def __init__(self, bars, timeframe=None, point=None):
+        if timeframe is not None:
+            bars = resample(bars, timeframe)
+        self.bars = bars
+        self.close = np.asarray(bars['close'], dtype='f8')
+        self.point = point or guess_point(self.close)
+        spread = bars.get('spread')
+        self.cost = np.asarray(spread, dtype='f8') * self.point / 2 if spread is not None else 0.0
+        self._indicators = {}
+        self._scores = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _memo(self, key, compute):
+        value = self._indicators.get(key)
+        if value is None:
+            value = self._indicators[key] = compute()
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def price(self, applied):
+        return self._memo(('price', applied), lambda: applied_price(self.bars, applied))
+
+    def ma(self, period, method=MA_SMA, applied=PRICE_CLOSE):
+        return self._memo(('ma', int(period), int(method), int(applied)),
+                          lambda: moving_average(self.price(applied), period, method))
+
+    def macd(self, fast, slow, signal):
+        """
+        Returns:
+          (main, signal) lines like iMACD of close. signal line is sma of main
+        """
+        def compute():
+            main = self.ma(fast, MA_EMA) - self.ma(slow, MA_EMA)
+            ready = np.flatnonzero(~np.isnan(main))
+            signal_line = np.full(len(main), np.nan)
+            if len(ready):
+                signal_line[ready[0]:] = moving_average(main[ready[0]:], signal, MA_SMA)
+            return main, signal_line
+
+        return self._memo(('macd', int(fast), int(slow), int(signal)), compute)
+
+    def evaluate(self, strategy, params):
+        """
+        Returns:
+          dict of metrics of approximate backtest, see simulate
+        Raises:
+          KeyError: strategy is not one of SIGNALS
+        """
+        signal, inputs = SIGNALS[strategy]
+        key = (strategy,) + tuple(params.get(name) for name in inputs)
+        metrics = self._scores.get(key)
+        if metrics is None:
+            metrics = self._scores[key] = simulate(signal(self, params), self.close, self.cost)
+        return metrics
+
+    def rank(self, strategy, candidates, score='profit'):
+        """
+        Returns:
+          list of (score, params) of candidates, best first
+        """
+        if score not in SCORES:
+            raise ValueError('%s is not a score. use one of %s' % (score, ', '.join(SCORES)))
+        start = time.time()
+        scored = [(self.evaluate(strategy, params)[score], i, params) for i, params in enumerate(candidates)]
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        logging.info('prescreened %d candidates of %s in %.2f seconds, %d indicators computed',
+                     len(scored), strategy, time.time() - start, self.misses)
+        return [(value, params) for value, _, params in scored]
+
+    def screen(self, strategy, candidates, keep=0.1, score='profit'):
+        """
+        Notes:
+          prune candidates to the best fraction by approximate score
+        Args:
+          keep(float or int): fraction of candidates if float, num of candidates if int
+        Returns:
+          list of params, best first
+        """
+        candidates = list(candidates)
+        n_keep = keep if isinstance(keep, int) else int(np.ceil(len(candidates) * keep))
+        return [params for _, params in self.rank(strategy, candidates, score)[:max(n_keep, 1)]]
+
+
+def _average_ranks(values):
+    # ranks from 1, tied values share their average rank
+    _, inverse, counts = np.unique(values, return_inverse=True, return_counts=True)
+    upper = np.cumsum(counts)
+    return (upper - (counts - 1) / 2.0)[inverse]
+
+
+def spearman(x, y):
+    """
+    Returns:
+      spearman rank correlation of x and y, nan if either is constant or has less than 2 values
+    """
+    x, y = np.asarray(x, dtype='f8'), np.asarray(y, dtype='f8')
+    if len(x) < 2:
+        return np.nan
+    rx, ry = _average_ranks(x), _average_ranks(y)
+    if rx.std() == 0 or ry.std() == 0:
+        return np.nan
+    return float(np.corrcoef(rx, ry)[0, 1])
+
+
+def rank_agreement(approximate, actual, keep=0.1):
+    """
+    Notes:
+      how well prescreen ranking agrees with terminal ranking of the same candidates
+    Args:
+      approximate(dict): candidate key => approximate score
+      actual(dict): candidate key => terminal score, e.g. profit from results store
+      keep(float): fraction of candidates kept by screen
+    Returns:
+      dict of
+        n: num of candidates in both
+        spearman: rank correlation
+        recall: fraction of terminal top keep which approximate top keep has too
+    """
+    keys = sorted(set(approximate) & set(actual))
+    n = len(keys)
+    if n == 0:
+        return {'n': 0, 'spearman': np.nan, 'recall': np.nan}
+    n_keep = max(int(np.ceil(n * keep)), 1)
+    top_approximate = set(sorted(keys, key=lambda k: -approximate[k])[:n_keep])
+    top_actual = sorted(keys, key=lambda k: -actual[k])[:n_keep]
+    return {
+        'n': n,
+        'spearman': spearman([approximate[k] for k in keys], [actual[k] for k in keys]),
+        'recall': sum(1 for k in top_actual if k in top_approximate) / float(n_keep),
+    }
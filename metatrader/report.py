@@ -4,8 +4,15 @@ Created on 2015/01/31
 @author: Taiga
 '''
 
+import html
 import logging
+import mmap
+import os
+import re
+import sys
+from html.parser import HTMLParser
 
+from metatrader import instrument
 from metatrader.mt5 import DEFAULT_MT5_NAME
 
 
@@ -13,14 +20,109 @@ def has_divtag_with_style(tag):
     return tag.name == 'div' and tag.has_attr('style')
 
 
+def freeze(value):
+    """
+    Notes:
+      convert value to hashable one. dicts become sorted tuples of items, lists become tuples.
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((k, freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def freeze_param(param, interned=None):
+    """
+    Notes:
+      frozen key of ea parameter dict. names, string values and (name, value) pairs are interned,
+      so the same parameter value in millions of passes is stored once.
+    Args:
+      param(dict): ea parameter name and value
+      interned(dict): (name, value) pairs shared by passes, e.g. RunInfo.param_items of their report.
+        it lives as long as its owner, so nothing is kept for life of process
+    Returns:
+      tuple of (name, value) sorted by name
+    """
+    if interned is None:
+        interned = {}
+    items = []
+    for name, value in param.items():
+        value = sys.intern(value) if isinstance(value, str) else freeze(value)
+        item = (sys.intern(name), value)
+        items.append(interned.setdefault(item, item))
+    items.sort()
+    return tuple(items)
+
+
+class RunInfo(object):
+    """
+    Notes:
+      input of backtest shared by all reports of one run.
+      reports keep reference to one RunInfo instead of copying these attributes.
+    Attributes:
+      same as BaseReport
+      param_items(dict): (name, value) pairs of ea parameters interned for passes of this run, see freeze_param
+    """
+    __slots__ = ('ea_name', 'param', 'symbol', 'period', 'deposit', 'from_date', 'to_date', 'model', 'spread',
+                 '_key', '_hash', 'param_items')
+    # param_items is a cache, it is neither compared nor pickled
+    _STATE_SLOTS = __slots__[:-1]
+
+    def __init__(self, backtest):
+        self.ea_name = backtest.ea_name
+        self.param = backtest.param
+        self.symbol = backtest.symbol
+        self.period = backtest.period
+        self.deposit = backtest.deposit
+        self.from_date = backtest.from_date
+        self.to_date = backtest.to_date
+        self.model = backtest.model
+        self.spread = backtest.spread
+        self._key = (self.ea_name, freeze(self.param), self.symbol, self.period, self.deposit, self.from_date,
+                     self.to_date, self.model, self.spread)
+        self._hash = hash(self._key)
+        self.param_items = {}
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, RunInfo):
+            return NotImplemented
+        return self._hash == other._hash and self._key == other._key
+
+    def __ne__(self, other):
+        ret = self.__eq__(other)
+        return ret if ret is NotImplemented else not ret
+
+    def __hash__(self):
+        return self._hash
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self._STATE_SLOTS)
+
+    def __setstate__(self, state):
+        for name, value in zip(self._STATE_SLOTS, state):
+            setattr(self, name, value)
+        self.param_items = {}
+
+
+def _run_attr(name):
+    return property(lambda self: getattr(self.run, name), doc='%s of backtest' % name)
+
+
 class BaseReport(object):
     """
     Notes:
-      this is a base class that has input of backtest
+      this is a base class that has input of backtest.
+      input is kept in one shared RunInfo, reports of one run are equal when their inputs are equal.
     Attributes:
+      run(RunInfo): input of backtest
       ea_name(string): ea name
       param(dict): ea parameter
       symbol(string): currency symbol. e.g.: USDJPY
+      period(string): timeframe. e.g.: H1
+      deposit(int): initial deposit of backtest
       from_date(datetime.datetime): backtest from date
       to_date(datetime.datetime): backtest to date
       model(int): backtest model 
@@ -29,194 +131,432 @@ class BaseReport(object):
         2: Open prices only
       spread(int): spread
     """
+    __slots__ = ('run',)
+
+    ea_name = _run_attr('ea_name')
+    param = _run_attr('param')
+    symbol = _run_attr('symbol')
+    period = _run_attr('period')
+    deposit = _run_attr('deposit')
+    from_date = _run_attr('from_date')
+    to_date = _run_attr('to_date')
+    model = _run_attr('model')
+    spread = _run_attr('spread')
 
     def __init__(self, backtest):
-        self.ea_name = backtest.ea_name
-        self.param = backtest.param
-        self.symbol = backtest.symbol
-        self.from_date = backtest.from_date
-        self.to_date = backtest.to_date
-        self.model = backtest.model
-        self.spread = backtest.spread
+        self.run = backtest if isinstance(backtest, RunInfo) else RunInfo(backtest)
+
+    def _key(self):
+        return (self.run,)
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if type(self) is not type(other):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __ne__(self, other):
+        ret = self.__eq__(other)
+        return ret if ret is NotImplemented else not ret
+
+    def __hash__(self):
+        return hash(self._key())
 
 
 class BacktestReport(BaseReport):
     """
     Note:
-      backtest report class.
+      backtest report class. fields not found in report are None.
     Attributes:
       initial_deposit(int): initial deposit of backtest of optimization
     """
-    # result
-    profit = None
-    profit_factor = None
-    expected_payoff = None
-    max_drawdown = None
-    max_drawdown_rate = None
-    relative_drawdown = None
-    relative_drawdown_rate = None
-    abs_drawdown = None
-    abs_drawdown_rate = None
-    gross_profit = None
-    gross_loss = None
-    total_trades = None
-    largest_profit_trade = None
-    largest_loss_trade = None
-    average_profit_trade = None
-    average_loss_trade = None
-    modeling_quality_percentage = None
-    max_consecutive_profit_count = None
-    max_consecutive_profit = None
-    max_consecutive_loss_count = None
-    max_consecutive_loss = None
-    max_consecutive_wins_count = None
-    max_consecutive_wins_profit = None
-    max_consecutive_losses_count = None
-    max_consecutive_losses_loss = None
-    profit_trades = None
-    profit_trades_rate = None
-    loss_trades = None
-    loss_trades_rate = None
-    ave_consecutive_wins = None
-    ave_consecutive_losses = None
-    short_positions = None
-    short_positions_rate = None
-    long_positions = None
-    long_positions_rate = None
+    __slots__ = (
+        'initial_deposit',
+        # result
+        'profit',
+        'profit_factor',
+        'expected_payoff',
+        'max_drawdown',
+        'max_drawdown_rate',
+        'relative_drawdown',
+        'relative_drawdown_rate',
+        'abs_drawdown',
+        'abs_drawdown_rate',
+        'gross_profit',
+        'gross_loss',
+        'total_trades',
+        'largest_profit_trade',
+        'largest_loss_trade',
+        'average_profit_trade',
+        'average_loss_trade',
+        'modeling_quality_percentage',
+        'max_consecutive_profit_count',
+        'max_consecutive_profit',
+        'max_consecutive_loss_count',
+        'max_consecutive_loss',
+        'max_consecutive_wins_count',
+        'max_consecutive_wins_profit',
+        'max_consecutive_losses_count',
+        'max_consecutive_losses_loss',
+        'profit_trades',
+        'profit_trades_rate',
+        'loss_trades',
+        'loss_trades_rate',
+        'ave_consecutive_wins',
+        'ave_consecutive_losses',
+        'short_positions',
+        'short_positions_rate',
+        'long_positions',
+        'long_positions_rate',
+    )
 
     def __init__(self, backtest, alias=DEFAULT_MT5_NAME):
-        from bs4 import BeautifulSoup
-        import re
         super(BacktestReport, self).__init__(backtest)
 
         report_file = get_report_abs_path(backtest.test_dir)
-        with open(report_file, 'r', encoding='cp1251') as fp:
-            raw_html = fp.read()
-
-        b_soup = BeautifulSoup(raw_html, 'lxml')
-        summary_in_table = b_soup.find_all('table')[0]
-        tds = summary_in_table.find_all('td')
-
-        for index, td in enumerate(tds):
-            if td.text == 'Initial deposit':
-                self.initial_deposit = float(tds[index + 1].text)
-            if td.text == 'Modelling quality':
-                modeling_quality_percentage_str = re.sub('%', '', tds[index + 1].text)
-                self.modeling_quality_percentage = float(modeling_quality_percentage_str)
-            elif td.text == 'Total net profit':
-                self.profit = float(tds[index + 1].text)
-            elif td.text == 'Gross profit':
-                self.gross_profit = float(tds[index + 1].text)
-            elif td.text == 'Gross loss':
-                self.gross_loss = float(tds[index + 1].text)
-            elif td.text == 'Profit factor':
-                self.profit_factor = float(tds[index + 1].text)
-            elif td.text == 'Expected payoff':
-                self.expected_payoff = float(tds[index + 1].text)
-            elif td.text == 'Absolute drawdown':
-                self.abs_drawdown = float(tds[index + 1].text)
-            elif td.text == 'Maximal drawdown':
-                data, rate = self.get_data_and_rate(tds[index + 1].text)
-                self.max_drawdown_rate = rate
-                self.max_drawdown = data
-            elif td.text == 'Relative drawdown':
-                data, rate = self.get_data_and_rate(tds[index + 1].text)
-                self.relative_drawdown_rate = rate
-                self.relative_drawdown = data
-            elif td.text == 'Total trades':
-                self.total_trades = int(tds[index + 1].text)
-            elif td.text == 'Short positions (won %)':
-                data, rate = self.get_data_and_rate(tds[index + 1].text)
-                self.short_positions_rate = rate
-                self.short_positions = data
-            elif td.text == 'Long positions (won %)':
-                data, rate = self.get_data_and_rate(tds[index + 1].text)
-                self.long_positions_rate = rate
-                self.long_positions = data
-            elif td.text == 'Profit trades (% of total)':
-                data, rate = self.get_data_and_rate(tds[index + 1].text)
-                self.profit_trades_rate = rate
-                self.profit_trades = int(data)
-            elif td.text == 'Loss trades (% of total)':
-                data, rate = self.get_data_and_rate(tds[index + 1].text)
-                self.loss_trades_rate = rate
-                self.loss_trades = int(data)
-            elif td.text == 'Largest':
-                if tds[index + 1].text == 'profit trade':
-                    self.largest_profit_trade = float(tds[index + 2].text)
-                if tds[index + 3].text == 'loss trade':
-                    self.largest_loss_trade = float(tds[index + 4].text)
-            elif td.text == 'Average':
-                if tds[index + 1].text == 'profit trade':
-                    self.average_profit_trade = float(tds[index + 2].text)
-                elif tds[index + 1].text == 'consecutive wins':
-                    self.ave_consecutive_wins = int(tds[index + 2].text)
-                if tds[index + 3].text == 'loss trade':
-                    self.average_loss_trade = float(tds[index + 4].text)
-                elif tds[index + 3].text == 'consecutive losses':
-                    self.ave_consecutive_losses = int(tds[index + 4].text)
-            elif td.text == 'Maximum':
-                if tds[index + 1].text == 'consecutive wins (profit in money)':
-                    token = self.split_to_tokens(tds[index + 2].text)
-                    self.max_consecutive_wins_count = int(token[0])
-                    self.max_consecutive_wins_profit = float(token[1])
-                if tds[index + 3].text == 'consecutive losses (loss in money)':
-                    token = self.split_to_tokens(tds[index + 4].text)
-                    self.max_consecutive_losses_count = int(token[0])
-                    self.max_consecutive_losses_loss = float(token[1])
-            elif td.text == 'Maximal':
-                if tds[index + 1].text == 'consecutive profit (count of wins)':
-                    token = self.split_to_tokens(tds[index + 2].text)
-                    self.max_consecutive_profit = float(token[0])
-                    self.max_consecutive_profit_count = int(token[1])
-                if tds[index + 3].text == 'consecutive loss (count of losses)':
-                    token = self.split_to_tokens(tds[index + 4].text)
-                    self.max_consecutive_loss = float(token[0])
-                    self.max_consecutive_loss_count = int(token[1])
+        summary = read_backtest_summary(report_file)
+
+        for field in self.__slots__:
+            setattr(self, field, summary.get(field))
 
     def get_data_and_rate(self, line):
-        import re
-        from metatrader.exception import InvalidReportFormat
-        formatted_str = re.sub('(\(|\))', '', line)
-        values = formatted_str.split(r' ')
-
-        if len(values) != 2:
-            raise InvalidReportFormat('value of Maximal drawdown contains more than 2 values')
-
-        for value in values:
-            if re.match('.*\%$', value):
-                rate = re.sub(r'%', '', value)
-                rate = float(rate)
-            else:
-                data = float(value)
-        return data, rate
+        return get_data_and_rate(line)
 
     def split_to_tokens(self, line):
-        '''
-        Notes:
-          split consecutive xxx into two tokens.
-          e.g. 1 (123.45) => (1, 123.45)
-               123.45 (1) => (123.45, 1)
-        '''
-        import re
-        from metatrader.exception import InvalidReportFormat
+        return split_to_tokens(line)
+
+
+def get_data_and_rate(line):
+    """
+    Notes:
+      split value with rate into two floats.
+      e.g. 1267.33 (12.55%) => (1267.33, 12.55)
+           12.55% (1267.33) => (1267.33, 12.55)
+    """
+    from metatrader.exception import InvalidReportFormat
+    formatted_str = re.sub(r'(\(|\))', '', line)
+    values = formatted_str.split(r' ')
+
+    if len(values) != 2:
+        raise InvalidReportFormat('backtest report', 'pair value in %r' % line)
+
+    for value in values:
+        if re.match(r'.*%$', value):
+            rate = re.sub(r'%', '', value)
+            rate = float(rate)
+        else:
+            data = float(value)
+    return data, rate
+
+
+def split_to_tokens(line):
+    '''
+    Notes:
+      split consecutive xxx into two tokens.
+      e.g. 1 (123.45) => (1, 123.45)
+           123.45 (1) => (123.45, 1)
+    '''
+    from metatrader.exception import InvalidReportFormat
+
+    formatted_str = re.sub(r'(\(|\))', '', line)
+    values = formatted_str.split(r' ')
+
+    if len(values) != 2:
+        raise InvalidReportFormat('backtest report', 'pair value in %r' % line)
+
+    return values
+
+
+# backtest report is written in cp1251 by mt4. mt5 writes utf-16 with bom, which is transcoded to it
+REPORT_ENCODING = 'cp1251'
+
+_TABLE_START_RE = re.compile(rb'<table\b', re.I)
+_TABLE_END_RE = re.compile(rb'</table\s*>', re.I)
+_TD_RE = re.compile(rb'<td\b[^>]*>(.*?)</td\s*>', re.I | re.S)
+_TAG_RE = re.compile(rb'<[^>]*>')
+
+
+def _cell_text(raw):
+    """
+    Notes:
+      text of td like BeautifulSoup td.text. tags are dropped and entities are unescaped.
+    """
+    if b'<' in raw:
+        raw = _TAG_RE.sub(b'', raw)
+    text = raw.decode(REPORT_ENCODING)
+    if '&' in text:
+        text = html.unescape(text)
+    return text
+
+
+def _cell_key(raw):
+    # most of cells are plain text, they are looked up without decoding
+    if b'<' in raw or b'&' in raw:
+        return _cell_text(raw).encode(REPORT_ENCODING)
+    return raw
+
+
+def _number_handler(field, convert=float):
+    def handler(cells, index):
+        return {field: convert(_cell_text(cells[index + 1]))}
+
+    return handler
+
+
+def _data_and_rate_handler(field, convert=lambda v: v):
+    def handler(cells, index):
+        data, rate = get_data_and_rate(_cell_text(cells[index + 1]))
+        return {field: convert(data), field + '_rate': rate}
+
+    return handler
+
+
+def _modeling_quality_handler(cells, index):
+    return {'modeling_quality_percentage': float(re.sub('%', '', _cell_text(cells[index + 1])))}
+
+
+def _largest_handler(cells, index):
+    values = {}
+    if _cell_text(cells[index + 1]) == 'profit trade':
+        values['largest_profit_trade'] = float(_cell_text(cells[index + 2]))
+    if _cell_text(cells[index + 3]) == 'loss trade':
+        values['largest_loss_trade'] = float(_cell_text(cells[index + 4]))
+    return values
+
+
+def _average_handler(cells, index):
+    values = {}
+    label = _cell_text(cells[index + 1])
+    if label == 'profit trade':
+        values['average_profit_trade'] = float(_cell_text(cells[index + 2]))
+    elif label == 'consecutive wins':
+        values['ave_consecutive_wins'] = int(_cell_text(cells[index + 2]))
+    label = _cell_text(cells[index + 3])
+    if label == 'loss trade':
+        values['average_loss_trade'] = float(_cell_text(cells[index + 4]))
+    elif label == 'consecutive losses':
+        values['ave_consecutive_losses'] = int(_cell_text(cells[index + 4]))
+    return values
+
+
+def _maximum_handler(cells, index):
+    values = {}
+    if _cell_text(cells[index + 1]) == 'consecutive wins (profit in money)':
+        token = split_to_tokens(_cell_text(cells[index + 2]))
+        values['max_consecutive_wins_count'] = int(token[0])
+        values['max_consecutive_wins_profit'] = float(token[1])
+    if _cell_text(cells[index + 3]) == 'consecutive losses (loss in money)':
+        token = split_to_tokens(_cell_text(cells[index + 4]))
+        values['max_consecutive_losses_count'] = int(token[0])
+        values['max_consecutive_losses_loss'] = float(token[1])
+    return values
 
-        formatted_str = re.sub('(\(|\))', '', line)
-        values = formatted_str.split(r' ')
 
-        if len(values) != 2:
-            raise InvalidReportFormat('value of Maximal drawdown contains more than 2 values')
+def _maximal_handler(cells, index):
+    values = {}
+    if _cell_text(cells[index + 1]) == 'consecutive profit (count of wins)':
+        token = split_to_tokens(_cell_text(cells[index + 2]))
+        values['max_consecutive_profit'] = float(token[0])
+        values['max_consecutive_profit_count'] = int(token[1])
+    if _cell_text(cells[index + 3]) == 'consecutive loss (count of losses)':
+        token = split_to_tokens(_cell_text(cells[index + 4]))
+        values['max_consecutive_loss'] = float(token[0])
+        values['max_consecutive_loss_count'] = int(token[1])
+    return values
 
-        return values
+
+def _mt5_number(text):
+    # mt5 groups thousands by space, e.g. -12 107.20
+    return float(text.replace(' ', ''))
+
+
+def _mt5_pair(text):
+    """
+    Notes:
+      split mt5 value with value in parentheses into two texts.
+      e.g. 12 602.40 (120.08%) => ('12 602.40', '120.08%')
+    """
+    from metatrader.exception import InvalidReportFormat
+    match = re.match(r'^\s*(.*?)\s*\((.*)\)\s*$', text)
+    if match is None:
+        raise InvalidReportFormat('backtest report', 'pair value in %r' % text)
+    return match.groups()
+
+
+def _mt5_number_handler(field, convert=float):
+    def handler(cells, index):
+        return {field: convert(_mt5_number(_cell_text(cells[index + 1])))}
+
+    return handler
+
+
+def _mt5_data_and_rate_handler(field, convert=float):
+    def handler(cells, index):
+        data, rate = sorted(_mt5_pair(_cell_text(cells[index + 1])), key=lambda v: v.endswith('%'))
+        return {field: convert(_mt5_number(data)), field + '_rate': _mt5_number(rate.rstrip('%'))}
+
+    return handler
+
+
+def _mt5_pair_handler(first_field, first_convert, second_field, second_convert):
+    def handler(cells, index):
+        first, second = _mt5_pair(_cell_text(cells[index + 1]))
+        return {first_field: first_convert(_mt5_number(first)), second_field: second_convert(_mt5_number(second))}
+
+    return handler
+
+
+def _mt5_quality_handler(cells, index):
+    return {'modeling_quality_percentage': _mt5_number(_cell_text(cells[index + 1]).rstrip('%'))}
+
+
+# label of summary cell => handler which parses cells next to the label
+_SUMMARY_HANDLERS = {label.encode(REPORT_ENCODING): handler for label, handler in (
+    ('Initial deposit', _number_handler('initial_deposit')),
+    ('Modelling quality', _modeling_quality_handler),
+    ('Total net profit', _number_handler('profit')),
+    ('Gross profit', _number_handler('gross_profit')),
+    ('Gross loss', _number_handler('gross_loss')),
+    ('Profit factor', _number_handler('profit_factor')),
+    ('Expected payoff', _number_handler('expected_payoff')),
+    ('Absolute drawdown', _number_handler('abs_drawdown')),
+    ('Maximal drawdown', _data_and_rate_handler('max_drawdown')),
+    ('Relative drawdown', _data_and_rate_handler('relative_drawdown')),
+    ('Total trades', _number_handler('total_trades', int)),
+    ('Short positions (won %)', _data_and_rate_handler('short_positions')),
+    ('Long positions (won %)', _data_and_rate_handler('long_positions')),
+    ('Profit trades (% of total)', _data_and_rate_handler('profit_trades', int)),
+    ('Loss trades (% of total)', _data_and_rate_handler('loss_trades', int)),
+    ('Largest', _largest_handler),
+    ('Average', _average_handler),
+    ('Maximum', _maximum_handler),
+    ('Maximal', _maximal_handler),
+    # mt5 has one label per value
+    ('Initial Deposit:', _mt5_number_handler('initial_deposit')),
+    ('History Quality:', _mt5_quality_handler),
+    ('Total Net Profit:', _mt5_number_handler('profit')),
+    ('Gross Profit:', _mt5_number_handler('gross_profit')),
+    ('Gross Loss:', _mt5_number_handler('gross_loss')),
+    ('Profit Factor:', _mt5_number_handler('profit_factor')),
+    ('Expected Payoff:', _mt5_number_handler('expected_payoff')),
+    ('Balance Drawdown Absolute:', _mt5_number_handler('abs_drawdown')),
+    ('Balance Drawdown Maximal:', _mt5_data_and_rate_handler('max_drawdown')),
+    ('Balance Drawdown Relative:', _mt5_data_and_rate_handler('relative_drawdown')),
+    ('Total Trades:', _mt5_number_handler('total_trades', int)),
+    ('Short Trades (won %):', _mt5_data_and_rate_handler('short_positions')),
+    ('Long Trades (won %):', _mt5_data_and_rate_handler('long_positions')),
+    ('Profit Trades (% of total):', _mt5_data_and_rate_handler('profit_trades', int)),
+    ('Loss Trades (% of total):', _mt5_data_and_rate_handler('loss_trades', int)),
+    ('Largest profit trade:', _mt5_number_handler('largest_profit_trade')),
+    ('Largest loss trade:', _mt5_number_handler('largest_loss_trade')),
+    ('Average profit trade:', _mt5_number_handler('average_profit_trade')),
+    ('Average loss trade:', _mt5_number_handler('average_loss_trade')),
+    ('Maximum consecutive wins ($):', _mt5_pair_handler('max_consecutive_wins_count', int,
+                                                         'max_consecutive_wins_profit', float)),
+    ('Maximum consecutive losses ($):', _mt5_pair_handler('max_consecutive_losses_count', int,
+                                                           'max_consecutive_losses_loss', float)),
+    ('Maximal consecutive profit (count):', _mt5_pair_handler('max_consecutive_profit', float,
+                                                               'max_consecutive_profit_count', int)),
+    ('Maximal consecutive loss (count):', _mt5_pair_handler('max_consecutive_loss', float,
+                                                             'max_consecutive_loss_count', int)),
+    ('Average consecutive wins:', _mt5_number_handler('ave_consecutive_wins', int)),
+    ('Average consecutive losses:', _mt5_number_handler('ave_consecutive_losses', int)),
+)}
+
+# fields which summary table can fill. parsing stops when all of them are found
+SUMMARY_FIELDS = frozenset([
+    'initial_deposit', 'modeling_quality_percentage', 'profit', 'gross_profit', 'gross_loss', 'profit_factor',
+    'expected_payoff', 'abs_drawdown', 'max_drawdown', 'max_drawdown_rate', 'relative_drawdown',
+    'relative_drawdown_rate', 'total_trades', 'short_positions', 'short_positions_rate', 'long_positions',
+    'long_positions_rate', 'profit_trades', 'profit_trades_rate', 'loss_trades', 'loss_trades_rate',
+    'largest_profit_trade', 'largest_loss_trade', 'average_profit_trade', 'average_loss_trade',
+    'ave_consecutive_wins', 'ave_consecutive_losses', 'max_consecutive_wins_count', 'max_consecutive_wins_profit',
+    'max_consecutive_losses_count', 'max_consecutive_losses_loss', 'max_consecutive_profit',
+    'max_consecutive_profit_count', 'max_consecutive_loss', 'max_consecutive_loss_count',
+])
+
+
+def parse_backtest_summary(data):
+    """
+    Notes:
+      extract summary of backtest report from raw bytes without building DOM.
+      only first table is scanned, and scanning stops as soon as every field is found.
+      cells are looked up by label in dispatch table. mt5 report (utf-16 with bom) is transcoded first.
+    Args:
+      data(bytes-like): raw report. bytes, memoryview or mmap.mmap
+    Returns:
+      summary(dict): field name => value. same names as attributes of BacktestReport
+    Raises:
+      InvalidReportFormat: report has no table
+    """
+    from metatrader.exception import InvalidReportFormat
+
+    if encoding_of_head(data[:2]) != REPORT_ENCODING:
+        # labels and numbers are ascii, other text is only replaced where cp1251 lacks it
+        data = bytes(data).decode('utf-16').encode(REPORT_ENCODING, 'replace')
+
+    table_start = _TABLE_START_RE.search(data)
+    if table_start is None:
+        raise InvalidReportFormat('backtest report', '<table>')
+    table_end = _TABLE_END_RE.search(data, table_start.end())
+    end = table_end.start() if table_end else len(data)
+
+    td_iter = _TD_RE.finditer(data, table_start.end(), end)
+    cells = []
+    summary = {}
+    remaining = set(SUMMARY_FIELDS)
+
+    index = 0
+    while True:
+        # handlers look at most 4 cells ahead of label
+        while len(cells) <= index + 4:
+            td = next(td_iter, None)
+            if td is None:
+                break
+            cells.append(td.group(1))
+        if index >= len(cells):
+            break
+
+        handler = _SUMMARY_HANDLERS.get(_cell_key(cells[index]))
+        if handler is not None:
+            values = handler(cells, index)
+            summary.update(values)
+            remaining.difference_update(values)
+            if not remaining:
+                break
+        index += 1
+
+    return summary
+
+
+def read_backtest_summary(report_file):
+    """
+    Notes:
+      memory map backtest report and extract its summary. see parse_backtest_summary.
+    """
+    from metatrader.exception import InvalidReportFormat
+
+    with instrument.span(instrument.SPAN_PARSE_BACKTEST), open(report_file, 'rb') as fp:
+        if os.fstat(fp.fileno()).st_size == 0:
+            raise InvalidReportFormat(report_file, '<table>')
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            try:
+                return parse_backtest_summary(data)
+            except InvalidReportFormat as e:
+                e.report_file = report_file
+                raise
 
 
 class ShortReport(BaseReport):
     """
-    @todo: implement __hash__ and __eq__ to do set operation
     Notes:
-      this class has a result of backtest included in optimization report
+      this class has a result of backtest included in optimization report.
+      reports are equal when they have equal run and pass parameter, so they can be put in set
+      to dedup or join passes of several optimizations.
     Attributes:
-      param(dict(str:str)): ea parameter name and value dict
+      param(dict(str:str)): ea parameter name and value dict. built from param_key on access
+      param_key(tuple): frozen ea parameter, see freeze_param
       profit(float): profit
       total_trades(int): num of trades
       profit_factor(float): profit factor
@@ -225,12 +565,14 @@ class ShortReport(BaseReport):
       max_drawdown_rate(float): max drawdown rate of deposit
       initial_deposit(int): initial deposit of backtest of optimization
     """
+    __slots__ = ('param_key', 'profit', 'total_trades', 'profit_factor', 'expected_payoff', 'max_drawdown',
+                 'max_drawdown_rate', 'initial_deposit')
 
     def __init__(self, back_test, **kwargs):
         super(ShortReport, self).__init__(back_test)
         result = kwargs.copy()
 
-        self.param = result.pop('param')
+        self.param_key = freeze_param(result.pop('param'), self.run.param_items)
         self.profit = result.pop('profit')
         self.total_trades = result.pop('total_trades')
         self.profit_factor = result.pop('profit_factor')
@@ -239,139 +581,428 @@ class ShortReport(BaseReport):
         self.max_drawdown_rate = result.pop('max_drawdown_rate')
         self.initial_deposit = result.pop('initial_deposit')
 
+    @property
+    def param(self):
+        return dict(self.param_key)
 
-class OptimizationReport():
+    def _key(self):
+        return (self.run, self.param_key)
+
+
+class _OptimizationReportParser(HTMLParser):
+    """
+    Notes:
+      incremental parser of optimization report html.
+      it is fed by chunks and keeps only rows of results table which are not consumed yet.
+      first table has conditions of optimization, second table has results.
     """
+
+    def __init__(self):
+        super(_OptimizationReportParser, self).__init__()
+        self.has_title = False
+        self.initial_deposit = 0
+        self.rows = []
+
+        self._n_tables = 0
+        self._table_stack = []
+        self._div_stack = []
+        self._cells = None
+        self._cell = None
+        self._is_header_skipped = False
+
+    def is_valid(self):
+        return self.has_title and self.initial_deposit != 0
+
+    def pop_rows(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def _in_table(self, index):
+        return index in self._table_stack
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'div':
+            # text of divs with style is collected to find report title
+            self._div_stack.append([] if 'style' in dict(attrs) else None)
+        elif tag == 'table':
+            self._table_stack.append(self._n_tables)
+            self._n_tables += 1
+        elif tag == 'tr':
+            self._end_row()
+            if self._in_table(0) or self._in_table(1):
+                self._cells = []
+        elif tag == 'td' and self._cells is not None:
+            self._end_cell()
+            self._cell = (dict(attrs), [])
+
+    def handle_endtag(self, tag):
+        if tag == 'div':
+            if self._div_stack:
+                text = self._div_stack.pop()
+                if text is not None and ''.join(text) == 'Optimization Report':
+                    self.has_title = True
+        elif tag == 'td':
+            self._end_cell()
+        elif tag == 'tr':
+            self._end_row()
+        elif tag == 'table':
+            self._end_row()
+            if self._table_stack:
+                self._table_stack.pop()
+
+    def handle_data(self, data):
+        for text in self._div_stack:
+            if text is not None:
+                text.append(data)
+        if self._cell is not None:
+            self._cell[1].append(data)
+
+    def _end_cell(self):
+        if self._cell is not None:
+            attrs, text = self._cell
+            self._cells.append((attrs, ''.join(text)))
+            self._cell = None
+
+    def _end_row(self):
+        if self._cells is None:
+            return
+        self._end_cell()
+        cells, self._cells = self._cells, None
+
+        if self._in_table(1):
+            if not self._is_header_skipped:
+                # first tr is category name
+                self._is_header_skipped = True
+            else:
+                self.rows.append(cells)
+        elif self._in_table(0):
+            if cells and cells[0][1] == 'Initial deposit':
+                self.initial_deposit = float(cells[1][1])
+
+
+def get_param_from_text(text):
+    '''
     Note:
-      this class has short reports
+      create param dict from text in td title attribute in optimization report.
+    Args:
+      text(string): 
+        e.g.: x=2; y=0.2; z=true;
+    Returns:
+      param(dict): ea param names and values.
+    '''
+    param = {}
+    param_array = text.split(r';')
+    # delete last element because its None data
+    param_array.pop(-1)
+
+    for p in param_array:
+        name_value = p.split(r'=')
+        name = name_value[0]
+        value = name_value[1]
+
+        param[name] = value
+
+    return param
+
+
+def _cells_to_short_report(backtest, cells, initial_deposit):
+    values = {
+        'param': None,
+        'profit': None,
+        'total_trades': None,
+        'profit_factor': None,
+        'expected_payoff': None,
+        'max_drawdown': None,
+        'max_drawdown_rate': None,
+    }
+
+    for i, (attrs, text) in enumerate(cells):
+        if i == 0:
+            values['param'] = get_param_from_text(attrs.pop('title'))
+        elif i == 1:
+            values['profit'] = float(text)
+        elif i == 2:
+            values['total_trades'] = int(text)
+        elif i == 3:
+            values['profit_factor'] = float(text)
+        elif i == 4:
+            values['expected_payoff'] = float(text)
+        elif i == 5:
+            values['max_drawdown'] = float(text)
+        elif i == 6:
+            values['max_drawdown_rate'] = float(text)
+
+    return ShortReport(backtest, initial_deposit=initial_deposit, **values)
+
+
+def iter_optimization_results(backtest, report_file, chunk_size=64 * 1024):
     """
-    reports = []
+    Notes:
+      parse optimization report in one streaming pass and yield results one by one.
+      memory usage is bounded by chunk_size, not by number of passes in report.
+      title "Optimization Report" and initial deposit must come before results table,
+      that is how terminal writes the report.
+      xml spreadsheet report (.xml) is read by iter_xml_optimization_results.
+    Args:
+      backtest(metatrader.backtest.BackTest): backtest of optimization
+      report_file(string): abs path of optimization report
+      chunk_size(int): num of chars read from report at once
+    Returns:
+      generator of ShortReport
+    Raises:
+      InvalidReportFormat: title or initial deposit is not found
+    """
+    if report_file.endswith(XML_REPORT_SUFFIX):
+        yield from iter_xml_optimization_results(backtest, report_file)
+        return
+
+    with open(report_file, 'r', encoding=sniff_report_encoding(report_file)) as fp:
+        yield from iter_html_optimization_results(backtest, fp, report_file, chunk_size=chunk_size)
+
+
+def iter_html_optimization_results(backtest, fp, report_name, chunk_size=64 * 1024):
+    """
+    Notes:
+      parse html optimization report from opened text stream, e.g. report in metatrader.archive.
+      see iter_optimization_results.
+    Args:
+      fp(file): text stream of report
+      report_name(string): name of report in error message
+    """
+    from metatrader.exception import InvalidReportFormat
 
-    def _is_valid_format(self, raw_html):
-        from bs4 import BeautifulSoup
+    parser = _OptimizationReportParser()
+    run = RunInfo(backtest)
 
-        is_valid = False
+    def check_format():
+        if not parser.is_valid():
+            raise InvalidReportFormat(report_name, r'"Optimization Report" not found in html')
 
-        b_soup = BeautifulSoup(raw_html)
-        report_titles = b_soup.find_all(has_divtag_with_style)
+    while True:
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            parser.close()
+        else:
+            parser.feed(chunk)
 
-        for title in report_titles:
-            if title.text == 'Optimization Report':
-                if self._get_initial_deposit(raw_html) != 0:
-                    is_valid = True
-        return is_valid
+        rows = parser.pop_rows()
+        if rows:
+            check_format()
+        for cells in rows:
+            yield _cells_to_short_report(run, cells, parser.initial_deposit)
 
-    def _get_initial_deposit(self, raw_html):
-        from bs4 import BeautifulSoup
+        if not chunk:
+            break
 
-        initial_deposit = 0
-        b_soup = BeautifulSoup(raw_html)
-        conditions = b_soup.find_all('table')[0]
+    check_format()
 
-        trs = conditions.find_all('tr')
 
-        for tr in trs:
-            tds = tr.find_all('td')
-            if tds[0].text == 'Initial deposit':
-                initial_deposit = float(tds[1].text)
+def encoding_of_head(head):
+    """
+    Returns:
+      encoding of report which starts with bytes head. 'utf-16' if it has bom (mt5), otherwise REPORT_ENCODING (mt4)
+    """
+    if head[:2] in (b'\xff\xfe', b'\xfe\xff'):
+        return 'utf-16'
+    return REPORT_ENCODING
 
-        return initial_deposit
 
-    def _get_param_from_text(self, text):
-        '''
-        Note:
-          create param dict from text in td title attribute in optimization report.
-        Args:
-          text(string): 
-            e.g.: x=2; y=0.2; z=true;
-        Returns:
-          param(dict): ea param names and values.
-        '''
-        param = {}
-        param_array = text.split(r';')
-        # delete last element because its None data
-        param_array.pop(-1)
-
-        for p in param_array:
-            name_value = p.split(r'=')
-            name = name_value[0]
-            value = name_value[1]
+def sniff_report_encoding(report_file):
+    """
+    Returns:
+      'utf-16' if report has bom (mt5), otherwise REPORT_ENCODING (mt4)
+    """
+    with open(report_file, 'rb') as fp:
+        return encoding_of_head(fp.read(2))
 
+
+XML_REPORT_SUFFIX = '.xml'
+XML_FORWARD_REPORT_SUFFIX = '.forward.xml'
+_SS = '{urn:schemas-microsoft-com:office:spreadsheet}'
+_O = '{urn:schemas-microsoft-com:office:office}'
+
+# column of xml report => (field of ShortReport, convert)
+_XML_METRIC_COLUMNS = {
+    'Profit': ('profit', float),
+    'Trades': ('total_trades', int),
+    'Profit Factor': ('profit_factor', float),
+    'Expected Payoff': ('expected_payoff', float),
+    'Equity DD %': ('max_drawdown_rate', float),
+}
+# columns which are neither ShortReport field nor ea parameter
+_XML_OTHER_COLUMNS = frozenset(('Pass', 'Result', 'Forward Result', 'Back Result', 'Recovery Factor',
+                                'Sharpe Ratio', 'Custom'))
+
+
+def _xml_row_values(row):
+    """
+    Returns:
+      list of cell texts. cells skipped by ss:Index are None
+    """
+    values = []
+    for cell in row.iter(_SS + 'Cell'):
+        index = cell.get(_SS + 'Index')
+        if index is not None:
+            values.extend([None] * (int(index) - 1 - len(values)))
+        data = cell.find(_SS + 'Data')
+        values.append(data.text if data is not None else None)
+    return values
+
+
+def _xml_deposit(text):
+    # e.g.: 10000 USD
+    try:
+        return float(text.split()[0])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def _xml_values_to_short_report(run, header, values, initial_deposit):
+    result = dict.fromkeys(('profit', 'total_trades', 'profit_factor', 'expected_payoff', 'max_drawdown',
+                            'max_drawdown_rate'))
+    param = {}
+    for i, name, metric in header:
+        value = values[i] if i < len(values) else None
+        if metric is None:
             param[name] = value
+        elif value is not None:
+            field, convert = metric
+            result[field] = convert(value)
+    return ShortReport(run, param=param, initial_deposit=initial_deposit, **result)
 
-        return param
-
-    def _get_results(self, backtest, raw_html):
-        from bs4 import BeautifulSoup
-        results = []
-        initial_deposit = self._get_initial_deposit(raw_html)
-
-        b_soup = BeautifulSoup(raw_html)
-        results_in_table = b_soup.find_all('table')[1]
-        trs = results_in_table.find_all('tr')
-
-        # delete first tr, because it is category name
-        trs.pop(0)
-
-        for tr in trs:
-            tds = tr.find_all('td')
-            param = None
-            profit = None
-            total_trades = None
-            profit_factor = None
-            expected_payoff = None
-            max_drawdown = None
-            max_drawdown_rate = None
-
-            for i, td in enumerate(tds):
-                if i == 0:
-                    param_raw_text = td.attrs.pop('title')
-                    param = self._get_param_from_text(param_raw_text)
-                elif i == 1:
-                    profit = float(td.text)
-                elif i == 2:
-                    total_trades = int(td.text)
-                elif i == 3:
-                    profit_factor = float(td.text)
-                elif i == 4:
-                    expected_payoff = float(td.text)
-                elif i == 5:
-                    max_drawdown = float(td.text)
-                elif i == 6:
-                    max_drawdown_rate = float(td.text)
-
-            short_report = ShortReport(backtest,
-                                       param=param,
-                                       profit=profit,
-                                       total_trades=total_trades,
-                                       profit_factor=profit_factor,
-                                       expected_payoff=expected_payoff,
-                                       max_drawdown=max_drawdown,
-                                       max_drawdown_rate=max_drawdown_rate,
-                                       initial_deposit=initial_deposit)
-            results.append(short_report)
-        return results
 
-    def __init__(self, backtest, alias=DEFAULT_MT5_NAME):
-        from metatrader.exception import InvalidReportFormat
+def iter_xml_optimization_results(backtest, report_file):
+    """
+    Notes:
+      parse optimization report of mt5 in xml spreadsheet format and yield results one by one.
+      forward results (report.forward.xml) have the same format.
+      rows are cleared as soon as they are read, so memory usage does not grow with num of passes.
+      columns which are not known metrics are ea parameters. max_drawdown is not in xml report, it is None.
+    Args:
+      backtest(metatrader.backtest.BackTest): backtest of optimization
+      report_file(string): abs path of xml report
+    Returns:
+      generator of ShortReport
+    Raises:
+      InvalidReportFormat: results table is not found
+    """
+    with open(report_file, 'rb') as fp:
+        yield from iter_xml_optimization_stream(backtest, fp, report_file)
+
+
+def iter_xml_optimization_stream(backtest, fp, report_name):
+    """
+    Notes:
+      parse xml optimization report from opened binary stream, e.g. report in metatrader.archive.
+      see iter_xml_optimization_results.
+    Args:
+      fp(file): binary stream of report
+      report_name(string): name of report in error message
+    """
+    from xml.etree.ElementTree import ParseError, iterparse
+
+    from metatrader.exception import InvalidReportFormat
+
+    run = RunInfo(backtest)
+    initial_deposit = None
+    header = None
+    table = None
+
+    try:
+        for event, elem in iterparse(fp, events=('start', 'end')):
+            if event == 'start':
+                if elem.tag == _SS + 'Table':
+                    table = elem
+                continue
+
+            if elem.tag == _O + 'Deposit':
+                initial_deposit = _xml_deposit(elem.text)
+            elif elem.tag == _SS + 'Table':
+                # only first worksheet has results
+                break
+            elif elem.tag == _SS + 'Row' and table is not None:
+                values = _xml_row_values(elem)
+                # row is done, drop it from table to keep memory flat
+                elem.clear()
+                del table[:]
+
+                if header is None:
+                    header = [(i, name, _XML_METRIC_COLUMNS.get(name)) for i, name in enumerate(values)
+                              if name is not None and name not in _XML_OTHER_COLUMNS]
+                    continue
+                yield _xml_values_to_short_report(run, header, values, initial_deposit)
+    except ParseError as e:
+        raise InvalidReportFormat(report_name, 'well formed xml (%s)' % e)
+
+    if header is None:
+        raise InvalidReportFormat(report_name, 'results table')
+
+
+class OptimizationReport():
+    """
+    Note:
+      this class has short reports.
+      xml report of mt5 is used if terminal wrote one, otherwise html report.
+    Attributes:
+      results(list): ShortReport of each pass
+      forward_results(list): ShortReport of each forward pass. empty unless backtest.forward_mode is set
+    """
+    reports = []
 
-        report_file = get_report_abs_path(backtest.ea_name)
+    def _get_param_from_text(self, text):
+        return get_param_from_text(text)
 
-        with open(report_file, 'r') as fp:
-            raw_html = fp.read()
+    def __init__(self, backtest, alias=DEFAULT_MT5_NAME):
+        report_file = get_optimization_report_abs_path(backtest.test_dir)
 
-        if self._is_valid_format(raw_html):
+        with instrument.span(instrument.SPAN_PARSE_OPTIMIZATION):
             try:
-                self.results = self._get_results(backtest, raw_html)
+                self.results = list(iter_optimization_results(backtest, report_file))
             except KeyError:
                 err_msg = 'optimization report seems invlid format'
                 logging.error(err_msg)
                 raise
-        else:
-            raise InvalidReportFormat(report_file, r'"Optimization Report" not found in html')
+
+            self.forward_results = []
+            forward_file = get_forward_report_abs_path(backtest.test_dir)
+            if getattr(backtest, 'forward_mode', 0) and os.path.exists(forward_file):
+                self.forward_results = list(iter_xml_optimization_results(backtest, forward_file))
+
+    def to_table(self):
+        """
+        Returns:
+          metatrader.result_table.ResultTable of results
+        """
+        from metatrader.result_table import ResultTable
+        return ResultTable.from_reports(self.results)
+
+
+def read_optimization_table(backtest, report_file):
+    """
+    Notes:
+      stream optimization report straight into columnar table without keeping ShortReport objects.
+    Returns:
+      metatrader.result_table.ResultTable
+    """
+    from metatrader.result_table import ResultTable
+    return ResultTable.from_reports(iter_optimization_results(backtest, report_file))
 
 
 def get_report_abs_path(test_dir):
-    import os
     report = os.path.join(test_dir, 'report', 'report.htm')
     return report
+
+
+def get_optimization_report_abs_path(test_dir):
+    """
+    Returns:
+      path of xml report if it exists, otherwise path of html report
+    """
+    report = os.path.join(test_dir, 'report', 'report' + XML_REPORT_SUFFIX)
+    if os.path.exists(report):
+        return report
+    return get_report_abs_path(test_dir)
+
+
+def get_forward_report_abs_path(test_dir):
+    return os.path.join(test_dir, 'report', 'report' + XML_FORWARD_REPORT_SUFFIX)
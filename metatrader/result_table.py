@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+columnar view of optimization results.
+metrics are typed numpy columns and ea parameters are dictionary encoded,
+so filter, sort, top k and pareto selection are vectorized.
+"""
+from array import array
+
+import numpy as np
+
+# metric name, numpy dtype, array.array typecode used while building
+METRIC_COLUMNS = (
+    ('profit', 'f8', 'd'),
+    ('total_trades', 'i8', 'q'),
+    ('profit_factor', 'f8', 'd'),
+    ('expected_payoff', 'f8', 'd'),
+    ('max_drawdown', 'f8', 'd'),
+    ('max_drawdown_rate', 'f8', 'd'),
+    ('initial_deposit', 'f8', 'd'),
+)
+METRIC_DTYPE = np.dtype([(name, dtype) for name, dtype, _ in METRIC_COLUMNS])
+
+# value of integer column when report has no value
+MISSING_INT = -1
+
+
+class ResultTable(object):
+    """
+    Notes:
+      table of optimization passes.
+      use ResultTable.from_reports to build it from ShortReport objects.
+    Attributes:
+      metrics(numpy.ndarray): structured array with METRIC_DTYPE. missing floats are nan, missing ints are -1
+      param_codes(dict(str:numpy.ndarray)): parameter name => int32 codes into param_categories.
+        code -1 means parameter is not in the pass
+      param_categories(dict(str:list)): parameter name => distinct values as written in report
+    """
+
+    def __init__(self, metrics, param_codes, param_categories):
+        self.metrics = metrics
+        self.param_codes = param_codes
+        self.param_categories = param_categories
+
+    @classmethod
+    def from_reports(cls, reports):
+        """
+        Notes:
+          build table from iterable of ShortReport.
+          values are appended into compact arrays, so it can consume
+          metatrader.report.iter_optimization_results without keeping report objects.
+        """
+        columns = [array(typecode) for _, _, typecode in METRIC_COLUMNS]
+        codes = {}
+        encoders = {}
+        n_rows = 0
+
+        for report in reports:
+            for column, (name, dtype, _) in zip(columns, METRIC_COLUMNS):
+                value = getattr(report, name)
+                if value is None:
+                    value = MISSING_INT if dtype == 'i8' else float('nan')
+                column.append(value)
+
+            # ShortReport has frozen param, which avoids building dict per row
+            items = report.param_key if hasattr(report, 'param_key') else report.param.items()
+            for name, value in items:
+                if name not in codes:
+                    # parameter seen first time, earlier rows don't have it
+                    codes[name] = array('l', [-1] * n_rows)
+                    encoders[name] = {}
+                encoder = encoders[name]
+                code = encoder.get(value)
+                if code is None:
+                    code = encoder[value] = len(encoder)
+                codes[name].append(code)
+            n_rows += 1
+            for name, param_codes in codes.items():
+                if len(param_codes) < n_rows:
+                    param_codes.append(-1)
+
+        metrics = np.empty(n_rows, dtype=METRIC_DTYPE)
+        for column, (name, dtype, _) in zip(columns, METRIC_COLUMNS):
+            metrics[name] = np.frombuffer(column, dtype=dtype) if n_rows else []
+
+        param_codes = {name: np.array(values, dtype=np.int32) for name, values in codes.items()}
+        param_categories = {name: sorted(encoder, key=encoder.get) for name, encoder in encoders.items()}
+        return cls(metrics, param_codes, param_categories)
+
+    def __len__(self):
+        return len(self.metrics)
+
+    def __getitem__(self, name):
+        """
+        Returns:
+          metric column, or decoded parameter column as object array
+        """
+        if name in METRIC_DTYPE.names:
+            return self.metrics[name]
+        return self.param_values(name, dtype=object)
+
+    def param_values(self, name, dtype=float):
+        """
+        Notes:
+          decode parameter column. each distinct value is converted only once.
+          rows without the parameter get nan (None for object dtype).
+        Args:
+          name(string): parameter name
+          dtype: type to convert string values to. e.g.: float, int, object
+        """
+        categories = self.param_categories[name]
+        if dtype is object:
+            lookup = np.empty(len(categories) + 1, dtype=object)
+            lookup[:-1] = categories
+            lookup[-1] = None
+        else:
+            lookup = np.array([dtype(v) for v in categories] + [np.nan], dtype=float)
+        # code -1 picks the last element of lookup, which is missing value
+        return lookup[self.param_codes[name]]
+
+    def param_mask(self, name, value):
+        """
+        Returns:
+          boolean mask of rows whose parameter equals value(string as written in report)
+        """
+        categories = self.param_categories.get(name, [])
+        if value not in categories:
+            return np.zeros(len(self), dtype=bool)
+        return self.param_codes[name] == categories.index(value)
+
+    def take(self, indices):
+        """
+        Returns:
+          new table with rows of indices or boolean mask. parameter categories are shared.
+        """
+        return ResultTable(self.metrics[indices],
+                           {name: codes[indices] for name, codes in self.param_codes.items()},
+                           self.param_categories)
+
+    def filter(self, mask):
+        return self.take(np.asarray(mask, dtype=bool))
+
+    def sort(self, by, descending=True):
+        values = -self.metrics[by] if descending else self.metrics[by]
+        # stable order, nan goes last
+        return self.take(np.argsort(values, kind='mergesort'))
+
+    def top_k(self, by, k, descending=True):
+        """
+        Returns:
+          table with k best rows of column by, sorted
+        """
+        if k >= len(self):
+            return self.sort(by, descending=descending)
+        values = -self.metrics[by] if descending else self.metrics[by]
+        values = np.where(np.isnan(values), np.inf, values)
+        candidates = np.argpartition(values, k - 1)[:k]
+        order = candidates[np.argsort(values[candidates], kind='mergesort')]
+        return self.take(order)
+
+    def pareto_mask(self, maximize='profit', minimize='max_drawdown_rate'):
+        """
+        Notes:
+          rows which no other row beats on both columns.
+          if rows are identical on both columns, first one is kept.
+          rows with nan in either column are excluded.
+        """
+        gain = self.metrics[maximize].astype(float)
+        loss = self.metrics[minimize].astype(float)
+        valid = ~(np.isnan(gain) | np.isnan(loss))
+        index = np.flatnonzero(valid)
+
+        # best gain first, lower loss first among equal gains
+        order = index[np.lexsort((loss[index], -gain[index]))]
+        sorted_loss = loss[order]
+        best_loss_before = np.concatenate(([np.inf], np.minimum.accumulate(sorted_loss)[:-1]))
+
+        mask = np.zeros(len(self), dtype=bool)
+        mask[order[sorted_loss < best_loss_before]] = True
+        return mask
+
+    def pareto_front(self, maximize='profit', minimize='max_drawdown_rate'):
+        """
+        Returns:
+          table of pareto optimal rows sorted by maximize column, best first
+        """
+        front = self.filter(self.pareto_mask(maximize=maximize, minimize=minimize))
+        return front.sort(maximize)
+
+    def to_pandas(self):
+        """
+        Returns:
+          pandas.DataFrame. parameters become categorical columns without copying strings per row
+        """
+        import pandas as pd
+
+        frame = pd.DataFrame(self.metrics)
+        for name, codes in self.param_codes.items():
+            frame[name] = pd.Categorical.from_codes(codes, categories=self.param_categories[name])
+        return frame
+
+    def to_arrow(self):
+        """
+        Returns:
+          pyarrow.Table. parameters become dictionary encoded columns
+        """
+        import pyarrow as pa
+
+        arrays = [pa.array(self.metrics[name]) for name in METRIC_DTYPE.names]
+        names = list(METRIC_DTYPE.names)
+        for name, codes in self.param_codes.items():
+            indices = pa.array(codes, mask=codes < 0)
+            arrays.append(pa.DictionaryArray.from_arrays(indices, pa.array(self.param_categories[name])))
+            names.append(name)
+        return pa.Table.from_arrays(arrays, names=names)
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+bounded retries of failed runs.
+failures are classified as retryable (terminal crashed, hung or timed out) or deterministic
+(report is invalid or missing, e.g. ea or symbol does not exist), only retryable ones are run again.
+"""
+import logging
+import time
+
+from metatrader.exception import InvalidReportFormat, TerminalError
+
+
+def is_retryable(error):
+    """
+    Returns:
+      True if running again may succeed
+    """
+    if isinstance(error, TerminalError):
+        return error.retryable
+    if isinstance(error, (InvalidReportFormat, FileNotFoundError, ValueError, KeyError)):
+        # same inputs give same report
+        return False
+    # e.g. file locked by antivirus or terminal which is shutting down
+    return isinstance(error, OSError)
+
+
+class RetryPolicy(object):
+    """
+    Notes:
+      exponential backoff between attempts of retryable failures.
+    Args:
+      max_attempts(int): num of attempts including the first one
+      backoff(float): seconds before the second attempt
+      factor(float): backoff is multiplied by this after each attempt
+      max_backoff(float): upper bound of backoff
+    """
+
+    def __init__(self, max_attempts=3, backoff=10.0, factor=2.0, max_backoff=300.0):
+        if max_attempts < 1:
+            raise ValueError('max_attempts must be 1 or more, got %s' % max_attempts)
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.factor = factor
+        self.max_backoff = max_backoff
+
+    def delay(self, attempt):
+        """
+        Returns:
+          seconds to wait after failed attempt (1 based)
+        """
+        return min(self.backoff * self.factor ** (attempt - 1), self.max_backoff)
+
+    def call(self, func, name='job', sleep=time.sleep):
+        """
+        Notes:
+          call func until it succeeds, fails deterministically or attempts run out.
+        Args:
+          func(callable): function without arguments
+          name(string): name of job in log
+          sleep(callable): sleep function, replaced in tests
+        Returns:
+          return value of func
+        Raises:
+          last error of func. its attempts attribute is num of attempts
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                return func()
+            except Exception as e:
+                e.attempts = attempt
+                if not is_retryable(e) or attempt == self.max_attempts:
+                    logging.error('%s failed after %d attempts: %s', name, attempt, e)
+                    raise
+                delay = self.delay(attempt)
+                logging.warning('%s failed (attempt %d of %d), retry in %.0f seconds: %s', name, attempt,
+                                self.max_attempts, delay, e)
+                sleep(delay)
@@ -4,34 +4,18 @@ import os
 import shutil
 
 from metatrader.backtest import BackTest
+from metatrader.catalog import SymbolCatalog
 from metatrader.mt5 import initizalize
 
 DEPOSIT = 10000
 RESULT_DIR = 'D:\\metatrader\\test_res_3'
 SYMBOLS_DATA_DIR = 'D:\\metatrader\data'
 METATRADER_DIR = 'C:\\Program Files\\MetaTrader 5'
-
-
-def list_symbols():
-    def parse_date(date_str):
-        return datetime.datetime.strptime(date_str, '%d%m%Y')
-
-    for file in os.listdir(SYMBOLS_DATA_DIR):
-        if file.endswith('.csv'):
-            file = file.split('.')[0]
-            symbol, _, start_date, end_date = file.split('_')
-            start_date, end_date = map(parse_date, (start_date, end_date))
-
-            yield symbol, start_date, end_date
-
-
-def get_symbol_dates(symbol):
-    for s, d1, d2 in list_symbols():
-        if s == symbol:
-            return d1, d2
+CATALOG = SymbolCatalog(SYMBOLS_DATA_DIR)
 
 
 def test_strategy(strategy, params, symbol, from_date, to_date, timeframe):
+    CATALOG.validate_range(symbol, from_date, to_date)
     dir_name = '{}_{}_{}_{}'.format(strategy, timeframe, symbol, datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%S'))
     test_dir = os.path.join(RESULT_DIR, dir_name)
 
@@ -71,5 +55,5 @@ if __name__ == '__main__':
     strategy = 'ExpertMAMA'
     symbol = 'DGD'
     timeframe = 'M5'
-    start_date, end_date = get_symbol_dates(symbol)
+    start_date, end_date = CATALOG.get_symbol_dates(symbol)
     test_strategy(strategy, params, symbol, start_date, end_date, timeframe)
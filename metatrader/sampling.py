@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+dependency free parameter grid and random sampler.
+same interface as sklearn.model_selection.ParameterGrid and ParameterSampler for lists of values.
+"""
+import itertools
+import random
+
+
+class ParameterGrid(object):
+    """
+    Notes:
+      every combination of parameter values. keys are iterated in sorted order, last key changes fastest.
+    Args:
+      param_grid(dict or list of dict): parameter name => list of values
+    """
+
+    def __init__(self, param_grid):
+        if isinstance(param_grid, dict):
+            param_grid = [param_grid]
+        self.param_grid = param_grid
+
+    def __iter__(self):
+        for grid in self.param_grid:
+            names = sorted(grid)
+            for values in itertools.product(*(grid[name] for name in names)):
+                yield dict(zip(names, values))
+
+    def __len__(self):
+        total = 0
+        for grid in self.param_grid:
+            n = 1
+            for values in grid.values():
+                n *= len(values)
+            total += n
+        return total
+
+    def __getitem__(self, index):
+        """
+        Notes:
+          combination at index without iterating former ones
+        """
+        for grid in self.param_grid:
+            names = sorted(grid)
+            n = 1
+            for name in names:
+                n *= len(grid[name])
+            if index >= n:
+                index -= n
+                continue
+
+            values = []
+            for name in reversed(names):
+                index, value_index = divmod(index, len(grid[name]))
+                values.append(grid[name][value_index])
+            return dict(zip(names, reversed(values)))
+        raise IndexError('ParameterGrid index out of range')
+
+
+class ParameterSampler(object):
+    """
+    Notes:
+      n_iter random combinations of parameter values.
+      if all values are lists, combinations are sampled from grid without replacement,
+      so n_iter larger than grid gives every combination once.
+      otherwise values with rvs method (e.g. scipy.stats distributions) are sampled with replacement.
+    Args:
+      param_distributions(dict): parameter name => list of values or distribution
+      n_iter(int): num of combinations
+      random_state(int): seed. same seed gives same combinations
+    """
+
+    def __init__(self, param_distributions, n_iter, random_state=None):
+        self.param_distributions = param_distributions
+        self.n_iter = n_iter
+        self.random_state = random_state
+
+    def _is_all_lists(self):
+        return not any(hasattr(v, 'rvs') for v in self.param_distributions.values())
+
+    def __iter__(self):
+        rnd = random.Random(self.random_state)
+        names = sorted(self.param_distributions)
+
+        if self._is_all_lists():
+            grid = ParameterGrid(self.param_distributions)
+            n_iter = min(self.n_iter, len(grid))
+            for index in rnd.sample(range(len(grid)), n_iter):
+                yield grid[index]
+            return
+
+        for _ in range(self.n_iter):
+            params = {}
+            for name in names:
+                values = self.param_distributions[name]
+                if hasattr(values, 'rvs'):
+                    params[name] = values.rvs(random_state=rnd.randint(0, 2 ** 32 - 1))
+                else:
+                    params[name] = rnd.choice(values)
+            yield params
+
+    def __len__(self):
+        if self._is_all_lists():
+            return min(self.n_iter, len(ParameterGrid(self.param_distributions)))
+        return self.n_iter
@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+"""
+isolated portable terminals cloned from one base install.
+terminals which run at once need separate data folders. a sandbox is a copy of the base install
+(and of its data folder if it is not portable) which is launched with /portable:
+
+  <root>/<name>/terminal64.exe, MQL5/..., Bases/...
+  <root>/<name>/.sandbox.json   base, stamp of base and clone counts
+
+each file is cloned as cheaply as it is safe:
+  reflink   copy on write clone, on filesystems which support it (btrfs, xfs)
+  hardlink  files which terminal replaces but never writes in place (LINK_PATTERNS): binaries, compiled experts
+  copy      everything else, e.g. history of Bases which terminal appends to, config files and profiles
+"""
+import fnmatch
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+
+from metatrader import mt5
+
+MANIFEST_FILE = '.sandbox.json'
+# files which are hardlinked when reflink is not supported. terminal never writes into them in place
+LINK_PATTERNS = ('*.exe', '*.dll', '*.ex5', '*.ex4')
+# files which are not cloned. logs, tester agents and their caches are own of each sandbox
+EXCLUDE_PATTERNS = ('logs/*', 'Tester/*', 'MQL5/Logs/*', mt5.ORIGIN_TXT, MANIFEST_FILE, '*.tmp')
+# files whose change makes sandbox stale: terminal update or recompiled experts
+STAMP_PATTERNS = ('*.exe', '*.dll', '*.ex5', '*.ex4')
+
+# linux ioctl of reflink, FICLONE in linux/fs.h
+_FICLONE = 0x40049409
+
+
+def _match(path, patterns):
+    return any(fnmatch.fnmatch(path, pattern) for pattern in patterns)
+
+
+def reflink(src, dst):
+    """
+    Notes:
+      copy on write clone of src. only linux filesystems with FICLONE are supported
+    Returns:
+      True if dst was cloned, False if reflink is not supported
+    """
+    try:
+        import fcntl
+    except ImportError:
+        return False
+
+    with open(src, 'rb') as src_fp, open(dst, 'wb') as dst_fp:
+        try:
+            fcntl.ioctl(dst_fp.fileno(), _FICLONE, src_fp.fileno())
+        except OSError:
+            cloned = False
+        else:
+            cloned = True
+    if not cloned:
+        os.remove(dst)
+        return False
+    shutil.copystat(src, dst)
+    return True
+
+
+def clone_file(src, dst, link=False):
+    """
+    Notes:
+      clone src into dst by reflink, hardlink if link is True, or copy
+    Returns:
+      method used: 'reflink', 'hardlink' or 'copy'
+    """
+    if reflink(src, dst):
+        return 'reflink'
+    if link:
+        try:
+            os.link(src, dst)
+            return 'hardlink'
+        except OSError:
+            # other device or filesystem without hardlinks
+            pass
+    shutil.copy2(src, dst)
+    return 'copy'
+
+
+def _same_file(src_stat, dst_path):
+    try:
+        dst_stat = os.stat(dst_path)
+    except FileNotFoundError:
+        return False
+    return (src_stat.st_size, src_stat.st_mtime_ns) == (dst_stat.st_size, dst_stat.st_mtime_ns)
+
+
+class SandboxManager(object):
+    """
+    Notes:
+      clone base install into sandboxes under root and register them as portable terminals.
+    Args:
+      base_path(string): install folder of base terminal
+      root(string): directory of sandboxes
+      link_patterns(tuple): files which may be hardlinked, relative path glob
+      exclude_patterns(tuple): files which are not cloned, relative path glob
+      portable(bool): base terminal runs in portable mode, its data folder is install folder
+    """
+
+    def __init__(self, base_path, root, link_patterns=LINK_PATTERNS, exclude_patterns=EXCLUDE_PATTERNS,
+                 portable=False):
+        if not os.path.isdir(base_path):
+            err_msg = 'base terminal %s not exists' % base_path
+            logging.error(err_msg)
+            raise IOError(err_msg)
+        self.base_path = base_path
+        self.root = root
+        self.link_patterns = link_patterns
+        self.exclude_patterns = exclude_patterns
+        self.portable = portable
+        os.makedirs(root, exist_ok=True)
+
+    def _sources(self):
+        """
+        Returns:
+          list of folders merged into a sandbox: install folder, and data folder if it is elsewhere
+        """
+        sources = [self.base_path]
+        # data folder is install folder if uac is disabled or base is portable
+        appdata_path, _ = mt5.discover(self.base_path, portable=self.portable)
+        if os.path.abspath(appdata_path) != os.path.abspath(self.base_path):
+            sources.append(appdata_path)
+        return sources
+
+    def _base_tree(self):
+        """
+        Returns:
+          (dirs, files). dirs is sorted relative paths with '/' of directories, files is sorted
+          (relative path, abs path) of files to clone. data folder wins over install folder
+        """
+        dirs = set()
+        files = {}
+        for source in self._sources():
+            for dir_path, dir_names, file_names in os.walk(source):
+                rel_dir = os.path.relpath(dir_path, source).replace(os.sep, '/')
+                prefix = '' if rel_dir == '.' else rel_dir + '/'
+                # excluded folders are not walked, e.g. tester caches
+                dir_names[:] = [d for d in dir_names if not _match(prefix + d + '/', self.exclude_patterns)]
+                dirs.update(prefix + d for d in dir_names)
+                for file_name in file_names:
+                    path = prefix + file_name
+                    if not _match(path, self.exclude_patterns):
+                        files[path] = os.path.join(dir_path, file_name)
+        return sorted(dirs), sorted(files.items())
+
+    def base_stamp(self):
+        """
+        Returns:
+          hex digest of paths, sizes and mtimes of STAMP_PATTERNS files of base
+        """
+        sha = hashlib.sha256()
+        for path, abs_path in self._base_tree()[1]:
+            if _match(path, STAMP_PATTERNS):
+                st = os.stat(abs_path)
+                sha.update(('%s:%d:%d\n' % (path, st.st_size, st.st_mtime_ns)).encode('utf-8'))
+        return sha.hexdigest()
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def manifest(self, name):
+        """
+        Returns:
+          dict of manifest of sandbox, None if it is not a sandbox
+        """
+        try:
+            with open(os.path.join(self.path(name), MANIFEST_FILE)) as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return None
+
+    def _write_manifest(self, name, manifest):
+        manifest_path = os.path.join(self.path(name), MANIFEST_FILE)
+        tmp_path = manifest_path + '.tmp'
+        with open(tmp_path, 'w') as fp:
+            json.dump(manifest, fp, sort_keys=True)
+        os.replace(tmp_path, manifest_path)
+
+    def sandboxes(self):
+        """
+        Returns:
+          sorted names of sandboxes under root
+        """
+        return sorted(name for name in os.listdir(self.root) if self.manifest(name) is not None)
+
+    def _sync(self, name):
+        """
+        Notes:
+          clone base files which are missing in sandbox or differ from base.
+          sandbox copy is removed first, so a hardlinked file never writes through to base.
+        Returns:
+          dict of method => num of cloned files
+        """
+        counts = {'reflink': 0, 'hardlink': 0, 'copy': 0, 'unchanged': 0}
+        sandbox_path = self.path(name)
+        dirs, files = self._base_tree()
+        # empty folders too, e.g. MQL5/Profiles/Tester which param file is copied into
+        for path in dirs:
+            os.makedirs(os.path.join(sandbox_path, *path.split('/')), exist_ok=True)
+        for path, abs_path in files:
+            dst_path = os.path.join(sandbox_path, *path.split('/'))
+            if _same_file(os.stat(abs_path), dst_path):
+                counts['unchanged'] += 1
+                continue
+            os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+            if os.path.lexists(dst_path):
+                os.remove(dst_path)
+            counts[clone_file(abs_path, dst_path, link=_match(path, self.link_patterns))] += 1
+        return counts
+
+    def create(self, name):
+        """
+        Notes:
+          clone base into new sandbox. existing sandbox of name is replaced
+        Returns:
+          abs path of sandbox
+        """
+        sandbox_path = self.path(name)
+        self.teardown(name)
+        try:
+            counts = self._sync(name)
+        except BaseException:
+            shutil.rmtree(sandbox_path, ignore_errors=True)
+            raise
+        now = time.time()
+        self._write_manifest(name, {'base': os.path.abspath(self.base_path), 'stamp': self.base_stamp(),
+                                    'created_at': now, 'refreshed_at': now, 'counts': counts})
+        logging.info('sandbox %s created from %s: %s', sandbox_path, self.base_path, counts)
+        return os.path.abspath(sandbox_path)
+
+    def is_stale(self, name):
+        """
+        Returns:
+          True if terminal or experts of base changed since sandbox was created or refreshed
+        """
+        manifest = self.manifest(name)
+        return manifest is None or manifest.get('stamp') != self.base_stamp()
+
+    def refresh(self, name):
+        """
+        Notes:
+          clone files of base which changed since sandbox was synced, e.g. updated terminal or recompiled ea.
+          files of sandbox which base does not have (logs, reports, tester caches) are kept.
+        Returns:
+          dict of method => num of cloned files
+        """
+        manifest = self.manifest(name)
+        if manifest is None:
+            raise FileNotFoundError('%s is not a sandbox' % self.path(name))
+        counts = self._sync(name)
+        manifest.update({'stamp': self.base_stamp(), 'refreshed_at': time.time(), 'counts': counts})
+        self._write_manifest(name, manifest)
+        logging.info('sandbox %s refreshed from %s: %s', self.path(name), self.base_path, counts)
+        return counts
+
+    def teardown(self, name):
+        """
+        Notes:
+          release alias of sandbox and delete it
+        """
+        mt5.release(name)
+        shutil.rmtree(self.path(name), ignore_errors=True)
+
+    def provision(self, n, prefix='sandbox', register=True):
+        """
+        Notes:
+          make n sandboxes ready: missing ones are created, stale ones refreshed.
+          each is registered as portable terminal whose alias is its name, e.g. for BacktestPool.
+        Args:
+          n(int): num of sandboxes
+          prefix(string): sandbox name is <prefix>_<i>
+          register(bool): initialize mt5 alias of each sandbox
+        Returns:
+          list of sandbox names (aliases)
+        """
+        names = []
+        for i in range(n):
+            name = '%s_%d' % (prefix, i)
+            if self.manifest(name) is None:
+                self.create(name)
+            elif self.is_stale(name):
+                self.refresh(name)
+            if register:
+                mt5.release(name)
+                mt5.initizalize(self.path(name), alias=name, portable=True)
+            names.append(name)
+        return names
+
+    def teardown_all(self, prefix=None):
+        """
+        Notes:
+          delete every sandbox under root, or those whose name starts with prefix
+        Returns:
+          list of deleted names
+        """
+        names = [name for name in self.sandboxes() if prefix is None or name.startswith(prefix + '_')]
+        for name in names:
+            self.teardown(name)
+        return names
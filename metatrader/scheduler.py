@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+cost model aware scheduling of backtests.
+duration of a run is learned per (strategy, symbol, timeframe, model) as seconds per day of tested range,
+jobs are queued longest first so the end of a sweep is not a long tail of one slow run,
+and a plan gives total terminal time and eta before anything runs.
+"""
+import datetime
+import heapq
+import logging
+
+# seconds per tested day of every tick model when nothing similar was run before
+PRIOR_SECONDS_PER_DAY = 1.0
+# relative duration of models, used while a model has no recorded run. 0: every tick, 1: control points, 2: open prices
+PRIOR_MODEL_FACTORS = {0: 1.0, 1: 0.3, 2: 0.05}
+
+
+def _days(from_date, to_date):
+    if isinstance(from_date, str):
+        from_date = datetime.datetime.strptime(from_date[:10], '%Y-%m-%d')
+    if isinstance(to_date, str):
+        to_date = datetime.datetime.strptime(to_date[:10], '%Y-%m-%d')
+    return max((to_date - from_date).total_seconds() / 86400, 1.0)
+
+
+class CostModel(object):
+    """
+    Notes:
+      mean seconds per day of runs, kept from most to least specific key:
+        (strategy, symbol, timeframe, model), (symbol, timeframe, model), (timeframe, model), (model,)
+      estimate uses the most specific key which has runs. updates and estimates are O(1).
+    """
+
+    def __init__(self):
+        # key => [sum of seconds per day, num of runs]
+        self._rates = {}
+
+    @staticmethod
+    def _keys(strategy, symbol, timeframe, model):
+        return ((strategy, symbol, timeframe, model), (None, symbol, timeframe, model),
+                (None, None, timeframe, model), (None, None, None, model))
+
+    def observe(self, strategy, symbol, timeframe, model, from_date, to_date, duration):
+        """
+        Notes:
+          learn duration of a finished run
+        Args:
+          from_date, to_date(datetime.datetime or iso string): tested range
+          duration(float): seconds
+        """
+        rate = duration / _days(from_date, to_date)
+        for key in self._keys(strategy, symbol, timeframe, model):
+            stat = self._rates.setdefault(key, [0.0, 0])
+            stat[0] += rate
+            stat[1] += 1
+
+    def estimate(self, strategy, symbol, timeframe, model, from_date, to_date):
+        """
+        Returns:
+          estimated seconds of run
+        """
+        days = _days(from_date, to_date)
+        for key in self._keys(strategy, symbol, timeframe, model):
+            stat = self._rates.get(key)
+            if stat is not None:
+                return stat[0] / stat[1] * days
+        return PRIOR_SECONDS_PER_DAY * PRIOR_MODEL_FACTORS.get(model, 1.0) * days
+
+    def __len__(self):
+        return sum(count for key, (_, count) in self._rates.items() if key[:3] == (None, None, None))
+
+    @classmethod
+    def from_store(cls, store):
+        """
+        Notes:
+          learn durations recorded in metatrader.store.ResultStore
+        """
+        cost_model = cls()
+        for row in store.iter_durations():
+            if row['from_date'] is None or row['to_date'] is None:
+                continue
+            cost_model.observe(row['strategy'], row['symbol'], row['timeframe'], row['model'], row['from_date'],
+                               row['to_date'], row['duration'])
+        logging.info('cost model learned from %d runs', len(cost_model))
+        return cost_model
+
+
+def longest_first(jobs, estimate):
+    """
+    Args:
+      jobs(list): anything
+      estimate(callable): estimate(job) => seconds
+    Returns:
+      list of (seconds, job) sorted longest first. order of jobs with same estimate is kept
+    """
+    estimated = [(estimate(job), i, job) for i, job in enumerate(jobs)]
+    estimated.sort(key=lambda item: (-item[0], item[1]))
+    return [(seconds, job) for seconds, _, job in estimated]
+
+
+class Plan(object):
+    """
+    Notes:
+      longest processing time first assignment of jobs to terminals.
+      BacktestPool gives each job to the terminal which becomes idle first,
+      so submitting jobs in order of plan reproduces it.
+    Attributes:
+      jobs(list): (seconds, job) in submission order
+      loads(list): estimated busy seconds of each terminal
+      assignments(list): list of jobs of each terminal
+    """
+
+    def __init__(self, jobs, n_terminals, estimate):
+        if n_terminals < 1:
+            raise ValueError('n_terminals must be 1 or more, got %s' % n_terminals)
+        self.jobs = longest_first(jobs, estimate)
+        self.loads = [0.0] * n_terminals
+        self.assignments = [[] for _ in range(n_terminals)]
+
+        # (load, terminal index) of terminal which becomes idle first on top
+        idle = [(0.0, i) for i in range(n_terminals)]
+        for seconds, job in self.jobs:
+            load, i = heapq.heappop(idle)
+            self.assignments[i].append(job)
+            self.loads[i] = load + seconds
+            heapq.heappush(idle, (self.loads[i], i))
+
+    @property
+    def total(self):
+        """
+        Returns:
+          estimated terminal seconds of all jobs
+        """
+        return sum(self.loads)
+
+    @property
+    def makespan(self):
+        """
+        Returns:
+          estimated seconds until the last job completes
+        """
+        return max(self.loads)
+
+    def eta(self, start=None):
+        """
+        Returns:
+          datetime.datetime when the last job is estimated to complete
+        """
+        start = start or datetime.datetime.now()
+        return start + datetime.timedelta(seconds=self.makespan)
+
+    def ordered_jobs(self):
+        return [job for _, job in self.jobs]
+
+    def format(self, start=None):
+        lines = ['jobs: %d' % len(self.jobs),
+                 'terminals: %d' % len(self.loads),
+                 'total terminal time: %s' % datetime.timedelta(seconds=int(self.total)),
+                 'estimated duration: %s' % datetime.timedelta(seconds=int(self.makespan)),
+                 'eta: %s' % self.eta(start).strftime('%Y-%m-%d %H:%M')]
+        for i, load in enumerate(self.loads):
+            lines.append('  terminal %d: %d jobs, %s' % (i, len(self.assignments[i]),
+                                                         datetime.timedelta(seconds=int(load))))
+        return '\n'.join(lines)
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+multi-fidelity parameter search.
+candidates are tested on a short part of the date range with open prices model first,
+only the best of them are promoted to longer ranges and finer models (successive halving).
+hyperband runs several successive halving brackets which trade num of candidates for fidelity.
+"""
+import logging
+import math
+from concurrent.futures import as_completed
+
+from metatrader.report import get_report_abs_path, read_backtest_summary
+from metatrader.sampling import ParameterSampler
+
+MODEL_EVERY_TICK = 0
+MODEL_CONTROL_POINTS = 1
+MODEL_OPEN_PRICES = 2
+
+# (fraction of date range, model) from lowest to full fidelity
+DEFAULT_RUNGS = (
+    (1.0 / 9, MODEL_OPEN_PRICES),
+    (1.0 / 3, MODEL_OPEN_PRICES),
+    (1.0, MODEL_EVERY_TICK),
+)
+
+# relative terminal time of models, used to count cost of a search
+MODEL_COSTS = {
+    MODEL_EVERY_TICK: 1.0,
+    MODEL_CONTROL_POINTS: 0.3,
+    MODEL_OPEN_PRICES: 0.05,
+}
+
+
+def sub_range(from_date, to_date, fraction):
+    """
+    Notes:
+      last part of date range, so short runs test the most recent data.
+    Returns:
+      (from_date, to_date)
+    """
+    if fraction >= 1:
+        return from_date, to_date
+    return to_date - (to_date - from_date) * fraction, to_date
+
+
+def rung_cost(rung):
+    """
+    Returns:
+      terminal time of one run at rung relative to a full every tick run
+    """
+    fraction, model = rung
+    return min(fraction, 1.0) * MODEL_COSTS.get(model, 1.0)
+
+
+class SearchResult(object):
+    """
+    Attributes:
+      best(list): (score, params) of candidates which reached the last rung, best first
+      history(list): (rung index, params, score) of every evaluation
+      cost(float): terminal time spent in units of a full every tick run
+    """
+
+    def __init__(self):
+        self.best = []
+        self.history = []
+        self.cost = 0.0
+
+    @property
+    def n_evaluations(self):
+        return len(self.history)
+
+    def extend(self, other):
+        self.best = sorted(self.best + other.best, key=lambda item: -item[0])
+        self.history.extend(other.history)
+        self.cost += other.cost
+
+
+def _score(value):
+    # failed runs and missing metrics rank last
+    if value is None or value != value:
+        return float('-inf')
+    return value
+
+
+def successive_halving(candidates, evaluate, rungs=DEFAULT_RUNGS, eta=3):
+    """
+    Notes:
+      evaluate every candidate on first rung, keep best 1/eta of them for next rung and so on.
+    Args:
+      candidates(list): params (dict) to search
+      evaluate(callable): evaluate(list of params, rung) => list of scores, larger is better.
+        all candidates of a rung are passed at once, so evaluate can run them in parallel
+      rungs(list): (fraction of date range, model) from lowest to full fidelity
+      eta(int): 1/eta of candidates is promoted to next rung
+    Returns:
+      SearchResult
+    """
+    if eta < 2:
+        raise ValueError('eta must be 2 or more, got %s' % eta)
+
+    result = SearchResult()
+    survivors = list(candidates)
+    for i, rung in enumerate(rungs):
+        if not survivors:
+            break
+        scores = [_score(score) for score in evaluate(survivors, rung)]
+        result.cost += rung_cost(rung) * len(survivors)
+        result.history.extend((i, params, score) for params, score in zip(survivors, scores))
+
+        # stable sort keeps order of candidates on ties
+        ranked = sorted(zip(scores, range(len(survivors)), survivors), key=lambda item: -item[0])
+        logging.info('rung %d (%.2f of range, model %d): %d candidates, best %s', i, rung[0], rung[1],
+                     len(survivors), ranked[0][0])
+        if i == len(rungs) - 1:
+            result.best = [(score, params) for score, _, params in ranked]
+        else:
+            survivors = [params for _, _, params in ranked[:max(1, len(ranked) // eta)]]
+    return result
+
+
+def hyperband(param_space, evaluate, rungs=DEFAULT_RUNGS, eta=3, n_candidates=None, random_state=None):
+    """
+    Notes:
+      run one successive halving bracket per starting rung. bracket which starts at a higher rung
+      tests fewer candidates with more data, which guards against rankings of short runs being misleading.
+      candidates are sampled from param space without replacement inside each bracket.
+    Args:
+      param_space(dict): name => list of values, see metatrader.sampling.ParameterSampler
+      evaluate(callable): see successive_halving
+      n_candidates(int): num of candidates of the first bracket. default is eta ** (num of rungs - 1)
+      random_state(int): seed of sampling
+    Returns:
+      SearchResult of all brackets
+    """
+    result = SearchResult()
+    n_rungs = len(rungs)
+    if n_candidates is None:
+        n_candidates = eta ** (n_rungs - 1)
+    for bracket, start in enumerate(range(n_rungs)):
+        # later brackets spend about the same terminal time on fewer candidates
+        n_bracket = int(math.ceil(n_candidates * n_rungs / float(n_rungs - start) / eta ** start))
+        seed = None if random_state is None else random_state + bracket
+        candidates = list(ParameterSampler(param_space, n_bracket, random_state=seed))
+        logging.info('bracket %d: %d candidates from rung %d', bracket, len(candidates), start)
+        result.extend(successive_halving(candidates, evaluate, rungs=rungs[start:], eta=eta))
+    return result
+
+
+def pool_evaluator(pool, create_backtest, from_date, to_date, metric='profit'):
+    """
+    Notes:
+      evaluate function for successive_halving which runs candidates of a rung on BacktestPool.
+    Args:
+      pool(metatrader.pool.BacktestPool): terminal pool
+      create_backtest(callable): create_backtest(params, from_date, to_date, model) => BackTest
+      from_date(datetime.datetime): start of full date range
+      to_date(datetime.datetime): end of full date range
+      metric(string): key of read_backtest_summary to maximize
+    Raises:
+      RuntimeError: every candidate of a rung failed, e.g. terminals are broken. failure of some candidates
+        only ranks them last
+    """
+
+    def evaluate(candidates, rung):
+        fraction, model = rung
+        rung_from, rung_to = sub_range(from_date, to_date, fraction)
+        futures = {}
+        for i, params in enumerate(candidates):
+            futures[pool.submit(create_backtest(params, rung_from, rung_to, model))] = i
+
+        scores = [None] * len(candidates)
+        errors = []
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                backtest = future.result()
+                scores[i] = read_backtest_summary(get_report_abs_path(backtest.test_dir)).get(metric)
+            except Exception as e:
+                logging.error('candidate %s failed: %s', candidates[i], e)
+                errors.append(e)
+        if errors and len(errors) == len(candidates):
+            raise RuntimeError('all %d candidates of rung %s failed, last error: %s' % (
+                len(candidates), rung, errors[-1])) from errors[-1]
+        return scores
+
+    return evaluate
@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+"""
+sqlite store of backtest results.
+each run is recorded with its key (strategy, params, symbol, timeframe, dates, model, spread, deposit)
+and metrics of its BacktestReport, so "already tested?" and leaderboard queries use indexes
+instead of scanning result directories.
+"""
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import time
+
+from metatrader.report import BacktestReport
+
+# metric name => sqlite column type
+METRIC_COLUMNS = tuple((name, 'INTEGER' if name.endswith('_count') or name in (
+    'total_trades', 'profit_trades', 'loss_trades', 'ave_consecutive_wins', 'ave_consecutive_losses') else 'REAL')
+                       for name in BacktestReport.__slots__)
+METRIC_NAMES = tuple(name for name, _ in METRIC_COLUMNS)
+
+KEY_COLUMNS = ('strategy', 'params', 'symbol', 'timeframe', 'from_date', 'to_date', 'model', 'spread', 'deposit')
+# key columns which conf.json of a run has besides strategy, params, symbol and timeframe
+RUN_COLUMNS = KEY_COLUMNS[4:]
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    run_key TEXT NOT NULL UNIQUE,
+    strategy TEXT NOT NULL,
+    params TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    timeframe TEXT NOT NULL,
+    from_date TEXT,
+    to_date TEXT,
+    model INTEGER,
+    spread INTEGER,
+    deposit REAL,
+    test_dir TEXT,
+    created_at REAL NOT NULL,
+    duration REAL,
+    error TEXT,
+    parse_error TEXT,
+    %s
+);
+CREATE INDEX IF NOT EXISTS runs_config ON runs (strategy, symbol, timeframe, params);
+CREATE INDEX IF NOT EXISTS runs_leaderboard ON runs (strategy, symbol, timeframe, profit DESC);
+''' % ',\n    '.join('%s %s' % column for column in METRIC_COLUMNS)
+
+
+# (name, type) of columns added after first version of schema
+_ADDED_COLUMNS = (('duration', 'REAL'), ('error', 'TEXT'), ('parse_error', 'TEXT'))
+
+
+def read_metrics(test_dir):
+    """
+    Notes:
+      summary of report of a run which terminal finished. errors of other than report are raised
+    Returns:
+      (metrics, parse_error). metrics is None and parse_error tells why if report is missing or unreadable
+    """
+    from metatrader.exception import InvalidReportFormat
+    from metatrader.report import get_report_abs_path, read_backtest_summary
+
+    report_file = get_report_abs_path(test_dir)
+    try:
+        return read_backtest_summary(report_file), None
+    except FileNotFoundError:
+        return None, 'report not found'
+    except (InvalidReportFormat, ValueError, IndexError) as e:
+        logging.warning('%s is not a valid report: %s', report_file, e)
+        return None, str(e) or type(e).__name__
+
+
+def dump_params(params):
+    """
+    Returns:
+      canonical json of ea params. same params always give same string
+    """
+    return json.dumps(params, sort_keys=True, separators=(',', ':'))
+
+
+def _dump_date(date):
+    if isinstance(date, (datetime.date, datetime.datetime)):
+        return date.isoformat()
+    return date
+
+
+def make_run_key(strategy, params, symbol, timeframe, from_date=None, to_date=None, model=None, spread=None,
+                 deposit=None):
+    """
+    Returns:
+      canonical string of all inputs which identify a run
+    """
+    return json.dumps([strategy, dump_params(params), symbol, timeframe, _dump_date(from_date), _dump_date(to_date),
+                       model, spread, deposit], separators=(',', ':'))
+
+
+def make_dir_run_key(test_dir):
+    """
+    Returns:
+      key of run whose inputs are unknown, e.g. conf.json is missing or corrupt. its result directory identifies it
+    """
+    return json.dumps(['test_dir', test_dir], separators=(',', ':'))
+
+
+class ResultStore(object):
+    """
+    Notes:
+      sqlite store of backtest results. rows are buffered and written in one transaction per batch.
+      call flush or close (or use with statement) to write buffered rows.
+    Args:
+      path(string): sqlite file path. ':memory:' is allowed
+      batch_size(int): num of buffered rows which triggers flush
+    """
+
+    def __init__(self, path, batch_size=500):
+        self.path = path
+        self.batch_size = batch_size
+        self._pending = []
+        self._pending_configs = set()
+
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        if path != ':memory:':
+            self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(_SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        columns = set(row['name'] for row in self.connection.execute('PRAGMA table_info(runs)'))
+        # columns which stores of former versions don't have
+        for name, column_type in _ADDED_COLUMNS:
+            if name not in columns:
+                with self.connection:
+                    self.connection.execute('ALTER TABLE runs ADD COLUMN %s %s' % (name, column_type))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def add(self, strategy, params, symbol, timeframe, from_date=None, to_date=None, model=None, spread=None,
+            deposit=None, test_dir=None, metrics=None, duration=None, error=None, parse_error=None, run_key=None):
+        """
+        Notes:
+          record a run. existing run with same key is replaced.
+        Args:
+          params(dict): ea params
+          metrics(dict or BacktestReport): metric name => value, missing metrics are NULL
+          duration(float): seconds the terminal took, see metatrader.scheduler
+          error(string): why run failed permanently. failed run counts as tested, so it is not run again
+          parse_error(string): why report of finished run could not be parsed. run counts as tested,
+            its metrics are backfilled by reparse
+          run_key(string): key of run instead of the one made of key columns, see make_dir_run_key
+        """
+        if isinstance(metrics, BacktestReport):
+            metrics = {name: getattr(metrics, name) for name in METRIC_NAMES}
+        metrics = metrics or {}
+
+        key = run_key or make_run_key(strategy, params, symbol, timeframe, from_date, to_date, model, spread, deposit)
+        row = [key, strategy, dump_params(params), symbol, timeframe, _dump_date(from_date), _dump_date(to_date),
+               model, spread, deposit, test_dir, time.time(), duration, error, parse_error]
+        row.extend(metrics.get(name) for name in METRIC_NAMES)
+
+        self._pending.append(row)
+        self._pending_configs.add((strategy, row[2], symbol, timeframe))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Notes:
+          write buffered rows in one transaction
+        """
+        if not self._pending:
+            return
+        columns = ('run_key',) + KEY_COLUMNS + ('test_dir', 'created_at', 'duration', 'error',
+                                                'parse_error') + METRIC_NAMES
+        sql = 'INSERT OR REPLACE INTO runs (%s) VALUES (%s)' % (', '.join(columns), ', '.join('?' * len(columns)))
+        with self.connection:
+            self.connection.executemany(sql, self._pending)
+        logging.debug('%d runs written to %s', len(self._pending), self.path)
+        self._pending = []
+        self._pending_configs = set()
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+    def is_tested(self, strategy, params, symbol, timeframe, **key):
+        """
+        Notes:
+          check run of configuration is recorded. buffered rows are included.
+        Args:
+          key: optional other key columns to match. e.g.: from_date=datetime(2018, 1, 1), model=0
+        """
+        if key:
+            self.flush()
+        elif (strategy, dump_params(params), symbol, timeframe) in self._pending_configs:
+            return True
+        return self._find_run('1', strategy, params, symbol, timeframe, key) is not None
+
+    def get(self, strategy, params, symbol, timeframe, **key):
+        """
+        Notes:
+          recorded run of configuration, see is_tested
+        Returns:
+          dict of run with decoded params, or None if not tested
+        """
+        self.flush()
+        row = self._find_run('*', strategy, params, symbol, timeframe, key)
+        if row is None:
+            return None
+        row = dict(row)
+        row['params'] = json.loads(row['params'])
+        return row
+
+    def _find_run(self, columns, strategy, params, symbol, timeframe, key):
+        where = ['strategy = ?', 'symbol = ?', 'timeframe = ?', 'params = ?']
+        args = [strategy, symbol, timeframe, dump_params(params)]
+        for column, value in sorted(key.items()):
+            if column not in KEY_COLUMNS:
+                raise ValueError('%s is not a key column' % column)
+            where.append('%s = ?' % column)
+            args.append(_dump_date(value))
+        sql = 'SELECT %s FROM runs WHERE %s LIMIT 1' % (columns, ' AND '.join(where))
+        return self.connection.execute(sql, args).fetchone()
+
+    def count(self):
+        self.flush()
+        return self.connection.execute('SELECT COUNT(*) FROM runs').fetchone()[0]
+
+    def leaderboard(self, metric='profit', strategy=None, symbol=None, timeframe=None, limit=10, descending=True):
+        """
+        Returns:
+          list of dict of best runs by metric. params are decoded from json
+        """
+        if metric not in METRIC_NAMES:
+            raise ValueError('%s is not a metric' % metric)
+        self.flush()
+
+        where = ['%s IS NOT NULL' % metric]
+        args = []
+        for column, value in (('strategy', strategy), ('symbol', symbol), ('timeframe', timeframe)):
+            if value is not None:
+                where.append('%s = ?' % column)
+                args.append(value)
+        sql = 'SELECT * FROM runs WHERE %s ORDER BY %s %s LIMIT ?' % (
+            ' AND '.join(where), metric, 'DESC' if descending else 'ASC')
+        args.append(limit)
+
+        rows = []
+        for row in self.connection.execute(sql, args):
+            row = dict(row)
+            row['params'] = json.loads(row['params'])
+            rows.append(row)
+        return rows
+
+    def iter_durations(self):
+        """
+        Returns:
+          generator of dict of strategy, symbol, timeframe, model, from_date, to_date and duration
+          of runs whose duration is recorded
+        """
+        self.flush()
+        sql = ('SELECT strategy, symbol, timeframe, model, from_date, to_date, duration FROM runs '
+               'WHERE duration IS NOT NULL')
+        for row in self.connection.execute(sql):
+            yield dict(row)
+
+    def failures(self, strategy=None):
+        """
+        Returns:
+          list of dict of strategy, params, symbol, timeframe and error of failed runs. params are decoded
+        """
+        self.flush()
+        sql = 'SELECT strategy, params, symbol, timeframe, error FROM runs WHERE error IS NOT NULL'
+        args = []
+        if strategy is not None:
+            sql += ' AND strategy = ?'
+            args.append(strategy)
+        rows = []
+        for row in self.connection.execute(sql, args):
+            row = dict(row)
+            row['params'] = json.loads(row['params'])
+            rows.append(row)
+        return rows
+
+    def unparsed(self):
+        """
+        Returns:
+          list of dict of run_key, test_dir and parse_error of runs whose report could not be parsed
+        """
+        self.flush()
+        sql = 'SELECT run_key, test_dir, parse_error FROM runs WHERE parse_error IS NOT NULL'
+        return [dict(row) for row in self.connection.execute(sql)]
+
+    def reparse(self):
+        """
+        Notes:
+          parse reports of runs recorded with parse_error again, e.g. after parser is fixed.
+          metrics of runs whose report is readable now are filled in one transaction
+        Returns:
+          num of runs whose metrics were backfilled
+        """
+        sql = 'UPDATE runs SET parse_error = NULL, %s WHERE run_key = ?' % ', '.join(
+            '%s = ?' % name for name in METRIC_NAMES)
+        rows = []
+        for run in self.unparsed():
+            # inputs of run are unknown until its conf.json is fixed and imported again
+            if run['test_dir'] is None or run['run_key'] == make_dir_run_key(run['test_dir']):
+                continue
+            metrics, parse_error = read_metrics(run['test_dir'])
+            if parse_error is None:
+                rows.append([metrics.get(name) for name in METRIC_NAMES] + [run['run_key']])
+        with self.connection:
+            self.connection.executemany(sql, rows)
+        logging.info('metrics of %d runs backfilled in %s', len(rows), self.path)
+        return len(rows)
+
+
+def import_result_dirs(store, result_dir):
+    """
+    Notes:
+      one shot import of result directories written by strategy_testing.
+      every <result_dir>/<run>/conf.json is recorded with metrics of its report/report.htm.
+      runs whose report is missing or unreadable are recorded with parse_error, see ResultStore.reparse.
+      runs whose conf.json is unreadable are recorded by their directory with parse_error
+    Returns:
+      num of imported runs
+    """
+    n_imported = 0
+    for folder in sorted(os.listdir(result_dir)):
+        test_dir = os.path.join(result_dir, folder)
+        conf_path = os.path.join(test_dir, 'conf.json')
+        if not os.path.exists(conf_path):
+            continue
+        try:
+            with open(conf_path) as f:
+                conf = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning('%s is not a valid conf: %s', conf_path, e)
+            store.add('', {}, '', '', test_dir=test_dir, parse_error='conf.json: %s' % (str(e) or type(e).__name__),
+                      run_key=make_dir_run_key(test_dir))
+        else:
+            metrics, parse_error = read_metrics(test_dir)
+            store.add(conf['strategy'], conf['params'], conf['symbol'], conf['timeframe'],
+                      test_dir=test_dir, metrics=metrics, parse_error=parse_error,
+                      **{name: conf.get(name) for name in RUN_COLUMNS})
+        n_imported += 1
+
+    store.flush()
+    return n_imported
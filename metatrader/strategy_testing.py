@@ -1,19 +1,42 @@
 import datetime
 import json
+import logging
 import os
 import shutil
-
-from sklearn.model_selection import ParameterSampler
+import sys
+import uuid
+from concurrent.futures import FIRST_COMPLETED, wait
 
 from metatrader.backtest import BackTest
+from metatrader.catalog import SymbolCatalog
+from metatrader.exception import MissingSymbolData
 from metatrader.mt5 import initizalize
+from metatrader.pool import BacktestPool
+from metatrader.retry import RetryPolicy, is_retryable
+from metatrader.sampling import ParameterSampler
+from metatrader.scheduler import CostModel, Plan
+from metatrader.search import MODEL_EVERY_TICK, hyperband, pool_evaluator, sub_range
+from metatrader.store import ResultStore, dump_params, import_result_dirs, read_metrics
 
 SYMBOLS_DATA_DIR = 'D:\\metatrader\data'
+CATALOG = SymbolCatalog(SYMBOLS_DATA_DIR)
 RESULT_DIR = 'D:\\metatrader\\test_res_2'
+RESULT_DB = os.path.join(RESULT_DIR, 'results.sqlite')
 TIMEFRAMES = ['M5', 'H1', 'M15', 'M30']
-METATRADER_DIR = 'C:\\Program Files\\MetaTrader 5'
+# one install per parallel terminal, terminals of one install can't run at once
+METATRADER_DIRS = ['C:\\Program Files\\MetaTrader 5']
 DEPOSIT = 10000
 N_PARAM_COMBS = 50
+# seconds after which a run is killed, and seconds without log activity of terminal, e.g. waiting on a dialog
+RUN_TIMEOUT = 4 * 60 * 60
+IDLE_TIMEOUT = 15 * 60
+RETRY_POLICY = RetryPolicy(max_attempts=3, backoff=30.0)
+# candidates of first hyperband bracket per strategy, timeframe and symbol, see run_search
+N_SEARCH_CANDIDATES = 81
+# candidates scored by approximate backtest per strategy, timeframe and symbol, see sample_params
+N_PRESCREEN_CANDIDATES = 2000
+# keep params which approximate backtest ranks best, needs numpy (table extra of setup.py)
+PRESCREEN = True
 
 
 def gen_param_dist(x, t=float, precision=2):
@@ -98,90 +121,302 @@ TEST_CONFIG = {
 }
 
 
-def dict_to_set(d):
-    return frozenset(d.items())
+def open_result_store():
+    """
+    Notes:
+      open results store. result directories of runs before the store existed are imported once,
+      reports which could not be parsed before are parsed again.
+    """
+    os.makedirs(RESULT_DIR, exist_ok=True)
+    is_new = not os.path.exists(RESULT_DB)
+    store = ResultStore(RESULT_DB)
+    if is_new:
+        n_imported = import_result_dirs(store, RESULT_DIR)
+        print('imported', n_imported, 'result directories into', RESULT_DB)
+    else:
+        n_backfilled = store.reparse()
+        if n_backfilled:
+            print('parsed', n_backfilled, 'reports which could not be parsed before')
+    return store
 
 
-def load_already_tested_configurations():
-    confs = set()
+def create_backtest(strategy, params, symbol, from_date, to_date, timeframe, model=1):
+    # fails before terminal is launched if history does not cover the range
+    symbol_data = CATALOG.validate_range(symbol, from_date, to_date)
+    job_id = uuid.uuid4().hex[:12]
+    dir_name = '{}_{}_{}_{}_{}'.format(strategy, timeframe, symbol,
+                                       datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%S'), job_id)
+    test_dir = os.path.join(RESULT_DIR, dir_name)
 
-    if not os.path.exists(RESULT_DIR):
-        return confs
+    shutil.rmtree(test_dir, ignore_errors=True)
+    os.makedirs(test_dir, exist_ok=True)
 
-    for folder in os.listdir(RESULT_DIR):
-        path = os.path.join(RESULT_DIR, folder, 'conf.json')
-        if os.path.exists(path):
-            with open(path) as f:
-                conf = json.load(f)
-                confs.add((conf['strategy'], dict_to_set(conf['params']), conf['symbol'], conf['timeframe']))
-    return confs
+    strategy_params = {param: {'value': '{0}||{0}||{0}||{0}||Y'.format(value)} for param, value in params.items()}
+    return BackTest(test_dir,
+                    'Advisors\\{}'.format(strategy),
+                    strategy_params,
+                    '{}USD'.format(symbol[:3]),
+                    timeframe,
+                    DEPOSIT,
+                    from_date,
+                    to_date,
+                    model=model,
+                    job_id=job_id,
+                    timeout=RUN_TIMEOUT,
+                    idle_timeout=IDLE_TIMEOUT,
+                    symbol_data_file=symbol_data.path)
 
 
-def list_symbols():
-    def parse_date(date_str):
-        return datetime.datetime.strptime(date_str, '%d%m%Y')
+def save_conf(backtest, strategy, params, symbol, timeframe):
+    conf_path = os.path.join(backtest.test_dir, 'conf.json')
+    # conf.json marks the run as complete for metatrader.leaderboard, so it appears at once
+    tmp_path = conf_path + '.tmp'
+    with open(tmp_path, 'w+') as f:
+        json.dump({
+            'strategy': strategy,
+            'timeframe': timeframe,
+            'symbol': symbol,
+            'params': params,
+            # rest of key of run, see metatrader.store.RUN_COLUMNS
+            'from_date': backtest.from_date.isoformat(),
+            'to_date': backtest.to_date.isoformat(),
+            'model': backtest.model,
+            'spread': backtest.spread,
+            'deposit': backtest.deposit,
+        }, f)
+    os.replace(tmp_path, conf_path)
 
-    for file in os.listdir(SYMBOLS_DATA_DIR):
-        if file.endswith('.csv'):
-            file = file.split('.')[0]
-            symbol, _, start_date, end_date = file.split('_')
-            start_date, end_date = map(parse_date, (start_date, end_date))
 
-            yield symbol, start_date, end_date
+def test_strategy(strategy, params, symbol, from_date, to_date, timeframe):
+    backtest = create_backtest(strategy, params, symbol, from_date, to_date, timeframe)
+    backtest.run()
 
+    save_conf(backtest, strategy, params, symbol, timeframe)
 
-def test_strategy(strategy, params, symbol, from_date, to_date, timeframe):
-    dir_name = '{}_{}_{}_{}'.format(strategy, timeframe, symbol, datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%S'))
-    test_dir = os.path.join(RESULT_DIR, dir_name)
 
-    shutil.rmtree(test_dir, ignore_errors=True)
-    os.makedirs(test_dir, exist_ok=True)
+def record_result(store, backtest, strategy, params, symbol, timeframe):
+    save_conf(backtest, strategy, params, symbol, timeframe)
+    # unreadable report is not a failure of terminal, metrics are backfilled once parser is fixed
+    metrics, parse_error = read_metrics(backtest.test_dir)
+    store.add(strategy, params, symbol, timeframe,
+              from_date=backtest.from_date, to_date=backtest.to_date, model=backtest.model,
+              spread=backtest.spread, deposit=backtest.deposit, test_dir=backtest.test_dir,
+              metrics=metrics, duration=backtest.duration, parse_error=parse_error)
 
-    def save_conf():
-        conf_path = os.path.join(test_dir, 'conf.json')
-        with open(conf_path, 'w+') as f:
-            json.dump({
-                'strategy': strategy,
-                'timeframe': timeframe,
-                'symbol': symbol,
-                'params': params
-            }, f)
 
-    strategy_params = {param: {'value': '{0}||{0}||{0}||{0}||Y'.format(value)} for param, value in params.items()}
-    backtest = BackTest(test_dir,
-                        'Advisors\\{}'.format(strategy),
-                        strategy_params,
-                        '{}USD'.format(symbol[:3]),
-                        timeframe,
-                        DEPOSIT,
-                        from_date,
-                        to_date)
-    backtest.run()
+def sample_params(strategy, param_space, symbol, from_date, to_date, timeframe, screeners=None):
+    """
+    Notes:
+      N_PARAM_COMBS params to test. for strategies which metatrader.prescreen simulates,
+      N_PRESCREEN_CANDIDATES are sampled and only the best by approximate backtest on csv bars are kept,
+      unless PRESCREEN is False.
+    Args:
+      screeners(dict): (symbol, timeframe) => Prescreener, shares indicators between strategies
+    """
+    if not PRESCREEN:
+        return list(ParameterSampler(param_space, N_PARAM_COMBS, random_state=1))
+    from metatrader.prescreen import SIGNALS, Prescreener
 
-    save_conf()
+    if strategy not in SIGNALS:
+        return list(ParameterSampler(param_space, N_PARAM_COMBS, random_state=1))
 
+    screeners = {} if screeners is None else screeners
+    screener = screeners.get((symbol, timeframe))
+    if screener is None:
+        bars = CATALOG.load_bars(symbol, from_date, to_date)
+        screener = screeners[(symbol, timeframe)] = Prescreener(bars, timeframe)
+    candidates = ParameterSampler(param_space, N_PRESCREEN_CANDIDATES, random_state=1)
+    return screener.screen(strategy, candidates, keep=N_PARAM_COMBS)
 
-def run_testing(already_tested_configurations, test_config):
-    n_tested, n_skipped = 0, len(already_tested_configurations)
-    symbols = list(list_symbols())
-    total = len(test_config) * len(TIMEFRAMES) * len(symbols) * N_PARAM_COMBS
 
+def list_jobs(store, test_config):
+    """
+    Returns:
+      (jobs, num of skipped). job is (strategy, params, symbol, from_date, to_date, timeframe) not tested yet
+    """
+    n_skipped = 0
+    symbols = CATALOG.list_symbols()
+    screeners = {}
+    jobs = []
     for strategy, param_space in sorted(test_config.items()):
-        for params in ParameterSampler(param_space, N_PARAM_COMBS, random_state=1):
-            for timeframe in TIMEFRAMES:
-                for (symbol, from_date, to_date) in symbols:
-                    if (strategy, dict_to_set(params), symbol, timeframe) not in already_tested_configurations:
-                        test_strategy(strategy, params, symbol, from_date, to_date, timeframe)
-                        n_tested += 1
-                        print('skipped:', n_skipped, 'tested:', n_tested, n_skipped + n_tested, '/', total)
+        for timeframe in TIMEFRAMES:
+            for (symbol, from_date, to_date) in symbols:
+                for params in sample_params(strategy, param_space, symbol, from_date, to_date, timeframe, screeners):
+                    if not store.is_tested(strategy, params, symbol, timeframe):
+                        jobs.append((strategy, params, symbol, from_date, to_date, timeframe))
                     else:
                         n_skipped += 1
+    return jobs, n_skipped
+
+
+def print_prescreen_agreement(store, test_config):
+    """
+    Notes:
+      compare ranking of approximate backtests with profit of terminal runs in store,
+      per strategy, timeframe and symbol
+    """
+    if not PRESCREEN:
+        return
+    from metatrader.prescreen import SIGNALS, Prescreener, rank_agreement
+
+    for strategy in sorted(test_config):
+        if strategy not in SIGNALS:
+            continue
+        for timeframe in TIMEFRAMES:
+            for (symbol, from_date, to_date) in CATALOG.list_symbols():
+                runs = store.leaderboard('profit', strategy, symbol, timeframe, limit=-1)
+                if len(runs) < 2:
+                    continue
+                screener = Prescreener(CATALOG.load_bars(symbol, from_date, to_date), timeframe)
+                actual = {dump_params(run['params']): run['profit'] for run in runs}
+                approximate = {dump_params(run['params']): screener.evaluate(strategy, run['params'])['profit']
+                               for run in runs}
+                agreement = rank_agreement(approximate, actual, keep=0.2)
+                print(strategy, timeframe, symbol, 'runs:', agreement['n'],
+                      'spearman: %.2f top 20%% recall: %.2f' % (agreement['spearman'], agreement['recall']))
+
+
+def plan_jobs(store, jobs, n_terminals):
+    """
+    Notes:
+      longest first plan of jobs by durations of runs recorded in store
+    Returns:
+      metatrader.scheduler.Plan
+    """
+    cost_model = CostModel.from_store(store)
+
+    def estimate(job):
+        strategy, params, symbol, from_date, to_date, timeframe = job
+        # model of create_backtest
+        return cost_model.estimate(strategy, symbol, timeframe, 1, from_date, to_date)
+
+    return Plan(jobs, n_terminals, estimate)
+
+
+def run_testing(store, test_config, pool):
+    """
+    Notes:
+      run jobs not tested yet on pool. result directory of a job is created when it is submitted,
+      at most 2 jobs per terminal are queued at once.
+    """
+    n_tested = 0
+    jobs, n_skipped = list_jobs(store, test_config)
+    total = n_skipped + len(jobs)
+    plan = plan_jobs(store, jobs, len(pool.aliases))
+    print(plan.format())
+
+    # longest first, so no terminal is left with a long run at the end
+    pending = iter(plan.ordered_jobs())
+    max_in_flight = 2 * len(pool.aliases)
+    futures = {}
+    n_failed = 0
+    while True:
+        for job in pending:
+            strategy, params, symbol, from_date, to_date, timeframe = job
+            try:
+                backtest = create_backtest(strategy, params, symbol, from_date, to_date, timeframe)
+            except MissingSymbolData as e:
+                # history never covers the range, recorded so it is not tried again
+                store.add(strategy, params, symbol, timeframe, from_date=from_date, to_date=to_date, model=1,
+                          deposit=DEPOSIT, error=str(e))
+                n_failed += 1
+                continue
+            futures[pool.submit(backtest)] = (backtest, strategy, params, symbol, timeframe)
+            if len(futures) >= max_in_flight:
+                break
+        if not futures:
+            break
+
+        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+        for future in done:
+            backtest, strategy, params, symbol, timeframe = futures.pop(future)
+            try:
+                future.result()
+            except Exception as e:
+                n_failed += 1
+                if is_retryable(e):
+                    # e.g. timeout or crash of terminal after all retries. not recorded, so next sweep runs it again
+                    logging.warning('%s failed after retries, not recorded: %s', backtest.test_dir, e)
+                else:
+                    # failed permanently. recorded, so sweep goes on and never runs it again
+                    store.add(strategy, params, symbol, timeframe,
+                              from_date=backtest.from_date, to_date=backtest.to_date, model=backtest.model,
+                              spread=backtest.spread, deposit=backtest.deposit, test_dir=backtest.test_dir,
+                              error=str(e) or type(e).__name__)
+            else:
+                # errors of store or result directory are not failures of the run, they stop the sweep
+                record_result(store, backtest, strategy, params, symbol, timeframe)
+                n_tested += 1
+            print('skipped:', n_skipped, 'tested:', n_tested, 'failed:', n_failed, n_skipped + n_tested + n_failed,
+                  '/', total)
+
+
+def run_search(store, test_config, pool):
+    """
+    Notes:
+      hyperband search instead of testing N_PARAM_COMBS samples on full range.
+      only runs of the last rung (full range, every tick) are recorded into store.
+      candidates whose full run is in store already are scored by it and not run again.
+    """
+    symbols = CATALOG.list_symbols()
+    for strategy, param_space in sorted(test_config.items()):
+        for timeframe in TIMEFRAMES:
+            for (symbol, from_date, to_date) in symbols:
+                full_runs = {}
+
+                def create(params, rung_from, rung_to, model):
+                    backtest = create_backtest(strategy, params, symbol, rung_from, rung_to, timeframe, model=model)
+                    if (rung_from, rung_to, model) == (from_date, to_date, MODEL_EVERY_TICK):
+                        full_runs[dump_params(params)] = backtest
+                    return backtest
+
+                run_candidates = pool_evaluator(pool, create, from_date, to_date)
+
+                def evaluate(candidates, rung):
+                    if sub_range(from_date, to_date, rung[0]) + (rung[1],) != (from_date, to_date, MODEL_EVERY_TICK):
+                        return run_candidates(candidates, rung)
+                    runs = [store.get(strategy, params, symbol, timeframe, from_date=from_date, to_date=to_date,
+                                      model=MODEL_EVERY_TICK, deposit=DEPOSIT) for params in candidates]
+                    untested = [params for params, run in zip(candidates, runs) if run is None]
+                    scores = iter(run_candidates(untested, rung) if untested else [])
+                    return [next(scores) if run is None else run['profit'] for run in runs]
+
+                result = hyperband(param_space, evaluate, n_candidates=N_SEARCH_CANDIDATES, random_state=1)
+                for score, params in result.best:
+                    backtest = full_runs.get(dump_params(params))
+                    # None if tested by former search
+                    if backtest is not None and score != float('-inf'):
+                        record_result(store, backtest, strategy, params, symbol, timeframe)
+                print(strategy, timeframe, symbol, 'evaluations:', result.n_evaluations,
+                      'cost in full runs: %.1f' % result.cost)
+
+
+def main(dry_run=False, search=False):
+    """
+    Args:
+      dry_run(bool): print plan and eta of runs without running them
+      search(bool): hyperband search of each strategy (run_search) instead of testing sampled params
+    """
+    if dry_run:
+        with open_result_store() as store:
+            jobs, n_skipped = list_jobs(store, TEST_CONFIG)
+            print('skipped:', n_skipped)
+            print(plan_jobs(store, jobs, len(METATRADER_DIRS)).format())
+        return
 
+    aliases = []
+    for i, metatrader_dir in enumerate(METATRADER_DIRS):
+        alias = 'terminal_%d' % i
+        initizalize(metatrader_dir, alias=alias)
+        aliases.append(alias)
 
-def main():
-    initizalize(METATRADER_DIR)
-    run_testing(load_already_tested_configurations(), TEST_CONFIG)
+    with open_result_store() as store, BacktestPool(aliases, retry=RETRY_POLICY) as pool:
+        if search:
+            run_search(store, TEST_CONFIG, pool)
+        else:
+            run_testing(store, TEST_CONFIG, pool)
+        print_prescreen_agreement(store, TEST_CONFIG)
 
 
 if __name__ == '__main__':
-    main()
+    main(dry_run='--dry-run' in sys.argv[1:], search='--search' in sys.argv[1:])
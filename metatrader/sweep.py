@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+compile python parameter sweeps into native terminal optimization.
+one optimization run tests every pass of the sweep, so terminal startup, history loading
+and report generation are paid once instead of once per grid point.
+"""
+import collections
+import itertools
+import logging
+import os
+
+from metatrader.backtest import BackTest, OPTIMIZATION_COMPLETE, OPTIMIZATION_GENETIC
+from metatrader.mt5 import DEFAULT_MT5_NAME
+
+# keys of param space which are not ea inputs. each combination of them needs own optimization run
+OUTER_KEYS = ('timeframe', 'symbol')
+
+# relative tolerance when checking values are evenly spaced
+_STEP_TOLERANCE = 1e-9
+
+# bool inputs as they are written in .set files
+_BOOL_TEXTS = {'true': True, 'false': False}
+
+
+def _to_bool(value):
+    if isinstance(value, str) and value.lower() in _BOOL_TEXTS:
+        return _BOOL_TEXTS[value.lower()]
+    return value
+
+
+def compile_range(name, spec):
+    """
+    Notes:
+      convert sweep spec of one ea input into BackTest param value.
+    Args:
+      name(string): ea input name, used in error message
+      spec: one of
+        scalar: fixed value. e.g.: 0.1
+        range: range(5, 55, 5)
+        dict: {'start': 5, 'stop': 50, 'step': 5}, stop is inclusive
+        list: evenly spaced values. e.g.: [5, 10, 15], [False, True] or ['true', 'false']
+    Returns:
+      param(dict): {'value': start, 'interval': step, 'max': stop} or {'value': value} if fixed.
+        fixed bool is 'true' or 'false' like in .set file
+    Raises:
+      ValueError: values can not be expressed as start, step and stop, see split_range
+    """
+    if isinstance(spec, range):
+        spec = list(spec)
+    if isinstance(spec, dict):
+        start, stop, step = spec['start'], spec['stop'], spec['step']
+        if step <= 0 or stop < start:
+            raise ValueError('%s: invalid range %s' % (name, spec))
+        if start == stop:
+            return {'value': start}
+        return {'value': start, 'interval': step, 'max': stop}
+    if not isinstance(spec, (list, tuple)):
+        return {'value': spec}
+
+    values = sorted(set(_to_bool(v) for v in spec), key=lambda v: (isinstance(v, str), v))
+    if not values:
+        raise ValueError('%s: no values' % name)
+    if len(values) == 1:
+        if isinstance(values[0], bool):
+            return {'value': 'true' if values[0] else 'false'}
+        return {'value': values[0]}
+    if all(isinstance(v, bool) for v in values):
+        # terminal optimizes bool as 0..1
+        return {'value': 0, 'interval': 1, 'max': 1}
+    if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+        raise ValueError('%s: only numbers and bools can be optimized natively, got %s' % (name, spec))
+
+    step = values[1] - values[0]
+    for expected_index, value in enumerate(values):
+        expected = values[0] + step * expected_index
+        if abs(value - expected) > _STEP_TOLERANCE * max(1.0, abs(expected)):
+            raise ValueError('%s: values %s are not evenly spaced' % (name, spec))
+    if isinstance(step, float):
+        step = round(step, 10)
+    return {'value': values[0], 'interval': step, 'max': values[-1]}
+
+
+def split_range(name, spec):
+    """
+    Notes:
+      compile spec of one ea input into one native range, or into one fixed value per listed value
+      if they can not be one range (unevenly spaced numbers or texts). each of them is run as own optimization.
+    Returns:
+      list of param(dict), see compile_range
+    Raises:
+      ValueError: spec is invalid, e.g. empty list or dict range whose stop is less than start
+    """
+    try:
+        return [compile_range(name, spec)]
+    except ValueError:
+        if not isinstance(spec, (list, tuple)) or not spec:
+            raise
+    values = []
+    for value in spec:
+        value = _to_bool(value)
+        if value not in values:
+            values.append(value)
+    logging.info('%s: %s can not be one range, they are optimized separately', name, spec)
+    return [compile_range(name, [value]) for value in values]
+
+
+def count_values(param):
+    """
+    Returns:
+      num of values tested for compiled param
+    """
+    if 'interval' not in param:
+        return 1
+    return int(round((param['max'] - param['value']) / param['interval'])) + 1
+
+
+def compile_sweep(param_space, outer_keys=OUTER_KEYS):
+    """
+    Notes:
+      split param space into native optimizations.
+      ea inputs become ranges of one optimization, outer keys (e.g. timeframe) are expanded in python.
+      ea inputs which can not be one range are expanded too, see split_range.
+    Args:
+      param_space(dict): name => spec, see compile_range
+      outer_keys(tuple): names which are not ea inputs
+    Returns:
+      list of (outer(dict), ea_param(dict for BackTest.param), num of passes).
+      outer has outer keys and values of expanded ea inputs
+    """
+    outer_names = sorted(k for k in param_space if k in outer_keys)
+    ranges = {}
+    split_names = []
+    split_params = []
+    for name, spec in sorted(param_space.items()):
+        if name in outer_keys:
+            continue
+        params = split_range(name, spec)
+        if len(params) == 1:
+            ranges[name] = params[0]
+        else:
+            split_names.append(name)
+            split_params.append(params)
+
+    n_passes = 1
+    for param in ranges.values():
+        n_passes *= count_values(param)
+
+    outer_values = []
+    for name in outer_names:
+        spec = param_space[name]
+        outer_values.append(spec if isinstance(spec, (list, tuple)) else [spec])
+
+    compiled = []
+    for combination in itertools.product(*outer_values):
+        outer = dict(zip(outer_names, combination))
+        for split in itertools.product(*split_params):
+            ea_param = dict(ranges)
+            ea_param.update(zip(split_names, split))
+            job_outer = dict(outer)
+            job_outer.update((name, param['value']) for name, param in zip(split_names, split))
+            compiled.append((job_outer, ea_param, n_passes))
+    return compiled
+
+
+def run_sweep(test_dir, ea_name, param_space, symbol, period, deposit, from_date, to_date, genetic=False,
+              alias=DEFAULT_MT5_NAME, **backtest_kwargs):
+    """
+    Notes:
+      run param space as native optimizations, one terminal launch per combination of outer keys.
+      symbol and period are used unless param space has 'symbol' or 'timeframe'.
+    Args:
+      test_dir(string): root directory. each optimization gets a sub directory
+      genetic(bool): use genetic algorithm instead of complete search
+      backtest_kwargs: other BackTest arguments. e.g.: model=0, spread=10
+    Returns:
+      list of (outer(dict), OptimizationReport). passes are in OptimizationReport.results
+    """
+    optimization_mode = OPTIMIZATION_GENETIC if genetic else OPTIMIZATION_COMPLETE
+    reports = []
+
+    compiled = compile_sweep(param_space)
+    n_jobs = collections.Counter((outer.get('symbol', symbol), outer.get('timeframe', period))
+                                 for outer, _, _ in compiled)
+    n_started = collections.Counter()
+    for outer, ea_param, n_passes in compiled:
+        outer_symbol = outer.get('symbol', symbol)
+        outer_period = outer.get('timeframe', period)
+        sub_name = '%s_%s' % (outer_symbol, outer_period)
+        if n_jobs[(outer_symbol, outer_period)] > 1:
+            # expanded ea inputs give several optimizations of one symbol and timeframe
+            sub_name += '_%d' % n_started[(outer_symbol, outer_period)]
+        n_started[(outer_symbol, outer_period)] += 1
+        sub_dir = os.path.join(test_dir, sub_name)
+        os.makedirs(sub_dir, exist_ok=True)
+
+        logging.info('optimize %s on %s %s, %d passes', ea_name, outer_symbol, outer_period, n_passes)
+        backtest = BackTest(sub_dir, ea_name, ea_param, outer_symbol, outer_period, deposit, from_date, to_date,
+                            optimization_mode=optimization_mode, **backtest_kwargs)
+        reports.append((outer, backtest.optimize(alias=alias)))
+    return reports
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+walk-forward analysis.
+date range is split into windows of in-sample and out-of-sample segments. each in-sample segment is
+optimized natively, the best pass is tested on the following out-of-sample segment and the
+out-of-sample results are stitched into one report. windows are independent, so they run
+at once on the terminals of a BacktestPool.
+"""
+import json
+import logging
+import os
+from concurrent.futures import as_completed
+
+from metatrader.backtest import BackTest, OPTIMIZATION_COMPLETE, OPTIMIZATION_GENETIC
+from metatrader.report import get_report_abs_path, read_backtest_summary
+from metatrader.sweep import compile_sweep
+
+
+class Window(object):
+    """
+    Attributes:
+      index(int): 0 based index of window
+      in_from(datetime.datetime): start of in-sample segment
+      in_to(datetime.datetime): end of in-sample segment, which is start of out-of-sample segment
+      out_to(datetime.datetime): end of out-of-sample segment
+    """
+    __slots__ = ('index', 'in_from', 'in_to', 'out_to')
+
+    def __init__(self, index, in_from, in_to, out_to):
+        self.index = index
+        self.in_from = in_from
+        self.in_to = in_to
+        self.out_to = out_to
+
+    @property
+    def out_from(self):
+        return self.in_to
+
+    def __repr__(self):
+        return 'Window(%d, %s, %s, %s)' % (self.index, self.in_from, self.in_to, self.out_to)
+
+
+def split_windows(from_date, to_date, n_windows, in_sample_ratio=0.75, anchored=False):
+    """
+    Notes:
+      split date range into windows whose out-of-sample segments follow each other without gap
+      and end at to_date. in-sample segment of first window starts at from_date.
+    Args:
+      n_windows(int): num of windows
+      in_sample_ratio(float): in-sample part of each window, 0 < ratio < 1
+      anchored(bool): every in-sample segment starts at from_date if True, otherwise it rolls forward
+    Returns:
+      list of Window
+    """
+    if n_windows < 1:
+        raise ValueError('n_windows must be 1 or more, got %s' % n_windows)
+    if not 0 < in_sample_ratio < 1:
+        raise ValueError('in_sample_ratio must be between 0 and 1, got %s' % in_sample_ratio)
+
+    total = to_date - from_date
+    out_length = total * ((1 - in_sample_ratio) / (in_sample_ratio + n_windows * (1 - in_sample_ratio)))
+    in_length = total - out_length * n_windows
+
+    windows = []
+    for i in range(n_windows):
+        in_to = from_date + in_length + out_length * i
+        out_to = to_date if i == n_windows - 1 else in_to + out_length
+        windows.append(Window(i, from_date if anchored else in_to - in_length, in_to, out_to))
+    return windows
+
+
+class WindowResult(object):
+    """
+    Attributes:
+      window(Window): window
+      param(dict): ea inputs of the best in-sample pass. None if optimization found no pass
+      in_sample(metatrader.report.ShortReport): the best in-sample pass
+      out_of_sample(dict): summary of out-of-sample backtest, see read_backtest_summary
+      test_dir(string): directory of out-of-sample backtest
+      error(string): why window has no out-of-sample result
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.param = None
+        self.in_sample = None
+        self.out_of_sample = None
+        self.test_dir = None
+        self.error = None
+
+
+class WalkForwardReport(object):
+    """
+    Notes:
+      out-of-sample results of all windows stitched together.
+      profit and trades are summed, drawdown is the worst of windows.
+      efficiency is out-of-sample profit per day over in-sample profit per day.
+    Attributes:
+      windows(list): WindowResult of each window in date order
+    """
+
+    def __init__(self, windows):
+        self.windows = windows
+
+    @property
+    def completed(self):
+        return [w for w in self.windows if w.out_of_sample is not None]
+
+    def _sum(self, name):
+        return sum(w.out_of_sample.get(name) or 0 for w in self.completed)
+
+    @property
+    def profit(self):
+        return self._sum('profit')
+
+    @property
+    def total_trades(self):
+        return int(self._sum('total_trades'))
+
+    @property
+    def max_drawdown(self):
+        return max([w.out_of_sample.get('max_drawdown') or 0 for w in self.completed] or [0])
+
+    @property
+    def efficiency(self):
+        in_rate, out_rate = 0.0, 0.0
+        for w in self.completed:
+            in_days = (w.window.in_to - w.window.in_from).total_seconds() / 86400
+            out_days = (w.window.out_to - w.window.out_from).total_seconds() / 86400
+            in_rate += (w.in_sample.profit or 0) / in_days
+            out_rate += (w.out_of_sample.get('profit') or 0) / out_days
+        if in_rate <= 0:
+            return None
+        return out_rate / in_rate
+
+    def to_dict(self):
+        windows = []
+        for w in self.windows:
+            windows.append({
+                'index': w.window.index,
+                'in_from': w.window.in_from.isoformat(),
+                'in_to': w.window.in_to.isoformat(),
+                'out_from': w.window.out_from.isoformat(),
+                'out_to': w.window.out_to.isoformat(),
+                'param': w.param,
+                'in_sample_profit': w.in_sample.profit if w.in_sample is not None else None,
+                'out_of_sample': w.out_of_sample,
+                'test_dir': w.test_dir,
+                'error': w.error,
+            })
+        return {'profit': self.profit, 'total_trades': self.total_trades, 'max_drawdown': self.max_drawdown,
+                'efficiency': self.efficiency, 'windows': windows}
+
+    def write(self, path):
+        with open(path, 'w') as fp:
+            json.dump(self.to_dict(), fp, indent=1, sort_keys=True)
+
+
+def _best_pass(results, metric):
+    passes = [r for r in results if getattr(r, metric) is not None]
+    if not passes:
+        return None
+    return max(passes, key=lambda r: getattr(r, metric))
+
+
+def walk_forward(pool, test_dir, ea_name, param_space, symbol, period, deposit, from_date, to_date, n_windows,
+                 in_sample_ratio=0.75, anchored=False, metric='profit', genetic=False, **backtest_kwargs):
+    """
+    Notes:
+      optimize in-sample segment of every window and backtest the best pass on its out-of-sample segment.
+      all in-sample optimizations are queued at once, out-of-sample run of a window is queued
+      as soon as its optimization completes.
+    Args:
+      pool(metatrader.pool.BacktestPool): terminals to run windows on
+      test_dir(string): root directory. each window gets in_<index> and out_<index> sub directories
+      param_space(dict): ea input name => spec, see metatrader.sweep.compile_range
+      n_windows(int): num of windows, see split_windows
+      metric(string): attribute of ShortReport which selects the best in-sample pass
+      genetic(bool): use genetic algorithm for in-sample optimization
+      backtest_kwargs: other BackTest arguments. e.g.: model=0, spread=10
+    Returns:
+      WalkForwardReport
+    """
+    compiled = compile_sweep(param_space, outer_keys=())
+    optimization_mode = OPTIMIZATION_GENETIC if genetic else OPTIMIZATION_COMPLETE
+
+    results = []
+    in_futures = {}
+    # window index => list of passes of its in-sample optimizations, num of optimizations left
+    in_passes = {}
+    n_left = {}
+    for window in split_windows(from_date, to_date, n_windows, in_sample_ratio=in_sample_ratio, anchored=anchored):
+        results.append(WindowResult(window))
+        in_passes[window.index] = []
+        n_left[window.index] = len(compiled)
+        for i, (_, ea_param, _) in enumerate(compiled):
+            # inputs which can not be one range are optimized separately, see compile_sweep
+            in_dir = os.path.join(test_dir, 'in_%d' % window.index if len(compiled) == 1 else
+                                  'in_%d_%d' % (window.index, i))
+            os.makedirs(in_dir, exist_ok=True)
+            backtest = BackTest(in_dir, ea_name, ea_param, symbol, period, deposit, window.in_from, window.in_to,
+                                optimization_mode=optimization_mode, **backtest_kwargs)
+            in_futures[pool.submit(backtest, optimize=True)] = (results[-1], ea_param)
+
+    out_futures = {}
+    for future in as_completed(in_futures):
+        result, ea_param = in_futures[future]
+        window = result.window
+        n_left[window.index] -= 1
+        try:
+            report = future.result()
+        except Exception as e:
+            result.error = 'in-sample optimization failed: %s' % e
+            logging.error('window %d: %s', window.index, result.error)
+        else:
+            # fixed inputs are not in passes of report
+            fixed = {name: param['value'] for name, param in ea_param.items() if 'interval' not in param}
+            in_passes[window.index].extend((r, fixed) for r in report.results)
+        if n_left[window.index] or result.error is not None:
+            continue
+
+        best = _best_pass([r for r, _ in in_passes[window.index]], metric)
+        if best is None:
+            result.error = 'in-sample optimization has no pass'
+            logging.error('window %d: %s', window.index, result.error)
+            continue
+        result.in_sample = best
+        result.param = dict(next(fixed for r, fixed in in_passes[window.index] if r is best))
+        result.param.update((name.strip(), value) for name, value in best.param_key)
+
+        result.test_dir = os.path.join(test_dir, 'out_%d' % window.index)
+        os.makedirs(result.test_dir, exist_ok=True)
+        backtest = BackTest(result.test_dir, ea_name, {name: {'value': value} for name, value in result.param.items()},
+                            symbol, period, deposit, window.out_from, window.out_to, **backtest_kwargs)
+        logging.info('window %d: in-sample %s %s, param %s', window.index, metric,
+                     getattr(result.in_sample, metric), result.param)
+        out_futures[window.index] = pool.submit(backtest)
+
+    for result in results:
+        future = out_futures.get(result.window.index)
+        if future is None:
+            continue
+        try:
+            future.result()
+            result.out_of_sample = read_backtest_summary(get_report_abs_path(result.test_dir))
+        except Exception as e:
+            result.error = 'out-of-sample backtest failed: %s' % e
+            logging.error('window %d: %s', result.window.index, result.error)
+    return WalkForwardReport(results)
@@ -10,7 +10,7 @@ def readme():
     with open("README.rst") as f:
         return f.read()
 
-from distutils.core import setup
+from setuptools import setup
 
 setup(name='metatrader',
       version = version,
@@ -34,6 +34,14 @@ setup(name='metatrader',
       packages=['metatrader',
                 ],
       install_requires=['beautifulsoup4'],
+      extras_require={
+          'table': ['numpy'],
+      },
+      entry_points={
+          'console_scripts': [
+              'metatrader = metatrader.cli:main',
+          ],
+      },
       tests_require=[
         'nose',
       ],
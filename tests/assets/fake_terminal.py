@@ -0,0 +1,344 @@
+"""
+stand-in of terminal64.exe to run orchestration off windows.
+
+install(prog_path) makes prog_path look like a portable terminal install whose terminal64.exe is this script.
+when launched with /config:<path> it reads config.ini and parameter file like terminal does,
+sleeps, and writes report files into its own directory (portable data folder):
+  backtest: <Report>.htm in layout of mt5 report, padded by deal rows, and chart pngs
+  optimization: <Report>.htm in format of OptimizationReport with one row per pass of ,F=1 ranges
+reports are written in utf-16 with bom like mt5 does.
+
+behavior is configured by env:
+  FAKE_TERMINAL_SLEEP(float): seconds to sleep, default 0
+  FAKE_TERMINAL_REPORT_SIZE(int): min size of backtest report in bytes, default 0
+  FAKE_TERMINAL_EXIT_CODE(int): exit code, default 0
+"""
+import configparser
+import hashlib
+import itertools
+import os
+import random
+import stat
+import sys
+import time
+
+# mt5 writes utf-16 le with bom, 'utf-16' codec writes the bom of native byte order
+REPORT_ENCODING = 'utf-16-le'
+BOM = '\ufeff'
+CHART_FILE_SUFFIXES = ('', '-hst', '-mfemae', '-holding')
+# minimal valid png
+PNG = (b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x06\x00\x00\x00\x1f\x15\xc4\x89'
+       b'\x00\x00\x00\rIDATx\x9cc\xf8\x0f\x00\x00\x01\x01\x00\x05\x18\xd8N\x00\x00\x00\x00IEND\xaeB`\x82')
+
+SUMMARY = '''<!DOCTYPE html PUBLIC "-//W3C//DTD HTML 4.01 Transitional//EN" "http://www.w3.org/TR/html4/loose.dtd">
+<html>
+  <head>
+    <title>Strategy Tester Report</title>
+    <meta name="generator" content="MetaTrader 5">
+  </head>
+<body>
+<div align="center">
+<table cellspacing="1" cellpadding="3" border="0">
+   <tr align="center">
+      <td colspan="13"><div style="font: 14pt Tahoma"><b>Strategy Tester Report</b><br></div></td>
+   </tr>
+   <tr align="right">
+      <td nowrap colspan="3">Expert:</td>
+      <td nowrap colspan="10" align="left"><b>{expert}</b></td>
+   </tr>
+   <tr align="right">
+      <td nowrap colspan="3">Symbol:</td>
+      <td nowrap colspan="10" align="left"><b>{symbol}</b></td>
+   </tr>
+   <tr align="right">
+      <td nowrap colspan="3">Period:</td>
+      <td nowrap colspan="10" align="left"><b>{period} ({from_date} - {to_date})</b></td>
+   </tr>
+   <tr align="right">
+      <td nowrap colspan="3" >Initial Deposit:</td>
+      <td nowrap colspan="10" align="left"><b>{deposit}</b></td>
+   </tr>
+   <tr>
+      <td colspan="13" align="center"><div style="font: 10pt Tahoma"><b>Results</b></div></td>
+   </tr>
+   <tr align="right">
+      <td nowrap colspan="3">History Quality:</td>
+      <td nowrap><b>90%</b></td>
+   </tr>
+   <tr align="right">
+      <td nowrap colspan="3">Total Net Profit:</td>
+      <td nowrap><b>{profit}</b></td>
+      <td nowrap colspan="3">Balance Drawdown Absolute:</td>
+      <td nowrap><b>{abs_dd}</b></td>
+      <td nowrap colspan="3">Equity Drawdown Absolute:</td>
+      <td nowrap colspan="2"><b>{abs_dd}</b></td>
+   </tr>
+   <tr align="right">
+      <td nowrap colspan="3">Gross Profit:</td>
+      <td nowrap><b>{gross_profit}</b></td>
+      <td nowrap colspan="3">Balance Drawdown Maximal:</td>
+      <td nowrap><b>{dd} ({dd_rate:.2f}%)</b></td>
+      <td nowrap colspan="3">Equity Drawdown Maximal:</td>
+      <td nowrap colspan="2"><b>{dd} ({dd_rate:.2f}%)</b></td>
+   </tr>
+   <tr align="right">
+      <td nowrap colspan="3">Gross Loss:</td>
+      <td nowrap><b>{gross_loss}</b></td>
+      <td nowrap colspan="3">Balance Drawdown Relative:</td>
+      <td nowrap><b>{dd_rate:.2f}% ({dd})</b></td>
+      <td nowrap colspan="3">Equity Drawdown Relative:</td>
+      <td nowrap colspan="2"><b>{dd_rate:.2f}% ({dd})</b></td>
+   </tr>
+   <tr align="right">
+      <td nowrap colspan="3">Profit Factor:</td>
+      <td nowrap><b>{profit_factor:.2f}</b></td>
+      <td nowrap colspan="3">Expected Payoff:</td>
+      <td nowrap><b>{payoff}</b></td>
+      <td nowrap colspan="3">Margin Level:</td>
+      <td nowrap colspan="2"><b>109.40%</b></td>
+   </tr>
+   <tr align="right">
+      <td nowrap colspan="3">Total Trades:</td>
+      <td nowrap><b>{trades}</b></td>
+      <td nowrap colspan="3">Short Trades (won %):</td>
+      <td nowrap><b>{short} (40.00%)</b></td>
+      <td nowrap colspan="3">Long Trades (won %):</td>
+      <td nowrap colspan="2"><b>{long} (45.00%)</b></td>
+   </tr>
+   <tr align="right">
+      <td nowrap colspan="3">Total Deals:</td>
+      <td nowrap><b>{deals}</b></td>
+      <td nowrap colspan="3">Profit Trades (% of total):</td>
+      <td nowrap><b>{wins} ({win_rate:.2f}%)</b></td>
+      <td nowrap colspan="3">Loss Trades (% of total):</td>
+      <td nowrap colspan="2"><b>{losses} ({loss_rate:.2f}%)</b></td>
+   </tr>
+   <tr align="right">
+      <td nowrap colspan="4"></td>
+      <td nowrap colspan="3">Largest profit trade:</td>
+      <td nowrap><b>155.62</b></td>
+      <td nowrap colspan="3">Largest loss trade:</td>
+      <td nowrap colspan="2"><b>-87.78</b></td>
+   </tr>
+   <tr align="right">
+      <td nowrap colspan="4"></td>
+      <td nowrap colspan="3">Average profit trade:</td>
+      <td nowrap><b>18.90</b></td>
+      <td nowrap colspan="3">Average loss trade:</td>
+      <td nowrap colspan="2"><b>-6.43</b></td>
+   </tr>
+   <tr align="right">
+      <td nowrap colspan="4"></td>
+      <td nowrap colspan="3">Maximum consecutive wins ($):</td>
+      <td nowrap><b>4 (44.31)</b></td>
+      <td nowrap colspan="3">Maximum consecutive losses ($):</td>
+      <td nowrap colspan="2"><b>30 (-192.53)</b></td>
+   </tr>
+   <tr align="right">
+      <td nowrap colspan="4"></td>
+      <td nowrap colspan="3">Maximal consecutive profit (count):</td>
+      <td nowrap><b>270.45 (3)</b></td>
+      <td nowrap colspan="3">Maximal consecutive loss (count):</td>
+      <td nowrap colspan="2"><b>-192.53 (30)</b></td>
+   </tr>
+   <tr align="right">
+      <td nowrap colspan="4"></td>
+      <td nowrap colspan="3">Average consecutive wins:</td>
+      <td nowrap><b>1</b></td>
+      <td nowrap colspan="3">Average consecutive losses:</td>
+      <td nowrap colspan="2"><b>4</b></td>
+   </tr>
+</table>
+<table cellspacing="1" cellpadding="3" border="0">
+   <tr align="center">
+      <th colspan="13" style="height: 25px"><div style="font: 10pt Tahoma"><b>Deals</b></div></th>
+   </tr>
+   <tr align="center" bgcolor="#E5F0FC">
+      <td nowrap style="height: 30px"><b>Time</b></td>
+      <td nowrap><b>Deal</b></td>
+      <td nowrap><b>Symbol</b></td>
+      <td nowrap><b>Type</b></td>
+      <td nowrap><b>Direction</b></td>
+      <td nowrap><b>Volume</b></td>
+      <td nowrap><b>Price</b></td>
+      <td nowrap><b>Order</b></td>
+      <td nowrap><b>Commission</b></td>
+      <td nowrap><b>Swap</b></td>
+      <td nowrap><b>Profit</b></td>
+      <td nowrap><b>Balance</b></td>
+      <td nowrap><b>Comment</b></td>
+   </tr>
+   <tr bgcolor="#FFFFFF" align=right><td>{from_date} 00:00:00</td><td>1</td><td></td><td>balance</td><td></td>\
+<td></td><td></td><td></td><td>0.00</td><td>0.00</td><td>{deposit}</td><td>{deposit}</td><td></td></tr>
+'''
+DEAL_ROW = ('   <tr bgcolor="#F7F7F7" align=right><td>{from_date} 09:05:00</td><td>{i}</td><td>{symbol}</td><td>sell</td>'
+            '<td>out</td><td>0.10</td><td>1.20250</td><td>{i}</td><td>0.00</td><td>0.00</td><td>{profit}</td>'
+            '<td>{balance}</td><td></td></tr>\n')
+FOOTER = '</table>\n</div>\n</body>\n</html>\n'
+
+
+def format_number(value):
+    """
+    Returns:
+      number as mt5 writes it, thousands are grouped by space. e.g.: -12 107.20
+    """
+    return '{:,.2f}'.format(value).replace(',', ' ')
+
+
+OPTIMIZATION_HEADER = '''<html><head><title>Strategy Tester: {expert}</title></head>
+<body topmargin=1 marginheight=1>
+<div style="font: 20pt Times New Roman"><b>Optimization Report</b></div>
+<table width=820 cellspacing=1 cellpadding=3 border=0>
+<tr align=left><td colspan=2>Symbol</td><td colspan=4>{symbol}</td></tr>
+<tr align=left><td colspan=2>Initial deposit</td><td colspan=4>{deposit:.2f}</td></tr>
+</table>
+<br>
+<table width=820 cellspacing=1 cellpadding=2 border=0>
+<tr bgcolor="#C0C0C0" align=right><td>Pass</td><td>Profit</td><td>Total trades</td><td>Profit factor</td>\
+<td>Expected Payoff</td><td>Drawdown $</td><td>Drawdown %</td></tr>
+'''
+OPTIMIZATION_ROW = ('<tr align=right><td title="{title}">{i}</td><td class=mspt>{profit:.2f}</td><td>{trades}</td>'
+                    '<td>{profit_factor:.2f}</td><td class=mspt>{payoff:.2f}</td><td class=mspt>{dd:.2f}</td>'
+                    '<td class=mspt>{dd_rate:.2f}</td></tr>\n')
+
+
+def install(prog_path):
+    """
+    Notes:
+      make prog_path look like a portable terminal install whose terminal64.exe is this script
+    Returns:
+      prog_path
+    """
+    os.makedirs(os.path.join(prog_path, 'MQL5', 'Profiles', 'Tester'), exist_ok=True)
+    exe_path = os.path.join(prog_path, 'terminal64.exe')
+    with open(os.path.abspath(__file__)) as src, open(exe_path, 'w') as dst:
+        dst.write('#!%s\n' % sys.executable)
+        dst.write(src.read())
+    os.chmod(exe_path, os.stat(exe_path).st_mode | stat.S_IEXEC)
+    return prog_path
+
+
+def read_param_file(path):
+    """
+    Returns:
+      list of (name, value, range) where range is (start, step, stop) if ,F=1 else None
+    """
+    values = {}
+    order = []
+    with open(path) as fp:
+        for line in fp:
+            key, _, value = line.rstrip('\n').partition('=')
+            name, _, suffix = key.partition(',')
+            if name not in values:
+                values[name] = {}
+                order.append(name)
+            values[name][suffix] = value
+
+    params = []
+    for name in order:
+        entry = values[name]
+        param_range = None
+        if entry.get('F') == '1':
+            param_range = (float(entry['1']), float(entry['2']), float(entry['3']))
+        params.append((name, entry.get(''), param_range))
+    return params
+
+
+def metrics(seed_text, deposit):
+    rnd = random.Random(hashlib.md5(seed_text.encode('utf-8')).hexdigest())
+    gross_profit = rnd.uniform(100, 5000)
+    gross_loss = -rnd.uniform(100, 5000)
+    trades = rnd.randint(20, 2000)
+    wins = rnd.randint(1, trades - 1)
+    dd = rnd.uniform(10, deposit / 2)
+    return {
+        'profit': gross_profit + gross_loss, 'gross_profit': gross_profit, 'gross_loss': gross_loss,
+        'profit_factor': gross_profit / -gross_loss, 'payoff': (gross_profit + gross_loss) / trades,
+        'abs_dd': dd / 2, 'dd': dd, 'dd_rate': dd / deposit * 100, 'trades': trades,
+        'short': trades // 2, 'long': trades - trades // 2, 'wins': wins, 'losses': trades - wins,
+        'win_rate': wins * 100.0 / trades, 'loss_rate': (trades - wins) * 100.0 / trades, 'deals': trades * 2,
+    }
+
+
+def write_backtest_report(report_path, tester, params, report_size):
+    deposit = float(tester.get('Deposit', '10000'))
+    seed_text = '%s|%s|%s|%s' % (tester.get('Expert'), tester.get('Symbol'), tester.get('Period'), params)
+    values = metrics(seed_text, deposit)
+
+    for name in ('profit', 'gross_profit', 'gross_loss', 'payoff', 'abs_dd', 'dd'):
+        values[name] = format_number(values[name])
+
+    with open(report_path + '.htm', 'w', encoding=REPORT_ENCODING) as fp:
+        fp.write(BOM)
+        # written size is counted in chars, each is 2 bytes
+        written = 2 * fp.write(SUMMARY.format(expert=tester.get('Expert'), symbol=tester.get('Symbol'),
+                                              period=tester.get('Period'), from_date=tester.get('FromDate'),
+                                              to_date=tester.get('ToDate'), deposit=format_number(deposit), **values))
+        balance = deposit
+        for i in itertools.count(2):
+            if written >= report_size:
+                break
+            balance += 1500
+            written += 2 * fp.write(DEAL_ROW.format(i=i, from_date=tester.get('FromDate'), symbol=tester.get('Symbol'),
+                                                    profit=format_number(1500), balance=format_number(balance)))
+        fp.write(FOOTER)
+
+    for suffix in CHART_FILE_SUFFIXES:
+        with open(report_path + suffix + '.png', 'wb') as fp:
+            fp.write(PNG)
+
+
+def write_optimization_report(report_path, tester, params):
+    deposit = float(tester.get('Deposit', '10000'))
+    names = [name for name, _, _ in params]
+    axes = []
+    for name, value, param_range in params:
+        if param_range is None:
+            axes.append([value])
+        else:
+            start, step, stop = param_range
+            n = int(round((stop - start) / step)) + 1
+            axes.append(['%g' % (start + step * i) for i in range(n)])
+
+    with open(report_path + '.htm', 'w', encoding=REPORT_ENCODING) as fp:
+        fp.write(BOM)
+        fp.write(OPTIMIZATION_HEADER.format(expert=tester.get('Expert'), symbol=tester.get('Symbol'),
+                                            deposit=deposit))
+        for i, combination in enumerate(itertools.product(*axes)):
+            title = ''.join('%s=%s; ' % (name, value) for name, value in zip(names, combination))
+            values = metrics('%s|%s' % (tester.get('Symbol'), title), deposit)
+            fp.write(OPTIMIZATION_ROW.format(i=i + 1, title=title, **values))
+        fp.write(FOOTER)
+
+
+def main(argv):
+    conf_path = None
+    for arg in argv[1:]:
+        if arg.startswith('/config:'):
+            conf_path = arg[len('/config:'):].strip('"')
+    if conf_path is None:
+        return 1
+
+    conf = configparser.ConfigParser()
+    conf.optionxform = str
+    conf.read(conf_path)
+    tester = conf['Tester']
+
+    data_dir = os.path.dirname(os.path.abspath(argv[0]))
+    param_path = os.path.join(data_dir, 'MQL5', 'Profiles', 'Tester', tester.get('ExpertParameters', 'param.set'))
+    params = read_param_file(param_path) if os.path.exists(param_path) else []
+
+    time.sleep(float(os.environ.get('FAKE_TERMINAL_SLEEP', '0')))
+
+    report_path = os.path.join(data_dir, *tester['Report'].split('/'))
+    os.makedirs(os.path.dirname(report_path), exist_ok=True)
+    if tester.get('Optimization', '0') != '0':
+        write_optimization_report(report_path, tester, params)
+    else:
+        write_backtest_report(report_path, tester, params, int(os.environ.get('FAKE_TERMINAL_REPORT_SIZE', '0')))
+
+    return int(os.environ.get('FAKE_TERMINAL_EXIT_CODE', '0'))
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
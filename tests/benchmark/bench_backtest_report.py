@@ -0,0 +1,149 @@
+"""
+benchmark of backtest report summary extraction.
+compares DOM-free read_backtest_summary with former BeautifulSoup implementation.
+
+usage:
+  python -m tests.benchmark.bench_backtest_report --trades 2000 --repeat 20
+"""
+import argparse
+import os
+import re
+import shutil
+import tempfile
+import time
+
+from metatrader.report import get_data_and_rate, read_backtest_summary, split_to_tokens
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'assets')
+
+TRADE_ROW = ('<tr align=right><td>{i}</td><td class=msdate>2014.09.01 09:05</td><td>sell</td><td>{i}</td>'
+             '<td class=mspt>0.20</td><td>104.25</td><td>0.00</td><td>0.00</td><td class=mspt>-11.50</td>'
+             '<td class=mspt>9988.50</td></tr>\n')
+
+
+def write_backtest_report(path, n_trades):
+    """
+    Notes:
+      summary of tests/assets/backtest_report.htm followed by n_trades rows of trades table
+    """
+    with open(os.path.join(ASSETS_DIR, 'backtest_report.htm'), encoding='cp1251') as fp:
+        template = fp.read()
+    head, tail = template.rsplit('</table>', 1)
+    trades = ''.join(TRADE_ROW.format(i=i) for i in range(n_trades))
+    with open(path, 'w', encoding='cp1251') as fp:
+        fp.write(head + trades + '</table>' + tail)
+
+
+def legacy_summary(report_file):
+    """
+    Notes:
+      former BacktestReport.__init__, kept here as baseline.
+    """
+    from bs4 import BeautifulSoup
+
+    with open(report_file, 'r', encoding='cp1251') as fp:
+        raw_html = fp.read()
+
+    tds = BeautifulSoup(raw_html, 'lxml').find_all('table')[0].find_all('td')
+    s = {}
+    for index, td in enumerate(tds):
+        if td.text == 'Initial deposit':
+            s['initial_deposit'] = float(tds[index + 1].text)
+        if td.text == 'Modelling quality':
+            s['modeling_quality_percentage'] = float(re.sub('%', '', tds[index + 1].text))
+        elif td.text == 'Total net profit':
+            s['profit'] = float(tds[index + 1].text)
+        elif td.text == 'Gross profit':
+            s['gross_profit'] = float(tds[index + 1].text)
+        elif td.text == 'Gross loss':
+            s['gross_loss'] = float(tds[index + 1].text)
+        elif td.text == 'Profit factor':
+            s['profit_factor'] = float(tds[index + 1].text)
+        elif td.text == 'Expected payoff':
+            s['expected_payoff'] = float(tds[index + 1].text)
+        elif td.text == 'Absolute drawdown':
+            s['abs_drawdown'] = float(tds[index + 1].text)
+        elif td.text == 'Maximal drawdown':
+            s['max_drawdown'], s['max_drawdown_rate'] = get_data_and_rate(tds[index + 1].text)
+        elif td.text == 'Relative drawdown':
+            s['relative_drawdown'], s['relative_drawdown_rate'] = get_data_and_rate(tds[index + 1].text)
+        elif td.text == 'Total trades':
+            s['total_trades'] = int(tds[index + 1].text)
+        elif td.text == 'Short positions (won %)':
+            s['short_positions'], s['short_positions_rate'] = get_data_and_rate(tds[index + 1].text)
+        elif td.text == 'Long positions (won %)':
+            s['long_positions'], s['long_positions_rate'] = get_data_and_rate(tds[index + 1].text)
+        elif td.text == 'Profit trades (% of total)':
+            data, s['profit_trades_rate'] = get_data_and_rate(tds[index + 1].text)
+            s['profit_trades'] = int(data)
+        elif td.text == 'Loss trades (% of total)':
+            data, s['loss_trades_rate'] = get_data_and_rate(tds[index + 1].text)
+            s['loss_trades'] = int(data)
+        elif td.text == 'Largest':
+            if tds[index + 1].text == 'profit trade':
+                s['largest_profit_trade'] = float(tds[index + 2].text)
+            if tds[index + 3].text == 'loss trade':
+                s['largest_loss_trade'] = float(tds[index + 4].text)
+        elif td.text == 'Average':
+            if tds[index + 1].text == 'profit trade':
+                s['average_profit_trade'] = float(tds[index + 2].text)
+            elif tds[index + 1].text == 'consecutive wins':
+                s['ave_consecutive_wins'] = int(tds[index + 2].text)
+            if tds[index + 3].text == 'loss trade':
+                s['average_loss_trade'] = float(tds[index + 4].text)
+            elif tds[index + 3].text == 'consecutive losses':
+                s['ave_consecutive_losses'] = int(tds[index + 4].text)
+        elif td.text == 'Maximum':
+            if tds[index + 1].text == 'consecutive wins (profit in money)':
+                token = split_to_tokens(tds[index + 2].text)
+                s['max_consecutive_wins_count'] = int(token[0])
+                s['max_consecutive_wins_profit'] = float(token[1])
+            if tds[index + 3].text == 'consecutive losses (loss in money)':
+                token = split_to_tokens(tds[index + 4].text)
+                s['max_consecutive_losses_count'] = int(token[0])
+                s['max_consecutive_losses_loss'] = float(token[1])
+        elif td.text == 'Maximal':
+            if tds[index + 1].text == 'consecutive profit (count of wins)':
+                token = split_to_tokens(tds[index + 2].text)
+                s['max_consecutive_profit'] = float(token[0])
+                s['max_consecutive_profit_count'] = int(token[1])
+            if tds[index + 3].text == 'consecutive loss (count of losses)':
+                token = split_to_tokens(tds[index + 4].text)
+                s['max_consecutive_loss'] = float(token[0])
+                s['max_consecutive_loss_count'] = int(token[1])
+    return s
+
+
+def timeit(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        ret = func()
+    return ret, (time.perf_counter() - start) / repeat
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--trades', type=int, default=2000)
+    arg_parser.add_argument('--repeat', type=int, default=20)
+    args = arg_parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        report_file = os.path.join(work_dir, 'report.htm')
+        write_backtest_report(report_file, args.trades)
+        print('report: %d trades, %.1f kB' % (args.trades, os.path.getsize(report_file) / 1e3))
+
+        fast, fast_elapsed = timeit(lambda: read_backtest_summary(report_file), args.repeat)
+        print('read_backtest_summary: %10.3f ms/report' % (fast_elapsed * 1e3))
+
+        legacy, legacy_elapsed = timeit(lambda: legacy_summary(report_file), args.repeat)
+        print('legacy BeautifulSoup:  %10.3f ms/report' % (legacy_elapsed * 1e3))
+        print('speedup: %.0fx' % (legacy_elapsed / fast_elapsed))
+
+        assert fast == legacy
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""
+benchmark of bulk ingestion of result directories.
+compares parsing in this process with process pool.
+
+usage:
+  python -m tests.benchmark.bench_ingest --dirs 2000 --trades 2000 --workers 4
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from metatrader.ingest import ingest
+from tests.benchmark.bench_backtest_report import write_backtest_report
+
+
+def make_result_dirs(root, n_dirs, n_trades):
+    template = os.path.join(root, 'template.htm')
+    write_backtest_report(template, n_trades)
+    results_dir = os.path.join(root, 'results')
+    for i in range(n_dirs):
+        report_dir = os.path.join(results_dir, 'run_%05d' % i, 'report')
+        os.makedirs(report_dir)
+        shutil.copy(template, os.path.join(report_dir, 'report.htm'))
+    return results_dir
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--dirs', type=int, default=2000)
+    arg_parser.add_argument('--trades', type=int, default=2000)
+    arg_parser.add_argument('--workers', type=int, default=os.cpu_count())
+    arg_parser.add_argument('--chunk-size', type=int, default=64)
+    args = arg_parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        results_dir = make_result_dirs(work_dir, args.dirs, args.trades)
+        for workers in (0, args.workers):
+            output = os.path.join(work_dir, 'results_%d.csv' % workers)
+            start = time.perf_counter()
+            n_parsed, n_failed = ingest(results_dir, output, workers=workers, chunk_size=args.chunk_size)
+            elapsed = time.perf_counter() - start
+            print('workers %2d: %8.3f s  %8.0f dirs/s  parsed %d failed %d' % (
+                workers, elapsed, args.dirs / elapsed, n_parsed, n_failed))
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
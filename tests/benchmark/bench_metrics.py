@@ -0,0 +1,98 @@
+"""
+benchmark of deals metrics.
+compares vectorized metatrader.metrics with python loop over deals.
+
+usage:
+  python -m tests.benchmark.bench_metrics --deals 10000 --reports 200
+"""
+import argparse
+import time
+
+import numpy as np
+
+from metatrader import metrics
+from metatrader.deals import DEAL_DIRECTIONS, DEAL_DTYPE, DEAL_TYPES
+
+
+def make_deals(n_deals, seed):
+    rnd = np.random.RandomState(seed)
+    deals = np.zeros(n_deals, dtype=DEAL_DTYPE)
+    deals['time'] = np.datetime64('2018-01-01T00:00:00') + np.cumsum(rnd.randint(60, 7200, n_deals))
+    deals['deal'] = np.arange(1, n_deals + 1)
+    deals['type'] = np.where(rnd.rand(n_deals) < 0.5, DEAL_TYPES.index('buy'), DEAL_TYPES.index('sell'))
+    deals['direction'] = np.where(np.arange(n_deals) % 2 == 0, DEAL_DIRECTIONS.index('in'),
+                                  DEAL_DIRECTIONS.index('out'))
+    deals['volume'] = 0.1
+    deals['profit'] = np.where(deals['direction'] == DEAL_DIRECTIONS.index('out'), rnd.normal(1, 20, n_deals), 0)
+    deals['type'][0] = DEAL_TYPES.index('balance')
+    deals['direction'][0] = -1
+    deals['profit'][0] = 10000
+    deals['balance'] = np.cumsum(deals['profit'])
+    return deals
+
+
+def loop_metrics(deals):
+    """
+    Notes:
+      same equity, drawdown and time under water as metrics, computed deal by deal
+    """
+    equity = 0.0
+    peak = None
+    max_dd = 0.0
+    under_since = None
+    longest = 0
+    for row in deals.tolist():
+        time_, _, _, _, _, _, commission, swap, profit, _ = row
+        equity += profit + commission + swap
+        if peak is None or equity >= peak:
+            peak = equity
+            if under_since is not None:
+                longest = max(longest, (time_ - under_since).total_seconds())
+                under_since = None
+        else:
+            max_dd = max(max_dd, peak - equity)
+            if under_since is None:
+                under_since = time_
+    return equity, max_dd, longest
+
+
+def vectorized_metrics(deals):
+    equity = metrics.equity_curve(deals)
+    dd, _ = metrics.max_drawdown(equity)
+    longest, _ = metrics.time_under_water(deals['time'], equity)
+    return equity[-1], dd, longest
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--deals', type=int, default=10000)
+    arg_parser.add_argument('--reports', type=int, default=200)
+    args = arg_parser.parse_args()
+
+    reports = [make_deals(args.deals, seed) for seed in range(args.reports)]
+
+    start = time.perf_counter()
+    for deals in reports:
+        vectorized_metrics(deals)
+    vectorized = time.perf_counter() - start
+    print('vectorized:  %8.3f ms/report' % (vectorized / args.reports * 1e3))
+
+    start = time.perf_counter()
+    for deals in reports:
+        loop_metrics(deals)
+    loop = time.perf_counter() - start
+    print('python loop: %8.3f ms/report' % (loop / args.reports * 1e3))
+    print('speedup: %.0fx' % (loop / vectorized))
+
+    start = time.perf_counter()
+    for deals in reports:
+        metrics.summary(deals)
+    print('summary:     %8.3f ms/report' % ((time.perf_counter() - start) / args.reports * 1e3))
+
+    equity, dd, _ = vectorized_metrics(reports[0])
+    loop_equity, loop_dd, _ = loop_metrics(reports[0])
+    assert np.isclose(equity, loop_equity) and np.isclose(dd, loop_dd)
+
+
+if __name__ == '__main__':
+    main()
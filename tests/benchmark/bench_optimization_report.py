@@ -0,0 +1,149 @@
+"""
+benchmark of optimization report parsing.
+compares streaming iter_optimization_results with former BeautifulSoup implementation
+which built DOM of report three times.
+
+usage:
+  python -m tests.benchmark.bench_optimization_report --passes 20000
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from metatrader.report import ShortReport, get_param_from_text, has_divtag_with_style, iter_optimization_results
+
+HEADER = '''<html><head><title>Strategy Tester: Moving Average</title></head>
+<body topmargin=1 marginheight=1>
+<div style="font: 20pt Times New Roman"><b>Optimization Report</b></div>
+<div style="font: 16pt Times New Roman"><b>Moving Average</b></div>
+<table width=820 cellspacing=1 cellpadding=3 border=0>
+<tr align=left><td colspan=2>Symbol</td><td colspan=4>USDJPY (US Dollar vs Japanese Yen)</td></tr>
+<tr align=left><td colspan=2>Initial deposit</td><td colspan=4>10000.00</td></tr>
+</table>
+<br>
+<table width=820 cellspacing=1 cellpadding=2 border=0>
+<tr bgcolor="#C0C0C0" align=right><td>Pass</td><td>Profit</td><td>Total trades</td><td>Profit factor</td>\
+<td>Expected Payoff</td><td>Drawdown $</td><td>Drawdown %</td><td>MovingPeriod</td></tr>
+'''
+ROW = ('<tr align=right><td title="MovingPeriod={p}; MovingShift={s}; MaximumRisk={r:.2f}; ">{i}</td>'
+       '<td class=mspt>{profit:.2f}</td><td>{trades}</td><td>{pf:.2f}</td><td class=mspt>{payoff:.2f}</td>'
+       '<td class=mspt>{dd:.2f}</td><td class=mspt>{ddr:.2f}</td><td>{p}</td></tr>\n')
+FOOTER = '</table>\n</body></html>\n'
+
+
+class BenchBackTest(object):
+    ea_name = 'Moving Average'
+    param = {}
+    symbol = 'USDJPY'
+    from_date = None
+    to_date = None
+    model = 1
+    spread = 10
+
+
+def write_optimization_report(path, n_passes, seed=0):
+    rnd = random.Random(seed)
+    with open(path, 'w') as fp:
+        fp.write(HEADER)
+        for i in range(n_passes):
+            fp.write(ROW.format(i=i + 1, p=rnd.randint(5, 50), s=rnd.randint(0, 10), r=rnd.random(),
+                                profit=rnd.uniform(-5000, 5000), trades=rnd.randint(10, 2000),
+                                pf=rnd.uniform(0, 3), payoff=rnd.uniform(-5, 5),
+                                dd=rnd.uniform(0, 5000), ddr=rnd.uniform(0, 50)))
+        fp.write(FOOTER)
+
+
+def legacy_results(backtest, report_file):
+    """
+    Notes:
+      former OptimizationReport implementation, kept here as baseline.
+    """
+    from bs4 import BeautifulSoup
+
+    with open(report_file, 'r') as fp:
+        raw_html = fp.read()
+
+    def get_initial_deposit():
+        initial_deposit = 0
+        conditions = BeautifulSoup(raw_html, 'lxml').find_all('table')[0]
+        for tr in conditions.find_all('tr'):
+            tds = tr.find_all('td')
+            if tds[0].text == 'Initial deposit':
+                initial_deposit = float(tds[1].text)
+        return initial_deposit
+
+    is_valid = False
+    for title in BeautifulSoup(raw_html, 'lxml').find_all(has_divtag_with_style):
+        if title.text == 'Optimization Report' and get_initial_deposit() != 0:
+            is_valid = True
+    assert is_valid
+
+    initial_deposit = get_initial_deposit()
+    trs = BeautifulSoup(raw_html, 'lxml').find_all('table')[1].find_all('tr')
+    trs.pop(0)
+    results = []
+    for tr in trs:
+        tds = tr.find_all('td')
+        results.append(ShortReport(backtest,
+                                   param=get_param_from_text(tds[0].attrs.pop('title')),
+                                   profit=float(tds[1].text),
+                                   total_trades=int(tds[2].text),
+                                   profit_factor=float(tds[3].text),
+                                   expected_payoff=float(tds[4].text),
+                                   max_drawdown=float(tds[5].text),
+                                   max_drawdown_rate=float(tds[6].text),
+                                   initial_deposit=initial_deposit))
+    return results
+
+
+def measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    ret = func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return ret, elapsed, peak
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--passes', type=int, default=20000)
+    arg_parser.add_argument('--skip-legacy', action='store_true')
+    args = arg_parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        report_file = os.path.join(work_dir, 'report.htm')
+        write_optimization_report(report_file, args.passes)
+        print('report: %d passes, %.1f MB' % (args.passes, os.path.getsize(report_file) / 1e6))
+
+        backtest = BenchBackTest()
+
+        def stream_only():
+            n = 0
+            for _ in iter_optimization_results(backtest, report_file):
+                n += 1
+            return n
+
+        n, elapsed, peak = measure(stream_only)
+        print('streaming (consume):  %8.3f s  peak %8.1f MB  %d rows' % (elapsed, peak / 1e6, n))
+
+        results, elapsed, peak = measure(lambda: list(iter_optimization_results(backtest, report_file)))
+        print('streaming (list):     %8.3f s  peak %8.1f MB' % (elapsed, peak / 1e6))
+
+        if not args.skip_legacy:
+            legacy, legacy_elapsed, legacy_peak = measure(lambda: legacy_results(backtest, report_file))
+            print('legacy BeautifulSoup: %8.3f s  peak %8.1f MB' % (legacy_elapsed, legacy_peak / 1e6))
+            assert [(r, r.profit, r.total_trades, r.max_drawdown_rate) for r in legacy] == \
+                [(r, r.profit, r.total_trades, r.max_drawdown_rate) for r in results]
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
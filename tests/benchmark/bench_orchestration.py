@@ -0,0 +1,120 @@
+"""
+benchmark of backtest orchestration on fake terminals (tests/assets/fake_terminal.py).
+measures python overhead of each phase of one run and throughput of a sweep over terminal pool.
+runs anywhere, terminal work is simulated by --sleep.
+
+usage:
+  python -m tests.benchmark.bench_orchestration --runs 50 --terminals 4 --sleep 0.1 --report-size 200000
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime
+
+from metatrader import mt5
+from metatrader.backtest import BackTest
+from metatrader.pool import BacktestPool
+from metatrader.report import BacktestReport
+from tests.assets import fake_terminal
+
+PHASES = ('prepare', 'terminal', 'move report', 'parse')
+
+
+def create_backtest(test_dir, i):
+    param = {
+        'Inp_Signal_MACD_PeriodFast': {'value': 5 + i},
+        'Inp_Signal_MACD_PeriodSlow': {'value': 40},
+        'InpLots': {'value': 0.1},
+    }
+    return BackTest(test_dir, 'Advisors\\ExpertMACD', param, 'EURUSD', 'H1', 10000,
+                    datetime(2018, 1, 1), datetime(2018, 6, 1))
+
+
+def run_phases(backtest, alias):
+    """
+    Returns:
+      dict of phase => elapsed seconds
+    """
+    elapsed = {}
+    start = time.perf_counter()
+    backtest._prepare(alias=alias)
+    elapsed['prepare'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    mt5.get_mt5(alias).run(conf=backtest._get_conf_abs_path(alias=alias))
+    elapsed['terminal'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    backtest.move_and_fix_report(alias=alias)
+    elapsed['move report'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    BacktestReport(backtest)
+    elapsed['parse'] = time.perf_counter() - start
+    return elapsed
+
+
+def bench_phases(work_dir, alias, n_runs):
+    totals = dict.fromkeys(PHASES, 0.0)
+    for i in range(n_runs):
+        test_dir = os.path.join(work_dir, 'phase_%d' % i)
+        os.makedirs(test_dir)
+        for phase, elapsed in run_phases(create_backtest(test_dir, i), alias).items():
+            totals[phase] += elapsed
+
+    print('per run:')
+    for phase in PHASES:
+        print('  %-12s %10.3f ms' % (phase, totals[phase] / n_runs * 1e3))
+    overhead = sum(totals[phase] for phase in PHASES if phase != 'terminal') / n_runs
+    print('  %-12s %10.3f ms' % ('overhead', overhead * 1e3))
+
+
+def bench_sweep(work_dir, aliases, n_runs, sleep):
+    backtests = []
+    for i in range(n_runs):
+        test_dir = os.path.join(work_dir, 'sweep_%d' % i)
+        os.makedirs(test_dir)
+        backtests.append(create_backtest(test_dir, i))
+
+    start = time.perf_counter()
+    with BacktestPool(aliases) as pool:
+        for backtest in pool.map(backtests):
+            BacktestReport(backtest)
+    elapsed = time.perf_counter() - start
+
+    ideal = sleep * n_runs / len(aliases)
+    print('sweep: %d runs on %d terminals in %.2f s, %.1f runs/s (terminal bound %.2f s)' % (
+        n_runs, len(aliases), elapsed, n_runs / elapsed, ideal))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--runs', type=int, default=50)
+    arg_parser.add_argument('--terminals', type=int, default=4)
+    arg_parser.add_argument('--sleep', type=float, default=0.0)
+    arg_parser.add_argument('--report-size', type=int, default=200000)
+    args = arg_parser.parse_args()
+
+    os.environ['FAKE_TERMINAL_SLEEP'] = str(args.sleep)
+    os.environ['FAKE_TERMINAL_REPORT_SIZE'] = str(args.report_size)
+    mt5.set_platform(mt5.PortablePlatform())
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        aliases = []
+        for i in range(args.terminals):
+            alias = 'bench_%d' % i
+            mt5.initizalize(fake_terminal.install(os.path.join(work_dir, 'terminal_%d' % i)), alias=alias)
+            aliases.append(alias)
+
+        bench_phases(work_dir, aliases[0], args.runs)
+        bench_sweep(work_dir, aliases, args.runs, args.sleep)
+    finally:
+        mt5.set_platform(None)
+        shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+benchmark of memory used by optimization results.
+compares slots based ShortReport sharing one RunInfo with former per instance __dict__ copy.
+
+usage:
+  python -m tests.benchmark.bench_report_memory --rows 1000000
+"""
+import argparse
+import random
+import time
+import tracemalloc
+from datetime import datetime
+
+from metatrader.report import RunInfo, ShortReport
+
+
+class BenchBackTest(object):
+    ea_name = 'Moving Average'
+    param = {'Lots': {'value': 0.1}}
+    symbol = 'USDJPY'
+    period = 'H1'
+    deposit = 10000
+    from_date = datetime(2014, 9, 1)
+    to_date = datetime(2015, 1, 1)
+    model = 1
+    spread = 10
+
+
+class LegacyShortReport(object):
+    """
+    Notes:
+      former ShortReport, copies backtest attributes into own __dict__.
+    """
+
+    def __init__(self, back_test, **kwargs):
+        self.ea_name = back_test.ea_name
+        self.param = back_test.param
+        self.symbol = back_test.symbol
+        self.from_date = back_test.from_date
+        self.to_date = back_test.to_date
+        self.model = back_test.model
+        self.spread = back_test.spread
+        for name, value in kwargs.items():
+            setattr(self, name, value)
+
+
+def rows(n, seed=0):
+    rnd = random.Random(seed)
+    for _ in range(n):
+        # values are parsed from text, so every row has its own string objects
+        yield dict(param={'MovingPeriod': str(rnd.randint(5, 50)), 'MovingShift': str(rnd.randint(0, 10))},
+                   profit=rnd.uniform(-5000, 5000), total_trades=rnd.randint(10, 2000),
+                   profit_factor=rnd.uniform(0, 3), expected_payoff=rnd.uniform(-5, 5),
+                   max_drawdown=rnd.uniform(0, 5000), max_drawdown_rate=rnd.uniform(0, 50),
+                   initial_deposit=10000.0)
+
+
+def measure(build):
+    tracemalloc.start()
+    start = time.perf_counter()
+    reports = build()
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return reports, elapsed, current
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--rows', type=int, default=200000)
+    args = arg_parser.parse_args()
+
+    backtest = BenchBackTest()
+
+    def build_slots():
+        run = RunInfo(backtest)
+        return [ShortReport(run, **row) for row in rows(args.rows)]
+
+    reports, elapsed, size = measure(build_slots)
+    print('slots ShortReport: %8.2f s  %8.1f MB  %6.0f B/row' % (elapsed, size / 1e6, size / args.rows))
+    start = time.perf_counter()
+    n_distinct = len(set(reports))
+    print('  set() of %d rows: %.2f s, %d distinct passes' % (args.rows, time.perf_counter() - start, n_distinct))
+    del reports
+
+    reports, elapsed, size = measure(lambda: [LegacyShortReport(backtest, **row) for row in rows(args.rows)])
+    print('legacy __dict__:   %8.2f s  %8.1f MB  %6.0f B/row' % (elapsed, size / 1e6, size / args.rows))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+benchmark of xml spreadsheet optimization report parsing.
+peak memory of streaming pass must stay flat while num of passes grows.
+
+usage:
+  python -m tests.benchmark.bench_xml_optimization_report --passes 1000000
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from metatrader.report import iter_xml_optimization_results
+from tests.benchmark.bench_optimization_report import BenchBackTest, measure
+
+HEADER = '''<?xml version="1.0"?>
+<?mso-application progid="Excel.Sheet"?>
+<Workbook xmlns="urn:schemas-microsoft-com:office:spreadsheet" xmlns:o="urn:schemas-microsoft-com:office:office" \
+xmlns:ss="urn:schemas-microsoft-com:office:spreadsheet">
+ <DocumentProperties xmlns="urn:schemas-microsoft-com:office:office">
+  <Title>Moving Average USDJPY,M5 2014.09.01-2015.01.01</Title>
+  <Deposit>10000 USD</Deposit>
+ </DocumentProperties>
+ <Worksheet ss:Name="Tester Optimizator Results">
+  <Table>
+'''
+COLUMNS = ('Pass', 'Result', 'Profit', 'Expected Payoff', 'Profit Factor', 'Recovery Factor', 'Sharpe Ratio',
+           'Custom', 'Equity DD %', 'Trades', 'MovingPeriod', 'MovingShift', 'MaximumRisk')
+CELL = '<Cell><Data ss:Type="{0}">{1}</Data></Cell>'
+FOOTER = '''  </Table>
+ </Worksheet>
+</Workbook>
+'''
+
+
+def write_xml_optimization_report(path, n_passes):
+    rnd = random.Random(1)
+    with open(path, 'w') as fp:
+        fp.write(HEADER)
+        fp.write('   <Row>%s</Row>\n' % ''.join(CELL.format('String', name) for name in COLUMNS))
+        for i in range(n_passes):
+            profit = rnd.uniform(-2000, 2000)
+            values = (i, profit, profit, rnd.uniform(-2, 2), rnd.uniform(0.5, 1.5), rnd.uniform(-2, 2),
+                      rnd.uniform(-1, 1), 0, rnd.uniform(1, 30), rnd.randint(100, 2000), rnd.randint(2, 50),
+                      rnd.randint(0, 10), round(rnd.uniform(0.01, 0.2), 2))
+            fp.write('   <Row>%s</Row>\n' % ''.join(CELL.format('Number', value) for value in values))
+        fp.write(FOOTER)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--passes', type=int, default=100000)
+    args = arg_parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        backtest = BenchBackTest()
+        for n_passes in (args.passes // 10, args.passes):
+            report_file = os.path.join(work_dir, 'report.xml')
+            write_xml_optimization_report(report_file, n_passes)
+
+            def stream_only():
+                n = 0
+                for _ in iter_xml_optimization_results(backtest, report_file):
+                    n += 1
+                return n
+
+            # tracemalloc slows parsing down, so time and memory are measured in separate runs
+            start = time.perf_counter()
+            n = stream_only()
+            elapsed = time.perf_counter() - start
+            _, _, peak = measure(stream_only)
+            print('%8d passes, %7.1f MB: %8.3f s  %8.0f passes/s  peak %6.2f MB' % (
+                n, os.path.getsize(report_file) / 1e6, elapsed, n / elapsed, peak / 1e6))
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,15 +3,26 @@ Created on 2015/04/15
 
 @author: Taiga
 '''
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
 
-from metatrader.mt5 import initizalize
 from metatrader.backtest import BackTest
-from datetime import datetime
-import logging
+from metatrader.mt5 import initizalize
+from metatrader.report import BacktestReport
+
+PROG_PATH = 'C:\\Program Files\\FXCM MetaTrader 4'
+
 
 def test_backtest():
+    if os.name != 'nt' or not os.path.exists(PROG_PATH):
+        raise unittest.SkipTest('%s is not installed' % PROG_PATH)
+
     logging.basicConfig(level=logging.DEBUG)
-    initizalize('C:\\Program Files\\FXCM MetaTrader 4')
+    initizalize(PROG_PATH)
 
     from_date = datetime(2014, 9, 1)
     to_date = datetime(2015, 1, 1)
@@ -25,10 +36,14 @@ def test_backtest():
              'MovingShift': {'value': 6}
              }
 
+    test_dir = tempfile.mkdtemp()
+    try:
+        backtest = BackTest(test_dir, ea_name, param, 'USDJPY', 'M5', 10000, from_date, to_date, spread=10)
+        backtest.run()
+        ret = BacktestReport(backtest)
+    finally:
+        shutil.rmtree(test_dir, ignore_errors=True)
 
-    backtest = BackTest(ea_name, param, 'USDJPY', 'M5', from_date, to_date, spread=10)
-
-    ret = backtest.run()
     assert ret.profit == -724.34
     assert ret.profit_factor == 0.88
     assert ret.expected_payoff == -0.59
@@ -0,0 +1,36 @@
+import pytest
+
+from metatrader import mt5
+from tests.assets import fake_terminal
+
+
+@pytest.fixture
+def fake_terminals(tmpdir, monkeypatch):
+    """
+    Notes:
+      register fake terminals and return factory which initializes n of them.
+    """
+    monkeypatch.setattr(mt5, '_mt5s', {})
+    monkeypatch.setattr(mt5, '_platform', mt5.PortablePlatform())
+
+    def factory(n):
+        aliases = []
+        for i in range(n):
+            alias = 'fake_%d' % i
+            prog_path = fake_terminal.install(str(tmpdir.join('terminal_%d' % i)))
+            mt5.initizalize(prog_path, alias=alias)
+            aliases.append(alias)
+        return aliases
+
+    return factory
+
+
+@pytest.fixture(autouse=True)
+def discovery_cache(tmp_path_factory, monkeypatch):
+    """
+    Notes:
+      keep discovery cache of each test out of home directory
+    """
+    cache = mt5.DiscoveryCache(str(tmp_path_factory.mktemp('discovery').joinpath('discovery.json')))
+    monkeypatch.setattr(mt5, '_discovery_cache', cache)
+    return cache
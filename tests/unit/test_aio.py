@@ -0,0 +1,51 @@
+import asyncio
+import os
+import time
+from datetime import datetime
+
+from metatrader.aio import as_completed_bounded, run_backtests_async
+from metatrader.backtest import BackTest
+
+
+def test_as_completed_bounded_limits_concurrency():
+    state = {'running': 0, 'max_running': 0}
+
+    async def job(i):
+        state['running'] += 1
+        state['max_running'] = max(state['max_running'], state['running'])
+        await asyncio.sleep(0.01 * (5 - i % 5))
+        state['running'] -= 1
+        return i
+
+    async def collect():
+        return [await f for f in as_completed_bounded([job(i) for i in range(10)], 3)]
+
+    results = asyncio.run(collect())
+    assert sorted(results) == list(range(10))
+    assert state['max_running'] == 3
+
+
+def test_run_backtests_async_with_fake_terminals(fake_terminals, tmpdir, monkeypatch):
+    monkeypatch.setenv('FAKE_TERMINAL_SLEEP', '0.5')
+    aliases = fake_terminals(3)
+    backtests = []
+    for i in range(3):
+        test_dir = str(tmpdir.join('test_%d' % i))
+        os.makedirs(test_dir)
+        backtests.append(BackTest(test_dir, 'Advisors\\EA%d' % i, {'Lots': {'value': 0.1}}, 'EURUSD', 'H1',
+                                  10000, datetime(2018, 1, 1), datetime(2018, 2, 1)))
+
+    async def collect():
+        return [await f for f in run_backtests_async(backtests, aliases)]
+
+    start = time.time()
+    done = asyncio.run(collect())
+    elapsed = time.time() - start
+
+    assert len(done) == 3
+    # three terminals work side by side
+    assert elapsed < 1.3
+    for backtest in done:
+        report_file = os.path.join(backtest.test_dir, 'report', 'report.htm')
+        with open(report_file, encoding='utf-16') as fp:
+            assert backtest.ea_name in fp.read()
@@ -0,0 +1,182 @@
+import os
+import shutil
+
+import pytest
+
+from metatrader.archive import Archive, parse_size
+from metatrader.exception import InvalidReportFormat
+from metatrader.report import iter_optimization_results, read_backtest_summary
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'assets')
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 64
+
+
+class FakeBackTest(object):
+    ea_name = 'Moving Average'
+    param = {}
+    symbol = 'USDJPY'
+    period = 'H1'
+    deposit = 10000
+    from_date = None
+    to_date = None
+    model = 1
+    spread = 10
+
+
+def make_run(root, name, report='backtest_report.htm', extra=None):
+    test_dir = root.mkdir(name)
+    report_dir = test_dir.mkdir('report')
+    shutil.copy(os.path.join(ASSETS_DIR, report), str(report_dir.join('report.htm')))
+    report_dir.mkdir('report').join('report.png').write_binary(PNG)
+    for file_name, asset in (extra or {}).items():
+        shutil.copy(os.path.join(ASSETS_DIR, asset), str(report_dir.join(file_name)))
+    test_dir.join('conf.json').write('{"name": "%s"}' % name)
+    return str(test_dir)
+
+
+@pytest.fixture
+def archive(tmpdir):
+    with Archive(str(tmpdir.join('archive')), codec='gzip') as archive:
+        yield archive
+
+
+def test_identical_files_are_stored_once(tmpdir, archive):
+    results = tmpdir.mkdir('results')
+    for i in range(3):
+        make_run(results, 'run_%d' % i)
+
+    assert archive.add_sweep('sweep_a', str(results)) == 3
+    assert archive.runs('sweep_a') == ['run_0', 'run_1', 'run_2']
+    assert archive.files('sweep_a', 'run_0') == ['conf.json', 'report/report.htm', 'report/report/report.png']
+
+    # report and chart are shared, conf.json differs
+    n_blobs = archive.connection.execute('SELECT COUNT(*) FROM blobs').fetchone()[0]
+    assert n_blobs == 2 + 3
+    stored, original = archive.disk_usage()
+    assert stored * 3 < original
+
+
+def test_read_back_without_extracting(tmpdir, archive):
+    test_dir = make_run(tmpdir, 'run_0')
+    archive.add_run('sweep_a', test_dir, remove=True)
+    assert not os.path.exists(test_dir)
+
+    report_file = os.path.join(ASSETS_DIR, 'backtest_report.htm')
+    assert archive.read_backtest_summary('sweep_a', 'run_0') == read_backtest_summary(report_file)
+    assert archive.read('sweep_a', 'run_0', 'report/report/report.png') == PNG
+
+    with pytest.raises(FileNotFoundError):
+        archive.read('sweep_a', 'run_1')
+
+    archive.extract('sweep_a', 'run_0', str(tmpdir.join('restored')))
+    with open(str(tmpdir.join('restored', 'report', 'report.htm')), 'rb') as fp, open(report_file, 'rb') as asset:
+        assert fp.read() == asset.read()
+
+
+def test_invalid_archived_report(tmpdir, archive):
+    test_dir = make_run(tmpdir, 'run_0')
+    with open(os.path.join(test_dir, 'report', 'report.htm'), 'w') as fp:
+        fp.write('<html>terminal crashed</html>')
+    archive.add_run('sweep_a', test_dir)
+
+    with pytest.raises(InvalidReportFormat) as e:
+        archive.read_backtest_summary('sweep_a', 'run_0')
+    assert e.value.report_file == 'archive:sweep_a/run_0/report/report.htm'
+
+
+@pytest.mark.parametrize('path, asset', [
+    ('report/optimization.htm', 'optimization_report.htm'),
+    ('report/optimization.xml', 'optimization_report.xml'),
+])
+def test_optimization_results_from_archive(tmpdir, archive, path, asset):
+    test_dir = make_run(tmpdir, 'opt', extra={os.path.basename(path): asset})
+    archive.add_run('sweep_a', test_dir)
+
+    archived = list(archive.iter_optimization_results(FakeBackTest(), 'sweep_a', 'opt', path))
+    direct = list(iter_optimization_results(FakeBackTest(), os.path.join(ASSETS_DIR, asset)))
+    assert len(archived) == len(direct) > 0
+    assert [(r.param, r.profit) for r in archived] == [(r.param, r.profit) for r in direct]
+
+
+def test_read_deals_from_archive(tmpdir, archive):
+    np = pytest.importorskip('numpy')
+    from metatrader.deals import read_deals
+
+    archive.add_run('sweep_a', make_run(tmpdir, 'mt5', report='mt5_backtest_report.htm'))
+    deals = archive.read_deals('sweep_a', 'mt5')
+    expected = read_deals(os.path.join(ASSETS_DIR, 'mt5_backtest_report.htm'))
+    assert len(deals) == len(expected) > 0
+    for name in expected.dtype.names:
+        np.testing.assert_array_equal(deals[name], expected[name])
+
+
+def test_enforce_quota_deletes_oldest_sweeps(tmpdir, archive):
+    for sweep in ('sweep_a', 'sweep_b', 'sweep_c'):
+        runs = tmpdir.mkdir(sweep)
+        # conf.json differs, so each sweep has own blobs
+        make_run(runs, sweep)
+        archive.add_sweep(sweep, str(runs))
+        archive.connection.execute('UPDATE sweeps SET archived_at = ? WHERE sweep = ?',
+                                   (len(archive.sweeps()), sweep))
+        archive.connection.commit()
+
+    assert archive.enforce_quota(10 ** 9) == []
+    assert archive.enforce_quota(0, keep=1) == ['sweep_a', 'sweep_b']
+    assert archive.sweeps() == ['sweep_c']
+    # shared report is kept for the remaining sweep
+    assert archive.read_backtest_summary('sweep_c', 'sweep_c')['profit'] == -724.34
+    n_files = sum(len(files) for _, _, files in os.walk(os.path.join(archive.root, 'blobs')))
+    assert n_files == archive.connection.execute('SELECT COUNT(*) FROM blobs').fetchone()[0] == 3
+
+
+def blob_files(archive):
+    return sorted(name for _, _, names in os.walk(os.path.join(archive.root, 'blobs')) for name in names)
+
+
+def test_failed_add_run_leaves_no_blob_files(tmpdir, archive, monkeypatch):
+    test_dir = make_run(tmpdir, 'run_0')
+    put_blob = archive._put_blob
+    calls = []
+
+    def failing_put_blob(data, written=None):
+        calls.append(1)
+        if len(calls) == 3:
+            raise OSError('disk full')
+        return put_blob(data, written)
+
+    monkeypatch.setattr(archive, '_put_blob', failing_put_blob)
+    with pytest.raises(OSError):
+        archive.add_run('sweep_a', test_dir, remove=True)
+    assert blob_files(archive) == []
+    assert archive.connection.execute('SELECT COUNT(*) FROM blobs').fetchone()[0] == 0
+    assert os.path.exists(test_dir)
+
+
+def test_delete_sweep_deletes_unindexed_blob_files(tmpdir, archive):
+    archive.add_run('sweep_a', make_run(tmpdir, 'run_0'))
+    archive.add_run('sweep_b', make_run(tmpdir, 'run_1'))
+    # left by a crash after blob was written
+    stray = tmpdir.join('archive', 'blobs', 'ab').ensure(dir=True).join('ab' + '0' * 62 + '.gz')
+    stray.write_binary(b'stray')
+
+    archive.delete_sweep('sweep_a')
+    assert not stray.exists()
+    assert len(blob_files(archive)) == 3
+    assert archive.read('sweep_b', 'run_1', 'conf.json') == b'{"name": "run_1"}'
+
+
+def test_empty_run_is_not_removed(tmpdir, archive):
+    test_dir = tmpdir.mkdir('empty')
+    assert archive.add_run('sweep_a', str(test_dir), remove=True) == 0
+    assert test_dir.exists()
+
+
+def test_parse_size():
+    assert parse_size('1024') == 1024
+    assert parse_size('2K') == 2048
+    assert parse_size('1.5GB') == int(1.5 * 1024 ** 3)
+
+
+def test_unknown_codec(tmpdir):
+    with pytest.raises(ValueError):
+        Archive(str(tmpdir), codec='lz4')
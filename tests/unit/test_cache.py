@@ -0,0 +1,147 @@
+import os
+import threading
+import time
+from datetime import datetime
+
+from metatrader import mt5
+from metatrader.cache import BacktestCache
+from metatrader.pool import BacktestPool
+
+
+class FakeMT5(object):
+    def __init__(self, appdata_path):
+        self.appdata_path = appdata_path
+
+
+class FakeBackTest(object):
+    ea_name = 'Advisors\\ExpertMACD'
+    symbol = 'EURUSD'
+    period = 'H1'
+    deposit = 10000
+    from_date = datetime(2018, 1, 1)
+    to_date = datetime(2018, 2, 1)
+    model = 1
+    spread = 5
+    forward_mode = 0
+    execution_mode = 1
+    leverage = '1:100'
+    symbol_data_file = None
+    job_id = None
+
+    def __init__(self, test_dir, param, runs):
+        self.test_dir = test_dir
+        self.param = param
+        self.runs = runs
+
+    def run(self, alias):
+        time.sleep(0.1)
+        self.runs.append(self.test_dir)
+        os.makedirs(os.path.join(self.test_dir, 'report'))
+        with open(os.path.join(self.test_dir, 'report', 'report.htm'), 'w') as fp:
+            fp.write(repr(self.param))
+
+
+def setup_terminal(tmpdir, monkeypatch):
+    appdata = tmpdir.mkdir('appdata')
+    ea_dir = appdata.mkdir('MQL5').mkdir('Experts').mkdir('Advisors')
+    ea_dir.join('ExpertMACD.ex5').write('v1')
+    monkeypatch.setattr(mt5, '_mt5s', {mt5.DEFAULT_MT5_NAME: FakeMT5(str(appdata))})
+    return ea_dir.join('ExpertMACD.ex5')
+
+
+def test_single_flight_and_hit(tmpdir, monkeypatch):
+    setup_terminal(tmpdir, monkeypatch)
+    cache = BacktestCache(str(tmpdir.join('cache')))
+    runs = []
+    backtests = [FakeBackTest(str(tmpdir.join('test_%d' % i)), {'Lots': {'value': 0.1}}, runs) for i in range(4)]
+
+    threads = [threading.Thread(target=cache.run, args=(bt,)) for bt in backtests]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(runs) == 1
+    assert cache.misses == 1 and cache.hits == 3
+    for bt in backtests:
+        with open(os.path.join(bt.test_dir, 'report', 'report.htm')) as fp:
+            assert 'Lots' in fp.read()
+
+
+def test_key_changes_with_inputs_and_ea_binary(tmpdir, monkeypatch):
+    ea_file = setup_terminal(tmpdir, monkeypatch)
+    cache = BacktestCache(str(tmpdir.join('cache')))
+    runs = []
+    backtest = FakeBackTest(str(tmpdir.join('test')), {'Lots': {'value': 0.1}}, runs)
+    key = cache.key(backtest)
+
+    assert cache.key(FakeBackTest('other_dir', {'Lots': {'value': 0.1}}, runs)) == key
+    assert cache.key(FakeBackTest('other_dir', {'Lots': {'value': 0.2}}, runs)) != key
+
+    ea_file.write('v2 rebuilt')
+    assert cache.key(backtest) != key
+
+
+def test_evict_by_entries(tmpdir, monkeypatch):
+    setup_terminal(tmpdir, monkeypatch)
+    cache = BacktestCache(str(tmpdir.join('cache')), max_entries=2)
+    runs = []
+    for i in range(3):
+        cache.run(FakeBackTest(str(tmpdir.join('test_%d' % i)), {'Lots': {'value': i}}, runs))
+        time.sleep(0.01)
+
+    first = FakeBackTest(str(tmpdir.join('again')), {'Lots': {'value': 0}}, runs)
+    assert not cache.get(first)
+    assert len(cache._entries()) == 2
+    # index of entries is built once, not walked again after every miss
+    calls = []
+    entries = cache._entries
+    monkeypatch.setattr(cache, '_entries', lambda: calls.append(1) or entries())
+    for i in range(3, 6):
+        cache.run(FakeBackTest(str(tmpdir.join('test_%d' % i)), {'Lots': {'value': i}}, runs))
+    assert calls == []
+    assert len(entries()) == 2
+
+
+def test_entry_evicted_before_restore_is_run(tmpdir, monkeypatch):
+    setup_terminal(tmpdir, monkeypatch)
+    cache = BacktestCache(str(tmpdir.join('cache')))
+    runs = []
+    cache.run(FakeBackTest(str(tmpdir.join('first')), {'Lots': {'value': 0.1}}, runs))
+
+    restore = cache._restore
+
+    def evict_then_restore(key, backtest):
+        # other process evicts entry after it was found
+        cache.max_entries = 0
+        cache.evict()
+        cache.max_entries = None
+        return restore(key, backtest)
+
+    monkeypatch.setattr(cache, '_restore', evict_then_restore)
+    backtest = FakeBackTest(str(tmpdir.join('second')), {'Lots': {'value': 0.1}}, runs)
+    assert cache.run(backtest) is backtest
+    assert len(runs) == 2 and cache.misses == 2 and cache.hits == 0
+    assert os.path.exists(os.path.join(backtest.test_dir, 'report', 'report.htm'))
+
+
+def test_pool_misses_cache_after_history_changes(tmpdir, monkeypatch):
+    setup_terminal(tmpdir, monkeypatch)
+    data_file = tmpdir.join('EURUSD_M1_01012018_01022018.csv')
+    data_file.write('2018.01.01,00:00,1.2,1.3,1.1,1.2,10\n')
+    cache = BacktestCache(str(tmpdir.join('cache')))
+    runs = []
+
+    def submit(name):
+        backtest = FakeBackTest(str(tmpdir.join(name)), {'Lots': {'value': 0.1}}, runs)
+        backtest.symbol_data_file = str(data_file)
+        with BacktestPool([mt5.DEFAULT_MT5_NAME], cache=cache) as pool:
+            pool.submit(backtest).result()
+
+    submit('first')
+    submit('same_history')
+    assert len(runs) == 1
+    # history is downloaded again
+    data_file.write('2018.01.01,00:00,1.2,1.3,1.1,1.2,10\n2018.01.01,00:01,1.2,1.3,1.1,1.2,10\n')
+    submit('new_history')
+    assert len(runs) == 2
@@ -0,0 +1,106 @@
+import os
+from datetime import date, datetime
+
+import pytest
+
+from metatrader import cli
+from metatrader.catalog import SymbolCatalog, parse_file_name
+from metatrader.exception import MissingSymbolData
+
+MT5_CSV = ('<DATE>\t<TIME>\t<OPEN>\t<HIGH>\t<LOW>\t<CLOSE>\t<TICKVOL>\t<VOL>\t<SPREAD>\r\n'
+           '2018.01.01\t00:00:00\t1.2000\t1.2010\t1.1990\t1.2005\t120\t0\t5\r\n'
+           '2018.01.01\t01:00:00\t1.2005\t1.2020\t1.2000\t1.2015\t80\t0\t6\r\n'
+           '2018.01.02\t00:00:00\t1.2015\t1.2030\t1.2010\t1.2025\t90\t0\t5\r\n'
+           '2018.01.03\t00:00:00\t1.2025\t1.2040\t1.2020\t1.2035\t70\t0\t4\r\n')
+
+
+@pytest.fixture
+def data_dir(tmpdir):
+    data_dir = tmpdir.mkdir('data')
+    data_dir.join('EUR_M1_01012018_03012018.csv').write_text(MT5_CSV, encoding='utf-16')
+    data_dir.join('GBP_M1_01012017_31122017.csv').write('2017.01.02 00:00,1.1,1.2,1.0,1.15,10\n')
+    data_dir.join('GBP_M1_01012018_30062018.csv').write('')
+    data_dir.join('notes.txt').write('')
+    return data_dir
+
+
+def test_parse_file_name():
+    data = parse_file_name('CNDUSD_M1_01022018_28022018.csv', 'data')
+    assert (data.symbol, data.kind) == ('CNDUSD', 'M1')
+    assert data.path == os.path.join('data', 'CNDUSD_M1_01022018_28022018.csv')
+    assert tuple(data) == ('CNDUSD', datetime(2018, 2, 1), datetime(2018, 2, 28))
+    assert parse_file_name('CNDUSD_M1_01022018.csv') is None
+    assert parse_file_name('CNDUSD_M1_01022018_31022018.csv') is None
+    assert parse_file_name('CNDUSD_M1_01022018_28022018.txt') is None
+
+
+def test_index_is_rebuilt_when_directory_changes(data_dir):
+    catalog = SymbolCatalog(str(data_dir))
+    assert [tuple(d) for d in catalog.list_symbols()] == [
+        ('EUR', datetime(2018, 1, 1), datetime(2018, 1, 3)),
+        ('GBP', datetime(2017, 1, 1), datetime(2017, 12, 31)),
+        ('GBP', datetime(2018, 1, 1), datetime(2018, 6, 30)),
+    ]
+    assert catalog.get_symbol_dates('GBP') == (datetime(2017, 1, 1), datetime(2017, 12, 31))
+    assert catalog.get_symbol_dates('JPY') is None
+
+    data_dir.join('JPY_M1_01012018_31012018.csv').write('')
+    assert catalog.get_symbol_dates('JPY') == (datetime(2018, 1, 1), datetime(2018, 1, 31))
+
+
+def test_validate_range(data_dir):
+    catalog = SymbolCatalog(str(data_dir))
+    assert catalog.validate_range('GBP', datetime(2018, 2, 1), date(2018, 6, 30)).from_date == datetime(2018, 1, 1)
+    # last day of file is included
+    assert catalog.validate_range('EUR', datetime(2018, 1, 1), datetime(2018, 1, 3, 12))
+
+    with pytest.raises(MissingSymbolData) as e:
+        catalog.validate_range('GBP', datetime(2017, 6, 1), datetime(2018, 2, 1))
+    assert len(e.value.available) == 2
+    with pytest.raises(ValueError):
+        catalog.validate_range('JPY', datetime(2018, 1, 1), datetime(2018, 2, 1))
+
+
+def test_bars_are_converted_once_and_memory_mapped(data_dir):
+    np = pytest.importorskip('numpy')
+    catalog = SymbolCatalog(str(data_dir), cache_dir=str(data_dir.join('cache')))
+
+    bars = catalog.load_bars('EUR')
+    assert isinstance(bars['close'], np.memmap)
+    assert bars['time'][1] == np.datetime64('2018-01-01T01:00:00')
+    np.testing.assert_array_equal(bars['close'], [1.2005, 1.2015, 1.2025, 1.2035])
+    np.testing.assert_array_equal(bars['spread'], [5, 6, 5, 4])
+
+    bars_dir = data_dir.join('cache', 'EUR_M1_01012018_03012018')
+    mtime = bars_dir.join('close.npy').mtime()
+    bars = catalog.load_bars('EUR', datetime(2018, 1, 2), datetime(2018, 1, 2), columns=('time', 'close'))
+    assert sorted(bars) == ['close', 'time']
+    np.testing.assert_array_equal(bars['close'], [1.2025])
+    assert bars_dir.join('close.npy').mtime() == mtime
+
+    gbp = catalog.load_bars('GBP', datetime(2017, 1, 1), datetime(2017, 1, 31))
+    assert (gbp['time'][0], gbp['close'][0], gbp['tick_volume'][0]) == (np.datetime64('2017-01-02T00:00'), 1.15, 10)
+
+    with pytest.raises(MissingSymbolData):
+        catalog.load_bars('EUR', datetime(2018, 1, 1), datetime(2018, 2, 1))
+
+
+def test_modified_csv_is_converted_again(data_dir):
+    pytest.importorskip('numpy')
+    catalog = SymbolCatalog(str(data_dir))
+    csv_file = data_dir.join('GBP_M1_01012017_31122017.csv')
+    assert list(catalog.load_bars('GBP')['close']) == [1.15]
+
+    csv_file.write('2017.01.02 00:00,1.1,1.2,1.0,1.15,10\n2017.01.03 00:00,1.15,1.2,1.1,1.18,12\n')
+    assert list(catalog.load_bars('GBP')['close']) == [1.15, 1.18]
+
+
+def test_cli_checks_history_before_terminal_start(data_dir, tmpdir, monkeypatch):
+    def init_terminals(args):
+        raise AssertionError('terminal must not start')
+
+    monkeypatch.setattr(cli, '_init_terminals', init_terminals)
+    with pytest.raises(SystemExit) as e:
+        cli.main(['run', '--ea', 'Advisors\\ExpertMACD', '--symbol', 'EUR', '--period', 'H1', '--from', '2018.01.01',
+                  '--to', '2018.02.01', '--data-dir', str(data_dir), '--test-dir', str(tmpdir)])
+    assert 'no history of EUR' in str(e.value)
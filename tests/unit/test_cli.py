@@ -0,0 +1,93 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from metatrader import cli, mt5
+from metatrader.store import ResultStore
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'assets')
+ROOT_DIR = os.path.dirname(os.path.dirname(ASSETS_DIR))
+
+# modules which must not be imported by light commands
+HEAVY_MODULES = ('bs4', 'lxml', 'sklearn', 'numpy', 'pandas', 'scipy', 'concurrent', 'asyncio')
+
+
+def import_times(*args):
+    """
+    Returns:
+      dict of module name => cumulative import time in us, measured by python -X importtime
+    """
+    proc = subprocess.run([sys.executable, '-X', 'importtime'] + list(args), cwd=ROOT_DIR,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    assert proc.returncode == 0, proc.stderr
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+@pytest.mark.parametrize('args', [
+    ('-c', 'import metatrader.cli'),
+    ('-m', 'metatrader', 'parse', os.path.join(ASSETS_DIR, 'backtest_report.htm')),
+    ('-m', 'metatrader', 'parse', os.path.join(ASSETS_DIR, 'optimization_report.htm')),
+])
+def test_light_commands_skip_heavy_imports(args):
+    times = import_times(*args)
+    heavy = [name for name in times if name.split('.')[0] in HEAVY_MODULES]
+    assert heavy == []
+    # generous bound for slow ci machines, typical value is 20 ms
+    assert times['metatrader.cli'] < 100 * 1000
+
+
+def test_parse_backtest_report(capsys):
+    assert cli.main(['parse', '--json', os.path.join(ASSETS_DIR, 'backtest_report.htm')]) == 0
+    summary = json.loads(capsys.readouterr().out)
+    assert summary['profit'] == -724.34
+    assert summary['total_trades'] == 1232
+
+
+def test_parse_optimization_report(capsys):
+    assert cli.main(['parse', '--json', os.path.join(ASSETS_DIR, 'optimization_report.htm')]) == 0
+    passes = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert len(passes) == 3
+    assert passes[0]['param'] == {'MaximumRisk': '0.02', 'Lots': '0.1'}
+
+    assert cli.main(['parse', '--top', '1', os.path.join(ASSETS_DIR, 'optimization_report.htm')]) == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 2
+    assert 'MaximumRisk=0.12' in lines[1]
+
+
+def test_run_and_status(fake_terminals, tmpdir, capsys):
+    alias = fake_terminals(1)[0]
+    prog_path = mt5.get_mt5(alias).prog_path
+    db = str(tmpdir.join('results.sqlite'))
+
+    assert cli.main(['run', '--terminal', prog_path, '--ea', 'Advisors\\ExpertMACD', '--symbol', 'EURUSD',
+                     '--period', 'H1', '--from', '2018.01.01', '--to', '2018-02-01', '--param', 'InpLots=0.1',
+                     '--test-dir', str(tmpdir.join('run')), '--db', db]) == 0
+    assert 'profit' in capsys.readouterr().out
+
+    with ResultStore(db) as store:
+        assert store.is_tested('Advisors\\ExpertMACD', {'InpLots': 0.1}, 'EURUSD', 'H1')
+
+    assert cli.main(['status', '--db', db]) == 0
+    out = capsys.readouterr().out
+    assert out.startswith('runs: 1\n')
+    assert 'InpLots=0.1' in out
+
+
+def test_status_of_missing_store(tmpdir):
+    assert cli.main(['status', '--db', str(tmpdir.join('missing.sqlite'))]) == 1
+
+
+def test_parse_param():
+    assert cli.parse_param('InpLots=0.1') == ('InpLots', 0.1)
+    assert cli.parse_param('Period=14') == ('Period', 14)
+    assert cli.parse_param('InpMM=false') == ('InpMM', 'false')
@@ -0,0 +1,105 @@
+import os
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from metatrader import metrics
+from metatrader.deals import DEAL_DIRECTIONS, DEAL_DTYPE, DEAL_TYPES, parse_deals, read_deals
+from metatrader.exception import InvalidReportFormat
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'assets')
+MT5_BACKTEST_REPORT = os.path.join(ASSETS_DIR, 'mt5_backtest_report.htm')
+
+
+def make_deals(rows):
+    """
+    Args:
+      rows: list of (time string, type, direction, volume, profit)
+    """
+    deals = np.zeros(len(rows), dtype=DEAL_DTYPE)
+    deals['time'] = [row[0] for row in rows]
+    deals['deal'] = np.arange(1, len(rows) + 1)
+    deals['type'] = [DEAL_TYPES.index(row[1]) for row in rows]
+    deals['direction'] = [DEAL_DIRECTIONS.index(row[2]) if row[2] else -1 for row in rows]
+    deals['volume'] = [row[3] for row in rows]
+    deals['profit'] = [row[4] for row in rows]
+    deals['balance'] = np.cumsum(deals['profit'])
+    return deals
+
+
+def test_read_deals():
+    deals = read_deals(MT5_BACKTEST_REPORT)
+
+    assert len(deals) == 7
+    assert deals['time'][0] == np.datetime64('2018-01-17T00:00:00')
+    assert deals['type'][0] == DEAL_TYPES.index('balance')
+    assert deals['direction'][0] == -1
+    assert np.isnan(deals['volume'][0])
+    assert list(deals['deal']) == list(range(1, 8))
+    assert deals['balance'][0] == 10000
+    assert deals['profit'][-1] == -12602
+    assert deals['balance'][-1] == -2107.2
+    assert [DEAL_DIRECTIONS[code] for code in deals['direction'][1:]] == ['in', 'out'] * 3
+
+
+def test_parse_deals_without_table():
+    with pytest.raises(InvalidReportFormat):
+        parse_deals('<html><body><b>Orders</b></body></html>')
+
+
+def test_equity_curve_matches_balance():
+    deals = read_deals(MT5_BACKTEST_REPORT)
+    assert np.allclose(metrics.equity_curve(deals), deals['balance'])
+
+
+def test_drawdown_and_time_under_water():
+    times = np.array(['2018-01-01T00:00', '2018-01-01T01:00', '2018-01-01T02:00', '2018-01-01T05:00',
+                      '2018-01-01T06:00', '2018-01-01T07:00'], dtype='datetime64[s]')
+    equity = np.array([100.0, 90.0, 120.0, 60.0, 90.0, 130.0])
+
+    dd, rate = metrics.drawdown(equity)
+    assert list(dd) == [0, 10, 0, 60, 30, 0]
+    assert rate[3] == 50
+    assert metrics.max_drawdown(equity) == (60.0, 50.0)
+
+    longest, total = metrics.time_under_water(times, equity)
+    assert longest == np.timedelta64(2, 'h')
+    assert total == np.timedelta64(3, 'h')
+
+
+def test_trade_metrics_and_exposure():
+    deals = make_deals([
+        ('2018-01-01T00:00', 'balance', None, 0, 1000),
+        ('2018-01-01T00:00', 'buy', 'in', 0.1, 0),
+        ('2018-01-01T06:00', 'sell', 'out', 0.1, 50),
+        ('2018-01-02T00:00', 'sell', 'in', 0.1, 0),
+        ('2018-01-02T06:00', 'buy', 'out', 0.1, -25),
+        ('2018-01-03T00:00', 'buy', 'in', 0.1, 0),
+        ('2018-01-03T00:00', 'sell', 'out', 0.1, 75),
+    ])
+
+    assert list(metrics.trade_profits(deals)) == [50, -25, 75]
+    assert metrics.profit_factor(metrics.trade_profits(deals)) == 5
+    assert list(metrics.position_volume(deals)) == pytest.approx([0, 0.1, 0, -0.1, 0, 0.1, 0])
+    assert metrics.exposure(deals) == 0.25
+
+    summary = metrics.summary(deals)
+    assert summary['initial_deposit'] == 1000
+    assert summary['profit'] == 100
+    assert summary['total_trades'] == 3
+    assert summary['win_rate'] == pytest.approx(2 / 3.0)
+    assert summary['max_drawdown'] == 25
+
+
+def test_returns_and_ratios():
+    times = np.array(['2018-01-01T10:00', '2018-01-01T20:00', '2018-01-02T10:00', '2018-01-03T10:00'],
+                     dtype='datetime64[s]')
+    equity = np.array([100.0, 110.0, 99.0, 108.9])
+
+    returns = metrics.returns_by_period(times, equity)
+    assert returns == pytest.approx([0.1, -0.1, 0.1])
+    expected = returns.mean() / returns.std(ddof=1) * np.sqrt(252)
+    assert metrics.sharpe_ratio(times, equity) == pytest.approx(expected)
+    assert metrics.sortino_ratio(times, equity) > metrics.sharpe_ratio(times, equity)
+    assert np.isnan(metrics.sharpe_ratio(times[:2], equity[:2]))
@@ -0,0 +1,103 @@
+import json
+import os
+
+import pytest
+
+from metatrader import mt5
+from tests.assets import fake_terminal
+
+
+class CountingPlatform(mt5.WindowsPlatform):
+    """
+    windows platform with uac enabled whose probes are counted, registry is never read
+    """
+
+    def __init__(self):
+        super(CountingPlatform, self).__init__()
+        self.probes = []
+
+    def _read_uac_enabled(self):
+        self.probes.append('registry')
+        return True
+
+    def get_appdata_path(self, program_file_dir):
+        self.probes.append('appdata')
+        return super(CountingPlatform, self).get_appdata_path(program_file_dir)
+
+    def get_exe_file_name(self, prog_path):
+        self.probes.append('exe')
+        return super(CountingPlatform, self).get_exe_file_name(prog_path)
+
+
+@pytest.fixture
+def platform(tmpdir, monkeypatch):
+    platform = CountingPlatform()
+    monkeypatch.setattr(mt5, '_platform', platform)
+    monkeypatch.setattr(mt5, '_mt5s', {})
+    monkeypatch.setenv('APPDATA', str(tmpdir.join('appdata')))
+    return platform
+
+
+def install(tmpdir, name):
+    prog_path = fake_terminal.install(str(tmpdir.join(name)))
+    data_dir = tmpdir.join('appdata', 'MetaQuotes', 'Terminal', name.upper())
+    data_dir.join(mt5.ORIGIN_TXT).write_text(prog_path, encoding='utf-16', ensure=True)
+    return prog_path, str(data_dir)
+
+
+def test_discovery_is_cached_across_processes(tmpdir, platform, discovery_cache):
+    installs = [install(tmpdir, 'terminal_%d' % i) for i in range(3)]
+    for i, (prog_path, _) in enumerate(installs):
+        mt5.initizalize(prog_path, alias='t%d' % i)
+    assert [mt5.get_mt5('t%d' % i).appdata_path for i in range(3)] == [data_dir for _, data_dir in installs]
+    assert platform.probes.count('registry') == 1
+    assert platform.probes.count('appdata') == 3
+
+    # new process: fresh platform and cache object on the same file
+    fresh = CountingPlatform()
+    mt5.set_platform(fresh)
+    mt5.set_discovery_cache(mt5.DiscoveryCache(discovery_cache.path))
+    terminal = mt5.MT5(installs[1][0])
+    assert (terminal.appdata_path, terminal.mt_exe) == (installs[1][1], 'terminal64.exe')
+    assert fresh.probes == ['registry']
+    assert mt5.get_discovery_cache().hits == 1
+
+    with open(discovery_cache.path) as fp:
+        assert len(json.load(fp)) == 3
+
+
+def test_changed_install_is_discovered_again(tmpdir, platform):
+    prog_path, data_dir = install(tmpdir, 'terminal')
+    mt5.MT5(prog_path)
+
+    # terminal.exe installed next to terminal64.exe changes mtime of install folder
+    tmpdir.join('terminal', 'terminal.exe').write('')
+    os.utime(prog_path, ns=(0, 0))
+    del platform.probes[:]
+    assert mt5.MT5(prog_path).mt_exe == 'terminal.exe'
+    assert platform.probes == ['appdata', 'exe']
+
+    # data folder was removed
+    tmpdir.join('appdata').remove()
+    with pytest.raises(IOError):
+        mt5.MT5(prog_path)
+
+
+def test_portable_terminals_skip_registry_and_appdata(tmpdir, platform):
+    prog_path, _ = install(tmpdir, 'terminal')
+    terminal = mt5.MT5(prog_path, portable=True)
+    assert terminal.appdata_path == prog_path
+    assert platform.probes == ['exe']
+    assert mt5.MT5.get_mt5_exe_file_name(prog_path) == 'terminal64.exe'
+
+
+def test_memory_only_cache(tmpdir, monkeypatch):
+    monkeypatch.setattr(mt5, '_discovery_cache', None)
+    monkeypatch.setenv(mt5.DISCOVERY_CACHE_ENV, '')
+    cache = mt5.get_discovery_cache()
+    assert cache.path is None
+
+    prog_path = str(tmpdir)
+    cache.put('key', prog_path, prog_path, 'terminal64.exe')
+    assert cache.get('key', prog_path) == (prog_path, 'terminal64.exe')
+    assert cache.get('other', prog_path) is None
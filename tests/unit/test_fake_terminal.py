@@ -0,0 +1,94 @@
+import os
+from datetime import datetime
+
+import pytest
+
+from metatrader import mt5
+from metatrader.backtest import BackTest
+from metatrader.report import BacktestReport, OptimizationReport
+
+EA_PARAM = {'Inp_Signal_MACD_PeriodFast': {'value': 5, 'interval': 5, 'max': 20}, 'InpLots': {'value': 0.1}}
+
+
+def create_backtest(test_dir, **kwargs):
+    return BackTest(test_dir, 'Advisors\\ExpertMACD', EA_PARAM, 'EURUSD', 'H1', 10000,
+                    datetime(2018, 1, 1), datetime(2018, 2, 1), **kwargs)
+
+
+def test_portable_platform(tmpdir):
+    platform = mt5.PortablePlatform()
+    assert platform.is_uac_enabled() is False
+    assert platform.get_appdata_path(str(tmpdir)) == str(tmpdir)
+    if os.name != 'nt':
+        assert platform.terminal_command('/mt5/terminal64.exe', '/tmp/config.ini') == [
+            '/mt5/terminal64.exe', '/config:/tmp/config.ini']
+
+
+def test_set_platform(monkeypatch):
+    monkeypatch.setattr(mt5, '_platform', None)
+    platform = mt5.PortablePlatform()
+    mt5.set_platform(platform)
+    assert mt5.get_platform() is platform
+    mt5.set_platform(None)
+    assert isinstance(mt5.get_platform(), mt5.WindowsPlatform)
+
+
+def test_backtest_run_on_fake_terminal(fake_terminals, tmpdir, monkeypatch):
+    monkeypatch.setenv('FAKE_TERMINAL_REPORT_SIZE', '20000')
+    alias = fake_terminals(1)[0]
+    test_dir = str(tmpdir.mkdir('run'))
+
+    backtest = create_backtest(test_dir, job_id='a1')
+    backtest.run(alias=alias)
+
+    report_dir = os.path.join(test_dir, 'report')
+    assert os.path.getsize(os.path.join(report_dir, 'report.htm')) > 20000
+    assert os.path.exists(os.path.join(report_dir, 'report', 'report.png'))
+    assert not os.path.exists(os.path.join(mt5.get_mt5(alias).appdata_path, 'report_a1'))
+
+    # mt5 report, utf-16 le with bom
+    with open(os.path.join(report_dir, 'report.htm'), 'rb') as fp:
+        assert fp.read(2) == b'\xff\xfe'
+    report = BacktestReport(backtest)
+    assert report.initial_deposit == 10000
+    assert report.total_trades == report.profit_trades + report.loss_trades
+    assert report.profit == pytest.approx(report.gross_profit + report.gross_loss, abs=0.011)
+
+    # same inputs give same report
+    other_dir = str(tmpdir.mkdir('other'))
+    other = create_backtest(other_dir)
+    other.run(alias=alias)
+    assert BacktestReport(other).profit == report.profit
+
+
+def test_optimize_on_fake_terminal(fake_terminals, tmpdir):
+    alias = fake_terminals(1)[0]
+    backtest = create_backtest(str(tmpdir))
+
+    report = backtest.optimize(alias=alias)
+    assert len(report.results) == 4
+    fast = [dict((k.strip(), v) for k, v in r.param.items())['Inp_Signal_MACD_PeriodFast'] for r in report.results]
+    assert fast == ['5', '10', '15', '20']
+    assert all(r.initial_deposit == 10000 for r in report.results)
+
+
+def test_terminal_failure_raises(fake_terminals, tmpdir, monkeypatch):
+    monkeypatch.setenv('FAKE_TERMINAL_EXIT_CODE', '3')
+    alias = fake_terminals(1)[0]
+
+    with pytest.raises(RuntimeError):
+        create_backtest(str(tmpdir)).run(alias=alias)
+
+
+def test_deals_of_fake_report(fake_terminals, tmpdir, monkeypatch):
+    pytest.importorskip('numpy')
+    from metatrader.deals import read_deals
+
+    monkeypatch.setenv('FAKE_TERMINAL_REPORT_SIZE', '20000')
+    alias = fake_terminals(1)[0]
+    backtest = create_backtest(str(tmpdir))
+    backtest.run(alias=alias)
+
+    deals = read_deals(os.path.join(str(tmpdir), 'report', 'report.htm'))
+    assert len(deals) > 10
+    assert deals['balance'][0] == 10000 and deals['balance'][-1] == 10000 + 1500 * (len(deals) - 1)
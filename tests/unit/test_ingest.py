@@ -0,0 +1,115 @@
+import csv
+import json
+import os
+import shutil
+
+import pytest
+
+from metatrader.ingest import RECORD_FIELDS, StoreWriter, find_report_dirs, ingest, iter_records, read_record
+from metatrader.store import ResultStore
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'assets')
+
+
+def make_result_dirs(root, n_valid, n_invalid):
+    for i in range(n_valid + n_invalid):
+        test_dir = root.mkdir('run_%03d' % i)
+        test_dir.mkdir('report')
+        if i < n_valid:
+            shutil.copy(os.path.join(ASSETS_DIR, 'backtest_report.htm'), str(test_dir.join('report', 'report.htm')))
+            with open(str(test_dir.join('conf.json')), 'w') as f:
+                json.dump({'strategy': 'MA', 'timeframe': 'M5', 'symbol': 'USDJPY', 'params': {'period': i}}, f)
+        else:
+            test_dir.join('report', 'report.htm').write('<html><body>terminal crashed</body></html>')
+    # directory without report is not a result directory
+    root.mkdir('logs')
+
+
+def test_find_report_dirs(tmpdir):
+    make_result_dirs(tmpdir, 3, 1)
+    assert [os.path.basename(d) for d in find_report_dirs(str(tmpdir))] == ['run_000', 'run_001', 'run_002',
+                                                                            'run_003']
+
+
+@pytest.mark.parametrize('workers', [0, 2])
+def test_iter_records_isolates_invalid_reports(tmpdir, workers):
+    make_result_dirs(tmpdir, 5, 2)
+    records = sorted(iter_records(find_report_dirs(str(tmpdir)), workers=workers, chunk_size=2))
+
+    assert len(records) == 7
+    records = [dict(zip(RECORD_FIELDS, record)) for record in records]
+    assert [r['error'] is None for r in records] == [True] * 5 + [False] * 2
+    assert records[0]['profit'] == -724.34
+    assert records[0]['params'] == '{"period":0}'
+    assert records[-1]['profit'] is None
+    assert records[-1]['strategy'] is None
+
+
+def test_read_record_of_broken_directories(tmpdir):
+    make_result_dirs(tmpdir, 3, 0)
+    # report is gone
+    tmpdir.join('run_000', 'report', 'report.htm').remove()
+    # report is truncated while terminal writes it
+    with open(os.path.join(ASSETS_DIR, 'backtest_report.htm'), 'rb') as f:
+        tmpdir.join('run_001', 'report', 'report.htm').write_binary(f.read(1500))
+    # conf.json is corrupt
+    tmpdir.join('run_002', 'conf.json').write('{"strategy": "MA", ')
+
+    for name in ('run_000', 'run_001', 'run_002'):
+        record = dict(zip(RECORD_FIELDS, read_record(str(tmpdir.join(name)))))
+        assert record['error']
+        assert record['profit'] is None
+
+
+def test_ingest_csv(tmpdir):
+    make_result_dirs(tmpdir.mkdir('results'), 4, 1)
+    output = str(tmpdir.join('results.csv'))
+    calls = []
+
+    assert ingest(str(tmpdir.join('results')), output, workers=2, chunk_size=2,
+                  progress=lambda n_done, n_total: calls.append((n_done, n_total))) == (4, 1)
+    assert calls[-1] == (5, 5)
+
+    with open(output, newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == 5
+    assert sorted(row['total_trades'] for row in rows) == ['', '1232', '1232', '1232', '1232']
+
+
+def test_ingest_store(tmpdir):
+    make_result_dirs(tmpdir.mkdir('results'), 3, 1)
+    output = str(tmpdir.join('results.sqlite'))
+
+    assert ingest(str(tmpdir.join('results')), output, workers=0) == (3, 1)
+    with ResultStore(output) as store:
+        assert store.count() == 4
+        assert store.is_tested('MA', {'period': 2}, 'USDJPY', 'M5')
+        assert len(store.leaderboard('profit')) == 3
+
+
+def test_store_writer_keeps_runs_without_conf_and_of_other_ranges(tmpdir):
+    make_result_dirs(tmpdir, 1, 0)
+    for i in range(2):
+        test_dir = tmpdir.mkdir('no_conf_%d' % i)
+        test_dir.mkdir('report')
+        shutil.copy(os.path.join(ASSETS_DIR, 'backtest_report.htm'), str(test_dir.join('report', 'report.htm')))
+    conf = json.loads(tmpdir.join('run_000', 'conf.json').read())
+    for i, from_date in enumerate(['2018-01-01T00:00:00', '2018-06-01T00:00:00']):
+        test_dir = tmpdir.mkdir('range_%d' % i)
+        shutil.copytree(str(tmpdir.join('run_000', 'report')), str(test_dir.join('report')))
+        test_dir.join('conf.json').write(json.dumps(dict(conf, from_date=from_date, model=0)))
+
+    output = str(tmpdir.join('results.sqlite'))
+    writer = StoreWriter(output)
+    for record in iter_records(find_report_dirs(str(tmpdir)), workers=0):
+        writer.write(record)
+    writer.close()
+
+    with ResultStore(output) as store:
+        assert store.count() == 5
+        assert store.is_tested('MA', {'period': 0}, 'USDJPY', 'M5', from_date='2018-06-01T00:00:00', model=0)
+
+
+def test_ingest_unknown_format(tmpdir):
+    with pytest.raises(ValueError):
+        ingest(str(tmpdir), str(tmpdir.join('results.txt')))
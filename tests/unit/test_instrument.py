@@ -0,0 +1,140 @@
+import json
+import os
+import threading
+from datetime import datetime
+
+import pytest
+
+from metatrader import instrument
+from metatrader.backtest import BackTest
+from metatrader.report import read_backtest_summary, get_report_abs_path
+
+
+@pytest.fixture
+def events(monkeypatch):
+    monkeypatch.setattr(instrument, '_hooks', [])
+    monkeypatch.setattr(instrument, '_profiler', None)
+    recorded = []
+    instrument.add_hook(recorded.append)
+    return recorded
+
+
+def test_span_passes_event_to_hooks(events):
+    with instrument.span('phase', alias='a'):
+        pass
+    with pytest.raises(KeyError):
+        with instrument.span('broken'):
+            raise KeyError('x')
+
+    assert [(e['name'], e['alias'] if 'alias' in e else None, e['error']) for e in events] == [
+        ('phase', 'a', None), ('broken', None, 'KeyError')]
+    assert all(e['duration'] >= 0 for e in events)
+
+
+def test_failing_hook_does_not_break_span(events):
+    def broken_hook(event):
+        raise ValueError('hook')
+
+    instrument.add_hook(broken_hook)
+    with instrument.span('phase'):
+        pass
+    assert len(events) == 1
+
+
+def test_json_lines_sink(tmpdir, events):
+    path = str(tmpdir.join('events.jsonl'))
+    sink = instrument.add_hook(instrument.JsonLinesSink(path, flush_every=2))
+    for i in range(3):
+        with instrument.span('phase', i=i):
+            pass
+    sink.close()
+
+    with open(path) as fp:
+        lines = [json.loads(line) for line in fp]
+    assert [line['i'] for line in lines] == [0, 1, 2]
+
+
+def test_prometheus_textfile_exporter(tmpdir):
+    path = str(tmpdir.join('metatrader.prom'))
+    exporter = instrument.PrometheusTextfileExporter(path, buckets=(0.1, 1), write_interval=None)
+    for duration in (0.05, 0.5, 5):
+        exporter({'name': 'terminal.run', 'duration': duration, 'error': None})
+    exporter({'name': 'terminal.run', 'duration': 0.01, 'error': 'TerminalTimeout'})
+    exporter.write()
+
+    with open(path) as fp:
+        text = fp.read()
+    assert 'metatrader_span_duration_seconds_bucket{span="terminal.run",le="0.1"} 2' in text
+    assert 'metatrader_span_duration_seconds_bucket{span="terminal.run",le="1.0"} 3' in text
+    assert 'metatrader_span_duration_seconds_bucket{span="terminal.run",le="+Inf"} 4' in text
+    assert 'metatrader_span_duration_seconds_count{span="terminal.run"} 4' in text
+    assert 'metatrader_span_errors_total{span="terminal.run"} 1' in text
+    assert not [name for name in os.listdir(str(tmpdir)) if name.endswith('.tmp')]
+
+
+def test_profiler_profiles_outermost_span(tmpdir, monkeypatch):
+    monkeypatch.setattr(instrument, '_hooks', [])
+    profiler = instrument.Profiler(names=('outer', 'inner'))
+    monkeypatch.setattr(instrument, '_profiler', profiler)
+
+    with instrument.span('outer'):
+        with instrument.span('inner'):
+            sorted(range(1000))
+
+    assert profiler.stats('outer') is not None
+    assert profiler.stats('inner') is None
+    assert profiler.dump(str(tmpdir)) == [str(tmpdir.join('outer.prof'))]
+
+
+def test_profiler_profiles_one_span_at_once(monkeypatch):
+    monkeypatch.setattr(instrument, '_hooks', [])
+    profiler = instrument.Profiler(names=('phase',))
+    monkeypatch.setattr(instrument, '_profiler', profiler)
+    started = threading.Event()
+    release = threading.Event()
+
+    def profiled():
+        with instrument.span('phase'):
+            started.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=profiled)
+    thread.start()
+    started.wait(5)
+    # other thread is profiled, this span runs without profiler
+    with instrument.span('phase'):
+        sorted(range(1000))
+    release.set()
+    thread.join()
+
+    assert len(profiler._profiles['phase']) == 1
+    with instrument.span('phase'):
+        pass
+    assert len(profiler._profiles['phase']) == 2
+
+
+def test_failing_profiler_does_not_break_span(events, monkeypatch):
+    class BrokenProfiler(object):
+        def start(self, name):
+            raise ValueError('Another profiling tool is already active')
+
+    monkeypatch.setattr(instrument, '_profiler', BrokenProfiler())
+    with instrument.span('phase'):
+        pass
+    assert [e['name'] for e in events] == ['phase']
+
+
+def test_backtest_phases_on_fake_terminal(fake_terminals, tmpdir, events):
+    alias = fake_terminals(1)[0]
+    backtest = BackTest(str(tmpdir.mkdir('run')), 'Advisors\\ExpertMACD', {'InpLots': {'value': 0.1}}, 'EURUSD',
+                        'H1', 10000, datetime(2018, 1, 1), datetime(2018, 2, 1), job_id='j1')
+    backtest.run(alias=alias)
+    read_backtest_summary(get_report_abs_path(backtest.test_dir))
+
+    assert [e['name'] for e in events] == [instrument.SPAN_CREATE_CONF, instrument.SPAN_COPY_PARAM,
+                                           instrument.SPAN_CREATE_PARAM, instrument.SPAN_TERMINAL,
+                                           instrument.SPAN_MOVE_REPORT, instrument.SPAN_RUN,
+                                           instrument.SPAN_PARSE_BACKTEST]
+    run = events[5]
+    assert run['job_id'] == 'j1' and run['alias'] == alias
+    assert run['duration'] >= sum(e['duration'] for e in events[:5] if e['name'] != instrument.SPAN_COPY_PARAM)
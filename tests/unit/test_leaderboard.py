@@ -0,0 +1,108 @@
+import json
+import os
+import random
+import shutil
+
+from metatrader import leaderboard as leaderboard_module
+from metatrader.leaderboard import Leaderboard, ResultWatcher
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'assets')
+
+
+def make_record(profit, strategy='MA', symbol='USDJPY', timeframe='M5', error=None):
+    return {'test_dir': 'run', 'strategy': strategy, 'params': json.dumps({'profit': profit}), 'symbol': symbol,
+            'timeframe': timeframe, 'error': error, 'profit': None if error else profit}
+
+
+def make_run(root, name, complete=True):
+    test_dir = root.mkdir(name)
+    test_dir.mkdir('report')
+    shutil.copy(os.path.join(ASSETS_DIR, 'backtest_report.htm'), str(test_dir.join('report', 'report.htm')))
+    if complete:
+        complete_run(root, name)
+
+
+def complete_run(root, name):
+    with open(str(root.join(name, 'conf.json')), 'w') as f:
+        json.dump({'strategy': 'MA', 'timeframe': 'M5', 'symbol': 'USDJPY', 'params': {'name': name}}, f)
+
+
+def test_leaderboard_keeps_top_k_per_group():
+    board = Leaderboard(k=3)
+    profits = list(range(20))
+    random.Random(0).shuffle(profits)
+    for profit in profits:
+        board.add(make_record(profit))
+        board.add(make_record(-profit, symbol='EURUSD'))
+    board.add(make_record(100, error='invalid report'))
+
+    assert board.n_runs == 41
+    assert board.groups() == [('MA', 'EURUSD', 'M5'), ('MA', 'USDJPY', 'M5')]
+    assert [r['profit'] for r in board.top('MA', 'USDJPY', 'M5')] == [19, 18, 17]
+    assert [r['profit'] for r in board.top('MA', 'EURUSD', 'M5')] == [0, -1, -2]
+
+    board = Leaderboard(k=2, descending=False)
+    for profit in profits:
+        board.add(make_record(profit))
+    assert [r['profit'] for r in board.top('MA', 'USDJPY', 'M5')] == [0, 1]
+
+
+def test_watcher_parses_only_new_runs(tmpdir, monkeypatch):
+    parsed = []
+    read_record = leaderboard_module.read_record
+
+    def counting_read_record(test_dir):
+        parsed.append(os.path.basename(test_dir))
+        return read_record(test_dir)
+
+    monkeypatch.setattr(leaderboard_module, 'read_record', counting_read_record)
+    results = tmpdir.mkdir('results')
+    make_run(results, 'run_000')
+    make_run(results, 'run_001', complete=False)
+
+    board = Leaderboard(k=5)
+    watcher = ResultWatcher(str(results), board)
+    records = watcher.poll()
+    assert [os.path.basename(r['test_dir']) for r in records] == ['run_000']
+    assert records[0]['profit'] == -724.34
+
+    assert watcher.poll() == []
+    assert parsed == ['run_000']
+
+    complete_run(results, 'run_001')
+    make_run(results, 'run_002')
+    assert [os.path.basename(r['test_dir']) for r in watcher.poll()] == ['run_001', 'run_002']
+    assert parsed == ['run_000', 'run_001', 'run_002']
+    assert board.n_runs == 3
+
+
+def test_watcher_records_broken_runs(tmpdir):
+    results = tmpdir.mkdir('results')
+    make_run(results, 'run_000')
+    make_run(results, 'run_001')
+    results.join('run_000', 'conf.json').write('{"strategy": ')
+
+    board = Leaderboard(k=5)
+    records = ResultWatcher(str(results), board).poll()
+    assert [bool(r['error']) for r in records] == [True, False]
+    assert board.n_runs == 2
+    assert board.top('MA', 'USDJPY', 'M5')[0]['profit'] == -724.34
+
+
+def test_watch_writes_snapshot(tmpdir):
+    results = tmpdir.mkdir('results')
+    make_run(results, 'run_000')
+    snapshot_path = str(tmpdir.join('top.json'))
+
+    board = Leaderboard(k=5)
+    ResultWatcher(str(results), board).watch(interval=0, snapshot_path=snapshot_path, max_polls=2)
+
+    assert not board.is_dirty
+    with open(snapshot_path) as f:
+        snapshot = json.load(f)
+    assert snapshot['n_runs'] == 1
+    assert snapshot['metric'] == 'profit'
+    group = snapshot['groups'][0]
+    assert (group['strategy'], group['symbol'], group['timeframe']) == ('MA', 'USDJPY', 'M5')
+    assert group['top'][0]['params'] == {'name': 'run_000'}
+    assert group['top'][0]['profit'] == -724.34
@@ -0,0 +1,63 @@
+import threading
+import time
+
+import pytest
+
+from metatrader import mt5
+from metatrader.pool import BacktestPool
+
+
+class FakeBackTest(object):
+    job_id = None
+    test_dir = 'fake'
+
+    def __init__(self, tracker):
+        self.tracker = tracker
+
+    def run(self, alias):
+        self.tracker.enter(alias)
+        time.sleep(0.05)
+        self.tracker.leave(alias)
+        self.alias = alias
+
+
+class Tracker(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.busy = set()
+        self.max_busy = 0
+
+    def enter(self, alias):
+        with self.lock:
+            assert alias not in self.busy, 'terminal %s used twice at once' % alias
+            self.busy.add(alias)
+            self.max_busy = max(self.max_busy, len(self.busy))
+
+    def leave(self, alias):
+        with self.lock:
+            self.busy.remove(alias)
+
+
+@pytest.fixture
+def aliases(monkeypatch):
+    names = ['pool_a', 'pool_b', 'pool_c']
+    monkeypatch.setattr(mt5, '_mt5s', {name: object() for name in names})
+    return names
+
+
+def test_pool_runs_jobs_on_idle_terminals(aliases):
+    tracker = Tracker()
+    backtests = [FakeBackTest(tracker) for _ in range(9)]
+
+    with BacktestPool(aliases) as pool:
+        done = list(pool.map(backtests))
+
+    assert len(done) == 9
+    assert tracker.max_busy == 3
+    assert {bt.alias for bt in done} == set(aliases)
+    assert len({bt.job_id for bt in done}) == 9
+
+
+def test_pool_rejects_unknown_alias(aliases):
+    with pytest.raises(RuntimeError):
+        BacktestPool(aliases + ['missing'])
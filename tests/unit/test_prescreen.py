@@ -0,0 +1,107 @@
+import time
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from metatrader import prescreen
+from metatrader.prescreen import Prescreener, moving_average, rank_agreement, resample, simulate, spearman
+from metatrader.sampling import ParameterGrid
+
+
+def make_bars(n=5000, seed=1):
+    rnd = np.random.RandomState(seed)
+    close = np.round(1.2 + np.cumsum(rnd.normal(0, 0.0005, n)), 5)
+    open_ = np.concatenate(([close[0]], close[:-1]))
+    return {
+        'time': np.datetime64('2018-01-01T00:00') + np.arange(n).astype('timedelta64[m]'),
+        'open': open_,
+        'high': np.maximum(open_, close) + 0.0002,
+        'low': np.minimum(open_, close) - 0.0002,
+        'close': close,
+        'tick_volume': np.ones(n, dtype='i8'),
+        'spread': np.full(n, 10, dtype='i4'),
+    }
+
+
+def test_moving_average_methods():
+    values = np.array([1.0, 2.0, 3.0, 4.0, 5.0])
+    np.testing.assert_allclose(moving_average(values, 3, prescreen.MA_SMA)[2:], [2.0, 3.0, 4.0])
+    np.testing.assert_allclose(moving_average(values, 3, prescreen.MA_LWMA)[2:], [14 / 6.0, 20 / 6.0, 26 / 6.0])
+    # ema starts from first value, alpha 0.5
+    np.testing.assert_allclose(moving_average(values, 3, prescreen.MA_EMA)[2:], [2.25, 3.125, 4.0625])
+    # smma starts from sma of first period
+    np.testing.assert_allclose(moving_average(values, 3, prescreen.MA_SMMA)[2:], [2.0, 8 / 3.0, 31 / 9.0])
+    assert np.isnan(moving_average(values, 3, prescreen.MA_EMA)[:2]).all()
+    with pytest.raises(ValueError):
+        moving_average(values, 3, 9)
+
+
+def test_resample():
+    bars = make_bars(150)
+    h1 = resample(bars, 'H1')
+    assert len(h1['time']) == 3
+    assert h1['open'][1] == bars['open'][60] and h1['close'][1] == bars['close'][119]
+    assert h1['high'][0] == bars['high'][:60].max() and h1['tick_volume'][2] == 30
+    with pytest.raises(ValueError):
+        resample(bars, 'MN1')
+
+
+def test_simulate_holds_position_from_close_to_close():
+    close = np.array([1.0, 1.1, 1.3, 1.2, 1.0])
+    result = simulate(np.array([1, 1, -1, -1, 0]), close, 0.01)
+    # +0.1 +0.2 then short +0.1 +0.2, 4 units traded
+    assert result['profit'] == pytest.approx(0.6 - 0.04)
+    assert result['total_trades'] == 2
+
+
+def test_candidates_share_indicators():
+    screener = Prescreener(make_bars(), timeframe='M5')
+    assert screener.point == pytest.approx(0.00001)
+    candidates = list(ParameterGrid({
+        'Inp_Signal_MA_Period': [5, 10, 20],
+        'Inp_Signal_MA_Method': [0, 1, 2, 3],
+        'Inp_Signal_MA_Shift': [0, 3],
+        # trailing inputs don't change positions
+        'Inp_Trailing_MA_Period': list(range(20)),
+    }))
+
+    start = time.time()
+    ranked = screener.rank('ExpertMAMA', candidates)
+    assert time.time() - start < 10
+    assert len(ranked) == len(candidates)
+    assert [score for score, _ in ranked] == sorted((score for score, _ in ranked), reverse=True)
+    # one ma per period and method, one simulation per signal inputs
+    assert screener.misses == 1 + 3 * 4
+    assert len(screener._scores) == 3 * 4 * 2
+
+    kept = screener.screen('ExpertMAMA', candidates, keep=0.1)
+    assert len(kept) == 48 and kept[0] == ranked[0][1]
+    assert len(screener.screen('ExpertMAMA', candidates, keep=5)) == 5
+
+
+@pytest.mark.parametrize('strategy, params', [
+    ('ExpertMACD', {'Inp_Signal_MACD_PeriodFast': 8, 'Inp_Signal_MACD_PeriodSlow': 21}),
+    ('MAMACD', {'MA1': 90, 'MA2': 75, 'MA3': 5, 'fastema': 15, 'slowema': 26, 'InpStopLoss': 15}),
+])
+def test_macd_strategies(strategy, params):
+    screener = Prescreener(make_bars(), timeframe='M5')
+    metrics = screener.evaluate(strategy, params)
+    assert metrics['total_trades'] > 0
+    assert np.isfinite(metrics['profit'])
+    with pytest.raises(KeyError):
+        screener.evaluate('N_Candles_v5', params)
+
+
+def test_spearman_and_rank_agreement():
+    assert spearman([1, 2, 3, 4], [10, 20, 30, 40]) == pytest.approx(1.0)
+    assert spearman([1, 2, 3, 4], [4, 3, 2, 1]) == pytest.approx(-1.0)
+    assert spearman([1, 2, 2, 3], [1, 2, 3, 4]) == pytest.approx(0.9486833)
+    assert np.isnan(spearman([1, 1, 1], [1, 2, 3]))
+
+    approximate = {'a': 4.0, 'b': 3.0, 'c': 2.0, 'd': 1.0, 'e': 0.0}
+    actual = {'a': 40.0, 'b': 10.0, 'c': 30.0, 'd': 20.0, 'x': 99.0}
+    agreement = rank_agreement(approximate, actual, keep=0.5)
+    assert agreement['n'] == 4
+    assert agreement['spearman'] == pytest.approx(0.4)
+    assert agreement['recall'] == 0.5
@@ -0,0 +1,229 @@
+import os
+import shutil
+
+import pytest
+
+from metatrader.exception import InvalidReportFormat
+from metatrader.report import (BacktestReport, OptimizationReport, iter_optimization_results,
+                               iter_xml_optimization_results, parse_backtest_summary, read_backtest_summary)
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'assets')
+OPTIMIZATION_REPORT = os.path.join(ASSETS_DIR, 'optimization_report.htm')
+XML_OPTIMIZATION_REPORT = os.path.join(ASSETS_DIR, 'optimization_report.xml')
+XML_FORWARD_REPORT = os.path.join(ASSETS_DIR, 'optimization_report.forward.xml')
+
+
+class FakeBackTest(object):
+    ea_name = 'Moving Average'
+    param = {}
+    symbol = 'USDJPY'
+    period = 'H1'
+    deposit = 10000
+    from_date = None
+    to_date = None
+    model = 1
+    spread = 10
+
+
+@pytest.mark.parametrize('chunk_size', [7, 64 * 1024])
+def test_iter_optimization_results(chunk_size):
+    results = list(iter_optimization_results(FakeBackTest(), OPTIMIZATION_REPORT, chunk_size=chunk_size))
+
+    assert len(results) == 3
+    first = results[0]
+    assert first.param == {'MaximumRisk': '0.02', ' Lots': '0.1'}
+    assert first.profit == -724.34
+    assert first.total_trades == 1232
+    assert first.profit_factor == 0.88
+    assert first.expected_payoff == -0.59
+    assert first.max_drawdown == 1267.33
+    assert first.max_drawdown_rate == 12.55
+    assert first.initial_deposit == 10000.0
+    assert [r.profit for r in results] == [-724.34, -1324.10, 512.80]
+
+
+def test_optimization_report_results(tmpdir):
+    backtest = FakeBackTest()
+    backtest.test_dir = str(tmpdir)
+    tmpdir.mkdir('report')
+    shutil.copy(OPTIMIZATION_REPORT, str(tmpdir.join('report', 'report.htm')))
+
+    report = OptimizationReport(backtest)
+    assert [r.total_trades for r in report.results] == [1232, 1232, 1190]
+
+
+def test_iter_optimization_results_invalid_format(tmpdir):
+    report_file = tmpdir.join('report.htm')
+    with open(OPTIMIZATION_REPORT) as fp:
+        report_file.write(fp.read().replace('Optimization Report', 'Strategy Tester Report'))
+
+    with pytest.raises(InvalidReportFormat):
+        list(iter_optimization_results(FakeBackTest(), str(report_file)))
+
+
+def test_xml_results_match_html_results():
+    html_results = list(iter_optimization_results(FakeBackTest(), OPTIMIZATION_REPORT))
+    xml_results = list(iter_optimization_results(FakeBackTest(), XML_OPTIMIZATION_REPORT))
+
+    assert len(xml_results) == 3
+    for html_result, xml_result in zip(html_results, xml_results):
+        assert xml_result.param == {name.strip(): value for name, value in html_result.param.items()}
+        for field in ('profit', 'total_trades', 'profit_factor', 'expected_payoff', 'max_drawdown_rate',
+                      'initial_deposit'):
+            assert getattr(xml_result, field) == getattr(html_result, field)
+        # not in xml report
+        assert xml_result.max_drawdown is None
+
+
+def test_optimization_report_reads_xml_and_forward(tmpdir):
+    backtest = FakeBackTest()
+    backtest.test_dir = str(tmpdir)
+    backtest.forward_mode = 2
+    tmpdir.mkdir('report')
+    shutil.copy(OPTIMIZATION_REPORT, str(tmpdir.join('report', 'report.htm')))
+    shutil.copy(XML_OPTIMIZATION_REPORT, str(tmpdir.join('report', 'report.xml')))
+    shutil.copy(XML_FORWARD_REPORT, str(tmpdir.join('report', 'report.forward.xml')))
+
+    report = OptimizationReport(backtest)
+    assert [r.max_drawdown for r in report.results] == [None, None, None]
+    assert [(r.param['MaximumRisk'], r.profit, r.total_trades) for r in report.forward_results] == [
+        ('0.07', 130.22, 213), ('0.12', -87.4, 208)]
+
+    backtest.forward_mode = 0
+    assert OptimizationReport(backtest).forward_results == []
+
+
+def test_xml_optimization_report_skipped_cells(tmpdir):
+    report_file = tmpdir.join('report.xml')
+    with open(XML_OPTIMIZATION_REPORT) as fp:
+        content = fp.read()
+    # cell of Profit Factor is omitted and the next cell is positioned by ss:Index
+    content = content.replace('<Cell><Data ss:Type="Number">0.88</Data></Cell>\n'
+                              '    <Cell><Data ss:Type="Number">-0.57</Data></Cell>',
+                              '<Cell ss:Index="6"><Data ss:Type="Number">-0.57</Data></Cell>')
+    report_file.write(content)
+
+    first = next(iter_xml_optimization_results(FakeBackTest(), str(report_file)))
+    assert first.profit_factor is None
+    assert first.total_trades == 1232
+    assert first.param == {'MaximumRisk': '0.02', 'Lots': '0.1'}
+
+
+@pytest.mark.parametrize('content', ['<Workbook xmlns="urn:schemas-microsoft-com:office:spreadsheet"/>',
+                                     '<html><body>not xml</html>'])
+def test_xml_optimization_report_invalid_format(tmpdir, content):
+    report_file = tmpdir.join('report.xml')
+    report_file.write(content)
+
+    with pytest.raises(InvalidReportFormat):
+        list(iter_xml_optimization_results(FakeBackTest(), str(report_file)))
+
+
+BACKTEST_REPORT = os.path.join(ASSETS_DIR, 'backtest_report.htm')
+
+EXPECTED_SUMMARY = {
+    'initial_deposit': 10000.0,
+    'profit': -724.34,
+    'profit_factor': 0.88,
+    'expected_payoff': -0.59,
+    'abs_drawdown': 920.68,
+    'max_drawdown': 1267.33,
+    'max_drawdown_rate': 12.55,
+    'relative_drawdown': 1267.33,
+    'relative_drawdown_rate': 12.55,
+    'gross_profit': 5368.83,
+    'gross_loss': -6093.17,
+    'total_trades': 1232,
+    'largest_profit_trade': 155.62,
+    'largest_loss_trade': -87.78,
+    'average_profit_trade': 18.90,
+    'average_loss_trade': -6.43,
+    'modeling_quality_percentage': 90.0,
+    'max_consecutive_profit': 270.45,
+    'max_consecutive_profit_count': 3,
+    'max_consecutive_loss': -192.53,
+    'max_consecutive_loss_count': 30,
+    'max_consecutive_wins_count': 4,
+    'max_consecutive_wins_profit': 44.31,
+    'max_consecutive_losses_count': 30,
+    'max_consecutive_losses_loss': -192.53,
+    'profit_trades': 284,
+    'profit_trades_rate': 23.05,
+    'loss_trades': 948,
+    'loss_trades_rate': 76.95,
+    'ave_consecutive_wins': 1,
+    'ave_consecutive_losses': 4,
+    'short_positions': 549,
+    'short_positions_rate': 20.95,
+    'long_positions': 683,
+    'long_positions_rate': 24.74,
+}
+
+
+def test_read_backtest_summary():
+    assert read_backtest_summary(BACKTEST_REPORT) == EXPECTED_SUMMARY
+
+
+MT5_BACKTEST_REPORT = os.path.join(ASSETS_DIR, 'mt5_backtest_report.htm')
+
+
+def test_read_mt5_backtest_summary():
+    summary = read_backtest_summary(MT5_BACKTEST_REPORT)
+    assert set(summary) == set(EXPECTED_SUMMARY)
+    assert summary['initial_deposit'] == 10000.0
+    assert summary['profit'] == -12107.2
+    assert (summary['max_drawdown'], summary['max_drawdown_rate']) == (12602.4, 120.08)
+    assert (summary['relative_drawdown'], summary['relative_drawdown_rate']) == (12602.4, 120.08)
+    assert (summary['total_trades'], summary['profit_trades'], summary['profit_trades_rate']) == (3, 2, 66.67)
+    assert (summary['short_positions'], summary['short_positions_rate']) == (1, 100.0)
+    assert (summary['max_consecutive_losses_count'], summary['max_consecutive_losses_loss']) == (1, -12602.2)
+    assert (summary['max_consecutive_profit'], summary['max_consecutive_profit_count']) == (495.6, 2)
+    assert summary['modeling_quality_percentage'] == 2.0
+    with open(MT5_BACKTEST_REPORT, 'rb') as fp:
+        assert parse_backtest_summary(fp.read()) == summary
+
+
+def test_malformed_mt5_pair_is_invalid_format():
+    with pytest.raises(InvalidReportFormat):
+        parse_backtest_summary(b'<table><tr><td>Balance Drawdown Maximal:</td><td>12.0</td></tr></table>')
+
+
+def test_backtest_report(tmpdir):
+    backtest = FakeBackTest()
+    backtest.test_dir = str(tmpdir)
+    tmpdir.mkdir('report')
+    shutil.copy(BACKTEST_REPORT, str(tmpdir.join('report', 'report.htm')))
+
+    report = BacktestReport(backtest)
+    for field, value in EXPECTED_SUMMARY.items():
+        assert getattr(report, field) == value
+    assert report.abs_drawdown_rate is None
+
+
+def test_parse_backtest_summary_without_table():
+    with pytest.raises(InvalidReportFormat):
+        parse_backtest_summary(b'<html><body>no report</body></html>')
+
+
+def test_short_reports_share_run_and_compare_by_param():
+    first = list(iter_optimization_results(FakeBackTest(), OPTIMIZATION_REPORT))
+    second = list(iter_optimization_results(FakeBackTest(), OPTIMIZATION_REPORT))
+
+    assert first[0].run is first[1].run
+    assert first[0].ea_name == 'Moving Average'
+    assert first == second
+    assert len(set(first) | set(second)) == 3
+    assert first[0] != first[1]
+    assert not hasattr(first[0], '__dict__')
+
+    other = FakeBackTest()
+    other.symbol = 'EURUSD'
+    assert set(first).isdisjoint(iter_optimization_results(other, OPTIMIZATION_REPORT))
+    for field, value in (('period', 'M15'), ('deposit', 5000)):
+        other = FakeBackTest()
+        setattr(other, field, value)
+        assert set(first).isdisjoint(iter_optimization_results(other, OPTIMIZATION_REPORT))
+
+    # interned parameters belong to run of report
+    assert first[0].param_key[0] is first[1].run.param_items[first[0].param_key[0]]
+    assert first[0].param_key[0] is not second[0].param_key[0]
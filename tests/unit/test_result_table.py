@@ -0,0 +1,52 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from metatrader.result_table import ResultTable  # noqa: E402
+
+
+class Row(object):
+    def __init__(self, profit, max_drawdown_rate, param, total_trades=10):
+        self.profit = profit
+        self.total_trades = total_trades
+        self.profit_factor = 1.0
+        self.expected_payoff = 0.5
+        self.max_drawdown = max_drawdown_rate * 100
+        self.max_drawdown_rate = max_drawdown_rate
+        self.initial_deposit = 10000.0
+        self.param = param
+
+
+@pytest.fixture
+def table():
+    rows = [
+        Row(100.0, 10.0, {'a': '1', 'b': 'x'}),
+        Row(200.0, 20.0, {'a': '2', 'b': 'x'}),
+        Row(150.0, 25.0, {'a': '3', 'b': 'y'}),
+        Row(50.0, 5.0, {'a': '1'}),
+        Row(None, 1.0, {'a': '2', 'b': 'y'}, total_trades=None),
+    ]
+    return ResultTable.from_reports(rows)
+
+
+def test_from_reports(table):
+    assert len(table) == 5
+    assert table.param_categories['a'] == ['1', '2', '3']
+    assert table.param_codes['b'].tolist() == [0, 0, 1, -1, 1]
+    assert list(table['b']) == ['x', 'x', 'y', None, 'y']
+    assert np.isnan(table['profit'][4])
+    assert table['total_trades'][4] == -1
+    assert table.param_values('a').tolist() == [1.0, 2.0, 3.0, 1.0, 2.0]
+
+
+def test_filter_sort_top_k(table):
+    assert table.filter(table.param_mask('b', 'x'))['profit'].tolist() == [100.0, 200.0]
+    assert table.sort('profit')['profit'][:4].tolist() == [200.0, 150.0, 100.0, 50.0]
+    assert table.top_k('profit', 2)['profit'].tolist() == [200.0, 150.0]
+    assert table.top_k('max_drawdown_rate', 2, descending=False)['max_drawdown_rate'].tolist() == [1.0, 5.0]
+
+
+def test_pareto_front(table):
+    front = table.pareto_front()
+    assert front['profit'].tolist() == [200.0, 100.0, 50.0]
+    assert front['max_drawdown_rate'].tolist() == [20.0, 10.0, 5.0]
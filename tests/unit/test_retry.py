@@ -0,0 +1,148 @@
+import os
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+from metatrader import mt5
+from metatrader.backtest import BackTest
+from metatrader.exception import InvalidReportFormat, TerminalError, TerminalTimeout
+from metatrader.pool import BacktestPool
+from metatrader.retry import RetryPolicy, is_retryable
+
+
+def create_backtest(test_dir, **kwargs):
+    return BackTest(test_dir, 'Advisors\\ExpertMACD', {'InpLots': {'value': 0.1}}, 'EURUSD', 'H1', 10000,
+                    datetime(2018, 1, 1), datetime(2018, 2, 1), **kwargs)
+
+
+@pytest.fixture
+def fast_watchdog(monkeypatch):
+    monkeypatch.setattr(mt5.MT5, 'poll_interval', 0.05)
+
+
+def test_is_retryable():
+    assert is_retryable(TerminalError('terminal', 1))
+    assert is_retryable(TerminalTimeout('terminal', 'idle', 10))
+    assert is_retryable(PermissionError('locked'))
+    assert not is_retryable(InvalidReportFormat('report.htm', 'Symbol'))
+    assert not is_retryable(FileNotFoundError('report.htm'))
+    assert not is_retryable(ZeroDivisionError())
+
+
+def test_retry_policy_backoff():
+    policy = RetryPolicy(max_attempts=5, backoff=10.0, factor=2.0, max_backoff=50.0)
+    assert [policy.delay(attempt) for attempt in range(1, 5)] == [10.0, 20.0, 40.0, 50.0]
+    with pytest.raises(ValueError):
+        RetryPolicy(max_attempts=0)
+
+
+def test_retry_policy_call():
+    sleeps = []
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise TerminalError('terminal', 1)
+        return 'done'
+
+    assert RetryPolicy(max_attempts=3).call(flaky, sleep=sleeps.append) == 'done'
+    assert sleeps == [10.0, 20.0]
+
+    def always_fails():
+        raise TerminalError('terminal', 1)
+
+    with pytest.raises(TerminalError) as e:
+        RetryPolicy(max_attempts=2).call(always_fails, sleep=sleeps.append)
+    assert e.value.attempts == 2
+
+    def invalid_report():
+        raise InvalidReportFormat('report.htm', 'Symbol')
+
+    with pytest.raises(InvalidReportFormat) as e:
+        RetryPolicy(max_attempts=3).call(invalid_report, sleep=sleeps.append)
+    assert e.value.attempts == 1
+
+
+def test_exit_code_raises_terminal_error(fake_terminals, tmpdir, monkeypatch):
+    monkeypatch.setenv('FAKE_TERMINAL_EXIT_CODE', '3')
+    alias = fake_terminals(1)[0]
+
+    with pytest.raises(RuntimeError) as e:
+        create_backtest(str(tmpdir.mkdir('run'))).run(alias=alias)
+    assert isinstance(e.value, TerminalError)
+    assert e.value.returncode == 3
+
+
+def test_timeout_kills_terminal(fake_terminals, tmpdir, monkeypatch, fast_watchdog):
+    monkeypatch.setenv('FAKE_TERMINAL_SLEEP', '30')
+    alias = fake_terminals(1)[0]
+
+    start = time.time()
+    with pytest.raises(TerminalTimeout) as e:
+        create_backtest(str(tmpdir.mkdir('run')), timeout=0.5).run(alias=alias)
+    assert e.value.reason == 'timeout'
+    assert time.time() - start < 10
+
+
+def test_idle_timeout_kills_silent_terminal(fake_terminals, tmpdir, monkeypatch, fast_watchdog):
+    monkeypatch.setenv('FAKE_TERMINAL_SLEEP', '30')
+    alias = fake_terminals(1)[0]
+
+    with pytest.raises(TerminalTimeout) as e:
+        create_backtest(str(tmpdir.mkdir('run')), idle_timeout=0.5).run(alias=alias)
+    assert e.value.reason == 'idle'
+
+
+def test_log_activity_keeps_terminal_alive(fake_terminals, tmpdir, monkeypatch, fast_watchdog):
+    monkeypatch.setenv('FAKE_TERMINAL_SLEEP', '1.5')
+    alias = fake_terminals(1)[0]
+    log_dir = os.path.join(mt5.get_mt5(alias).appdata_path, 'Tester', 'Agent-127.0.0.1-3000', 'logs')
+    os.makedirs(log_dir)
+    done = threading.Event()
+
+    def write_logs():
+        while not done.wait(0.1):
+            with open(os.path.join(log_dir, '20180101.log'), 'a') as f:
+                f.write('pass\n')
+
+    writer = threading.Thread(target=write_logs)
+    writer.start()
+    try:
+        backtest = create_backtest(str(tmpdir.mkdir('run')), idle_timeout=0.8)
+        backtest.run(alias=alias)
+    finally:
+        done.set()
+        writer.join()
+    assert os.path.exists(os.path.join(backtest.test_dir, 'report', 'report.htm'))
+
+
+class FlakyBackTest(object):
+    job_id = None
+    test_dir = 'flaky'
+
+    def __init__(self, n_failures, error=TerminalError):
+        self.n_failures = n_failures
+        self.error = error
+        self.aliases = []
+
+    def run(self, alias):
+        self.aliases.append(alias)
+        if len(self.aliases) <= self.n_failures:
+            raise self.error('terminal', 1)
+
+
+def test_pool_retries_retryable_failures(monkeypatch):
+    monkeypatch.setattr(mt5, '_mt5s', {'a': object(), 'b': object()})
+    policy = RetryPolicy(max_attempts=3, backoff=0.01)
+
+    flaky = FlakyBackTest(2)
+    broken = FlakyBackTest(5)
+    with BacktestPool(['a', 'b'], retry=policy) as pool:
+        assert pool.submit(flaky).result() is flaky
+        with pytest.raises(TerminalError):
+            pool.submit(broken).result()
+    assert len(flaky.aliases) == 3
+    assert len(broken.aliases) == 3
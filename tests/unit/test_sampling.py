@@ -0,0 +1,39 @@
+from metatrader.sampling import ParameterGrid, ParameterSampler
+
+SPACE = {'fast': [5, 10, 15], 'slow': [20, 40], 'mm': ['true', 'false']}
+
+
+def test_grid_order_and_index():
+    grid = ParameterGrid(SPACE)
+    combinations = list(grid)
+
+    assert len(grid) == len(combinations) == 12
+    assert combinations[0] == {'fast': 5, 'mm': 'true', 'slow': 20}
+    assert combinations[1] == {'fast': 5, 'mm': 'true', 'slow': 40}
+    assert [grid[i] for i in range(len(grid))] == combinations
+
+
+def test_grid_of_several_dicts():
+    grid = ParameterGrid([{'a': [1, 2]}, {'b': [3]}])
+    assert list(grid) == [{'a': 1}, {'a': 2}, {'b': 3}]
+    assert grid[2] == {'b': 3}
+
+
+def test_sampler_without_replacement():
+    combinations = list(ParameterSampler(SPACE, 5, random_state=1))
+    assert len(combinations) == 5
+    assert len({tuple(sorted(c.items())) for c in combinations}) == 5
+    assert combinations == list(ParameterSampler(SPACE, 5, random_state=1))
+
+    # n_iter larger than grid gives every combination once
+    assert len(list(ParameterSampler(SPACE, 100, random_state=1))) == 12
+
+
+def test_sampler_with_distribution():
+    class Constant(object):
+        def rvs(self, random_state=None):
+            return 0.5
+
+    combinations = list(ParameterSampler({'lots': Constant(), 'fast': [5, 10]}, 20, random_state=0))
+    assert len(combinations) == 20
+    assert all(c['lots'] == 0.5 and c['fast'] in (5, 10) for c in combinations)
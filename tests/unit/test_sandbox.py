@@ -0,0 +1,137 @@
+import os
+from datetime import datetime
+
+import pytest
+
+from metatrader import cli, mt5
+from metatrader.backtest import BackTest
+from metatrader.pool import BacktestPool
+from metatrader.sandbox import MANIFEST_FILE, SandboxManager, clone_file
+from tests.assets import fake_terminal
+
+
+@pytest.fixture
+def base(tmpdir, monkeypatch):
+    monkeypatch.setattr(mt5, '_mt5s', {})
+    monkeypatch.setattr(mt5, '_platform', mt5.PortablePlatform())
+
+    base = tmpdir.mkdir('base')
+    fake_terminal.install(str(base))
+    base.join('MQL5', 'Experts', 'Advisors', 'ExpertMACD.ex5').write('v1', ensure=True)
+    base.mkdir('Bases').mkdir('Default').join('EURUSD.hcc').write('history' * 100)
+    base.mkdir('config').join('common.ini').write('[Common]\n')
+    base.mkdir('logs').join('20180101.log').write('base log')
+    return base
+
+
+def create_backtest(test_dir):
+    return BackTest(test_dir, 'Advisors\\ExpertMACD', {'InpLots': {'value': 0.1}}, 'EURUSD', 'H1', 10000,
+                    datetime(2018, 1, 1), datetime(2018, 2, 1))
+
+
+def test_clone_file_links_only_when_allowed(tmpdir):
+    src = tmpdir.join('src.ex5')
+    src.write('binary')
+    assert clone_file(str(src), str(tmpdir.join('linked')), link=True) in ('reflink', 'hardlink')
+    assert clone_file(str(src), str(tmpdir.join('copied')), link=False) in ('reflink', 'copy')
+    assert tmpdir.join('copied').read() == 'binary'
+    assert os.stat(str(tmpdir.join('copied'))).st_ino != os.stat(str(src)).st_ino
+
+
+def test_provision_registers_portable_sandboxes(tmpdir, base):
+    manager = SandboxManager(str(base), str(tmpdir.join('sandboxes')))
+    aliases = manager.provision(2)
+    assert aliases == ['sandbox_0', 'sandbox_1'] == manager.sandboxes()
+
+    sandbox = tmpdir.join('sandboxes', 'sandbox_0')
+    terminal = mt5.get_mt5('sandbox_0')
+    assert terminal.portable and terminal.appdata_path == str(sandbox)
+    # read only files are shared, written ones are copied, logs are own of each sandbox
+    assert sandbox.join('Bases', 'Default', 'EURUSD.hcc').read() == 'history' * 100
+    # terminal appends to history, so it is never hardlinked
+    assert os.stat(str(sandbox.join('Bases', 'Default', 'EURUSD.hcc'))).st_ino != os.stat(
+        str(base.join('Bases', 'Default', 'EURUSD.hcc'))).st_ino
+    assert os.stat(str(sandbox.join('config', 'common.ini'))).st_ino != os.stat(str(base.join('config',
+                                                                                              'common.ini'))).st_ino
+    assert not sandbox.join('logs').exists()
+    counts = manager.manifest('sandbox_0')['counts']
+    assert counts['hardlink'] + counts['reflink'] + counts['copy'] == 4
+
+    sandbox.join('config', 'common.ini').write('[Common]\nLogin=1\n')
+    assert base.join('config', 'common.ini').read() == '[Common]\n'
+
+    with BacktestPool(aliases) as pool:
+        backtests = [pool.submit(create_backtest(str(tmpdir.mkdir('run_%d' % i)))).result() for i in range(2)]
+    assert all(os.path.exists(os.path.join(b.test_dir, 'report', 'report.htm')) for b in backtests)
+
+
+def test_refresh_after_ea_is_recompiled(tmpdir, base):
+    manager = SandboxManager(str(base), str(tmpdir.join('sandboxes')))
+    manager.provision(1)
+    sandbox = tmpdir.join('sandboxes', 'sandbox_0')
+    sandbox.mkdir('logs').join('sandbox.log').write('own log')
+    assert not manager.is_stale('sandbox_0')
+
+    # compiler writes a new file
+    ea = base.join('MQL5', 'Experts', 'Advisors', 'ExpertMACD.ex5')
+    ea.dirpath().join('ExpertMACD.ex5.new').write('v2')
+    os.replace(str(ea) + '.new', str(ea))
+    assert manager.is_stale('sandbox_0')
+
+    manager.provision(1)
+    assert sandbox.join('MQL5', 'Experts', 'Advisors', 'ExpertMACD.ex5').read() == 'v2'
+    assert manager.manifest('sandbox_0')['counts']['unchanged'] == 3
+    assert sandbox.join('logs', 'sandbox.log').read() == 'own log'
+    assert not manager.is_stale('sandbox_0')
+
+
+def test_data_folder_is_discovered(tmpdir, base, monkeypatch):
+    appdata = tmpdir.mkdir('appdata')
+    appdata.join(mt5.ORIGIN_TXT).write(str(base))
+    appdata.mkdir('config').join('common.ini').write('[Common]\nLogin=1\n')
+
+    class UacPlatform(mt5.PortablePlatform):
+        def is_uac_enabled(self):
+            return True
+
+        def get_appdata_path(self, program_path):
+            return str(appdata)
+
+    monkeypatch.setattr(mt5, '_platform', UacPlatform())
+    # data folder wins over install folder
+    SandboxManager(str(base), str(tmpdir.join('sandboxes'))).create('uac')
+    assert tmpdir.join('sandboxes', 'uac', 'config', 'common.ini').read() == '[Common]\nLogin=1\n'
+
+    SandboxManager(str(base), str(tmpdir.join('sandboxes')), portable=True).create('portable')
+    assert tmpdir.join('sandboxes', 'portable', 'config', 'common.ini').read() == '[Common]\n'
+
+
+def test_teardown(tmpdir, base):
+    manager = SandboxManager(str(base), str(tmpdir.join('sandboxes')))
+    manager.provision(2, prefix='a')
+    manager.provision(1, prefix='b')
+
+    assert manager.teardown_all(prefix='a') == ['a_0', 'a_1']
+    assert manager.sandboxes() == ['b_0']
+    assert not tmpdir.join('sandboxes', 'a_0').exists()
+    with pytest.raises(RuntimeError):
+        mt5.get_mt5('a_0')
+    assert base.join('MQL5', 'Experts', 'Advisors', 'ExpertMACD.ex5').read() == 'v1'
+    assert os.path.exists(os.path.join(manager.path('b_0'), MANIFEST_FILE))
+
+
+def test_cli_runs_on_sandbox(tmpdir, base):
+    test_dir = tmpdir.mkdir('run')
+    assert cli.main(['run', '--terminal', str(base), '--sandboxes', '1', '--ea', 'Advisors\\ExpertMACD',
+                     '--symbol', 'EURUSD', '--period', 'H1', '--from', '2018.01.01', '--to', '2018.02.01',
+                     '--test-dir', str(test_dir)]) == 0
+    assert test_dir.join('report', 'report.htm').exists()
+    assert mt5.get_mt5('sandbox_0').prog_path == str(test_dir.join('sandboxes', 'sandbox_0'))
+
+
+def test_portable_command():
+    if os.name != 'nt':
+        assert mt5.PortablePlatform().terminal_command('/mt5/terminal64.exe', '/tmp/config.ini', portable=True) == [
+            '/mt5/terminal64.exe', '/config:/tmp/config.ini', '/portable']
+    assert mt5.WindowsPlatform().terminal_command('terminal64.exe', 'config.ini', portable=True) == (
+        '"terminal64.exe" /config:"config.ini" /portable')
@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from metatrader.pool import BacktestPool
+from metatrader.scheduler import PRIOR_MODEL_FACTORS, PRIOR_SECONDS_PER_DAY, CostModel, Plan, longest_first
+from metatrader.store import ResultStore
+
+FROM_DATE = datetime(2018, 1, 1)
+
+
+def days_later(days):
+    return FROM_DATE + timedelta(days=days)
+
+
+def test_cost_model_falls_back_to_less_specific_key():
+    cost_model = CostModel()
+    assert cost_model.estimate('MA', 'EUR', 'M1', 2, FROM_DATE, days_later(10)) == pytest.approx(
+        PRIOR_SECONDS_PER_DAY * PRIOR_MODEL_FACTORS[2] * 10)
+
+    cost_model.observe('MA', 'EUR', 'M1', 0, FROM_DATE, days_later(10), 100.0)
+    cost_model.observe('MA', 'EUR', 'M1', 0, FROM_DATE, days_later(10), 300.0)
+    cost_model.observe('MACD', 'USD', 'H4', 0, FROM_DATE, days_later(10), 1.0)
+    assert len(cost_model) == 3
+
+    # same key, scaled by days
+    assert cost_model.estimate('MA', 'EUR', 'M1', 0, FROM_DATE, days_later(20)) == pytest.approx(400.0)
+    # other strategy on same symbol and timeframe
+    assert cost_model.estimate('CCI', 'EUR', 'M1', 0, FROM_DATE, days_later(10)) == pytest.approx(200.0)
+    # only model is known
+    assert cost_model.estimate('CCI', 'JPY', 'M5', 0, FROM_DATE, days_later(10)) == pytest.approx(401.0 / 3)
+
+
+def test_cost_model_from_store():
+    with ResultStore(':memory:') as store:
+        store.add('MA', {'a': 1}, 'EUR', 'H1', from_date=FROM_DATE, to_date=days_later(5), model=1, duration=10.0)
+        store.add('MA', {'a': 2}, 'EUR', 'H1', model=1, duration=99.0)
+        cost_model = CostModel.from_store(store)
+    assert len(cost_model) == 1
+    assert cost_model.estimate('MA', 'EUR', 'H1', 1, '2018-01-01', '2018-01-11') == pytest.approx(20.0)
+
+
+def test_longest_first_keeps_order_of_ties():
+    assert longest_first(['a', 'bb', 'cc', 'ddd'], len) == [(3, 'ddd'), (2, 'bb'), (2, 'cc'), (1, 'a')]
+
+
+def test_plan_balances_terminals():
+    durations = [1, 1, 1, 1, 1, 1, 6]
+    plan = Plan(durations, 2, float)
+
+    # longest first: 6 | 1 * 6
+    assert plan.makespan == 6
+    assert plan.total == 12
+    assert sorted(len(jobs) for jobs in plan.assignments) == [1, 6]
+    assert plan.ordered_jobs()[0] == 6
+    assert plan.eta(datetime(2018, 1, 1)) == datetime(2018, 1, 1, 0, 0, 6)
+    assert 'estimated duration: 0:00:06' in plan.format()
+
+    with pytest.raises(ValueError):
+        Plan(durations, 0, float)
+
+
+class SleepBackTest(object):
+    job_id = None
+    test_dir = 'sleep'
+
+    def run(self, alias):
+        pass
+
+
+def test_pool_records_duration(monkeypatch):
+    from metatrader import mt5
+
+    monkeypatch.setattr(mt5, '_mt5s', {'a': object()})
+    backtest = SleepBackTest()
+    with BacktestPool(['a']) as pool:
+        assert pool.submit(backtest).result() is backtest
+    assert backtest.duration >= 0
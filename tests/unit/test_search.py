@@ -0,0 +1,104 @@
+import os
+from datetime import datetime
+
+import pytest
+
+from metatrader.backtest import BackTest
+from metatrader.pool import BacktestPool
+from metatrader.search import (DEFAULT_RUNGS, MODEL_EVERY_TICK, MODEL_OPEN_PRICES, hyperband, pool_evaluator,
+                               rung_cost, sub_range, successive_halving)
+
+
+def quality(params):
+    return -abs(params['x'] - 17)
+
+
+def noisy_evaluate(calls):
+    def evaluate(candidates, rung):
+        calls.append((rung, len(candidates)))
+        fraction, _ = rung
+        # short runs rank roughly right, full runs exactly
+        return [quality(params) + (1 - fraction) * ((params['x'] * 7) % 5) for params in candidates]
+
+    return evaluate
+
+
+def test_sub_range():
+    from_date, to_date = datetime(2018, 1, 1), datetime(2018, 1, 10)
+    assert sub_range(from_date, to_date, 1.0) == (from_date, to_date)
+    assert sub_range(from_date, to_date, 1.0 / 3) == (datetime(2018, 1, 7), to_date)
+
+
+def test_successive_halving_promotes_best():
+    calls = []
+    candidates = [{'x': x} for x in range(27)]
+    result = successive_halving(candidates, noisy_evaluate(calls), eta=3)
+
+    assert [n for _, n in calls] == [27, 9, 3]
+    assert [rung for rung, _ in calls] == list(DEFAULT_RUNGS)
+    assert result.best[0] == (0, {'x': 17})
+    assert len(result.best) == 3
+    assert result.n_evaluations == 39
+    # far less than 27 full runs
+    assert result.cost == pytest.approx(27 * rung_cost(DEFAULT_RUNGS[0]) + 9 * rung_cost(DEFAULT_RUNGS[1]) + 3)
+    assert result.cost < 27 / 5.0
+
+
+def test_successive_halving_ranks_failures_last():
+    def evaluate(candidates, rung):
+        return [None if params['x'] == 1 else params['x'] for params in candidates]
+
+    result = successive_halving([{'x': 1}, {'x': 0}], evaluate, rungs=[(1.0, MODEL_EVERY_TICK)])
+    assert result.best == [(0, {'x': 0}), (float('-inf'), {'x': 1})]
+
+
+def test_successive_halving_rejects_small_eta():
+    with pytest.raises(ValueError):
+        successive_halving([{'x': 1}], noisy_evaluate([]), eta=1)
+
+
+def test_hyperband_brackets():
+    calls = []
+    result = hyperband({'x': list(range(100))}, noisy_evaluate(calls), eta=3, random_state=0)
+
+    # brackets start at rung 0, 1 and 2
+    assert [n for _, n in calls] == [9, 3, 1, 5, 1, 3]
+    assert result.best == sorted(result.best, key=lambda item: -item[0])
+    assert len(result.best) == 5
+
+
+def test_pool_evaluator_on_fake_terminals(tmpdir, fake_terminals):
+    aliases = fake_terminals(2)
+    from_date, to_date = datetime(2018, 1, 1), datetime(2018, 7, 1)
+    created = []
+
+    def create_backtest(params, rung_from, rung_to, model):
+        test_dir = str(tmpdir.mkdir('run_%d' % len(created)))
+        created.append((rung_from, model))
+        return BackTest(test_dir, 'Advisors\\ExpertMACD', {'Inp_Period': {'value': params['period']}}, 'EURUSD',
+                        'H1', 10000, rung_from, rung_to, model=model)
+
+    with BacktestPool(aliases) as pool:
+        evaluate = pool_evaluator(pool, create_backtest, from_date, to_date)
+        scores = evaluate([{'period': p} for p in (5, 10, 15)], (1.0 / 3, MODEL_OPEN_PRICES))
+
+    assert len(scores) == 3
+    assert all(isinstance(score, float) for score in scores)
+    assert created == [(sub_range(from_date, to_date, 1.0 / 3)[0], MODEL_OPEN_PRICES)] * 3
+    assert all(os.path.exists(str(tmpdir.join('run_%d' % i, 'report', 'report.htm'))) for i in range(3))
+
+
+def test_pool_evaluator_raises_if_all_candidates_fail(tmpdir, fake_terminals, monkeypatch):
+    monkeypatch.setenv('FAKE_TERMINAL_EXIT_CODE', '3')
+    aliases = fake_terminals(2)
+    from_date, to_date = datetime(2018, 1, 1), datetime(2018, 7, 1)
+
+    def create_backtest(params, rung_from, rung_to, model):
+        return BackTest(str(tmpdir.mkdir('run_%d' % params['period'])), 'Advisors\\ExpertMACD',
+                        {'Inp_Period': {'value': params['period']}}, 'EURUSD', 'H1', 10000, rung_from, rung_to,
+                        model=model)
+
+    with BacktestPool(aliases) as pool:
+        evaluate = pool_evaluator(pool, create_backtest, from_date, to_date)
+        with pytest.raises(RuntimeError):
+            evaluate([{'period': p} for p in (5, 10)], (1.0 / 3, MODEL_OPEN_PRICES))
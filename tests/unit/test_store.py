@@ -0,0 +1,130 @@
+import json
+import os
+import shutil
+from datetime import datetime
+
+from metatrader.store import _SCHEMA, ResultStore, import_result_dirs
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'assets')
+
+
+def test_add_and_is_tested():
+    with ResultStore(':memory:', batch_size=2) as store:
+        store.add('ExpertMAMA', {'a': 1, 'b': 2}, 'EUR', 'M5', from_date=datetime(2018, 1, 1), model=1,
+                  metrics={'profit': 10.0})
+        assert store.is_tested('ExpertMAMA', {'b': 2, 'a': 1}, 'EUR', 'M5')
+        assert store.is_tested('ExpertMAMA', {'a': 1, 'b': 2}, 'EUR', 'M5', from_date=datetime(2018, 1, 1))
+        assert not store.is_tested('ExpertMAMA', {'a': 1, 'b': 2}, 'EUR', 'M5', model=0)
+        assert not store.is_tested('ExpertMAMA', {'a': 1, 'b': 3}, 'EUR', 'M5')
+        assert store.get('ExpertMAMA', {'a': 1, 'b': 2}, 'EUR', 'M5', model=1)['profit'] == 10.0
+        assert store.get('ExpertMAMA', {'a': 1, 'b': 2}, 'EUR', 'M5', model=0) is None
+
+        # same key replaces former run
+        store.add('ExpertMAMA', {'a': 1, 'b': 2}, 'EUR', 'M5', from_date=datetime(2018, 1, 1), model=1,
+                  metrics={'profit': 20.0})
+        assert store.count() == 1
+
+
+def test_leaderboard():
+    with ResultStore(':memory:') as store:
+        for i, profit in enumerate([5.0, 50.0, None, 20.0]):
+            store.add('MAMACD', {'MA1': i}, 'EUR', 'H1', metrics={'profit': profit, 'total_trades': i})
+        store.add('MAMACD', {'MA1': 9}, 'USD', 'H1', metrics={'profit': 100.0})
+
+        board = store.leaderboard(strategy='MAMACD', symbol='EUR', limit=2)
+        assert [row['profit'] for row in board] == [50.0, 20.0]
+        assert board[0]['params'] == {'MA1': 1}
+        assert board[0]['total_trades'] == 1
+
+
+def test_import_result_dirs(tmpdir):
+    run_dir = tmpdir.mkdir('ExpertMAMA_M5_EUR_1')
+    run_dir.join('conf.json').write(json.dumps({'strategy': 'ExpertMAMA', 'timeframe': 'M5', 'symbol': 'EUR',
+                                                'params': {'a': 1}}))
+    run_dir.mkdir('report')
+    shutil.copy(os.path.join(ASSETS_DIR, 'backtest_report.htm'), str(run_dir.join('report', 'report.htm')))
+    tmpdir.mkdir('not_a_run')
+
+    with ResultStore(str(tmpdir.join('results.sqlite'))) as store:
+        assert import_result_dirs(store, str(tmpdir)) == 1
+        assert store.is_tested('ExpertMAMA', {'a': 1}, 'EUR', 'M5')
+        assert store.leaderboard()[0]['profit'] == -724.34
+        assert store.unparsed() == []
+
+
+def test_import_result_dirs_keeps_runs_of_other_ranges_and_corrupt_conf(tmpdir):
+    for i, from_date in enumerate(['2018-01-01T00:00:00', '2018-06-01T00:00:00']):
+        run_dir = tmpdir.mkdir('MAMACD_H1_EUR_%d' % i)
+        run_dir.join('conf.json').write(json.dumps({'strategy': 'MAMACD', 'timeframe': 'H1', 'symbol': 'EUR',
+                                                    'params': {'MA1': 1}, 'from_date': from_date, 'model': 1}))
+    tmpdir.mkdir('MAMACD_H1_EUR_2').join('conf.json').write('{"strategy": "MAMACD", ')
+
+    with ResultStore(':memory:') as store:
+        assert import_result_dirs(store, str(tmpdir)) == 3
+        assert store.count() == 3
+        assert store.is_tested('MAMACD', {'MA1': 1}, 'EUR', 'H1', from_date=datetime(2018, 6, 1), model=1)
+        unparsed = store.unparsed()
+        assert [run['test_dir'] for run in unparsed if run['parse_error'].startswith('conf.json')] == [
+            str(tmpdir.join('MAMACD_H1_EUR_2'))]
+        # report is readable, but inputs of run are unknown
+        shutil.copy(os.path.join(ASSETS_DIR, 'backtest_report.htm'),
+                    str(tmpdir.join('MAMACD_H1_EUR_2').mkdir('report').join('report.htm')))
+        assert store.reparse() == 0
+
+
+def test_unparsed_reports_are_backfilled(tmpdir):
+    for i, content in enumerate([None, '<html>truncated', '<table><tr><td>Total net profit</td></table>']):
+        run_dir = tmpdir.mkdir('MAMACD_H1_EUR_%d' % i)
+        run_dir.join('conf.json').write(json.dumps({'strategy': 'MAMACD', 'timeframe': 'H1', 'symbol': 'EUR',
+                                                    'params': {'MA1': i}}))
+        if content is not None:
+            run_dir.mkdir('report').join('report.htm').write(content)
+
+    with ResultStore(':memory:') as store:
+        assert import_result_dirs(store, str(tmpdir)) == 3
+        # tested, but neither a failure of terminal nor on leaderboard
+        assert store.is_tested('MAMACD', {'MA1': 1}, 'EUR', 'H1')
+        assert store.failures() == [] and store.leaderboard() == []
+        assert [run['parse_error'] for run in store.unparsed()][0] == 'report not found'
+        assert store.reparse() == 0
+
+        # e.g. parser is fixed or report is copied back
+        shutil.copy(os.path.join(ASSETS_DIR, 'mt5_backtest_report.htm'),
+                    str(tmpdir.join('MAMACD_H1_EUR_1', 'report', 'report.htm')))
+        assert store.reparse() == 1
+        assert [(row['params'], row['profit']) for row in store.leaderboard()] == [({'MA1': 1}, -12107.2)]
+        assert len(store.unparsed()) == 2
+
+
+def test_durations_and_migration(tmpdir):
+    path = str(tmpdir.join('old.sqlite'))
+    with ResultStore(path) as store:
+        # store of former version has no duration column
+        store.connection.executescript('DROP TABLE runs;' + _SCHEMA.replace('duration REAL,', '').replace('parse_error TEXT,', '')
+                                     .replace('error TEXT,', ''))
+        store.connection.execute('INSERT INTO runs (run_key, strategy, params, symbol, timeframe, created_at) '
+                                 "VALUES ('k', 'MA', '{}', 'EUR', 'H1', 0)")
+        store.connection.commit()
+
+    with ResultStore(path) as store:
+        columns = [row['name'] for row in store.connection.execute('PRAGMA table_info(runs)')]
+        assert 'duration' in columns and 'error' in columns and 'parse_error' in columns
+        assert store.count() == 1
+
+    with ResultStore(':memory:') as store:
+        store.add('MAMACD', {'MA1': 1}, 'EUR', 'H1', from_date=datetime(2018, 1, 1), to_date=datetime(2018, 2, 1),
+                  model=0, duration=12.5)
+        store.add('MAMACD', {'MA1': 2}, 'EUR', 'H1')
+        assert list(store.iter_durations()) == [{'strategy': 'MAMACD', 'symbol': 'EUR', 'timeframe': 'H1', 'model': 0,
+                                                 'from_date': '2018-01-01T00:00:00',
+                                                 'to_date': '2018-02-01T00:00:00', 'duration': 12.5}]
+
+
+def test_failures_count_as_tested():
+    with ResultStore(':memory:') as store:
+        store.add('MAMACD', {'MA1': 1}, 'EUR', 'H1', error='terminal killed after 600 seconds of idle')
+        store.add('MAMACD', {'MA1': 2}, 'EUR', 'H1', metrics={'profit': 1.0})
+        assert store.is_tested('MAMACD', {'MA1': 1}, 'EUR', 'H1')
+        assert store.failures() == [{'strategy': 'MAMACD', 'params': {'MA1': 1}, 'symbol': 'EUR', 'timeframe': 'H1',
+                                     'error': 'terminal killed after 600 seconds of idle'}]
+        assert [row['params'] for row in store.leaderboard()] == [{'MA1': 2}]
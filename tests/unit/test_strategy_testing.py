@@ -0,0 +1,60 @@
+import os
+from datetime import datetime
+
+from metatrader import strategy_testing
+from metatrader.catalog import SymbolData
+from metatrader.exception import MissingSymbolData
+from metatrader.pool import BacktestPool
+from metatrader.store import ResultStore
+
+
+class FakeCatalog(object):
+    def validate_range(self, symbol, from_date, to_date):
+        if symbol == 'XXX':
+            raise MissingSymbolData(symbol, from_date, to_date, [])
+        return SymbolData(symbol, 'M1', from_date, to_date, None)
+
+
+def setup_sweep(tmpdir, monkeypatch, symbols):
+    monkeypatch.setattr(strategy_testing, 'RESULT_DIR', str(tmpdir.mkdir('results')))
+    monkeypatch.setattr(strategy_testing, 'CATALOG', FakeCatalog())
+    jobs = [('ExpertMACD', {'InpLots': i}, symbol, datetime(2018, 1, 1), datetime(2018, 2, 1), 'H1')
+            for i, symbol in enumerate(symbols)]
+    monkeypatch.setattr(strategy_testing, 'list_jobs', lambda store, test_config: (jobs, 0))
+    return jobs
+
+
+def test_run_testing_creates_result_dirs_when_submitted(tmpdir, monkeypatch, fake_terminals):
+    setup_sweep(tmpdir, monkeypatch, ['EUR', 'EUR', 'XXX', 'EUR', 'EUR', 'EUR'])
+    n_dirs = []
+    record_result = strategy_testing.record_result
+
+    def counting_record_result(store, backtest, *args):
+        n_dirs.append(len(os.listdir(strategy_testing.RESULT_DIR)))
+        return record_result(store, backtest, *args)
+
+    monkeypatch.setattr(strategy_testing, 'record_result', counting_record_result)
+    with ResultStore(':memory:') as store, BacktestPool(fake_terminals(1)) as pool:
+        strategy_testing.run_testing(store, {}, pool)
+
+        assert n_dirs[0] <= 2 and len(n_dirs) == 5
+        # run whose history is missing is recorded and does not stop the sweep
+        assert [failure['symbol'] for failure in store.failures()] == ['XXX']
+        assert store.count() == 6
+
+
+def test_run_testing_records_only_permanent_failures(tmpdir, monkeypatch, fake_terminals):
+    setup_sweep(tmpdir, monkeypatch, ['EUR', 'EUR'])
+    # crash of terminal is retryable
+    monkeypatch.setenv('FAKE_TERMINAL_EXIT_CODE', '3')
+    with ResultStore(':memory:') as store, BacktestPool(fake_terminals(1)) as pool:
+        strategy_testing.run_testing(store, {}, pool)
+        assert store.count() == 0
+
+
+def test_sample_params_without_prescreen(monkeypatch):
+    monkeypatch.setattr(strategy_testing, 'PRESCREEN', False)
+    monkeypatch.setattr(strategy_testing, 'CATALOG', None)
+    params = strategy_testing.sample_params('MAMACD', strategy_testing.TEST_CONFIG['MAMACD'], 'EUR',
+                                            datetime(2018, 1, 1), datetime(2019, 1, 1), 'H1')
+    assert len(params) == strategy_testing.N_PARAM_COMBS
@@ -0,0 +1,91 @@
+import os
+from datetime import datetime
+
+import pytest
+
+from metatrader.backtest import BackTest, OPTIMIZATION_GENETIC
+from metatrader.sweep import compile_range, compile_sweep, split_range
+
+
+def test_compile_range():
+    assert compile_range('a', 0.1) == {'value': 0.1}
+    assert compile_range('a', [5]) == {'value': 5}
+    assert compile_range('a', [15, 5, 10]) == {'value': 5, 'interval': 5, 'max': 15}
+    assert compile_range('a', range(5, 55, 5)) == {'value': 5, 'interval': 5, 'max': 50}
+    assert compile_range('a', [0.1, 0.2, 0.3]) == {'value': 0.1, 'interval': 0.1, 'max': 0.3}
+    assert compile_range('a', {'start': 1, 'stop': 9, 'step': 2}) == {'value': 1, 'interval': 2, 'max': 9}
+    assert compile_range('a', [False, True]) == {'value': 0, 'interval': 1, 'max': 1}
+
+    with pytest.raises(ValueError):
+        compile_range('a', [5, 8, 13, 21])
+    with pytest.raises(ValueError):
+        compile_range('a', ['fast', 'slow'])
+    assert compile_range('a', ['true', 'false']) == {'value': 0, 'interval': 1, 'max': 1}
+    assert compile_range('a', ['false']) == compile_range('a', [False]) == {'value': 'false'}
+
+
+def test_split_range():
+    assert split_range('a', range(5, 20, 5)) == [{'value': 5, 'interval': 5, 'max': 15}]
+    # gen_param_dist(14, int) of strategy_testing
+    assert split_range('a', [11, 12, 14, 15, 16]) == [{'value': v} for v in (11, 12, 14, 15, 16)]
+    assert split_range('a', ['fast', 'slow', 'fast']) == [{'value': 'fast'}, {'value': 'slow'}]
+    with pytest.raises(ValueError):
+        split_range('a', [])
+    with pytest.raises(ValueError):
+        split_range('a', {'start': 5, 'stop': 1, 'step': 1})
+
+
+def test_compile_sweep_expands_outer_keys_only():
+    param_space = {
+        'timeframe': ['M1', 'M5', 'H1'],
+        'Inp_Signal_MACD_PeriodFast': range(5, 25, 5),
+        'Inp_Signal_MACD_PeriodSlow': [20, 40, 60],
+        'InpLots': 0.1,
+    }
+    compiled = compile_sweep(param_space)
+
+    assert [outer for outer, _, _ in compiled] == [{'timeframe': 'M1'}, {'timeframe': 'M5'}, {'timeframe': 'H1'}]
+    _, ea_param, n_passes = compiled[0]
+    assert n_passes == 12
+    assert ea_param['InpLots'] == {'value': 0.1}
+
+
+def test_compile_sweep_expands_uneven_values():
+    param_space = {
+        'timeframe': ['M1', 'H1'],
+        'InpPeriod': [11, 12, 14],
+        'InpUseTradeHours': ['true', 'false'],
+        'InpLots': [0.1, 0.2],
+    }
+    compiled = compile_sweep(param_space)
+
+    assert len(compiled) == 2 * 3
+    assert [outer for outer, _, _ in compiled[:3]] == [{'timeframe': 'M1', 'InpPeriod': v} for v in (11, 12, 14)]
+    outer, ea_param, n_passes = compiled[1]
+    assert ea_param == {'InpPeriod': {'value': 12}, 'InpUseTradeHours': {'value': 0, 'interval': 1, 'max': 1},
+                        'InpLots': {'value': 0.1, 'interval': 0.1, 'max': 0.2}}
+    assert n_passes == 4
+
+
+def test_test_config_compiles():
+    from metatrader.strategy_testing import TEST_CONFIG
+
+    for param_space in TEST_CONFIG.values():
+        assert compile_sweep(param_space)
+
+
+def test_optimization_conf_and_param_files(fake_terminals, tmpdir):
+    fake_terminals(1)
+    ea_param = {'Fast': {'value': 5, 'interval': 5, 'max': 20}, 'Lots': {'value': 0.1}}
+    backtest = BackTest(str(tmpdir), 'Advisors\\ExpertMACD', ea_param, 'EURUSD', 'H1', 10000,
+                        datetime(2018, 1, 1), datetime(2018, 2, 1), optimization_mode=OPTIMIZATION_GENETIC)
+    backtest.optimization = True
+    backtest._prepare(alias='fake_0')
+
+    with open(os.path.join(str(tmpdir), 'config.ini')) as fp:
+        assert 'Optimization=2\n' in fp.read()
+    with open(os.path.join(str(tmpdir), 'param.set')) as fp:
+        lines = fp.read().splitlines()
+    start = lines.index('Fast=5')
+    assert lines[start:start + 5] == ['Fast=5', 'Fast,F=1', 'Fast,1=5', 'Fast,2=5', 'Fast,3=20']
+    assert 'Lots,F=0' in lines
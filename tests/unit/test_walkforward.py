@@ -0,0 +1,77 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from metatrader.pool import BacktestPool
+from metatrader.walkforward import split_windows, walk_forward
+
+
+def test_split_windows_rolling():
+    from_date, to_date = datetime(2018, 1, 1), datetime(2018, 1, 1) + timedelta(days=55)
+    windows = split_windows(from_date, to_date, 4, in_sample_ratio=0.6)
+
+    assert len(windows) == 4
+    assert windows[0].in_from == from_date
+    assert windows[-1].out_to == to_date
+    for window in windows:
+        assert (window.in_to - window.in_from).total_seconds() == pytest.approx(15 * 86400)
+        assert (window.out_to - window.out_from).total_seconds() == pytest.approx(10 * 86400)
+    # out-of-sample segments follow each other without gap
+    for former, latter in zip(windows, windows[1:]):
+        assert former.out_to == latter.out_from
+
+
+def test_split_windows_anchored():
+    from_date, to_date = datetime(2018, 1, 1), datetime(2018, 1, 1) + timedelta(days=70)
+    windows = split_windows(from_date, to_date, 4, in_sample_ratio=0.6, anchored=True)
+
+    assert [w.in_from for w in windows] == [from_date] * 4
+    assert [w.out_from for w in windows] == [w.out_from for w in split_windows(from_date, to_date, 4, 0.6)]
+
+
+@pytest.mark.parametrize('n_windows, ratio', [(0, 0.5), (2, 0), (2, 1)])
+def test_split_windows_invalid(n_windows, ratio):
+    with pytest.raises(ValueError):
+        split_windows(datetime(2018, 1, 1), datetime(2019, 1, 1), n_windows, in_sample_ratio=ratio)
+
+
+def test_walk_forward_on_fake_terminals(tmpdir, fake_terminals):
+    aliases = fake_terminals(2)
+    param_space = {'InpPeriod': {'start': 5, 'stop': 20, 'step': 5}, 'InpLots': 0.1}
+
+    with BacktestPool(aliases) as pool:
+        report = walk_forward(pool, str(tmpdir.join('wf')), 'Advisors\\ExpertMACD', param_space, 'EURUSD', 'H1',
+                              10000, datetime(2018, 1, 1), datetime(2019, 1, 1), 3)
+
+    assert [w.window.index for w in report.windows] == [0, 1, 2]
+    assert len(report.completed) == 3
+    for w in report.windows:
+        assert w.error is None
+        assert w.param['InpPeriod'] in ('5', '10', '15', '20')
+        assert w.out_of_sample['profit'] is not None
+    assert report.profit == pytest.approx(sum(w.out_of_sample['profit'] for w in report.windows))
+    assert report.total_trades == sum(w.out_of_sample['total_trades'] for w in report.windows)
+
+    path = str(tmpdir.join('wf.json'))
+    report.write(path)
+    with open(path) as fp:
+        stitched = json.load(fp)
+    assert len(stitched['windows']) == 3
+    assert stitched['windows'][0]['out_from'] == report.windows[0].window.out_from.isoformat()
+    assert stitched['profit'] == pytest.approx(report.profit)
+
+
+def test_walk_forward_optimizes_uneven_values_separately(tmpdir, fake_terminals):
+    aliases = fake_terminals(2)
+    param_space = {'InpPeriod': {'start': 5, 'stop': 20, 'step': 5}, 'InpShift': [1, 2, 4]}
+
+    with BacktestPool(aliases) as pool:
+        report = walk_forward(pool, str(tmpdir.join('wf')), 'Advisors\\ExpertMACD', param_space, 'EURUSD', 'H1',
+                              10000, datetime(2018, 1, 1), datetime(2019, 1, 1), 2)
+
+    assert len(report.completed) == 2
+    assert len(tmpdir.join('wf').listdir(lambda p: p.basename.startswith('in_'))) == 2 * 3
+    for w in report.windows:
+        assert w.param['InpShift'] in ('1', '2', '4')
+        assert w.param['InpPeriod'] in ('5', '10', '15', '20')